@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Alimentacion, Destino, Entidad, Hospedaje, Seguro, Transporte, Paquete, ConvenioAgencia
+from .models import Alimentacion, Destino, Entidad, Hospedaje, Seguro, Transporte, Paquete, ConvenioAgencia, Pais, Departamento, Municipio, Cotizacion, LineaCotizacion, TrabajoCotizacion
 
 # Administrador personalizado para Entidad para añadir comportamiento dinámico
 class EntidadAdmin(admin.ModelAdmin):
@@ -17,6 +17,28 @@ class ConvenioAgenciaAdmin(admin.ModelAdmin):
     date_hierarchy = 'fecha_inicio'
     ordering = ('-fecha_inicio',)
 
+# Cotizaciones guardadas con sus líneas por componente
+class LineaCotizacionInline(admin.TabularInline):
+    model = LineaCotizacion
+    extra = 0
+    readonly_fields = ('componente', 'fuente', 'costo', 'firma')
+    exclude = ('proveedores',)
+
+class CotizacionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'entidad', 'destino', 'fecha_inicio', 'fecha_fin', 'total_pax', 'total', 'version', 'creado')
+    list_filter = ('creado',)
+    search_fields = ('entidad__nombre', 'destino__nombre', 'origen')
+    date_hierarchy = 'creado'
+    exclude = ('datos', 'costos', 'detalle')
+    inlines = [LineaCotizacionInline]
+
+# Cola de trabajos de cotización
+class TrabajoCotizacionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'estado', 'entidad', 'intentos', 'trabajador', 'creado', 'terminado')
+    list_filter = ('estado', 'tipo')
+    search_fields = ('entidad__nombre', 'error')
+    readonly_fields = ('resultado', 'error', 'intentos', 'trabajador', 'reservado_hasta', 'iniciado', 'terminado')
+
 # Register your models here.
 admin.site.register(Alimentacion)
 admin.site.register(Destino)
@@ -25,6 +47,11 @@ admin.site.register(Seguro)
 admin.site.register(Transporte)
 admin.site.register(Paquete)
 admin.site.register(ConvenioAgencia, ConvenioAgenciaAdmin)
+admin.site.register(Pais)
+admin.site.register(Departamento)
+admin.site.register(Municipio)
+admin.site.register(Cotizacion, CotizacionAdmin)
+admin.site.register(TrabajoCotizacion, TrabajoCotizacionAdmin)
 
 # Desregistrar el administrador predeterminado de Entidad y registrarlo con nuestra clase personalizada
 # Esto necesita hacerse después del registro inicial si ya estaba registrado.
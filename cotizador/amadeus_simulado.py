@@ -0,0 +1,191 @@
+"""
+Servidor local que simula la API de Amadeus
+
+Implementa los endpoints que usa AmadeusAPI (token OAuth, ofertas de vuelos y
+ofertas de hoteles) para hacer pruebas de carga y de latencia sin consumir la
+cuota de Amadeus. Basta con apuntar AMADEUS_BASE_URL a su dirección.
+
+La latencia de cada respuesta sigue una distribución configurable y una
+fracción de las peticiones puede fallar con 500 o con 401 (para probar la
+renovación del token). Las ofertas se generan de forma determinista a partir
+de los parámetros, o se toman de un archivo JSON con respuestas fijas.
+
+Se inicia con el comando servidor_amadeus_simulado.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class Latencia:
+    """
+    Distribución de latencia en milisegundos, a partir de un texto:
+    'fija:200', 'uniforme:50,400' o 'lognormal:200,0.6' (mediana y sigma).
+    """
+
+    def __init__(self, especificacion='fija:0', semilla=None):
+        tipo, _, valores = especificacion.partition(':')
+        self.tipo = tipo
+        self.valores = [float(valor) for valor in valores.split(',') if valor]
+        if tipo not in ('fija', 'uniforme', 'lognormal'):
+            raise ValueError(f'Distribución de latencia desconocida: {tipo}')
+        esperados = {'fija': 1, 'uniforme': 2, 'lognormal': 2}[tipo]
+        if len(self.valores) != esperados:
+            raise ValueError(f"La latencia '{tipo}' requiere {esperados} valor(es)")
+        self._random = random.Random(semilla)
+        self._lock = threading.Lock()
+
+    def muestra(self):
+        """Latencia en segundos para una respuesta"""
+        with self._lock:
+            if self.tipo == 'fija':
+                milisegundos = self.valores[0]
+            elif self.tipo == 'uniforme':
+                milisegundos = self._random.uniform(*self.valores)
+            else:
+                mediana, sigma = self.valores
+                milisegundos = mediana * self._random.lognormvariate(0, sigma)
+        return max(milisegundos, 0) / 1000
+
+
+def _entero_desde(*partes):
+    """Entero determinista a partir de los parámetros de la búsqueda"""
+    return int(hashlib.sha256('|'.join(str(parte) for parte in partes).encode('utf-8')).hexdigest()[:8], 16)
+
+
+def oferta_vuelos(params):
+    origen = params.get('originLocationCode', 'BOG')
+    destino = params.get('destinationLocationCode', 'CTG')
+    fecha = params.get('departureDate', '')
+    adultos = int(params.get('adults', 1) or 1)
+    ofertas = []
+    for indice in range(3):
+        precio = 150000 + _entero_desde(origen, destino, fecha, indice) % 750000
+        ofertas.append({
+            'type': 'flight-offer',
+            'id': str(indice + 1),
+            'itineraries': [{'segments': [{
+                'departure': {'iataCode': origen, 'at': f'{fecha}T08:00:00'},
+                'arrival': {'iataCode': destino, 'at': f'{fecha}T09:30:00'},
+            }]}],
+            'price': {'currency': 'COP', 'total': f'{precio * adultos:.2f}'},
+        })
+    ofertas.sort(key=lambda oferta: float(oferta['price']['total']))
+    return {'meta': {'count': len(ofertas)}, 'data': ofertas}
+
+
+def oferta_hoteles(params):
+    ciudad = params.get('cityCode', 'CTG')
+    entrada = params.get('checkInDate', '')
+    salida = params.get('checkOutDate', '')
+    adultos = int(params.get('adults', 1) or 1)
+    hoteles = []
+    for indice in range(3):
+        precio = 120000 + _entero_desde(ciudad, entrada, salida, indice) % 480000
+        hoteles.append({
+            'type': 'hotel-offers',
+            'hotel': {'hotelId': f'SIM{ciudad}{indice}', 'name': f'Hotel simulado {ciudad} {indice + 1}', 'cityCode': ciudad},
+            'offers': [{
+                'id': f'OF{indice}', 'checkInDate': entrada, 'checkOutDate': salida,
+                'guests': {'adults': adultos},
+                'price': {'currency': 'COP', 'total': f'{precio * adultos:.2f}'},
+            }],
+        })
+    return {'data': hoteles}
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    server_version = 'AmadeusSimulado/1.0'
+
+    def log_message(self, formato, *args):
+        if self.server.configuracion['registrar']:
+            super().log_message(formato, *args)
+
+    def _responder(self, estado, cuerpo):
+        contenido = json.dumps(cuerpo).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(contenido)))
+        self.end_headers()
+        self.wfile.write(contenido)
+
+    def _simular_red(self):
+        """Aplica la latencia y, según las tasas configuradas, retorna un error a responder"""
+        configuracion = self.server.configuracion
+        time.sleep(configuracion['latencia'].muestra())
+        with self.server.lock:
+            self.server.peticiones += 1
+            azar = self.server.random.random()
+        if azar < configuracion['tasa_error']:
+            return 500, {'errors': [{'status': 500, 'title': 'Error simulado'}]}
+        if azar < configuracion['tasa_error'] + configuracion['tasa_401']:
+            return 401, {'errors': [{'status': 401, 'title': 'Token simulado expirado'}]}
+        return None
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/v1/security/oauth2/token':
+            return self._responder(404, {'errors': [{'status': 404, 'title': 'Not found'}]})
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        time.sleep(self.server.configuracion['latencia'].muestra())
+        with self.server.lock:
+            self.server.tokens += 1
+            token = f'simulado-{self.server.tokens}'
+        self._responder(200, {
+            'type': 'amadeusOAuth2Token', 'access_token': token, 'token_type': 'Bearer',
+            'expires_in': self.server.configuracion['expires_in'],
+        })
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {campo: valores[0] for campo, valores in parse_qs(url.query).items()}
+        if url.path == '/v2/shopping/flight-offers':
+            endpoint, generar = 'vuelos', oferta_vuelos
+        elif url.path in ('/v3/shopping/hotel-offers', '/v3/shopping/hotel-offers/by-city'):
+            endpoint, generar = 'hoteles', oferta_hoteles
+        else:
+            return self._responder(404, {'errors': [{'status': 404, 'title': 'Not found'}]})
+
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            return self._responder(401, {'errors': [{'status': 401, 'title': 'Falta el token'}]})
+        error = self._simular_red()
+        if error:
+            return self._responder(*error)
+
+        fijas = self.server.configuracion['respuestas'].get(endpoint)
+        self._responder(200, fijas if fijas is not None else generar(params))
+
+
+def crear_servidor(host='127.0.0.1', puerto=0, latencia='fija:0', tasa_error=0.0, tasa_401=0.0,
+                   expires_in=1799, respuestas=None, semilla=None, registrar=False):
+    """
+    Crea el servidor (sin iniciarlo). Con puerto 0 se elige uno libre; la
+    dirección queda en servidor.server_address. respuestas es un diccionario
+    opcional {'vuelos': cuerpo, 'hoteles': cuerpo} con respuestas fijas.
+    """
+    servidor = ThreadingHTTPServer((host, puerto), _Manejador)
+    servidor.daemon_threads = True
+    servidor.configuracion = {
+        'latencia': Latencia(latencia, semilla),
+        'tasa_error': tasa_error,
+        'tasa_401': tasa_401,
+        'expires_in': expires_in,
+        'respuestas': respuestas or {},
+        'registrar': registrar,
+    }
+    servidor.lock = threading.Lock()
+    servidor.random = random.Random(semilla)
+    servidor.peticiones = 0
+    servidor.tokens = 0
+    return servidor
+
+
+def iniciar_en_hilo(**opciones):
+    """Inicia el servidor en un hilo de fondo. Retorna (servidor, url_base)"""
+    servidor = crear_servidor(**opciones)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    host, puerto = servidor.server_address[:2]
+    return servidor, f'http://{host}:{puerto}'
@@ -3,11 +3,22 @@ Módulo para integraciones con APIs externas
 como Amadeus para vuelos y hospedajes
 """
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timedelta
 from decimal import Decimal
 import os
 from dotenv import load_dotenv
 import sys
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 # Cargar variables de entorno desde la ruta específica
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -15,6 +26,162 @@ project_dir = os.path.dirname(os.path.dirname(current_dir))
 env_path = os.path.join(project_dir, '.env')
 load_dotenv(dotenv_path=env_path)
 
+# Timeout (conexión, lectura) en segundos de cada petición a Amadeus
+REQUEST_TIMEOUT = (
+    float(os.getenv('AMADEUS_CONNECT_TIMEOUT', '3.05')),
+    float(os.getenv('AMADEUS_READ_TIMEOUT', '10')),
+)
+
+# Conexiones keep-alive que se conservan por host en la sesión compartida
+POOL_MAXSIZE = int(os.getenv('AMADEUS_POOL_MAXSIZE', '10'))
+
+# Segundos antes de su expiración en que se renueva el token
+TOKEN_REFRESH_MARGIN = 60
+
+_session = None
+_session_lock = threading.Lock()
+
+# Tokens compartidos por todas las instancias del proceso:
+# (base_url, api_key) -> (token, instante de expiración en time.monotonic())
+_token_cache = {}
+_token_lock = threading.Lock()
+# Renovaciones en curso: (base_url, api_key) -> Event que se activa al terminar
+_token_refreshes = {}
+
+
+def get_session():
+    """
+    Sesión HTTP compartida por el proceso. Reutiliza las conexiones TLS con
+    Amadeus entre cotizaciones en lugar de abrir una nueva en cada petición.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+# Segundos que se comparte una falla con quienes repiten la misma búsqueda
+FAILURE_TTL = float(os.getenv('AMADEUS_FAILURE_TTL', '5'))
+
+# Directorio para los archivos de bloqueo entre procesos (vacío: solo entre hilos)
+LOCK_DIR = os.getenv('AMADEUS_LOCK_DIR', '')
+
+
+@contextmanager
+def process_lock(key):
+    """
+    Bloqueo entre procesos con un archivo por clave en LOCK_DIR. Si no se
+    configuró LOCK_DIR no hace nada.
+    """
+    if not LOCK_DIR:
+        yield
+        return
+
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    path = os.path.join(LOCK_DIR, f"amadeus-{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}.lock")
+    with open(path, 'a+b') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class _InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes con la misma clave: la primera ejecuta la
+    función y las demás esperan y reciben su mismo resultado o su misma
+    excepción. Una falla además se repite durante failure_ttl segundos sin
+    volver a llamar a la función, para no lanzar una ráfaga de reintentos.
+
+    Con AMADEUS_LOCK_DIR la ejecución también se serializa entre procesos,
+    de modo que el segundo proceso encuentre la respuesta ya en caché. Si se
+    da cached (retorna el resultado en caché o None), se consulta antes de
+    tomar el bloqueo, para que los aciertos no esperen a otros procesos, y
+    otra vez con el bloqueo tomado.
+    """
+    def __init__(self, failure_ttl=FAILURE_TTL):
+        self.failure_ttl = failure_ttl
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._failures = {}
+
+    def do(self, key, function, cached=None):
+        with self._lock:
+            failure = self._failures.get(key)
+            if failure is not None:
+                error, until = failure
+                if time.monotonic() < until:
+                    raise error
+                del self._failures[key]
+
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _InFlightCall()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = cached() if cached is not None else None
+            if call.result is None:
+                with process_lock(key):
+                    # Otro proceso pudo guardarlo mientras se esperaba el bloqueo
+                    call.result = cached() if cached is not None else None
+                    if call.result is None:
+                        call.result = function()
+        except Exception as e:
+            call.error = e
+            if self.failure_ttl:
+                with self._lock:
+                    now = time.monotonic()
+                    self._failures = {k: v for k, v in self._failures.items() if v[1] > now}
+                    self._failures[key] = (e, now + self.failure_ttl)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def clear(self):
+        with self._lock:
+            self._failures.clear()
+
+
+# Búsquedas en curso en el proceso, compartidas por todos los hilos
+_single_flight = SingleFlight()
+
+
+def clear_token_cache():
+    """Descarta los tokens guardados (se pedirá uno nuevo en la siguiente petición)"""
+    with _token_lock:
+        _token_cache.clear()
+
 
 class AmadeusAPI:
     """
@@ -26,10 +193,46 @@ class AmadeusAPI:
         self.base_url = os.getenv('AMADEUS_BASE_URL', 'https://test.api.amadeus.com')
         self.access_token = None
 
-    def get_access_token(self):
+    def get_access_token(self, force_refresh=False):
         """
-        Obtiene un token de acceso para la API de Amadeus
+        Obtiene un token de acceso para la API de Amadeus.
+
+        El token se guarda a nivel de proceso hasta poco antes de que expire
+        (según expires_in), así que las distintas instancias y hilos lo
+        comparten y solo uno de ellos lo renueva. La petición del token se
+        hace sin tener _token_lock: los hilos que necesitan el mismo token
+        esperan a quien lo está pidiendo y los demás no se bloquean.
         """
+        clave = (self.base_url, self.api_key)
+        while True:
+            with _token_lock:
+                token, expira = _token_cache.get(clave, (None, 0))
+                if not force_refresh and token is not None and time.monotonic() < expira:
+                    break
+                renovacion = _token_refreshes.get(clave)
+                renueva = renovacion is None
+                if renueva:
+                    renovacion = _token_refreshes[clave] = threading.Event()
+
+            if not renueva:
+                # Se usa el token que está pidiendo otro hilo (o, si falló, se vuelve a intentar)
+                renovacion.wait()
+                force_refresh = False
+                continue
+
+            try:
+                token, expira = self._request_token()
+                with _token_lock:
+                    _token_cache[clave] = (token, expira)
+            finally:
+                with _token_lock:
+                    _token_refreshes.pop(clave, None)
+                renovacion.set()
+            break
+        self.access_token = token
+        return token
+
+    def _request_token(self):
         url = f"{self.base_url}/v1/security/oauth2/token"
         headers = {
             'Content-Type': 'application/x-www-form-urlencoded'
@@ -40,27 +243,61 @@ class AmadeusAPI:
             'client_secret': self.api_secret
         }
 
-        response = requests.post(url, headers=headers, data=data)
+        response = get_session().post(url, headers=headers, data=data, timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
             token_data = response.json()
-            self.access_token = token_data['access_token']
-            return self.access_token
+            vigencia = max(int(token_data.get('expires_in', 1799)) - TOKEN_REFRESH_MARGIN, 0)
+            return token_data['access_token'], time.monotonic() + vigencia
         else:
             raise Exception(f"Error al obtener token: {response.text}")
 
-    def search_flights(self, origin, destination, departure_date, return_date=None, adults=1):
+    def _get(self, path, params):
         """
-        Busca vuelos usando la API de Amadeus
+        GET autenticado. Si Amadeus responde 401 (token revocado o expirado
+        antes de tiempo) se renueva el token y se reintenta una vez.
         """
-        if not self.access_token:
-            self.get_access_token()
+        url = f"{self.base_url}{path}"
+        token = self.get_access_token()
+        for intento in range(2):
+            headers = {
+                'Authorization': f'Bearer {token}',
+                'Content-Type': 'application/json'
+            }
+            response = get_session().get(url, headers=headers, params=params, timeout=REQUEST_TIMEOUT)
+            if response.status_code != 401 or intento:
+                return response
+            token = self.get_access_token(force_refresh=True)
+
+    def _fetch(self, path, params, descripcion):
+        """GET autenticado que retorna el JSON de la respuesta o lanza una excepción"""
+        response = self._get(path, params)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise Exception(f"Error al buscar {descripcion}: {response.text}")
 
-        url = f"{self.base_url}/v2/shopping/flight-offers"
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json'
-        }
+    def _cached_search(self, endpoint, path, params, solo_cache=False):
+        """
+        Búsqueda con caché (cotizador.cache_amadeus) en la que las llamadas
+        concurrentes con los mismos parámetros normalizados se agrupan en una sola.
+        Con solo_cache no se consulta Amadeus: retorna None si no hay respuesta en caché.
+        """
+        from .cache_amadeus import clave_respuesta, no_vencida, obtener, vigente
+
+        if solo_cache:
+            return vigente(endpoint, params)
+
+        return _single_flight.do(
+            clave_respuesta(endpoint, params),
+            lambda: obtener(endpoint, params, lambda: self._fetch(path, params, endpoint)),
+            cached=lambda: no_vencida(endpoint, params),
+        )
 
+    def search_flights(self, origin, destination, departure_date, return_date=None, adults=1, solo_cache=False):
+        """
+        Busca vuelos usando la API de Amadeus.
+        Las respuestas se guardan en caché (ver cotizador.cache_amadeus).
+        """
         params = {
             'originLocationCode': origin,
             'destinationLocationCode': destination,
@@ -72,25 +309,13 @@ class AmadeusAPI:
         if return_date:
             params['returnDate'] = return_date
 
-        response = requests.get(url, headers=headers, params=params)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise Exception(f"Error al buscar vuelos: {response.text}")
+        return self._cached_search('vuelos', '/v2/shopping/flight-offers', params, solo_cache)
 
-    def get_hotel_offers(self, city_code, check_in_date, check_out_date, adults=1):
+    def get_hotel_offers(self, city_code, check_in_date, check_out_date, adults=1, solo_cache=False):
         """
-        Busca ofertas de hoteles usando la API de Amadeus
+        Busca ofertas de hoteles usando la API de Amadeus.
+        Las respuestas se guardan en caché (ver cotizador.cache_amadeus).
         """
-        if not self.access_token:
-            self.get_access_token()
-
-        url = f"{self.base_url}/v3/shopping/hotel-offers/by-city"
-        headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'Content-Type': 'application/json'
-        }
-
         params = {
             'cityCode': city_code,
             'checkInDate': check_in_date,
@@ -98,78 +323,23 @@ class AmadeusAPI:
             'adults': adults
         }
 
-        response = requests.get(url, headers=headers, params=params)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise Exception(f"Error al buscar hoteles: {response.text}")
+        return self._cached_search('hoteles', '/v3/shopping/hotel-offers/by-city', params, solo_cache)
 
 
-def get_flight_prices_amadeus(origen, destino, fecha_inicio, fecha_fin, adultos=1):
+def get_flight_prices_amadeus(origen, destino, fecha_inicio, fecha_fin, adultos=1, solo_cache=False):
     """
-    Función para obtener precios de vuelos de Amadeus
+    Función para obtener precios de vuelos de Amadeus.
+    Con solo_cache se usa únicamente la caché de respuestas.
     """
     try:
-        # Obtener códigos de aeropuerto de manera más precisa
-        # En una implementación completa, necesitarías un mapeo de ciudades a códigos IATA
-        # Por ahora, usaremos un enfoque básico o puedes proporcionar los códigos directamente
-        origin_code = origen[:3].upper() if len(origen) >= 3 else "CLO"  # Bogotá como ejemplo
-        destination_code = destino[:3].upper() if len(destino) >= 3 else "MIA"  # Miami como ejemplo
+        from .codigos_iata import resolver_iata
 
-        # Limpiar origen para obtener solo la ciudad (antes del paréntesis si existe)
+        # Códigos de aeropuerto según la tabla de municipios y aeropuertos;
+        # si no se reconoce el nombre se usan sus primeras 3 letras como respaldo
         origen_limpio = origen.split('(')[0].strip()
-
-        # Ajustar si se proporcionan nombres completos
-        if "BOGOTÁ" in origen_limpio.upper() or "BOGOTA" in origen_limpio.upper() or "EL DORADO" in origen_limpio.upper():
-            origin_code = "BOG"
-        elif "MEDELLÍN" in origen_limpio.upper() or "MEDELLIN" in origen_limpio.upper() or "JOSÉ MARÍA" in origen_limpio.upper():
-            origin_code = "MDE"
-        elif "CARTAGENA" in origen_limpio.upper() or "RAFAEL" in origen_limpio.upper():
-            origin_code = "CTG"
-        elif "CALI" in origen_limpio.upper() or "ALFONSO" in origen_limpio.upper():
-            origin_code = "CLO"
-        elif "BARRANQUILLA" in origen_limpio.upper() or "ERNESTO" in origen_limpio.upper():
-            origin_code = "BAQ"
-        elif "BUCARAMANGA" in origen_limpio.upper() or "PALONEGRO" in origen_limpio.upper():
-            origin_code = "BGA"
-        elif "IBAGUÉ" in origen_limpio.upper() or "PULARQUIO" in origen_limpio.upper():
-            origin_code = "IBE"
-        elif "PEREIRA" in origen_limpio.upper() or "MATECAÑA" in origen_limpio.upper():
-            origin_code = "PEI"
-        elif "MANIZALES" in origen_limpio.upper():
-            origin_code = "MZL"
-        else:
-            # Si no se reconoce el nombre, usar las primeras 3 letras en mayúsculas como respaldo
-            origin_code = origen_limpio[:3].upper()
-
-        # Limpiar destino para obtener solo la ciudad (antes del paréntesis si existe)
         destino_limpio = destino.split('(')[0].strip()
-
-        if "BOGOTÁ" in destino_limpio.upper() or "BOGOTA" in destino_limpio.upper() or "EL DORADO" in destino_limpio.upper():
-            destination_code = "BOG"
-        elif "MEDELLÍN" in destino_limpio.upper() or "MEDELLIN" in destino_limpio.upper() or "JOSÉ MARÍA" in destino_limpio.upper():
-            destination_code = "MDE"
-        elif "CARTAGENA" in destino_limpio.upper() or "RAFAEL" in destino_limpio.upper():
-            destination_code = "CTG"
-        elif "CALI" in destino_limpio.upper() or "ALFONSO" in destino_limpio.upper():
-            destination_code = "CLO"
-        elif "BARRANQUILLA" in destino_limpio.upper() or "ERNESTO" in destino_limpio.upper():
-            destination_code = "BAQ"
-        elif "BUCARAMANGA" in destino_limpio.upper() or "PALONEGRO" in destino_limpio.upper():
-            destination_code = "BGA"
-        elif "IBAGUÉ" in destino_limpio.upper() or "PULARQUIO" in destino_limpio.upper():
-            destination_code = "IBE"
-        elif "PEREIRA" in destino_limpio.upper() or "MATECAÑA" in destino_limpio.upper():
-            destination_code = "PEI"
-        elif "MANIZALES" in destino_limpio.upper():
-            destination_code = "MZL"
-        elif "AGUADAS" in destino_limpio.upper():
-            destination_code = "MZL"  # Cerca a Manizales
-        elif "CHINCHINÁ" in destino_limpio.upper():
-            destination_code = "MZL"  # Cerca a Manizales
-        else:
-            # Si no se reconoce el nombre, usar las primeras 3 letras en mayúsculas como respaldo
-            destination_code = destino_limpio[:3].upper()
+        origin_code = resolver_iata(origen) or origen_limpio[:3].upper()
+        destination_code = resolver_iata(destino) or destino_limpio[:3].upper()
 
         amadeus = AmadeusAPI()
 
@@ -190,8 +360,11 @@ def get_flight_prices_amadeus(origen, destino, fecha_inicio, fecha_fin, adultos=
             destination=destination_code,
             departure_date=departure_date,
             return_date=return_date,
-            adults=adultos
+            adults=adultos,
+            solo_cache=solo_cache
         )
+        if flights_data is None:
+            return {'success': False, 'error': 'Sin respuesta de vuelos en caché', 'en_cache': False}
 
         # Procesar los resultados y retornar precios
         if 'data' in flights_data and len(flights_data['data']) > 0:
@@ -220,60 +393,18 @@ def get_flight_prices_amadeus(origen, destino, fecha_inicio, fecha_fin, adultos=
         }
 
 
-def get_hotel_prices_amadeus(destino, fecha_inicio, fecha_fin, adultos=1):
+def get_hotel_prices_amadeus(destino, fecha_inicio, fecha_fin, adultos=1, solo_cache=False):
     """
-    Función para obtener precios de hoteles de Amadeus
+    Función para obtener precios de hoteles de Amadeus.
+    Con solo_cache se usa únicamente la caché de respuestas.
     """
     try:
-        # Mapeo de destinos comunes a códigos de ciudad IATA
-        city_codes = {
-            'BOGOTÁ': 'BOG', 'BOGOTA': 'BOG',
-            'MEDELLÍN': 'MDE', 'MEDELLIN': 'MDE',
-            'CARTAGENA': 'CTG',
-            'CALI': 'CLO',
-            'BARRANQUILLA': 'BAQ',
-            'BUCARAMANGA': 'BGA',
-            'CARTAGENA': 'CTG',
-            'CUCUTA': 'CUC',
-            'IBAGUE': 'IBE',
-            'PEREIRA': 'PEI',
-            'MANIZALES': 'MZL',
-            'VILLAVICENCIO': 'VVC',
-            'ARMENIA': 'AXM',
-            'POPAYAN': 'PPN',
-            'TUNJA': 'TUA',
-            'YOPAL': 'EYP',
-            'SAN ANDRÉS': 'ADZ',
-            'LETICIA': 'LET',
-            'PUERTO CARREÑO': 'PCR',
-            'MITÚ': 'MVP',
-            'QUIBDO': 'UIB',
-            'MONTERÍA': 'MTR',
-            'COROZAL': 'CZU',
-            'VALLEDUPAR': 'VUP',
-            'RIOHACHA': 'RCH',
-            'SAN JOSÉ DEL GUAVIARE': 'GPI',
-            # Agregar también municipios comunes
-            'AGUADAS': 'MZL',  # Cerca a Manizales
-            'CHINCHINÁ': 'MZL',  # Cerca a Manizales
-            'ANSERMA': 'MZL',   # Cerca a Manizales
-        }
+        from .codigos_iata import resolver_iata
 
-        # Limpiar el destino para obtener solo la ciudad (antes del paréntesis si existe)
+        # Código de ciudad según la tabla de municipios y aeropuertos; si no
+        # se reconoce el nombre se usan sus primeras 3 letras como respaldo
         destino_limpio = destino.split('(')[0].strip().upper()
-
-        # Convertir destino a código de ciudad
-        destino_upper = destino_limpio
-        city_code = None
-
-        for key, code in city_codes.items():
-            if key in destino_upper:
-                city_code = code
-                break
-
-        # Si no se encontró un código específico, usar las primeras 3 letras
-        if not city_code:
-            city_code = destino_limpio[:3].upper()
+        city_code = resolver_iata(destino) or destino_limpio[:3].upper()
 
         amadeus = AmadeusAPI()
 
@@ -288,53 +419,32 @@ def get_hotel_prices_amadeus(destino, fecha_inicio, fecha_fin, adultos=1):
         check_in_date = fecha_inicio.strftime('%Y-%m-%d')
         check_out_date = fecha_fin.strftime('%Y-%m-%d')
 
-        # Obtener token para la solicitud
-        token = amadeus.get_access_token()
-
-        # Buscar hoteles usando la API directamente con el endpoint correcto
-        import requests
-
-        # Intentar primero con el endpoint by-city
-        url = f"{amadeus.base_url}/v3/shopping/hotel-offers/by-city"
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': 'application/json'
-        }
-
-        params = {
-            'cityCode': city_code,
-            'checkInDate': check_in_date,
-            'checkOutDate': check_out_date,
-            'adults': adultos
-        }
-
-        response = requests.get(url, headers=headers, params=params)
+        # Buscar hoteles con el endpoint by-city
+        hotels_data = amadeus.get_hotel_offers(
+            city_code=city_code,
+            check_in_date=check_in_date,
+            check_out_date=check_out_date,
+            adults=adultos,
+            solo_cache=solo_cache
+        )
+        if hotels_data is None:
+            return {'success': False, 'error': 'Sin respuesta de hoteles en caché', 'en_cache': False}
 
-        if response.status_code == 200:
-            hotels_data = response.json()
-
-            # Procesar los resultados y retornar precios
-            if 'data' in hotels_data and len(hotels_data['data']) > 0:
-                # Obtener el precio del primer hotel como ejemplo
-                first_hotel = hotels_data['data'][0]
-                if 'offers' in first_hotel and len(first_hotel['offers']) > 0:
-                    first_offer = first_hotel['offers'][0]
-                    if 'price' in first_offer and 'total' in first_offer['price']:
-                        total_price = Decimal(first_offer['price']['total'])
-                        return {
-                            'success': True,
-                            'price': total_price,
-                            'currency': first_offer['price'].get('currency', 'COP'),
-                            'hotel_data': first_offer,
-                            'city_code': city_code
-                        }
-        else:
-            # Si by-city falla, podemos intentar con otros endpoints, pero el error sugiere formato incorrecto
-            print(f"Error en API de hoteles: {response.status_code} - {response.text}")
-            return {
-                'success': False,
-                'error': f'Error en API de hoteles: {response.text}'
-            }
+        # Procesar los resultados y retornar precios
+        if 'data' in hotels_data and len(hotels_data['data']) > 0:
+            # Obtener el precio del primer hotel como ejemplo
+            first_hotel = hotels_data['data'][0]
+            if 'offers' in first_hotel and len(first_hotel['offers']) > 0:
+                first_offer = first_hotel['offers'][0]
+                if 'price' in first_offer and 'total' in first_offer['price']:
+                    total_price = Decimal(first_offer['price']['total'])
+                    return {
+                        'success': True,
+                        'price': total_price,
+                        'currency': first_offer['price'].get('currency', 'COP'),
+                        'hotel_data': first_offer,
+                        'city_code': city_code
+                    }
 
         return {
             'success': False,
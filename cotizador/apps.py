@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CotizadorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cotizador'
+
+    def ready(self):
+        # Registrar las señales que mantienen el índice de proveedores
+        from . import signals  # noqa: F401
+        # Construir al inicio la tabla de códigos IATA (solo lee archivos de datos)
+        from .codigos_iata import tabla_iata
+        tabla_iata()
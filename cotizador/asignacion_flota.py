@@ -0,0 +1,270 @@
+"""
+Asignación de flota para el transporte de una cotización
+
+Elige la combinación de vehículos más barata que lleva a todo el grupo, en
+lugar de cobrar el precio por persona de todos los vehículos de la zona.
+Cada Transporte es un tipo de vehículo con capacidad (pax), número de
+unidades (cantidad, 1 si no se indica) y precio por unidad.
+
+Hay dos modos:
+
+- 'exacto': programación dinámica sobre el número de pasajeros (mochila
+  acotada con objetivo "al menos total_pax"). Los vehículos se agrupan por
+  capacidad y de cada grupo solo se consideran las unidades más baratas, así
+  que el costo depende del tamaño del grupo y no del tamaño de la flota.
+- 'voraz': ordena los vehículos por precio por puesto, toma los más
+  rentables y cierra el remanente con el vehículo más barato que lo cubra
+  (o con el que resulte más barato cerrar antes). Es O(n log n) y sirve para
+  grupos grandes.
+
+El modo 'auto' usa el exacto cuando el número estimado de operaciones no
+supera FLOTA_LIMITE_EXACTO y, si no, el voraz. Los precios se manejan en
+centavos enteros.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from decimal import Decimal
+
+from .montos import a_centavos
+
+
+# Operaciones de la programación dinámica por encima de las cuales se usa el modo voraz
+LIMITE_EXACTO_DEFECTO = 50000
+
+MODOS = ('auto', 'exacto', 'voraz')
+
+
+def _vehiculos_validos(vehiculos):
+    """Vehículos con capacidad y al menos una unidad, con el precio en centavos"""
+    validos = []
+    for vehiculo in vehiculos:
+        pax = vehiculo.get('pax') or 0
+        unidades = vehiculo.get('cantidad') or 1
+        if pax > 0 and unidades > 0:
+            validos.append({**vehiculo, 'pax': pax, 'cantidad': unidades,
+                            'centavos': a_centavos(vehiculo.get('precio'))})
+    return validos
+
+
+def _grupos_por_capacidad(vehiculos, total_pax):
+    """
+    capacidad -> lista de (centavos, indice del vehículo) con una entrada por
+    unidad, de la más barata a la más cara. Nunca hacen falta más de
+    ceil(total_pax / capacidad) unidades de una misma capacidad.
+    """
+    grupos = defaultdict(list)
+    for indice, vehiculo in enumerate(vehiculos):
+        grupos[vehiculo['pax']].append((vehiculo['centavos'], indice, vehiculo['cantidad']))
+
+    unidades = {}
+    for pax, tipos in grupos.items():
+        maximo = -(-total_pax // pax)
+        tipos.sort()
+        lista = []
+        for centavos, indice, cantidad in tipos:
+            lista.extend([(centavos, indice)] * min(cantidad, maximo - len(lista)))
+            if len(lista) >= maximo:
+                break
+        unidades[pax] = lista
+    return unidades
+
+
+def _operaciones(grupos, total_pax):
+    """Estimación del número de operaciones del modo exacto"""
+    return (total_pax + 1) * sum(len(lista) + 1 for lista in grupos.values())
+
+
+def _tabla(grupos, total_pax):
+    """
+    Programación dinámica del modo exacto. Retorna (costo, elecciones):
+    costo[c] es el costo mínimo para llevar exactamente c pasajeros (al menos
+    total_pax en la última posición) y elecciones permite reconstruir la
+    elección de cada grupo de capacidad.
+    """
+    infinito = float('inf')
+    costo = [0] + [infinito] * total_pax
+    elecciones = []
+    for pax, lista in grupos:
+        acumulado = [0]
+        for centavos, _ in lista:
+            acumulado.append(acumulado[-1] + centavos)
+
+        nuevo = costo[:]
+        eleccion = [(c, 0) for c in range(total_pax + 1)]
+        for c in range(total_pax + 1):
+            base = costo[c]
+            if base == infinito:
+                continue
+            for unidades in range(1, len(acumulado)):
+                destino = min(total_pax, c + unidades * pax)
+                candidato = base + acumulado[unidades]
+                if candidato < nuevo[destino]:
+                    nuevo[destino] = candidato
+                    eleccion[destino] = (c, unidades)
+                if destino == total_pax:
+                    # Más unidades solo suben el costo
+                    break
+        costo = nuevo
+        elecciones.append(eleccion)
+    return costo, elecciones
+
+
+def _exacto(vehiculos, total_pax):
+    """Elección de costo mínimo como {indice: unidades}, o None si la flota no alcanza"""
+    grupos = list(_grupos_por_capacidad(vehiculos, total_pax).items())
+    costo, elecciones = _tabla(grupos, total_pax)
+    if costo[total_pax] == float('inf'):
+        return None
+
+    seleccion = defaultdict(int)
+    c = total_pax
+    for (pax, lista), eleccion in zip(reversed(grupos), reversed(elecciones)):
+        c, unidades = eleccion[c]
+        for _, indice in lista[:unidades]:
+            seleccion[indice] += 1
+    return dict(seleccion)
+
+
+def _voraz(vehiculos, total_pax):
+    """Elección aproximada como {indice: unidades}, o None si la flota no alcanza"""
+    if sum(vehiculo['pax'] * vehiculo['cantidad'] for vehiculo in vehiculos) < total_pax:
+        return None
+
+    orden = sorted(range(len(vehiculos)), key=lambda i: (vehiculos[i]['centavos'] / vehiculos[i]['pax'], -vehiculos[i]['pax']))
+    libres = [vehiculo['cantidad'] for vehiculo in vehiculos]
+    seleccion = defaultdict(int)
+
+    # Vehículo más barato con capacidad >= p entre los que tienen unidades
+    # libres: búsqueda binaria sobre las capacidades y mínimo acumulado desde
+    # la mayor. El mínimo se recalcula solo cuando un vehículo se agota
+    por_capacidad = sorted(range(len(vehiculos)), key=lambda i: vehiculos[i]['pax'])
+    capacidades = [vehiculos[i]['pax'] for i in por_capacidad]
+    mas_barato = [None] * len(por_capacidad)
+
+    def recalcular():
+        minimo = None
+        for posicion in range(len(por_capacidad) - 1, -1, -1):
+            indice = por_capacidad[posicion]
+            if libres[indice] and (minimo is None or vehiculos[indice]['centavos'] < vehiculos[minimo]['centavos']):
+                minimo = indice
+            mas_barato[posicion] = minimo
+
+    def cierre(restantes):
+        posicion = bisect_left(capacidades, restantes)
+        return mas_barato[posicion] if posicion < len(capacidades) else None
+
+    def tomar(indice, unidades):
+        seleccion[indice] += unidades
+        libres[indice] -= unidades
+        if not libres[indice]:
+            recalcular()
+        return unidades * vehiculos[indice]['pax'], unidades * vehiculos[indice]['centavos']
+
+    recalcular()
+    restantes = total_pax
+    acumulado = 0
+    mejor = None
+
+    # Vehículos completos, del menor al mayor precio por puesto. Antes de
+    # cada tipo se evalúa cerrar el grupo con el vehículo más barato que
+    # cubra a los pasajeros restantes
+    for indice in orden:
+        if restantes <= 0:
+            break
+        cerrar = cierre(restantes)
+        if cerrar is not None:
+            costo = acumulado + vehiculos[cerrar]['centavos']
+            if mejor is None or costo < mejor[0]:
+                mejor = (costo, {**seleccion, cerrar: seleccion.get(cerrar, 0) + 1})
+        unidades = min(libres[indice], restantes // vehiculos[indice]['pax'])
+        if unidades:
+            pax, centavos = tomar(indice, unidades)
+            restantes -= pax
+            acumulado += centavos
+
+    # Remanente: el vehículo más barato que lo cubra o, si ninguno alcanza,
+    # el de mayor capacidad, hasta completar
+    while restantes > 0:
+        indice = cierre(restantes)
+        if indice is None:
+            indice = max((i for i in orden if libres[i]), key=lambda i: (vehiculos[i]['pax'], -vehiculos[i]['centavos']))
+        pax, centavos = tomar(indice, 1)
+        restantes -= pax
+        acumulado += centavos
+
+    if mejor is not None and mejor[0] < acumulado:
+        return mejor[1]
+    return dict(seleccion)
+
+
+def costos_flota(vehiculos, pax_maximo, limite_exacto=LIMITE_EXACTO_DEFECTO):
+    """
+    Costo mínimo en centavos de llevar a cada tamaño de grupo de 0 a
+    pax_maximo pasajeros, con una sola programación dinámica en lugar de una
+    asignación por tamaño. La posición c es None si la flota no alcanza para
+    c pasajeros. Retorna None si el número estimado de operaciones supera
+    limite_exacto (entonces conviene asignar_flota() en modo voraz por tamaño).
+    """
+    validos = _vehiculos_validos(vehiculos)
+    grupos = _grupos_por_capacidad(validos, pax_maximo)
+    if _operaciones(grupos, pax_maximo) > limite_exacto:
+        return None
+    costo, _ = _tabla(list(grupos.items()), pax_maximo)
+
+    # costo[c] es para exactamente c puestos: el mínimo desde c en adelante
+    # es el de llevar al menos c pasajeros
+    costos = [None] * (pax_maximo + 1)
+    minimo = float('inf')
+    for c in range(pax_maximo, -1, -1):
+        minimo = min(minimo, costo[c])
+        costos[c] = None if minimo == float('inf') else minimo
+    return costos
+
+
+def asignar_flota(vehiculos, total_pax, modo='auto', limite_exacto=LIMITE_EXACTO_DEFECTO):
+    """
+    Elige los vehículos que llevan a total_pax pasajeros al menor costo.
+    vehiculos es una lista de diccionarios con 'pax', 'cantidad' y 'precio'
+    (y cualquier otro campo, que se conserva en el resultado).
+
+    Retorna un diccionario con 'costo' (Decimal), 'vehiculos' (los elegidos,
+    con las unidades usadas en 'unidades' y su 'subtotal'), 'capacidad'
+    (puestos asignados), 'faltantes' (pasajeros sin puesto si la flota no
+    alcanza; en ese caso se asignan todos los vehículos) y 'modo' usado.
+    """
+    if modo not in MODOS:
+        raise ValueError(f'Modo de asignación desconocido: {modo}')
+
+    validos = _vehiculos_validos(vehiculos)
+    if modo == 'auto':
+        operaciones = _operaciones(_grupos_por_capacidad(validos, total_pax), total_pax)
+        modo = 'exacto' if operaciones <= limite_exacto else 'voraz'
+
+    if total_pax <= 0:
+        seleccion = {}
+    else:
+        seleccion = (_exacto if modo == 'exacto' else _voraz)(validos, total_pax)
+        if seleccion is None:
+            # La flota no alcanza para todo el grupo: se usan todos los vehículos
+            seleccion = {indice: vehiculo['cantidad'] for indice, vehiculo in enumerate(validos)}
+
+    elegidos = []
+    total = 0
+    capacidad = 0
+    for indice in sorted(seleccion):
+        vehiculo = dict(validos[indice])
+        unidades = seleccion[indice]
+        centavos = vehiculo.pop('centavos')
+        total += centavos * unidades
+        capacidad += vehiculo['pax'] * unidades
+        vehiculo['unidades'] = unidades
+        vehiculo['subtotal'] = Decimal(centavos * unidades) / 100
+        elegidos.append(vehiculo)
+
+    return {
+        'costo': Decimal(total) / 100,
+        'vehiculos': elegidos,
+        'capacidad': capacidad,
+        'faltantes': max(total_pax - capacidad, 0),
+        'modo': modo,
+    }
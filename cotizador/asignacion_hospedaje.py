@@ -0,0 +1,129 @@
+"""
+Asignación de habitaciones para el hospedaje de una cotización
+
+Elige dónde se aloja el grupo en lugar de sumar el precio por persona de
+todos los hospedajes de la zona. Cada Hospedaje tiene capacidad (capacidadpax),
+número de habitaciones y precio por noche del total de habitaciones; cada
+habitación aloja capacidadpax / habitaciones personas y cuesta
+precio / habitaciones por noche. Sin habitaciones registradas, el hospedaje
+se toma como una sola unidad.
+
+Si algún hospedaje aloja a todo el grupo se elige el más barato, y las k
+mejores alternativas se obtienen con un heap (heapq.nsmallest) sin ordenar
+todo el catálogo. Si ninguno alcanza, se usa el menor número posible de
+hospedajes: los de mayor capacidad (extraídos de un heap) y, para el
+remanente, el más barato que lo aloje. Los precios se manejan en centavos.
+"""
+import heapq
+from decimal import Decimal
+
+from .montos import a_centavos
+
+
+ALTERNATIVAS_DEFECTO = 3
+
+
+def noches(fecha_inicio, fecha_fin):
+    """Noches de la estadía (al menos una)"""
+    return max((fecha_fin - fecha_inicio).days, 1)
+
+
+def _unidades(hospedajes):
+    """
+    (capacidad, habitaciones, precio en centavos, índice) de los hospedajes
+    con capacidad. Se usan tuplas para no copiar el catálogo.
+    """
+    unidades = []
+    for indice, hospedaje in enumerate(hospedajes):
+        capacidad = hospedaje.get('capacidadpax') or 0
+        if capacidad > 0:
+            habitaciones = min(hospedaje.get('habitaciones') or 1, capacidad)
+            unidades.append((capacidad, habitaciones, a_centavos(hospedaje.get('precio')), indice))
+    return unidades
+
+
+def habitaciones_necesarias(capacidad, habitaciones, pax):
+    """Habitaciones que ocupan pax personas en un hospedaje"""
+    return min(-(-pax * habitaciones // capacidad), habitaciones)
+
+
+def _costo(unidad, pax, numero_noches):
+    """Costo en centavos de alojar pax personas durante las noches indicadas"""
+    capacidad, habitaciones, centavos, _ = unidad
+    ocupadas = habitaciones_necesarias(capacidad, habitaciones, pax)
+    # Redondeo al centavo más cercano
+    return (2 * centavos * ocupadas * numero_noches + habitaciones) // (2 * habitaciones)
+
+
+def _opcion(hospedajes, unidad, pax, numero_noches):
+    capacidad, habitaciones, _, indice = unidad
+    return {
+        **hospedajes[indice],
+        'pax': pax,
+        'habitaciones_usadas': habitaciones_necesarias(capacidad, habitaciones, pax),
+        'subtotal': Decimal(_costo(unidad, pax, numero_noches)) / 100,
+    }
+
+
+def _minimo_de_hospedajes(unidades, total_pax):
+    """Lista de (unidad, pax) con el menor número de hospedajes (todos si no alcanzan)"""
+    por_capacidad = [(-unidad[0], posicion) for posicion, unidad in enumerate(unidades)]
+    heapq.heapify(por_capacidad)
+    usados = set()
+    asignacion = []
+    restantes = total_pax
+    while restantes > 0 and por_capacidad:
+        capacidad = -por_capacidad[0][0]
+        if capacidad >= restantes:
+            # El remanente cabe en un solo hospedaje: el más barato que lo aloje
+            posicion = min(
+                (p for p, unidad in enumerate(unidades) if p not in usados and unidad[0] >= restantes),
+                key=lambda p: _costo(unidades[p], restantes, 1),
+            )
+            asignacion.append((unidades[posicion], restantes))
+            break
+        _, posicion = heapq.heappop(por_capacidad)
+        usados.add(posicion)
+        asignacion.append((unidades[posicion], capacidad))
+        restantes -= capacidad
+    return asignacion
+
+
+def asignar_hospedaje(hospedajes, total_pax, numero_noches, alternativas=ALTERNATIVAS_DEFECTO):
+    """
+    Aloja a total_pax personas durante numero_noches al menor costo.
+    hospedajes es una lista de diccionarios con 'capacidadpax',
+    'habitaciones' y 'precio' (y cualquier otro campo, que se conserva).
+
+    Retorna un diccionario con 'costo' (Decimal), 'hospedajes' (los elegidos,
+    con 'pax', 'habitaciones_usadas' y 'subtotal'), 'alternativas' (las
+    mejores opciones de un solo hospedaje para todo el grupo, de la más
+    barata a la más cara), 'faltantes' (personas sin alojamiento si el
+    catálogo no alcanza) y 'noches'.
+    """
+    unidades = _unidades(hospedajes)
+    opciones = []
+    elegidos = []
+    if total_pax > 0:
+        mejores = heapq.nsmallest(
+            alternativas or 1,
+            ((_costo(unidad, total_pax, numero_noches), unidad[3], unidad)
+             for unidad in unidades if unidad[0] >= total_pax),
+        )
+        opciones = [_opcion(hospedajes, unidad, total_pax, numero_noches) for _, _, unidad in mejores]
+        if opciones:
+            elegidos = opciones[:1]
+        else:
+            elegidos = [
+                _opcion(hospedajes, unidad, pax, numero_noches)
+                for unidad, pax in _minimo_de_hospedajes(unidades, total_pax)
+            ]
+
+    alojados = sum(opcion['pax'] for opcion in elegidos)
+    return {
+        'costo': sum((opcion['subtotal'] for opcion in elegidos), Decimal('0.00')),
+        'hospedajes': elegidos,
+        'alternativas': opciones[:alternativas],
+        'faltantes': max(total_pax - alojados, 0),
+        'noches': numero_noches,
+    }
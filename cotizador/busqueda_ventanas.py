@@ -0,0 +1,299 @@
+"""
+Búsqueda de la ventana de viaje más barata
+
+Dado un rango de fechas y un número de noches (p. ej. cualquier estadía de
+4 noches en marzo), busca las salidas más baratas con el mismo cálculo de
+calculate_quotation, sin cotizar cada ventana contra Amadeus:
+
+1. Cada ventana se toma de la caché de cotizaciones o, si sus consultas a
+   Amadeus ya están en la caché de respuestas, se calcula sin consultar.
+2. Para las demás se estima una cota inferior: los componentes locales
+   (alimentación, seguro, flota terrestre y marítima) no dependen de la
+   fecha, y el hotel y el vuelo se estiman con el menor precio de Amadeus
+   ya conocido en fechas cercanas (o, si no hay, con el precio local de
+   respaldo), menos una holgura (VENTANAS_HOLGURA).
+3. Las ventanas se cotizan por lotes, de la menor cota a la mayor (el
+   primero se reparte en el rango para tener precios de referencia). Las
+   consultas de cada lote se hacen en paralelo con un solo plazo. Tras cada
+   lote se descartan las ventanas cuya cota no mejora las N más baratas
+   ya calculadas.
+
+La búsqueda termina cuando no quedan ventanas que puedan mejorar el
+resultado, cuando se agota el presupuesto de tiempo (VENTANAS_PRESUPUESTO) o
+el de consultas a Amadeus (VENTANAS_FRACCION_CONSULTAS por ventana, y al
+menos las de una ventana para que un rango corto tenga resultado). La cota
+es una estimación: una ventana descartada podría resultar más barata si su
+precio en Amadeus cae muy por debajo del de las fechas vecinas.
+"""
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+
+from .cache_cotizaciones import buscar_costos, guardar_costos
+from .cotizacion import (
+    PLAZO_AMADEUS_DEFECTO, DatosDestino, calcular_costos, calcular_totales, consultar_amadeus, consultas_amadeus,
+    detalle_cotizacion, total_pasajeros,
+)
+
+
+MEJORES_DEFECTO = 5
+# Segundos que puede tomar una búsqueda
+PRESUPUESTO_DEFECTO = 10
+# Ventanas que se cotizan contra Amadeus en cada lote
+LOTE_DEFECTO = 4
+# Consultas a Amadeus permitidas por ventana del rango (en promedio)
+FRACCION_CONSULTAS_DEFECTO = 0.5
+# Fracción que se descuenta de los precios conocidos al estimar la cota
+HOLGURA_DEFECTO = Decimal('0.10')
+# Días alrededor de una ventana cuyos precios de Amadeus sirven para estimarla
+VECINDAD_DEFECTO = 3
+MAXIMO_VENTANAS_DEFECTO = 366
+
+SIN_RESPUESTA = {'success': False, 'error': 'Estimación con precios locales'}
+
+
+def ventanas_del_rango(fecha_desde, fecha_hasta, numero_noches):
+    """(fecha_inicio, fecha_fin) de las estadías de numero_noches que caben en el rango"""
+    duracion = timedelta(days=numero_noches)
+    ventanas = []
+    fecha = fecha_desde
+    while fecha + duracion <= fecha_hasta:
+        ventanas.append((fecha, fecha + duracion))
+        fecha += timedelta(days=1)
+    return ventanas
+
+
+def _repartidas(ventanas, cantidad):
+    """cantidad ventanas repartidas uniformemente en el rango"""
+    if len(ventanas) <= cantidad:
+        return ventanas
+    return [ventanas[int((indice + 0.5) * len(ventanas) / cantidad)] for indice in range(cantidad)]
+
+
+class _Busqueda:
+    """Estado de una búsqueda: ventanas, precios conocidos y contadores"""
+
+    def __init__(self, datos_form, destino, entidad_id, numero_noches, datos):
+        self.datos_form = datos_form
+        self.destino = destino
+        self.entidad_id = entidad_id
+        self.datos = datos
+        self.total_pax = total_pasajeros(datos_form)
+        self.medio = datos_form['medio_transporte']
+        self.utilidad = datos_form['porcentaje_utilidad']
+        self.ventanas = [
+            {'fecha_inicio': inicio, 'fecha_fin': fin, 'costos': None, 'total': None}
+            for inicio, fin in ventanas_del_rango(datos_form['fecha_inicio'], datos_form['fecha_fin'], numero_noches)
+        ]
+        # Precios de Amadeus conocidos por componente: [(fecha_inicio, precio)]
+        self.conocidos = {}
+        self._locales = None
+        self.desde_cache = 0
+        self.consultas = 0
+
+    def escenario(self, ventana):
+        return {**self.datos_form, 'fecha_inicio': ventana['fecha_inicio'], 'fecha_fin': ventana['fecha_fin']}
+
+    def consultas_de(self, ventana):
+        return consultas_amadeus(self.datos, self.datos_form['origen'], ventana['fecha_inicio'],
+                                 ventana['fecha_fin'], self.total_pax, self.medio)
+
+    def calcular(self, ventana, resultados):
+        """Cotiza la ventana con las respuestas de Amadeus dadas y la guarda en la caché"""
+        for nombre, resultado in resultados.items():
+            if resultado['success']:
+                self.conocidos.setdefault(nombre, []).append((ventana['fecha_inicio'], resultado['price']))
+        ventana['costos'] = calcular_costos(
+            self.destino, self.datos_form['origen'], ventana['fecha_inicio'], ventana['fecha_fin'],
+            self.total_pax, self.medio, datos=self.datos, resultados=resultados,
+        )
+        ventana['total'] = calcular_totales(ventana['costos'], self.utilidad)['total']
+        guardar_costos(ventana['clave'], ventana['costos'])
+
+    def locales(self, ventana):
+        """
+        Costos de la ventana solo con proveedores locales y el precio de
+        respaldo de cada consulta a Amadeus. Se calculan con la primera
+        ventana y se reutilizan en las demás: solo cambian con la fecha si
+        un convenio empieza o termina dentro del rango, y solo se usan para
+        estimar.
+        """
+        if self._locales is None:
+            consultas = self.consultas_de(ventana)
+            costos = calcular_costos(
+                self.destino, self.datos_form['origen'], ventana['fecha_inicio'], ventana['fecha_fin'],
+                self.total_pax, self.medio, datos=self.datos,
+                resultados={nombre: SIN_RESPUESTA for nombre in consultas},
+            )
+            respaldo = {}
+            if 'hospedaje' in consultas:
+                respaldo['hospedaje'] = costos['hospedaje']
+            if 'transporte_aereo' in consultas:
+                respaldo['transporte_aereo'] = (self.datos.en(ventana['fecha_inicio']).por_persona('aereo')
+                                                * Decimal(str(self.total_pax)))
+            self._locales = (costos, respaldo)
+        return self._locales
+
+    def cota(self, ventana):
+        """Estimación optimista del total de una ventana sin cotizar"""
+        costos, respaldo = self.locales(ventana)
+        holgura = Decimal('1') - Decimal(str(getattr(settings, 'VENTANAS_HOLGURA', HOLGURA_DEFECTO)))
+        vecindad = getattr(settings, 'VENTANAS_VECINDAD', VECINDAD_DEFECTO)
+
+        estimados = {}
+        for nombre, precio_local in respaldo.items():
+            if nombre in ventana['en_cache']:
+                # Precio exacto de la caché de respuestas
+                estimados[nombre] = ventana['en_cache'][nombre]['price']
+                continue
+            conocidos = self.conocidos.get(nombre, [])
+            cercanos = [precio for fecha, precio in conocidos
+                        if abs((fecha - ventana['fecha_inicio']).days) <= vecindad]
+            precios = cercanos or [precio for _, precio in conocidos]
+            # Sin precios de Amadeus conocidos se estima con el precio local de respaldo
+            estimados[nombre] = (min(precios) if precios else precio_local) * holgura
+
+        estimacion = dict(costos)
+        if 'hospedaje' in estimados:
+            estimacion['hospedaje'] = estimados['hospedaje']
+        if 'transporte_aereo' in estimados:
+            estimacion['transporte'] = costos['transporte'] - respaldo['transporte_aereo'] + estimados['transporte_aereo']
+        return calcular_totales(estimacion, self.utilidad)['total']
+
+    def umbral(self, mejores):
+        """Total de la N-ésima ventana más barata ya cotizada (None si hay menos de N)"""
+        totales = sorted(ventana['total'] for ventana in self.ventanas if ventana['total'] is not None)
+        return totales[mejores - 1] if len(totales) >= mejores else None
+
+
+def buscar_ventanas(datos_form, destino, entidad_id, numero_noches, mejores=None, presupuesto=None, datos=None):
+    """
+    Busca las ventanas de numero_noches más baratas entre
+    datos_form['fecha_inicio'] y datos_form['fecha_fin']. datos_form son los
+    datos limpios de un QuotationForm (el resto de campos se aplica a todas
+    las ventanas).
+
+    Retorna {'ventanas': [...], 'estadisticas': {...}}: las mejores
+    ventanas de la más barata a la más cara, cada una con sus fechas, su
+    total y el detalle de calculate_quotation; y las ventanas del rango,
+    las cotizadas, las tomadas de la caché, las consultas a Amadeus, las
+    descartadas por la cota, las que quedaron sin evaluar y el presupuesto
+    agotado ('tiempo', 'consultas' o None).
+    """
+    inicio = time.monotonic()
+    if mejores is None:
+        mejores = getattr(settings, 'VENTANAS_MEJORES', MEJORES_DEFECTO)
+    if presupuesto is None:
+        presupuesto = getattr(settings, 'VENTANAS_PRESUPUESTO', PRESUPUESTO_DEFECTO)
+    limite = inicio + presupuesto
+    lote = getattr(settings, 'VENTANAS_LOTE', LOTE_DEFECTO)
+    if datos is None:
+        datos = DatosDestino(destino)
+
+    busqueda = _Busqueda(datos_form, destino, entidad_id, numero_noches, datos)
+    maximo_consultas = int(len(busqueda.ventanas) * getattr(settings, 'VENTANAS_FRACCION_CONSULTAS', FRACCION_CONSULTAS_DEFECTO))
+
+    # Ventanas que se pueden cotizar sin consultar Amadeus
+    for ventana in busqueda.ventanas:
+        ventana['clave'], ventana['costos'] = buscar_costos(busqueda.escenario(ventana), entidad_id)
+        if ventana['costos'] is not None:
+            ventana['total'] = calcular_totales(ventana['costos'], busqueda.utilidad)['total']
+            busqueda.desde_cache += 1
+            continue
+        ventana['en_cache'] = {}
+        ventana['faltantes'] = {}
+        for nombre, (funcion, argumentos) in busqueda.consultas_de(ventana).items():
+            respuesta = funcion(*argumentos, solo_cache=True)
+            if respuesta['success']:
+                ventana['en_cache'][nombre] = respuesta
+            else:
+                ventana['faltantes'][nombre] = (funcion, argumentos)
+        if not ventana['faltantes']:
+            # Sin consultas a Amadeus o con todas sus respuestas en caché
+            busqueda.calcular(ventana, ventana['en_cache'])
+            if ventana['en_cache']:
+                busqueda.desde_cache += 1
+    # Un rango corto debe alcanzar al menos para las consultas de una ventana
+    maximo_consultas = max(maximo_consultas, max(
+        (len(ventana['faltantes']) for ventana in busqueda.ventanas if ventana['total'] is None), default=0,
+    ))
+
+    agotado = None
+    descartadas = []
+    while True:
+        umbral = busqueda.umbral(mejores)
+        pendientes = [ventana for ventana in busqueda.ventanas if ventana['total'] is None]
+        cotas = {id(ventana): busqueda.cota(ventana) for ventana in pendientes}
+        descartadas = [v for v in pendientes if umbral is not None and cotas[id(v)] >= umbral]
+        viables = [v for v in pendientes if umbral is None or cotas[id(v)] < umbral]
+        if not viables:
+            break
+        if time.monotonic() >= limite:
+            agotado = 'tiempo'
+            break
+        disponibles = maximo_consultas - busqueda.consultas
+        if disponibles < min(len(v['faltantes']) for v in viables):
+            agotado = 'consultas'
+            break
+
+        # Sin precios de referencia se reparte el lote en el rango; después se
+        # sigue de la menor cota a la mayor
+        if busqueda.conocidos:
+            # A igual cota, primero las más cercanas a la ventana más barata hasta ahora
+            cotizadas = [v for v in busqueda.ventanas if v['total'] is not None]
+            referencia = min(cotizadas, key=lambda v: v['total'])['fecha_inicio'] if cotizadas else viables[0]['fecha_inicio']
+            candidatas = sorted(viables, key=lambda v: (
+                cotas[id(v)], abs((v['fecha_inicio'] - referencia).days), v['fecha_inicio'],
+            ))
+        else:
+            candidatas = _repartidas(viables, lote)
+        elegidas = []
+        for ventana in candidatas:
+            if len(elegidas) == lote:
+                break
+            if len(ventana['faltantes']) <= disponibles:
+                elegidas.append(ventana)
+                disponibles -= len(ventana['faltantes'])
+
+        # Consultas del lote en paralelo, sin repetir las iguales
+        unicas = {}
+        for ventana in elegidas:
+            for consulta in ventana['faltantes'].values():
+                unicas.setdefault(consulta, str(len(unicas)))
+        plazo = min(getattr(settings, 'COTIZACION_PLAZO_AMADEUS', PLAZO_AMADEUS_DEFECTO), limite - time.monotonic())
+        respuestas = consultar_amadeus({compartida: consulta for consulta, compartida in unicas.items()}, plazo=max(plazo, 0))
+        busqueda.consultas += len(unicas)
+        for ventana in elegidas:
+            busqueda.calcular(ventana, {
+                **ventana['en_cache'],
+                **{nombre: respuestas[unicas[consulta]] for nombre, consulta in ventana['faltantes'].items()},
+            })
+
+    cotizadas = sorted(
+        (ventana for ventana in busqueda.ventanas if ventana['total'] is not None),
+        key=lambda ventana: (ventana['total'], ventana['fecha_inicio']),
+    )
+    sin_evaluar = len([v for v in busqueda.ventanas if v['total'] is None]) - len(descartadas)
+    return {
+        'ventanas': [
+            {
+                'fecha_inicio': ventana['fecha_inicio'].strftime('%Y-%m-%d'),
+                'fecha_fin': ventana['fecha_fin'].strftime('%Y-%m-%d'),
+                'total': float(ventana['total']),
+                'detalle': detalle_cotizacion(busqueda.escenario(ventana), destino, ventana['costos']),
+            }
+            for ventana in cotizadas[:mejores]
+        ],
+        'estadisticas': {
+            'ventanas': len(busqueda.ventanas),
+            'cotizadas': len(cotizadas),
+            'desde_cache': busqueda.desde_cache,
+            'consultas_amadeus': busqueda.consultas,
+            'descartadas': len(descartadas),
+            'sin_evaluar': sin_evaluar,
+            'agotado': agotado,
+            'segundos': round(time.monotonic() - inicio, 3),
+        },
+    }
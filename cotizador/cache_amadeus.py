@@ -0,0 +1,236 @@
+"""
+Caché de respuestas de Amadeus
+
+Guarda las respuestas de búsqueda de vuelos y de hoteles en dos niveles:
+un LRU en memoria del proceso (acotado y sin consultas a la base de datos)
+y la tabla RespuestaAmadeus, que se conserva entre reinicios y se comparte
+entre procesos. Cada endpoint tiene su propio TTL.
+
+Una respuesta vencida se sigue entregando durante una ventana adicional
+(stale-while-revalidate) mientras se renueva en segundo plano; pasada esa
+ventana se consulta de nuevo a Amadeus antes de responder. La tabla se
+limita a un número máximo de filas y descarta las de acceso más antiguo;
+los aciertos en memoria registran su acceso en la tabla a lo sumo una vez
+cada AMADEUS_CACHE_INTERVALO_ACCESO segundos por respuesta. Un TTL de 0
+desactiva la caché del endpoint.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+
+from .models import RespuestaAmadeus
+
+
+# TTL en segundos por endpoint
+TTL_DEFECTO = {
+    'vuelos': 15 * 60,
+    'hoteles': 30 * 60,
+}
+# Segundos después de vencida en que una respuesta aún se entrega mientras se renueva
+VENTANA_OBSOLETA_DEFECTO = 60 * 60
+MAX_ENTRADAS_DEFECTO = 5000
+MAX_MEMORIA_DEFECTO = 256
+# Segundos entre escrituras de ultimo_acceso de una misma respuesta por sus aciertos en memoria
+INTERVALO_ACCESO_DEFECTO = 5 * 60
+
+
+class CacheMemoria:
+    """
+    LRU en memoria, seguro entre hilos, de clave -> (respuesta, expira).
+    Recuerda además cuándo se registró en la base de datos el último acceso
+    a cada clave (ver registrar_acceso).
+    """
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self._entradas = OrderedDict()
+        self._registrados = {}
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                self._entradas.move_to_end(clave)
+            return entrada
+
+    def set(self, clave, respuesta, expira):
+        with self._lock:
+            self._entradas[clave] = (respuesta, expira)
+            self._entradas.move_to_end(clave)
+            # Quien guarda la entrada acaba de registrar su acceso en la base de datos
+            self._registrados[clave] = time.monotonic()
+            while len(self._entradas) > self.maximo:
+                descartada, _ = self._entradas.popitem(last=False)
+                self._registrados.pop(descartada, None)
+
+    def registrar_acceso(self, clave, intervalo):
+        """True si el último acceso a la clave se registró hace más de intervalo segundos (y lo marca como registrado)"""
+        ahora = time.monotonic()
+        with self._lock:
+            registrado = self._registrados.get(clave)
+            if registrado is not None and ahora - registrado < intervalo:
+                return False
+            self._registrados[clave] = ahora
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entradas.clear()
+            self._registrados.clear()
+
+
+_memoria = CacheMemoria(getattr(settings, 'AMADEUS_CACHE_MAX_MEMORIA', MAX_MEMORIA_DEFECTO))
+
+# Claves que se están renovando en segundo plano en este proceso
+_revalidando = set()
+_revalidando_lock = threading.Lock()
+
+
+def clave_respuesta(endpoint, parametros):
+    """Hash del endpoint y los parámetros (sin importar el orden ni el tipo de los valores)"""
+    canonico = json.dumps([endpoint, {campo: str(valor) for campo, valor in parametros.items()}], sort_keys=True)
+    return hashlib.sha256(canonico.encode('utf-8')).hexdigest()
+
+
+def _ttl(endpoint):
+    return getattr(settings, 'AMADEUS_CACHE_TTL', TTL_DEFECTO).get(endpoint, TTL_DEFECTO[endpoint])
+
+
+def _leer(clave):
+    """(respuesta, expira) desde la memoria o, si no está, desde la base de datos"""
+    entrada = _memoria.get(clave)
+    if entrada is not None:
+        # Sin registrar los aciertos en memoria podar() descartaría las
+        # respuestas más usadas; se escriben a lo sumo una vez por intervalo
+        intervalo = getattr(settings, 'AMADEUS_CACHE_INTERVALO_ACCESO', INTERVALO_ACCESO_DEFECTO)
+        if _memoria.registrar_acceso(clave, intervalo):
+            RespuestaAmadeus.objects.filter(clave=clave).update(ultimo_acceso=timezone.now())
+        return entrada
+
+    fila = RespuestaAmadeus.objects.filter(clave=clave).values('pk', 'respuesta', 'expira').first()
+    if fila is None:
+        return None
+    RespuestaAmadeus.objects.filter(pk=fila['pk']).update(ultimo_acceso=timezone.now())
+    _memoria.set(clave, fila['respuesta'], fila['expira'])
+    return fila['respuesta'], fila['expira']
+
+
+def _guardar(endpoint, clave, parametros, respuesta):
+    ahora = timezone.now()
+    expira = ahora + timedelta(seconds=_ttl(endpoint))
+    valores = {
+        'endpoint': endpoint, 'parametros': {campo: str(valor) for campo, valor in parametros.items()},
+        'respuesta': respuesta, 'creado': ahora, 'expira': expira, 'ultimo_acceso': ahora,
+    }
+    try:
+        with transaction.atomic():
+            _, creada = RespuestaAmadeus.objects.update_or_create(clave=clave, defaults=valores)
+    except IntegrityError:
+        # Otro proceso la creó al mismo tiempo
+        RespuestaAmadeus.objects.filter(clave=clave).update(**valores)
+        creada = False
+    _memoria.set(clave, respuesta, expira)
+    if creada:
+        podar()
+    return respuesta
+
+
+def podar(maximo=None):
+    """Elimina las respuestas de acceso más antiguo que excedan el máximo de filas"""
+    if maximo is None:
+        maximo = getattr(settings, 'AMADEUS_CACHE_MAX_ENTRADAS', MAX_ENTRADAS_DEFECTO)
+    exceso = RespuestaAmadeus.objects.count() - maximo
+    if exceso <= 0:
+        return 0
+    antiguas = list(RespuestaAmadeus.objects.order_by('ultimo_acceso').values_list('pk', flat=True)[:exceso])
+    return RespuestaAmadeus.objects.filter(pk__in=antiguas).delete()[0]
+
+
+def _revalidar(endpoint, clave, parametros, consultar):
+    try:
+        _guardar(endpoint, clave, parametros, consultar())
+    except Exception as e:
+        print(f"No se pudo renovar la respuesta de Amadeus en caché: {str(e)}")  # Mensaje de debug
+    finally:
+        with _revalidando_lock:
+            _revalidando.discard(clave)
+        # El hilo no pertenece a una petición: cerrar su conexión a la base de datos
+        connections.close_all()
+
+
+def _programar_revalidacion(endpoint, clave, parametros, consultar):
+    with _revalidando_lock:
+        if clave in _revalidando:
+            return
+        _revalidando.add(clave)
+    threading.Thread(
+        target=_revalidar, args=(endpoint, clave, parametros, consultar), daemon=True,
+    ).start()
+
+
+def obtener(endpoint, parametros, consultar):
+    """
+    Retorna la respuesta de Amadeus para el endpoint y los parámetros.
+    consultar() hace la petición real; solo se llama si no hay una respuesta
+    vigente (o dentro de la ventana de renovación) en caché. Los errores
+    no se guardan.
+    """
+    if _ttl(endpoint) <= 0:
+        # Caché desactivada para el endpoint
+        return consultar()
+
+    clave = clave_respuesta(endpoint, parametros)
+    entrada = _leer(clave)
+    if entrada is not None:
+        respuesta, expira = entrada
+        ahora = timezone.now()
+        if ahora < expira:
+            return respuesta
+        ventana = getattr(settings, 'AMADEUS_CACHE_VENTANA_OBSOLETA', VENTANA_OBSOLETA_DEFECTO)
+        if ahora < expira + timedelta(seconds=ventana):
+            _programar_revalidacion(endpoint, clave, parametros, consultar)
+            return respuesta
+
+    return _guardar(endpoint, clave, parametros, consultar())
+
+
+def no_vencida(endpoint, parametros):
+    """Respuesta en caché para el endpoint y los parámetros que aún no vence, o None"""
+    if _ttl(endpoint) <= 0:
+        return None
+    entrada = _leer(clave_respuesta(endpoint, parametros))
+    if entrada is None or timezone.now() >= entrada[1]:
+        return None
+    return entrada[0]
+
+
+def vigente(endpoint, parametros):
+    """
+    Respuesta en caché para el endpoint y los parámetros sin consultar a
+    Amadeus: la vigente o, dentro de la ventana de renovación, la vencida.
+    Retorna None si no hay.
+    """
+    if _ttl(endpoint) <= 0:
+        return None
+    entrada = _leer(clave_respuesta(endpoint, parametros))
+    if entrada is None:
+        return None
+    respuesta, expira = entrada
+    ventana = getattr(settings, 'AMADEUS_CACHE_VENTANA_OBSOLETA', VENTANA_OBSOLETA_DEFECTO)
+    if timezone.now() < expira + timedelta(seconds=ventana):
+        return respuesta
+    return None
+
+
+def limpiar():
+    """Vacía ambos niveles de la caché"""
+    _memoria.clear()
+    RespuestaAmadeus.objects.all().delete()
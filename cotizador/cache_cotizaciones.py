@@ -0,0 +1,261 @@
+"""
+Caché de cotizaciones
+
+Guarda los costos calculados por cotizacion.calcular_costos() con una clave
+derivada de los datos del QuotationForm y de la entidad de la agencia. El
+porcentaje de utilidad no forma parte de la clave: se aplica después, así
+que cambiarlo reutiliza la entrada.
+
+Cada destino tiene una versión guardada en la caché que forma parte de la
+clave; las señales de cotizador.signals la cambian cuando se modifica algo
+que afecta al destino (proveedores, convenios, rutas), con lo que las
+entradas anteriores dejan de encontrarse y expiran por su TTL. Cambios que
+afectan a todos los destinos (p. ej. transporte aéreo con convenio) cambian
+la versión global.
+
+Con las mismas versiones se guardan los proveedores de cada destino
+(DatosDestino.valores()), que no dependen del grupo ni de las fechas: una
+cotización del mismo destino con otros pasajeros o fechas no vuelve a
+consultarlos.
+"""
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import CandidatoProveedor
+
+
+PREFIJO = 'cotizacion'
+
+# Segundos que se conserva una cotización calculada solo con proveedores locales
+TTL_DEFECTO = 60 * 60
+# Segundos que se conserva una cotización que consultó precios de Amadeus
+TTL_AMADEUS_DEFECTO = 15 * 60
+# Segundos que se conserva una cotización con precios locales de respaldo
+# porque Amadeus falló o no respondió a tiempo: se vuelve a consultar pronto
+TTL_RESPALDO_DEFECTO = 60
+
+CLAVE_ACIERTOS = f'{PREFIJO}:aciertos'
+CLAVE_FALLOS = f'{PREFIJO}:fallos'
+
+# Campos del QuotationForm que determinan los costos
+CAMPOS_CLAVE = [
+    'origen', 'destino', 'fecha_inicio', 'fecha_fin', 'adultos', 'ninios',
+    'bebes', 'adultos_mayores', 'estudiantes', 'medio_transporte',
+]
+
+
+def _clave_version(destino_id=None):
+    return f'{PREFIJO}:version:{destino_id if destino_id is not None else "global"}'
+
+
+def version_de_clave(clave):
+    """
+    Versión guardada en una clave de la caché. Si no existe, o fue
+    descartada por la caché, se crea una nueva: nunca vuelve a un valor
+    anterior, por lo que no se pueden leer entradas obsoletas. La usan
+    también los índices de convenios y de rutas.
+    """
+    version = cache.get(clave)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(clave, version, timeout=None):
+            version = cache.get(clave) or version
+    return version
+
+
+def renovar_version(clave):
+    """Cambia la versión de la clave: lo guardado con la anterior deja de encontrarse"""
+    cache.set(clave, uuid.uuid4().hex, timeout=None)
+
+
+def _version(destino_id=None):
+    """Versión actual de un destino (o la global)"""
+    return version_de_clave(_clave_version(destino_id))
+
+
+def clave_cotizacion(datos, entidad_id):
+    """Clave de caché para los datos limpios de un QuotationForm y la entidad de la agencia"""
+    canonico = {}
+    for campo in CAMPOS_CLAVE:
+        valor = datos.get(campo)
+        if campo == 'medio_transporte':
+            valor = sorted(valor or [])
+        elif hasattr(valor, 'isoformat'):
+            valor = valor.isoformat()
+        elif campo == 'origen':
+            valor = ' '.join(str(valor or '').lower().split())
+        canonico[campo] = valor
+    canonico['entidad'] = entidad_id
+
+    resumen = hashlib.sha256(
+        json.dumps(canonico, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+    return f'{PREFIJO}:{_version()}:{_version(datos.get("destino"))}:{resumen}'
+
+
+def _incrementar(clave):
+    try:
+        cache.incr(clave)
+    except ValueError:
+        # El contador aún no existe (o fue descartado)
+        if not cache.add(clave, 1, timeout=None):
+            cache.incr(clave)
+
+
+def buscar_costos(datos, entidad_id, clave=None):
+    """
+    Retorna (clave, costos) desde la caché; costos es None si no están.
+    clave es la de clave_cotizacion() si ya se calculó.
+    """
+    if clave is None:
+        clave = clave_cotizacion(datos, entidad_id)
+    costos = cache.get(clave)
+    _incrementar(CLAVE_ACIERTOS if costos is not None else CLAVE_FALLOS)
+    return clave, costos
+
+
+def guardar_costos(clave, costos):
+    """Guarda los costos calculados; el TTL depende de si incluyen precios de Amadeus o de respaldo"""
+    if costos.get('respaldo'):
+        ttl = getattr(settings, 'COTIZACION_CACHE_TTL_RESPALDO', TTL_RESPALDO_DEFECTO)
+    elif costos.get('amadeus'):
+        ttl = getattr(settings, 'COTIZACION_CACHE_TTL_AMADEUS', TTL_AMADEUS_DEFECTO)
+    else:
+        ttl = getattr(settings, 'COTIZACION_CACHE_TTL', TTL_DEFECTO)
+    if ttl:
+        cache.set(clave, costos, timeout=ttl)
+
+
+def obtener_costos(datos, entidad_id, calcular):
+    """
+    Retorna los costos de la cotización desde la caché o, si no están,
+    llamando a calcular() y guardando el resultado.
+    """
+    clave, costos = buscar_costos(datos, entidad_id)
+    if costos is None:
+        costos = calcular()
+        guardar_costos(clave, costos)
+    return costos
+
+
+def buscar_proveedores(destino_id):
+    """
+    Retorna (clave, valores) de los proveedores del destino desde la caché;
+    valores (para DatosDestino) es None si no están.
+    """
+    clave = f'{PREFIJO}:proveedores:{_version()}:{_version(destino_id)}:{destino_id}'
+    return clave, cache.get(clave)
+
+
+def guardar_proveedores(clave, datos, anteriores=None):
+    """Guarda los proveedores consultados por datos (un DatosDestino) si hay alguno que no estaba en anteriores"""
+    valores = datos.valores()
+    if anteriores is not None and len(valores) <= len(anteriores):
+        return
+    ttl = getattr(settings, 'COTIZACION_CACHE_TTL', TTL_DEFECTO)
+    if ttl:
+        cache.set(clave, valores, timeout=ttl)
+
+
+def invalidar_destinos(destino_ids):
+    """Invalida las cotizaciones guardadas de los destinos indicados"""
+    cache.set_many({_clave_version(destino_id): uuid.uuid4().hex for destino_id in set(destino_ids)},
+                   timeout=None)
+
+
+def invalidar_todo():
+    """Invalida todas las cotizaciones guardadas"""
+    renovar_version(_clave_version())
+
+
+def destinos_de_proveedor(categoria, proveedor_id):
+    """Ids de los destinos para los que el proveedor es candidato"""
+    if categoria is None or proveedor_id is None:
+        return set()
+    return set(CandidatoProveedor.objects.filter(
+        categoria=categoria, proveedor_id=proveedor_id
+    ).values_list('destino_id', flat=True))
+
+
+def destinos_de_entidad(entidad_id):
+    """Ids de los destinos para los que algún proveedor de la entidad es candidato"""
+    from .indice_proveedores import MODELOS_POR_CATEGORIA
+
+    if entidad_id is None:
+        return set()
+    destinos = set()
+    for categoria, modelo in MODELOS_POR_CATEGORIA.items():
+        destinos.update(CandidatoProveedor.objects.filter(
+            categoria=categoria,
+            proveedor_id__in=modelo.objects.filter(entidad_id=entidad_id).values('pk'),
+        ).values_list('destino_id', flat=True))
+    return destinos
+
+
+def destinos_de_agencias(agencias):
+    """
+    Ids de los destinos de las agencias (ids o subconsulta). Las rutas solo
+    se usan en los destinos de su agencia, pero con los caminos de varios
+    tramos una ruta puede cambiar el transporte de cualquiera de ellos
+    """
+    from .models import Destino
+
+    return set(Destino.objects.filter(entidad_id__in=agencias).values_list('pk', flat=True))
+
+
+def afectados(instancia):
+    """
+    Destinos cuyas cotizaciones dependen de la instancia en su estado actual.
+    Retorna (ids de destinos, afecta_a_todos).
+    """
+    from .indice_proveedores import categoria_de
+    from .models import ConvenioAgencia, Destino, Entidad, RutaTransporte, Transporte
+
+    if isinstance(instancia, Destino):
+        return {instancia.pk}, False
+    if isinstance(instancia, RutaTransporte):
+        agencias = ConvenioAgencia.objects.filter(pk=instancia.convenio_agencia_id).values('entidad_agencia_id')
+        return destinos_de_agencias(agencias), False
+    if isinstance(instancia, Entidad):
+        return destinos_de_entidad(instancia.pk), False
+    if isinstance(instancia, ConvenioAgencia):
+        # Los convenios de transporte habilitan el transporte aéreo para cualquier destino
+        destinos = destinos_de_entidad(instancia.entidad_convenio_id)
+        if RutaTransporte.objects.filter(convenio_agencia_id=instancia.pk).exists():
+            destinos |= destinos_de_agencias([instancia.entidad_agencia_id])
+        return destinos, instancia.tipo_convenio == 'Transporte'
+    # El transporte aéreo con convenio se cotiza sin importar el destino
+    afecta_a_todos = isinstance(instancia, Transporte) and instancia.tipoTransporte == 'aereo'
+    destinos = destinos_de_proveedor(categoria_de(instancia), instancia.pk)
+    if isinstance(instancia, Transporte):
+        destinos |= destinos_de_agencias(RutaTransporte.objects.filter(
+            transporte_id=instancia.pk
+        ).values('convenio_agencia__entidad_agencia_id'))
+    return destinos, afecta_a_todos
+
+
+def invalidar(destino_ids, afecta_a_todos=False):
+    if afecta_a_todos:
+        invalidar_todo()
+    elif destino_ids:
+        invalidar_destinos(destino_ids)
+
+
+def estadisticas():
+    """Contadores de aciertos y fallos de la caché de cotizaciones"""
+    aciertos = cache.get(CLAVE_ACIERTOS, 0)
+    fallos = cache.get(CLAVE_FALLOS, 0)
+    total = aciertos + fallos
+    return {
+        'aciertos': aciertos,
+        'fallos': fallos,
+        'tasa_aciertos': aciertos / total if total else 0.0,
+    }
+
+
+def reiniciar_estadisticas():
+    cache.delete_many([CLAVE_ACIERTOS, CLAVE_FALLOS])
@@ -0,0 +1,189 @@
+"""
+Resolución de ciudades a códigos IATA
+
+Construye una sola vez una tabla de búsqueda (claves normalizadas sin tildes)
+a partir del catálogo de municipios y de static/data/aeropuertos_colombia.csv,
+que lista los aeropuertos con vuelos comerciales. Cada municipio queda
+asociado a un aeropuerto, en este orden:
+
+1. el aeropuerto ubicado en el municipio o que lo atiende explícitamente
+   (columna municipios_atendidos, p. ej. Medellín -> MDE en Rionegro);
+2. el aeropuerto principal de su departamento (el primero del CSV, o el
+   que lo atiende según departamentos_atendidos, p. ej. Boyacá -> BOG).
+
+El catálogo no tiene coordenadas, así que el "aeropuerto más cercano" se
+aproxima por municipio y departamento. Las búsquedas son por diccionario y
+deterministas. Los nombres que no se pueden resolver se registran en la
+caché de Django, compartida por los procesos web y los comandos, para
+revisarlos con el comando revisar_codigos_iata.
+"""
+import csv
+import hashlib
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .ubicaciones import PAISES_IGNORADOS, catalogo_colombia, normalizar_texto
+
+
+RUTA_AEROPUERTOS = settings.BASE_DIR / 'static' / 'data' / 'aeropuertos_colombia.csv'
+
+# Código IATA escrito entre paréntesis, p. ej. 'Bogotá (BOG)'
+PATRON_CODIGO = re.compile(r'\(([A-Za-z]{3})\)')
+
+# Nombres sin resolver: cada uno tiene un contador de consultas y, la
+# primera vez, se anota en la siguiente posición de una lista numerada
+PREFIJO_SIN_RESOLVER = 'iata:sin_resolver'
+CLAVE_CANTIDAD_SIN_RESOLVER = f'{PREFIJO_SIN_RESOLVER}:cantidad'
+
+
+def _lista(valor):
+    return [parte.strip() for parte in (valor or '').split(';') if parte.strip()]
+
+
+@lru_cache(maxsize=1)
+def tabla_iata():
+    """
+    Tabla de búsqueda con tres diccionarios:
+    'municipios' (clave_departamento, clave_municipio) -> código,
+    'nombres' nombre normalizado -> código (municipios sin ambigüedad,
+    departamentos, nombres de aeropuertos y los propios códigos) y
+    'aeropuertos' código -> fila del CSV.
+    """
+    with open(RUTA_AEROPUERTOS, encoding='utf-8', newline='') as archivo:
+        aeropuertos = list(csv.DictReader(archivo))
+
+    por_municipio = {}
+    por_departamento = {}
+    nombres = {}
+    for aeropuerto in aeropuertos:
+        codigo = aeropuerto['iata']
+        clave_departamento = normalizar_texto(aeropuerto['departamento'])
+        for municipio in [aeropuerto['municipio'], *_lista(aeropuerto['municipios_atendidos'])]:
+            por_municipio.setdefault((clave_departamento, normalizar_texto(municipio)), codigo)
+        por_departamento.setdefault(clave_departamento, codigo)
+        for departamento in _lista(aeropuerto['departamentos_atendidos']):
+            por_departamento.setdefault(normalizar_texto(departamento), codigo)
+        nombres[codigo] = codigo
+        nombres[normalizar_texto(aeropuerto['aeropuerto'])] = codigo
+
+    departamentos, municipios = catalogo_colombia()
+    tabla_municipios = {}
+    for clave_municipio, claves_departamento in municipios.items():
+        for clave_departamento in claves_departamento:
+            codigo = por_municipio.get((clave_departamento, clave_municipio)) or por_departamento.get(clave_departamento)
+            if codigo:
+                tabla_municipios[(clave_departamento, clave_municipio)] = codigo
+
+    for clave_departamento in departamentos:
+        if clave_departamento in por_departamento:
+            nombres.setdefault(clave_departamento, por_departamento[clave_departamento])
+
+    # Un nombre de municipio solo se resuelve sin departamento si no es
+    # ambiguo: o todos sus homónimos usan el mismo aeropuerto, o solo uno de
+    # ellos tiene (o es atendido por) un aeropuerto propio, como Armenia (Quindío)
+    for clave_municipio, claves_departamento in municipios.items():
+        codigos = {tabla_municipios.get((d, clave_municipio)) for d in claves_departamento} - {None}
+        propios = {por_municipio[(d, clave_municipio)] for d in claves_departamento if (d, clave_municipio) in por_municipio}
+        if len(codigos) == 1:
+            nombres.setdefault(clave_municipio, codigos.pop())
+        elif len(propios) == 1:
+            nombres.setdefault(clave_municipio, propios.pop())
+
+    return {
+        'municipios': tabla_municipios,
+        'nombres': nombres,
+        'aeropuertos': {aeropuerto['iata']: aeropuerto for aeropuerto in aeropuertos},
+    }
+
+
+def _resolver(texto):
+    tabla = tabla_iata()
+
+    codigo = PATRON_CODIGO.search(texto or '')
+    if codigo and codigo.group(1).upper() in tabla['aeropuertos']:
+        return codigo.group(1).upper()
+
+    # Sin lo que esté entre paréntesis: 'Bogotá (El Dorado)' -> 'Bogotá'
+    limpio = (texto or '').split('(')[0]
+    clave = normalizar_texto(limpio)
+    if clave in tabla['nombres']:
+        return tabla['nombres'][clave]
+
+    partes = [normalizar_texto(parte) for parte in limpio.split(',')]
+    partes = [parte for parte in partes if parte and parte not in PAISES_IGNORADOS]
+    departamentos, _ = catalogo_colombia()
+    clave_departamento = next((parte for parte in reversed(partes) if parte in departamentos), '')
+    for parte in partes:
+        if clave_departamento and (clave_departamento, parte) in tabla['municipios']:
+            return tabla['municipios'][(clave_departamento, parte)]
+    for parte in partes:
+        if parte in tabla['nombres']:
+            return tabla['nombres'][parte]
+    return None
+
+
+def resolver_iata(texto):
+    """
+    Código IATA del aeropuerto que atiende a una ciudad, municipio,
+    departamento o aeropuerto escrito como texto libre ('Medellín',
+    'Salento, Quindío', 'Bogotá (BOG)'). Retorna None si no se reconoce y
+    registra el nombre para su revisión.
+    """
+    codigo = _resolver(texto)
+    if codigo is None and texto:
+        _registrar_sin_resolver(' '.join(str(texto).split()))
+    return codigo
+
+
+def resolver_iata_lote(textos):
+    """Resuelve varios nombres a la vez. Retorna un diccionario texto -> código (o None)"""
+    return {texto: resolver_iata(texto) for texto in dict.fromkeys(textos)}
+
+
+def _clave_conteo(nombre):
+    return f"{PREFIJO_SIN_RESOLVER}:conteo:{hashlib.sha256(nombre.encode('utf-8')).hexdigest()[:32]}"
+
+
+def _clave_nombre(posicion):
+    return f'{PREFIJO_SIN_RESOLVER}:nombre:{posicion}'
+
+
+def _registrar_sin_resolver(nombre):
+    clave = _clave_conteo(nombre)
+    if cache.add(clave, 1, timeout=None):
+        # Primera consulta del nombre: se anota en la lista
+        cache.add(CLAVE_CANTIDAD_SIN_RESOLVER, 0, timeout=None)
+        cache.set(_clave_nombre(cache.incr(CLAVE_CANTIDAD_SIN_RESOLVER)), nombre, timeout=None)
+        return
+    try:
+        cache.incr(clave)
+    except ValueError:
+        # El contador fue descartado entre add e incr
+        cache.add(clave, 1, timeout=None)
+
+
+def _claves_de_nombres():
+    cantidad = cache.get(CLAVE_CANTIDAD_SIN_RESOLVER, 0)
+    return [_clave_nombre(posicion) for posicion in range(1, cantidad + 1)]
+
+
+def nombres_sin_resolver():
+    """
+    Nombres que no se pudieron resolver en cualquier proceso que comparta la
+    caché, con su número de consultas, del más consultado al menos
+    """
+    claves = _claves_de_nombres()
+    guardados = cache.get_many(claves)
+    nombres = list(dict.fromkeys(guardados[clave] for clave in claves if clave in guardados))
+    conteos = cache.get_many([_clave_conteo(nombre) for nombre in nombres])
+    return sorted(((nombre, conteos.get(_clave_conteo(nombre), 0)) for nombre in nombres),
+                  key=lambda fila: -fila[1])
+
+
+def limpiar_sin_resolver():
+    claves = _claves_de_nombres()
+    nombres = cache.get_many(claves).values()
+    cache.delete_many([*claves, *(_clave_conteo(nombre) for nombre in nombres), CLAVE_CANTIDAD_SIN_RESOLVER])
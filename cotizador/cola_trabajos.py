@@ -0,0 +1,238 @@
+"""
+Cola de trabajos de cotización en la base de datos
+
+Las cotizaciones grandes (lotes, barridos, búsquedas de ventanas o una
+cotización que espera a Amadeus) pueden tardar varios segundos y ocupar un
+worker WSGI todo ese tiempo. Con la cola, la vista guarda un
+TrabajoCotizacion y retorna su id de inmediato; el comando
+procesar_trabajos lo ejecuta y el cliente consulta el resultado en
+trabajos/<id>/.
+
+La cola usa la misma base de datos (también SQLite), sin broker externo:
+
+- un trabajo se toma con un UPDATE condicionado a su estado anterior, así
+  que si dos trabajadores intentan tomar el mismo solo a uno le afecta una
+  fila; no hace falta SELECT ... FOR UPDATE, que SQLite no tiene;
+- el trabajador lo reserva por TRABAJOS_RESERVA segundos; si muere, otro lo
+  vuelve a tomar cuando vence la reserva;
+- si la ejecución lanza una excepción se reintenta con espera exponencial
+  (TRABAJOS_ESPERA_BASE, el doble en cada intento) hasta maximo_intentos;
+  los errores de validación no se reintentan: son el resultado del trabajo.
+
+Los resultados tienen la misma forma que la respuesta de la vista síncrona
+equivalente.
+"""
+import json
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Destino, TrabajoCotizacion
+
+
+MAXIMO_INTENTOS_DEFECTO = 3
+ESPERA_BASE_DEFECTO = 5  # segundos
+RESERVA_DEFECTO = 300  # segundos
+
+# Funciones que ejecutan cada tipo de trabajo: función(parametros, entidad) -> resultado
+EJECUTORES = {}
+
+
+def ejecutor(tipo):
+    """Registra la función que ejecuta los trabajos de un tipo"""
+    def registrar(funcion):
+        EJECUTORES[tipo] = funcion
+        return funcion
+    return registrar
+
+
+def parametros_de(datos):
+    """Datos limpios de un formulario como parámetros JSON del trabajo (fechas y decimales como texto)"""
+    return json.loads(json.dumps(datos, cls=DjangoJSONEncoder))
+
+
+def nombre_trabajador():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def encolar(tipo, parametros, entidad=None, maximo_intentos=None):
+    """Guarda un trabajo pendiente y lo retorna"""
+    if tipo not in EJECUTORES:
+        raise ValueError(f'Tipo de trabajo desconocido: {tipo}')
+    if maximo_intentos is None:
+        maximo_intentos = getattr(settings, 'TRABAJOS_MAXIMO_INTENTOS', MAXIMO_INTENTOS_DEFECTO)
+    return TrabajoCotizacion.objects.create(
+        tipo=tipo, parametros=parametros, entidad=entidad, maximo_intentos=maximo_intentos,
+        disponible_desde=timezone.now(),
+    )
+
+
+def _espera(intentos):
+    """Segundos antes del siguiente intento: ESPERA_BASE, 2 x ESPERA_BASE, 4 x ESPERA_BASE, ..."""
+    base = getattr(settings, 'TRABAJOS_ESPERA_BASE', ESPERA_BASE_DEFECTO)
+    return base * 2 ** max(intentos - 1, 0)
+
+
+def tomar(trabajador=None):
+    """
+    Toma el siguiente trabajo disponible (pendiente y sin espera, o en
+    proceso con la reserva vencida) y lo reserva para el trabajador.
+    Retorna el trabajo o None si no hay ninguno.
+    """
+    trabajador = trabajador or nombre_trabajador()
+    ahora = timezone.now()
+    reserva = getattr(settings, 'TRABAJOS_RESERVA', RESERVA_DEFECTO)
+    candidatos = TrabajoCotizacion.objects.filter(
+        Q(estado='pendiente', disponible_desde__lte=ahora) | Q(estado='en_proceso', reservado_hasta__lt=ahora)
+    ).order_by('disponible_desde', 'id').values_list('pk', 'estado', 'reservado_hasta', 'intentos', 'maximo_intentos')
+
+    for pk, estado, reservado_hasta, intentos, maximo_intentos in candidatos[:10]:
+        # Solo se actualiza si nadie lo tomó desde la consulta anterior
+        mismo_estado = TrabajoCotizacion.objects.filter(pk=pk, estado=estado, reservado_hasta=reservado_hasta)
+        if estado == 'en_proceso' and intentos >= maximo_intentos:
+            # El trabajador murió en el último intento
+            mismo_estado.update(estado='fallido', terminado=ahora, reservado_hasta=None,
+                                error='El trabajo no terminó dentro de su reserva')
+            continue
+        tomados = mismo_estado.update(
+            estado='en_proceso', trabajador=trabajador, reservado_hasta=ahora + timedelta(seconds=reserva),
+            iniciado=ahora, intentos=F('intentos') + 1,
+        )
+        if tomados:
+            return TrabajoCotizacion.objects.select_related('entidad').get(pk=pk)
+    return None
+
+
+def ejecutar(trabajo):
+    """
+    Ejecuta un trabajo tomado con tomar() y guarda su resultado, o lo
+    programa para reintentarlo si falló. Retorna el estado final.
+    """
+    reservado = TrabajoCotizacion.objects.filter(pk=trabajo.pk, estado='en_proceso', trabajador=trabajo.trabajador)
+    try:
+        resultado = EJECUTORES[trabajo.tipo](trabajo.parametros, trabajo.entidad)
+    except Exception as e:
+        print(f"Error en el trabajo {trabajo.pk} (intento {trabajo.intentos}): {str(e)}")  # Mensaje de debug
+        if trabajo.intentos < trabajo.maximo_intentos:
+            estado = 'pendiente'
+            reservado.update(estado=estado, error=str(e), trabajador='', reservado_hasta=None,
+                             disponible_desde=timezone.now() + timedelta(seconds=_espera(trabajo.intentos)))
+        else:
+            estado = 'fallido'
+            reservado.update(estado=estado, error=str(e), reservado_hasta=None, terminado=timezone.now())
+        return estado
+
+    reservado.update(estado='completado', resultado=parametros_de(resultado), error='', reservado_hasta=None,
+                     terminado=timezone.now())
+    return 'completado'
+
+
+def ejecutar_en_hilo(trabajo):
+    """ejecutar() desde un hilo del trabajador, cerrando su conexión a la base de datos al terminar"""
+    try:
+        return ejecutar(trabajo)
+    finally:
+        connections.close_all()
+
+
+def procesar_pendientes(trabajador=None):
+    """Ejecuta uno a uno los trabajos disponibles hasta vaciar la cola; retorna cuántos se ejecutaron"""
+    ejecutados = 0
+    while (trabajo := tomar(trabajador)) is not None:
+        ejecutar(trabajo)
+        ejecutados += 1
+    return ejecutados
+
+
+def estado_trabajo(trabajo):
+    """Estado de un trabajo para la respuesta JSON; incluye el resultado si terminó"""
+    respuesta = {
+        'trabajo_id': trabajo.pk,
+        'tipo': trabajo.tipo,
+        'estado': trabajo.estado,
+        'intentos': trabajo.intentos,
+        'creado': trabajo.creado,
+        'terminado': trabajo.terminado,
+    }
+    if trabajo.estado == 'completado':
+        respuesta['resultado'] = trabajo.resultado
+    elif trabajo.error:
+        respuesta['error'] = trabajo.error
+    return respuesta
+
+
+def _destino(datos):
+    return Destino.objects.filter(pk=datos['destino']).first()
+
+
+def _destino_no_encontrado(datos):
+    return {'success': False, 'error': f'Destino con ID {datos["destino"]} no encontrado'}
+
+
+@ejecutor('cotizacion')
+def _cotizacion(parametros, entidad):
+    from .cotizaciones_guardadas import cotizar
+    from .forms import QuotationForm
+
+    form = QuotationForm(parametros, entidad_usuario=entidad)
+    if not form.is_valid():
+        return {'success': False, 'errors': form.errors}
+    destino = _destino(form.cleaned_data)
+    if destino is None:
+        return _destino_no_encontrado(form.cleaned_data)
+    cotizacion = cotizar(form.cleaned_data, destino, entidad, guardar=bool(parametros.get('guardar')))
+    return {'success': True, 'cotizacion_id': cotizacion.pk, 'vista_previa': getattr(cotizacion, 'vista_previa', None),
+            'detalle': cotizacion.detalle}
+
+
+@ejecutor('lote')
+def _lote(parametros, entidad):
+    from .cotizacion_lote import cotizar_lote
+
+    escenarios = parametros.get('escenarios')
+    if not isinstance(escenarios, list) or not escenarios:
+        return {'success': False, 'error': 'Se requiere una lista de escenarios'}
+    resultados, estadisticas = cotizar_lote(escenarios, entidad)
+    return {'success': True, 'resultados': resultados, 'estadisticas': estadisticas}
+
+
+@ejecutor('barrido')
+def _barrido(parametros, entidad):
+    from .cotizacion_barrido import barrido_cotizacion
+    from .forms import BarridoCotizacionForm
+
+    form = BarridoCotizacionForm(parametros, entidad_usuario=entidad)
+    if not form.is_valid():
+        return {'success': False, 'errors': form.errors}
+    datos = form.cleaned_data
+    destino = _destino(datos)
+    if destino is None:
+        return _destino_no_encontrado(datos)
+    barrido = barrido_cotizacion(
+        destino, datos['pax'], datos['temporadas'], datos['fecha_inicio'], datos['fecha_fin'],
+        datos['medio_transporte'], datos['porcentaje_utilidad'], origen=datos['origen'],
+    )
+    return {'success': True, 'destino': destino.nombre, 'barrido': barrido}
+
+
+@ejecutor('ventanas')
+def _ventanas(parametros, entidad):
+    from .busqueda_ventanas import buscar_ventanas
+    from .forms import VentanasCotizacionForm
+
+    form = VentanasCotizacionForm(parametros, entidad_usuario=entidad)
+    if not form.is_valid():
+        return {'success': False, 'errors': form.errors}
+    datos = form.cleaned_data
+    destino = _destino(datos)
+    if destino is None:
+        return _destino_no_encontrado(datos)
+    busqueda = buscar_ventanas(datos, destino, entidad.pk if entidad else None, datos['noches'],
+                               mejores=datos.get('mejores'))
+    return {'success': True, **busqueda}
@@ -0,0 +1,722 @@
+"""
+Cálculo de cotizaciones
+
+Funciones que calculan los montos de una cotización directamente en la base
+de datos: cada categoría de proveedor se reduce a un solo número mediante una
+consulta agregada, sin cargar instancias de los modelos en Python.
+
+El cálculo se separa en dos pasos: calcular_costos() obtiene el costo de
+cada componente (hospedaje, transporte, alimentación y seguro) y
+calcular_totales() aplica IVA y utilidad. Así los costos pueden guardarse en
+caché y reutilizarse al cambiar solo el porcentaje de utilidad.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, F, FloatField, Sum, When
+from django.db.models.functions import Cast
+
+from . import api_integrations
+from .asignacion_flota import LIMITE_EXACTO_DEFECTO, asignar_flota
+from .asignacion_hospedaje import ALTERNATIVAS_DEFECTO, asignar_hospedaje, noches
+from .grafo_rutas import grafo_de_agencia
+from .indice_convenios import TIPO_POR_CATEGORIA, indice_de_agencia
+from .indice_proveedores import CAMPO_CAPACIDAD, proveedores_candidatos
+from .indice_rutas import INDICE_VACIO, clave_ciudad, indice_de_origen
+from .matriz_distancias import distancia_origen_destino
+from .models import Transporte
+from .opciones import buscar_opciones, opciones_cotizacion
+
+
+PRECISION = Decimal('0.000001')
+
+_SIN_CALCULAR = object()
+
+# Segundos que una cotización espera, en total, las respuestas de Amadeus
+PLAZO_AMADEUS_DEFECTO = 8
+HILOS_AMADEUS_DEFECTO = 8
+
+_EJECUTOR = None
+_EJECUTOR_LOCK = threading.Lock()
+
+
+# Temporadas con precio propio (Alimentacion.price_per_person_<temporada>)
+TEMPORADAS = ('Alta', 'Media', 'Baja')
+
+
+def expresion_precio_por_persona(categoria, temporada=None):
+    """
+    Expresión SQL equivalente a precio_por_persona() del modelo de la categoría:
+    precio / capacidad cuando la capacidad es mayor que cero y, si no, el precio completo.
+    En alimentación, con temporada se usa el precio por persona de la
+    temporada si es mayor que cero y, si no, el precio base.
+    """
+    if categoria == 'alimentacion' and temporada:
+        campo = f'price_per_person_{temporada.lower()}'
+        return Case(
+            When(**{f'{campo}__gt': 0}, then=Cast(campo, FloatField())),
+            default=Cast('precio', FloatField()),
+            output_field=FloatField(),
+        )
+
+    campo_capacidad = CAMPO_CAPACIDAD.get(categoria)
+    if campo_capacidad is None:
+        return F('precio')
+
+    # Se convierte a flotante para que SQLite no haga división entera
+    precio = Cast('precio', FloatField())
+    return Case(
+        When(**{f'{campo_capacidad}__gt': 0}, then=precio / Cast(campo_capacidad, FloatField())),
+        default=precio,
+        output_field=FloatField(),
+    )
+
+
+def total_por_persona(proveedores, categoria, temporada=None):
+    """
+    Suma el precio por persona de los proveedores disponibles del queryset en
+    una sola consulta agregada. Retorna un Decimal (0 si no hay proveedores).
+    """
+    resultado = proveedores.filter(disponible=True).aggregate(
+        total=Sum(expresion_precio_por_persona(categoria, temporada))
+    )['total']
+    if resultado is None:
+        return Decimal('0.00')
+    return Decimal(str(resultado)).quantize(PRECISION)
+
+
+def sumas_por_persona(proveedores, categoria, temporada=None):
+    """
+    Como total_por_persona(), pero con la suma de cada empresa (entidad_id)
+    en una sola consulta agrupada: {entidad_id: Decimal}
+    """
+    filas = proveedores.filter(disponible=True).order_by().values('entidad_id').annotate(
+        total=Sum(expresion_precio_por_persona(categoria, temporada))
+    )
+    return {
+        fila['entidad_id']: Decimal(str(fila['total'])).quantize(PRECISION)
+        for fila in filas if fila['total'] is not None
+    }
+
+
+def total_categoria(proveedores, categoria, total_pax):
+    """Total de una categoría para todos los pasajeros"""
+    return total_por_persona(proveedores, categoria) * Decimal(str(total_pax))
+
+
+def asignar_transporte(vehiculos, total_pax):
+    """Vehículos más baratos que llevan a todo el grupo (ver asignacion_flota)"""
+    return asignar_flota(
+        vehiculos, total_pax,
+        modo=getattr(settings, 'FLOTA_MODO', 'auto'),
+        limite_exacto=getattr(settings, 'FLOTA_LIMITE_EXACTO', LIMITE_EXACTO_DEFECTO),
+    )
+
+
+def asignar_vehiculos(proveedores, tipo, total_pax):
+    """
+    asignar_transporte() con los vehículos de un tipo de un ProveedoresEnFecha;
+    con un camino de varios tramos desde el origen se suma la asignación de
+    cada tramo y cada vehículo lleva su 'tramo'
+    """
+    resultado = {'costo': Decimal('0.00'), 'vehiculos': [], 'faltantes': 0}
+    for tramo, vehiculos in proveedores.tramos(tipo, total_pax):
+        asignacion = asignar_transporte(vehiculos, total_pax)
+        resultado['costo'] += asignacion['costo']
+        resultado['vehiculos'].extend({**vehiculo, 'tramo': tramo} if tramo else vehiculo
+                                      for vehiculo in asignacion['vehiculos'])
+        resultado['faltantes'] = max(resultado['faltantes'], asignacion['faltantes'])
+    return resultado
+
+
+def asignar_habitaciones(hospedajes, total_pax, numero_noches):
+    """
+    Hospedajes donde el grupo se aloja al menor costo, con sus mejores
+    alternativas (ver asignacion_hospedaje)
+    """
+    return asignar_hospedaje(
+        hospedajes, total_pax, numero_noches,
+        alternativas=getattr(settings, 'HOSPEDAJE_ALTERNATIVAS', ALTERNATIVAS_DEFECTO),
+    )
+
+
+class DatosDestino:
+    """
+    Proveedores de un destino para cotizar. Ninguna de estas consultas
+    depende del grupo ni de las fechas: se hacen al primer uso y se
+    reutilizan en todas las cotizaciones del mismo destino (un lote de
+    escenarios o un barrido de pasajeros y temporadas).
+
+    Los precios se guardan sin descuentos; en(fecha) aplica los convenios
+    de la agencia dueña del destino vigentes en esa fecha y, con origen,
+    sus rutas de transporte desde esa ciudad.
+    """
+
+    CAMPOS_HOSPEDAJE = ('id', 'entidad_id', 'nombreLugar', 'capacidadpax', 'habitaciones', 'precio', 'calificacion')
+    CAMPOS_TRANSPORTE = ('id', 'entidad_id', 'nombre', 'tipoTransporte', 'pax', 'cantidad', 'precio',
+                         'modo_precio', 'precio_km')
+
+    def __init__(self, destino, valores=None):
+        self.destino = destino
+        # valores son consultas ya hechas (ver valores()), p. ej. desde la caché
+        self._valores = dict(valores or {})
+
+    def valores(self):
+        """Resultados de las consultas hechas hasta ahora, para reutilizarlos en otra instancia"""
+        return dict(self._valores)
+
+    def _memoria(self, clave, cargar):
+        if clave not in self._valores:
+            self._valores[clave] = cargar()
+        return self._valores[clave]
+
+    def en(self, fecha, origen=None, temporada=None):
+        """
+        Proveedores con los descuentos por convenio vigentes en la fecha y
+        las rutas desde el origen, si se da (ver ProveedoresEnFecha)
+        """
+        agencia_id = self.destino.entidad_id
+        rutas = indice_de_origen(agencia_id, origen) if origen else INDICE_VACIO
+        return ProveedoresEnFecha(self, fecha, indice_de_agencia(agencia_id), rutas, origen, temporada)
+
+    def hospedajes(self):
+        """Hospedajes disponibles del destino, sin descuentos"""
+        return self._memoria('hospedajes', lambda: list(
+            proveedores_candidatos(self.destino, 'hospedaje').filter(disponible=True).values(*self.CAMPOS_HOSPEDAJE)
+        ))
+
+    def vehiculos(self, tipo):
+        """Transportes disponibles del destino de un tipo, sin descuentos"""
+        return self._memoria(('vehiculos', tipo), lambda: list(
+            proveedores_candidatos(self.destino, 'transporte').filter(
+                tipoTransporte=tipo, disponible=True,
+            ).values(*self.CAMPOS_TRANSPORTE)
+        ))
+
+    def sumas_por_persona(self, componente, temporada=None):
+        """
+        {empresa: suma de precios por persona} de 'alimentacion', 'seguro',
+        'aereo' (transporte aéreo del destino) o 'aereos' (todo el
+        transporte aéreo, entre el que está el que tiene convenio). La
+        temporada solo cambia el precio de la alimentación.
+        """
+        def cargar():
+            if temporada and componente == 'alimentacion':
+                return sumas_por_persona(proveedores_candidatos(self.destino, componente), componente, temporada)
+            if componente == 'aereo':
+                return sumas_por_persona(
+                    proveedores_candidatos(self.destino, 'transporte').filter(tipoTransporte='aereo'), 'transporte'
+                )
+            if componente == 'aereos':
+                return sumas_por_persona(Transporte.objects.filter(tipoTransporte='aereo'), 'transporte')
+            # Se usa el precio base (sin temporada), igual que Alimentacion.precio_por_persona()
+            return sumas_por_persona(proveedores_candidatos(self.destino, componente), componente)
+        return self._memoria(('por_persona', componente, temporada), cargar)
+
+    def opciones(self, medio_transporte):
+        """Filas de buscar_opciones() para los medios de transporte"""
+        return self._memoria(('opciones', tuple(sorted(medio_transporte))),
+                             lambda: buscar_opciones(self.destino, medio_transporte))
+
+
+class ProveedoresEnFecha:
+    """
+    Proveedores de un DatosDestino para un viaje que empieza en 'fecha', con
+    el descuento del convenio vigente de la agencia con cada empresa (ver
+    cotizador.indice_convenios). Un proveedor "tiene convenio" si su empresa
+    tiene un convenio vigente del tipo de la categoría con la agencia.
+
+    Los vehículos de un tipo con ruta de la agencia desde el origen al
+    destino (ver cotizador.indice_rutas) se cotizan con el precio de la ruta
+    en lugar de los transportes genéricos del destino; si no hay ruta
+    directa, con el camino más barato de varios tramos (ver
+    cotizador.grafo_rutas). Los transportes terrestres con precio por
+    kilómetro cuestan precio_km por la distancia del origen al destino (ver
+    cotizador.matriz_distancias).
+
+    Las rutas se cotizan con el precio de la temporada de la fecha, salvo
+    que se dé otra temporada (el barrido cotiza varias con la misma fecha).
+    """
+
+    def __init__(self, datos, fecha, indice, rutas=INDICE_VACIO, origen=None, temporada=None):
+        self.datos = datos
+        self.destino = datos.destino
+        self.fecha = fecha
+        self.indice = indice
+        self.rutas = rutas
+        self.origen = origen
+        self.temporada = temporada
+        self._tramos = {}
+        self._distancia = _SIN_CALCULAR
+
+    def _descuento(self, categoria, entidad_id):
+        return self.indice.descuento(TIPO_POR_CATEGORIA[categoria], entidad_id, self.fecha)
+
+    def _con_descuento(self, filas, categoria, solo_convenio=False):
+        resultado = []
+        for fila in filas:
+            descuento = self._descuento(categoria, fila['entidad_id'])
+            if descuento is None and solo_convenio:
+                continue
+            if descuento:
+                fila = {**fila, 'precio': _descontar(fila['precio'], descuento)}
+            resultado.append(fila)
+        return resultado
+
+    def hay_convenio_hospedaje(self):
+        """Si hay hoteles con convenio en el destino (entonces no se consulta Amadeus)"""
+        return any(self._descuento('hospedaje', fila['entidad_id']) is not None for fila in self.datos.hospedajes())
+
+    def hay_convenio_aereo(self):
+        """Si hay transporte aéreo con convenio (se cotiza sin importar el destino)"""
+        return any(self._descuento('transporte', entidad_id) is not None
+                   for entidad_id in self.datos.sumas_por_persona('aereos'))
+
+    def hospedajes(self, con_convenio=False):
+        """Hospedajes disponibles del destino (o solo los que tienen convenio) con su descuento"""
+        return self._con_descuento(self.datos.hospedajes(), 'hospedaje', solo_convenio=con_convenio)
+
+    def hay_ruta(self, tipo):
+        """Si hay rutas vigentes con vehículos del tipo desde el origen al destino"""
+        return bool(self.rutas.rutas(self.destino, self.fecha, tipo))
+
+    def vehiculos(self, tipo):
+        """
+        Vehículos de un tipo de las rutas desde el origen con el precio
+        negociado o, si no hay ruta, los transportes disponibles del destino
+        con su descuento
+        """
+        en_ruta = self.rutas.vehiculos(self.destino, self.fecha, tipo, self.temporada)
+        if en_ruta:
+            return en_ruta
+        vehiculos = self.datos.vehiculos(tipo)
+        if tipo == 'terrestre':
+            vehiculos = self._con_precio_por_km(vehiculos)
+        return self._con_descuento(vehiculos, 'transporte')
+
+    def distancia_km(self):
+        """Distancia en km del origen al destino según la matriz de distancias, o None"""
+        if self._distancia is _SIN_CALCULAR:
+            self._distancia = distancia_origen_destino(self.origen, self.destino) if self.origen else None
+        return self._distancia
+
+    def _con_precio_por_km(self, filas):
+        """
+        Vehículos con el precio por kilómetro por la distancia del origen al
+        destino; sin distancia conocida conservan su precio por trayecto
+        """
+        resultado = []
+        for fila in filas:
+            if fila.get('modo_precio') == 'km' and fila.get('precio_km') is not None:
+                distancia = self.distancia_km()
+                if distancia is not None:
+                    precio = Decimal(str(fila['precio_km'])) * Decimal(str(distancia))
+                    fila = {**fila, 'precio': precio.quantize(PRECISION), 'distancia_km': distancia}
+            resultado.append(fila)
+        return resultado
+
+    def tramos(self, tipo, total_pax):
+        """
+        Tramos con los que se cotiza el transporte de un tipo para el grupo,
+        como [(tramo, vehículos)]: con ruta directa o sin camino desde el
+        origen, un solo tramo None con vehiculos(); si no, cada ruta del
+        camino más barato ({'ruta_id', 'desde', 'hasta'}) con su vehículo
+        """
+        clave = (tipo, total_pax)
+        if clave not in self._tramos:
+            camino = None
+            if self.origen and self.destino.entidad_id and self.destino.clave_municipio and not self.hay_ruta(tipo):
+                camino = grafo_de_agencia(self.destino.entidad_id).camino(
+                    clave_ciudad(self.origen), self.destino.clave_municipio, self.fecha, total_pax, tipos={tipo},
+                    temporada=self.temporada,
+                )
+            if camino is None:
+                self._tramos[clave] = [(None, self.vehiculos(tipo))]
+            else:
+                self._tramos[clave] = [(_tramo(tramo), [_vehiculo_de_tramo(tramo)]) for tramo in camino['tramos']]
+        return self._tramos[clave]
+
+    def en_ruta(self, tipo, total_pax):
+        """Si el transporte de un tipo se cotiza con rutas (directa o de varios tramos)"""
+        return self.hay_ruta(tipo) or self.tramos(tipo, total_pax)[0][0] is not None
+
+    def por_persona(self, componente, temporada=None):
+        """
+        Suma de precios por persona de 'alimentacion', 'seguro', 'aereo'
+        (transporte aéreo local) o 'aereo_convenio' (transporte aéreo con
+        convenio), con el descuento de cada empresa
+        """
+        categoria = 'transporte' if componente.startswith('aereo') else componente
+        sumas = self.datos.sumas_por_persona('aereos' if componente == 'aereo_convenio' else componente, temporada)
+        total = Decimal('0.00')
+        for entidad_id, suma in sumas.items():
+            descuento = self._descuento(categoria, entidad_id)
+            if descuento is None and componente == 'aereo_convenio':
+                continue
+            total += _descontar(suma, descuento) if descuento else suma
+        return total
+
+    def opciones(self, medio_transporte):
+        return self.datos.opciones(medio_transporte)
+
+
+def _tramo(tramo):
+    return {'ruta_id': tramo['ruta_id'], 'desde': tramo['desde'], 'hasta': tramo['hasta']}
+
+
+def _vehiculo_de_tramo(tramo):
+    """Vehículo de un tramo de grafo_rutas con la forma de DatosDestino.vehiculos()"""
+    return {
+        'id': tramo['transporte_id'],
+        'entidad_id': tramo['entidad_id'],
+        'nombre': tramo['vehiculo'],
+        'tipoTransporte': tramo['tipo'],
+        'pax': tramo['capacidad'],
+        'cantidad': tramo['unidades'],
+        'precio': tramo['precio_unitario'],
+        'ruta_id': tramo['ruta_id'],
+    }
+
+
+def _descontar(precio, porcentaje):
+    """Precio con el porcentaje de descuento, como ConvenioAgencia.get_tarifa_despues_descuento()"""
+    precio = Decimal(str(precio))
+    return (precio - precio * porcentaje / Decimal('100')).quantize(PRECISION)
+
+
+def _ejecutor():
+    """Pool de hilos compartido (y acotado) para las consultas a Amadeus"""
+    global _EJECUTOR
+    with _EJECUTOR_LOCK:
+        if _EJECUTOR is None:
+            _EJECUTOR = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'AMADEUS_MAX_HILOS', HILOS_AMADEUS_DEFECTO),
+                thread_name_prefix='amadeus',
+            )
+        return _EJECUTOR
+
+
+def _en_hilo(funcion, argumentos):
+    try:
+        return funcion(*argumentos)
+    finally:
+        # La caché de Amadeus usa la base de datos desde el hilo del pool
+        connections.close_all()
+
+
+def consultar_amadeus(consultas, plazo=None):
+    """
+    Ejecuta en paralelo las consultas a Amadeus y espera como máximo 'plazo'
+    segundos en total. consultas mapea un nombre a (función, argumentos).
+
+    Retorna para cada nombre el diccionario de la función, o uno con
+    success=False si lanzó una excepción o no terminó a tiempo.
+    """
+    return dict(consultar_amadeus_a_medida(consultas, plazo))
+
+
+def consultar_amadeus_a_medida(consultas, plazo=None):
+    """
+    Como consultar_amadeus(), pero retorna un iterador de (nombre,
+    resultado) en el orden en que terminan las consultas. Las consultas se
+    lanzan al llamar la función, así que se puede trabajar mientras tanto.
+    """
+    if not consultas:
+        return iter(())
+    if plazo is None:
+        plazo = getattr(settings, 'COTIZACION_PLAZO_AMADEUS', PLAZO_AMADEUS_DEFECTO)
+
+    futuros = {_ejecutor().submit(_en_hilo, funcion, argumentos): nombre
+               for nombre, (funcion, argumentos) in consultas.items()}
+    return _a_medida(futuros, plazo)
+
+
+def _a_medida(futuros, plazo):
+    try:
+        for futuro in as_completed(list(futuros), timeout=plazo):
+            nombre = futuros.pop(futuro)
+            if futuro.exception() is not None:
+                yield nombre, {'success': False, 'error': str(futuro.exception())}
+            else:
+                yield nombre, futuro.result()
+    except TimeoutError:
+        pass
+    for futuro, nombre in futuros.items():
+        # Las que ya empezaron terminan solas (las peticiones HTTP tienen timeout)
+        futuro.cancel()
+        yield nombre, {'success': False, 'error': f'Sin respuesta de Amadeus en {plazo} segundos'}
+
+
+def lugar_destino(destino):
+    """
+    Texto con el que se busca el destino en Amadeus: su municipio y
+    departamento si los tiene (el nombre suele ser el de un atractivo,
+    p. ej. 'Valle del Cocora') y, si no, su nombre.
+    """
+    partes = [parte for parte in (destino.municipio, destino.departamento) if parte]
+    return ', '.join(partes) if partes else destino.nombre
+
+
+def consultas_amadeus(datos, origen, fecha_inicio, fecha_fin, total_pax, medio_transporte):
+    """
+    Consultas a Amadeus que necesita una cotización, como {nombre: (función,
+    argumentos)}. Los componentes con convenio se cotizan con los
+    proveedores locales y no se consultan.
+    """
+    proveedores = datos.en(fecha_inicio)
+    consultas = {}
+    if not proveedores.hay_convenio_hospedaje():
+        consultas['hospedaje'] = (api_integrations.get_hotel_prices_amadeus,
+                                  (lugar_destino(datos.destino), fecha_inicio, fecha_fin, total_pax))
+    if 'aereo' in medio_transporte and not proveedores.hay_convenio_aereo():
+        consultas['transporte_aereo'] = (api_integrations.get_flight_prices_amadeus,
+                                         (origen, lugar_destino(datos.destino), fecha_inicio, fecha_fin, total_pax))
+    return consultas
+
+
+def calcular_costos(destino, origen, fecha_inicio, fecha_fin, total_pax, medio_transporte,
+                    datos=None, resultados=None):
+    """
+    Calcula el costo de cada componente de la cotización para todos los pasajeros.
+
+    Las consultas de hoteles y vuelos a Amadeus se hacen en paralelo con un
+    plazo común; si fallan o no responden a tiempo se usan los precios de los
+    proveedores locales. datos es un DatosDestino para reutilizar las
+    consultas de proveedores entre cotizaciones y resultados, las respuestas
+    de Amadeus ya obtenidas para consultas_amadeus() (si no se dan, se
+    consulta aquí).
+
+    Retorna un diccionario con los totales (Decimal) de hospedaje, transporte,
+    alimentacion y seguro; 'fuentes' con el origen de los precios de
+    hospedaje y transporte aéreo ('convenio', 'amadeus' o 'respaldo') y
+    'ruta' en el transporte terrestre o marítimo cotizado con rutas,
+    'respaldo' con los componentes que usaron precios locales por falla de
+    Amadeus, 'hospedajes' y 'alternativas_hospedaje' con los hospedajes
+    locales asignados y sus mejores alternativas, 'pax_sin_hospedaje',
+    'vehiculos' con los vehículos terrestres y marítimos asignados,
+    'pax_sin_transporte' con los pasajeros que no alcanzan en la flota de
+    cada tipo, 'opciones' con las mejores opciones de cada categoría (ver
+    cotizador.opciones) y 'amadeus' en True si se consultó la API.
+    """
+    if datos is None:
+        datos = DatosDestino(destino)
+    # Precios con los descuentos de los convenios vigentes al inicio del viaje
+    # y las rutas desde el origen
+    proveedores = datos.en(fecha_inicio, origen)
+    pax = Decimal(str(total_pax))
+    total_transporte = Decimal('0.00')
+    fuentes = {}
+
+    # Lo que no tenga convenio (hoteles del destino, transporte aéreo) se consulta en Amadeus
+    consultas = consultas_amadeus(datos, origen, fecha_inicio, fecha_fin, total_pax, medio_transporte)
+    if resultados is None:
+        resultados = consultar_amadeus(consultas)
+
+    # Calcular precios de hospedaje: el grupo se aloja en el hospedaje (o
+    # el menor número de hospedajes) más barato, por cada noche
+    asignacion_hospedaje = None
+    if 'hospedaje' not in consultas:
+        fuentes['hospedaje'] = 'convenio'
+        asignacion_hospedaje = asignar_habitaciones(
+            proveedores.hospedajes(con_convenio=True), total_pax, noches(fecha_inicio, fecha_fin)
+        )
+    elif resultados['hospedaje']['success']:
+        fuentes['hospedaje'] = 'amadeus'
+        total_hospedaje = resultados['hospedaje']['price']
+        print(f"Se encontró hotel vía API Amadeus: {total_hospedaje}")  # Mensaje de debug
+    else:
+        print(f"Error API Amadeus hoteles: {resultados['hospedaje']['error']}")  # Mensaje de debug
+        # Si la API falla, usar hoteles locales como respaldo
+        fuentes['hospedaje'] = 'respaldo'
+        asignacion_hospedaje = asignar_habitaciones(proveedores.hospedajes(), total_pax, noches(fecha_inicio, fecha_fin))
+    if asignacion_hospedaje is not None:
+        total_hospedaje = asignacion_hospedaje['costo']
+
+    # Calcular precios de transporte
+    if 'aereo' in medio_transporte and 'transporte_aereo' not in consultas:
+        fuentes['transporte_aereo'] = 'convenio'
+        total_transporte += proveedores.por_persona('aereo_convenio') * pax
+    elif 'transporte_aereo' in consultas:
+        if resultados['transporte_aereo']['success']:
+            fuentes['transporte_aereo'] = 'amadeus'
+            total_transporte += resultados['transporte_aereo']['price']
+            print(f"Se encontró vuelo vía API Amadeus: {total_transporte}")  # Mensaje de debug
+        else:
+            print(f"Error API Amadeus vuelos: {resultados['transporte_aereo']['error']}")  # Mensaje de debug
+            # Si la API falla, usar transportes aéreos locales
+            fuentes['transporte_aereo'] = 'respaldo'
+            total_transporte += proveedores.por_persona('aereo') * pax
+
+    # Los vehículos terrestres y marítimos se contratan completos: se cobra la
+    # combinación más barata que lleva al grupo, no todos los de la zona. Si
+    # hay rutas desde el origen (directas o de varios tramos) se usan sus
+    # vehículos y precios
+    vehiculos = []
+    pax_sin_transporte = {}
+    for tipo in ('terrestre', 'maritimo'):
+        if tipo in medio_transporte:
+            if proveedores.en_ruta(tipo, total_pax):
+                fuentes[f'transporte_{tipo}'] = 'ruta'
+            asignacion = asignar_vehiculos(proveedores, tipo, total_pax)
+            total_transporte += asignacion['costo']
+            vehiculos.extend(asignacion['vehiculos'])
+            if asignacion['faltantes']:
+                pax_sin_transporte[tipo] = asignacion['faltantes']
+
+    return {
+        'hospedaje': total_hospedaje,
+        'transporte': total_transporte,
+        'alimentacion': proveedores.por_persona('alimentacion') * pax,
+        'seguro': proveedores.por_persona('seguro') * pax,
+        'fuentes': fuentes,
+        'respaldo': [componente for componente, fuente in fuentes.items() if fuente == 'respaldo'],
+        'hospedajes': asignacion_hospedaje['hospedajes'] if asignacion_hospedaje else [],
+        'alternativas_hospedaje': asignacion_hospedaje['alternativas'] if asignacion_hospedaje else [],
+        'pax_sin_hospedaje': asignacion_hospedaje['faltantes'] if asignacion_hospedaje else 0,
+        'vehiculos': vehiculos,
+        'pax_sin_transporte': pax_sin_transporte,
+        'opciones': opciones_cotizacion(destino, total_pax, medio_transporte,
+                                        encontradas=datos.opciones(medio_transporte)),
+        'amadeus': bool(consultas),
+    }
+
+
+def calcular_totales(costos, porcentaje_utilidad):
+    """
+    Aplica IVA y utilidad a los costos de calcular_costos().
+    El hospedaje tiene IVA del 10% y los demás servicios del 19%; la utilidad
+    se calcula sobre el total con IVA.
+    """
+    subtotal = costos['hospedaje'] + costos['transporte'] + costos['alimentacion'] + costos['seguro']
+
+    iva_hospedaje = costos['hospedaje'] * Decimal('0.10')
+    iva_otros = (costos['transporte'] + costos['alimentacion'] + costos['seguro']) * Decimal('0.19')
+    total_iva = iva_hospedaje + iva_otros
+
+    total_con_iva = subtotal + total_iva
+    utilidad = total_con_iva * (porcentaje_utilidad / Decimal('100.0'))
+
+    return {
+        'subtotal': subtotal,
+        'iva_hospedaje': iva_hospedaje,
+        'iva': total_iva,
+        'total_con_iva': total_con_iva,
+        'utilidad': utilidad,
+        'total': total_con_iva + utilidad,
+    }
+
+
+CAMPOS_PAX = ['adultos', 'ninios', 'bebes', 'adultos_mayores', 'estudiantes']
+
+
+def total_pasajeros(datos):
+    """Total de pasajeros de los datos limpios de un QuotationForm"""
+    return sum(datos[campo] for campo in CAMPOS_PAX)
+
+
+def _hospedaje_json(hospedaje):
+    return {
+        'id': hospedaje['id'],
+        'nombre': hospedaje['nombreLugar'],
+        'calificacion': float(hospedaje['calificacion']) if hospedaje['calificacion'] is not None else None,
+        'pax': hospedaje['pax'],
+        'habitaciones': hospedaje['habitaciones_usadas'],
+        'subtotal': float(hospedaje['subtotal']),
+    }
+
+
+def _vehiculo_json(vehiculo):
+    resultado = {
+        'id': vehiculo['id'],
+        'nombre': vehiculo['nombre'],
+        'tipo': vehiculo['tipoTransporte'],
+        'pax': vehiculo['pax'],
+        'unidades': vehiculo['unidades'],
+        'precio_unitario': float(vehiculo['precio']),
+        'subtotal': float(vehiculo['subtotal']),
+    }
+    if vehiculo.get('tramo'):
+        resultado['tramo'] = vehiculo['tramo']
+    if vehiculo.get('distancia_km') is not None:
+        resultado['distancia_km'] = vehiculo['distancia_km']
+    return resultado
+
+
+def detalle_cotizacion(datos, destino, costos):
+    """
+    Detalle de la respuesta JSON de una cotización a partir de los datos
+    limpios del QuotationForm, el destino y los costos de calcular_costos()
+    """
+    total_pax = total_pasajeros(datos)
+
+    def por_pax(valor):
+        return _por_pax(valor, total_pax)
+
+    detalle = {
+        'origen': datos['origen'],
+        'destino': destino.nombre,
+        'fecha_inicio': datos['fecha_inicio'].strftime('%Y-%m-%d'),
+        'fecha_fin': datos['fecha_fin'].strftime('%Y-%m-%d'),
+        'total_pax': total_pax,
+        'desglose_pax': {campo: datos[campo] for campo in CAMPOS_PAX},
+        'precios_por_pax': {
+            'hospedaje': por_pax(costos['hospedaje']),
+            'transporte': por_pax(costos['transporte']),
+            'alimentacion': por_pax(costos['alimentacion']),
+            'seguro': por_pax(costos['seguro']),
+        },
+        'totales': {
+            'hospedaje': float(costos['hospedaje']),
+            'transporte': float(costos['transporte']),
+            'alimentacion': float(costos['alimentacion']),
+            'seguro': float(costos['seguro']),
+        },
+        'porcentajes': {
+            'iva_hospedaje': 10,
+            'iva_otros': 19,
+        },
+        # Origen de los precios y componentes que usaron precios locales
+        # porque Amadeus falló o no respondió a tiempo
+        'fuentes': costos['fuentes'],
+        'respaldo': costos['respaldo'],
+        # Hospedajes locales asignados al grupo y alternativas de un solo hospedaje
+        'hospedajes': [_hospedaje_json(hospedaje) for hospedaje in costos.get('hospedajes', [])],
+        'alternativas_hospedaje': [_hospedaje_json(hospedaje) for hospedaje in costos.get('alternativas_hospedaje', [])],
+        'pax_sin_hospedaje': costos.get('pax_sin_hospedaje', 0),
+        # Vehículos terrestres y marítimos asignados al grupo
+        'vehiculos': [_vehiculo_json(vehiculo) for vehiculo in costos.get('vehiculos', [])],
+        'pax_sin_transporte': costos.get('pax_sin_transporte', {}),
+        # Opciones más baratas (y, en hospedaje, mejor calificadas) de cada categoría
+        'opciones': costos.get('opciones', {}),
+    }
+    return aplicar_utilidad(detalle, costos, datos['porcentaje_utilidad'])
+
+
+def _por_pax(valor, total_pax):
+    return float(valor / Decimal(str(total_pax))) if total_pax > 0 else 0.0
+
+
+def aplicar_utilidad(detalle, costos, porcentaje_utilidad):
+    """
+    Detalle con el IVA, la utilidad y el total para el porcentaje de
+    utilidad, a partir de los costos con los que se calculó (sin modificar
+    detalle). Es la única parte del detalle que depende del porcentaje.
+    """
+    totales = calcular_totales(costos, porcentaje_utilidad)
+    return {
+        **detalle,
+        'precios_por_pax': {**detalle['precios_por_pax'], 'total': _por_pax(totales['total'], detalle['total_pax'])},
+        'totales': {
+            **detalle['totales'],
+            'subtotal': float(totales['subtotal']),
+            'iva_hospedaje': float(totales['iva_hospedaje']),
+            'iva': float(totales['iva']),
+            'subtotal_con_iva': float(totales['total_con_iva']),
+            'utilidad': float(totales['utilidad']),
+            'total': float(totales['total']),
+        },
+        'porcentajes': {**detalle['porcentajes'], 'utilidad': float(porcentaje_utilidad)},
+    }
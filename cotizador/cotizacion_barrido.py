@@ -0,0 +1,196 @@
+"""
+Barrido de una cotización por número de pasajeros y temporada
+
+Calcula en una sola petición la matriz de precios de un destino para un
+rango de tamaños de grupo y varias temporadas (p. ej. de 10 a 40 viajeros en
+Alta, Media y Baja), en lugar de una cotización por cada combinación:
+
+- los proveedores del destino se consultan una sola vez (DatosDestino) y los
+  precios por persona de cada componente se reducen a un número por
+  temporada;
+- la flota terrestre y marítima se resuelve con una sola programación
+  dinámica para todos los tamaños de grupo (costos_flota);
+- los totales, el IVA y la utilidad se calculan sobre vectores de centavos
+  enteros (un valor por tamaño de grupo), sin errores de redondeo binario.
+
+El transporte terrestre y marítimo usa las rutas de la agencia desde el
+origen y el precio por kilómetro, como calculate_quotation; con un camino de
+varios tramos (que depende del tamaño del grupo) esos tamaños se asignan uno
+por uno. Las rutas tienen un precio por temporada, así que cuando se usan
+el transporte se cotiza una vez por temporada.
+
+El barrido no consulta Amadeus (serían dos consultas por tamaño de grupo):
+el hospedaje y el transporte aéreo se cotizan con los proveedores con
+convenio o, si no hay, con los locales, igual que calculate_quotation cuando
+Amadeus no responde. 'fuentes' indica cuáles se usaron.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+
+from .asignacion_flota import LIMITE_EXACTO_DEFECTO, costos_flota
+from .asignacion_hospedaje import noches
+from .cotizacion import TEMPORADAS, DatosDestino, asignar_habitaciones, asignar_transporte, asignar_vehiculos
+from .montos import a_centavos
+
+
+# Puntos (tamaños de grupo) que se permiten en un barrido
+MAXIMO_PUNTOS_DEFECTO = 200
+
+# Los precios por persona de la base de datos se manejan en millonésimas
+# (cotizacion.PRECISION) y los totales en centavos
+MILLONESIMAS = 10 ** 6
+MILLONESIMAS_POR_CENTAVO = MILLONESIMAS // 100
+
+
+def _redondeo(numerador, denominador):
+    """División entera redondeada a la unidad más cercana (mitad hacia arriba)"""
+    return (2 * numerador + denominador) // (2 * denominador)
+
+
+def _por_pax(por_persona, pax):
+    """Vector de centavos de un precio por persona (Decimal) para cada tamaño de grupo"""
+    millonesimas = int(Decimal(str(por_persona)) * MILLONESIMAS)
+    return [_redondeo(millonesimas * n, MILLONESIMAS_POR_CENTAVO) for n in pax]
+
+
+def _sumar(*vectores):
+    return [sum(valores) for valores in zip(*vectores)]
+
+
+def _porcentaje(vector, centesimas):
+    """Porcentaje de cada valor; centesimas es el porcentaje por 100 (10.5% -> 1050)"""
+    return [_redondeo(valor * centesimas, 10000) for valor in vector]
+
+
+def _pesos(vector):
+    return [valor / 100 for valor in vector]
+
+
+def rango_pax(pax_desde, pax_hasta, paso=1):
+    """Tamaños de grupo del barrido, incluyendo pax_hasta"""
+    pax = list(range(pax_desde, pax_hasta + 1, paso))
+    if pax and pax[-1] != pax_hasta:
+        pax.append(pax_hasta)
+    return pax
+
+
+def _curva_transporte(vehiculos, pax):
+    """
+    (centavos, pasajeros sin puesto) de la flota más barata para cada
+    tamaño de grupo. Con una flota o un grupo demasiado grandes para la
+    programación dinámica se asigna cada tamaño por separado.
+    """
+    limite = getattr(settings, 'FLOTA_LIMITE_EXACTO', LIMITE_EXACTO_DEFECTO)
+    curva = costos_flota(vehiculos, max(pax), limite) if getattr(settings, 'FLOTA_MODO', 'auto') != 'voraz' else None
+    if curva is None:
+        asignaciones = [asignar_transporte(vehiculos, n) for n in pax]
+        return [a_centavos(a['costo']) for a in asignaciones], [a['faltantes'] for a in asignaciones]
+
+    # Si la flota no alcanza se cobran todos los vehículos, como asignar_flota()
+    capacidad = sum((v['pax'] or 0) * (v['cantidad'] or 1) for v in vehiculos if (v['pax'] or 0) > 0)
+    todos = sum(a_centavos(v['precio']) * (v['cantidad'] or 1) for v in vehiculos if (v['pax'] or 0) > 0)
+    costos = [curva[n] if curva[n] is not None else todos for n in pax]
+    return costos, [max(n - capacidad, 0) if curva[n] is None else 0 for n in pax]
+
+
+def _transporte_de_tipo(proveedores, tipo, pax):
+    """
+    _curva_transporte() con los vehículos de un tipo de un ProveedoresEnFecha;
+    los tamaños de grupo que viajan por un camino de varios tramos desde el
+    origen se asignan con asignar_vehiculos(), como en la cotización
+    """
+    costos, faltantes = _curva_transporte(proveedores.vehiculos(tipo), pax)
+    for indice, n in enumerate(pax):
+        if proveedores.tramos(tipo, n)[0][0] is not None:
+            asignacion = asignar_vehiculos(proveedores, tipo, n)
+            costos[indice], faltantes[indice] = a_centavos(asignacion['costo']), asignacion['faltantes']
+    return costos, faltantes
+
+
+def _usa_rutas(proveedores, tipo, pax):
+    """Si algún tamaño de grupo viaja por rutas (directas o de varios tramos), cuyo precio depende de la temporada"""
+    return proveedores.hay_ruta(tipo) or any(proveedores.tramos(tipo, n)[0][0] is not None for n in pax)
+
+
+def barrido_cotizacion(destino, pax, temporadas, fecha_inicio, fecha_fin, medio_transporte,
+                       porcentaje_utilidad, datos=None, origen=None):
+    """
+    Matriz de precios del destino para cada tamaño de grupo de pax (lista de
+    enteros positivos) y cada temporada de temporadas.
+
+    Retorna un diccionario listo para graficar: 'pax' (eje x), 'series' con
+    el total y el precio por persona de cada temporada, 'componentes' con el
+    costo de cada componente por tamaño de grupo (la alimentación y el
+    transporte, por temporada), los pasajeros sin hospedaje o transporte y
+    las 'fuentes' de los precios. Los valores están en pesos. Con origen, el
+    transporte se cotiza con las rutas y distancias desde esa ciudad.
+    """
+    if datos is None:
+        datos = DatosDestino(destino)
+    numero_noches = noches(fecha_inicio, fecha_fin)
+    # Precios con los descuentos de los convenios vigentes al inicio del viaje
+    # y las rutas desde el origen
+    proveedores = datos.en(fecha_inicio, origen)
+    fuentes = {}
+
+    # Hospedaje: la asignación depende del tamaño del grupo, pero los
+    # hospedajes se consultan una sola vez
+    con_convenio = proveedores.hay_convenio_hospedaje()
+    fuentes['hospedaje'] = 'convenio' if con_convenio else 'local'
+    hospedajes = proveedores.hospedajes(con_convenio=con_convenio)
+    asignaciones = [asignar_habitaciones(hospedajes, n, numero_noches) for n in pax]
+    hospedaje = [a_centavos(a['costo']) for a in asignaciones]
+
+    aereo = [0] * len(pax)
+    pax_sin_transporte = {}
+    if 'aereo' in medio_transporte:
+        con_convenio = proveedores.hay_convenio_aereo()
+        fuentes['transporte_aereo'] = 'convenio' if con_convenio else 'local'
+        aereo = _por_pax(proveedores.por_persona('aereo_convenio' if con_convenio else 'aereo'), pax)
+    transporte = {temporada: aereo for temporada in temporadas}
+    for tipo in ('terrestre', 'maritimo'):
+        if tipo in medio_transporte:
+            if _usa_rutas(proveedores, tipo, pax):
+                por_temporada = {temporada: _transporte_de_tipo(datos.en(fecha_inicio, origen, temporada), tipo, pax)
+                                 for temporada in temporadas}
+            else:
+                curva = _transporte_de_tipo(proveedores, tipo, pax)
+                por_temporada = {temporada: curva for temporada in temporadas}
+            for temporada, (costos, _) in por_temporada.items():
+                transporte[temporada] = _sumar(transporte[temporada], costos)
+            faltantes = [max(valores) for valores in zip(*(f for _, f in por_temporada.values()))]
+            if any(faltantes):
+                pax_sin_transporte[tipo] = faltantes
+
+    seguro = _por_pax(proveedores.por_persona('seguro'), pax)
+    alimentacion = {temporada: _por_pax(proveedores.por_persona('alimentacion', temporada), pax) for temporada in temporadas}
+
+    centesimas_utilidad = int(Decimal(str(porcentaje_utilidad)) * 100)
+    iva_hospedaje = _porcentaje(hospedaje, 10 * 100)
+    series = []
+    for temporada in temporadas:
+        otros = _sumar(transporte[temporada], alimentacion[temporada], seguro)
+        total_con_iva = _sumar(hospedaje, otros, iva_hospedaje, _porcentaje(otros, 19 * 100))
+        total = _sumar(total_con_iva, _porcentaje(total_con_iva, centesimas_utilidad))
+        series.append({
+            'temporada': temporada,
+            'total': _pesos(total),
+            'por_pax': [_redondeo(valor, n) / 100 for valor, n in zip(total, pax)],
+        })
+
+    return {
+        'pax': list(pax),
+        'temporadas': list(temporadas),
+        'series': series,
+        'componentes': {
+            'hospedaje': _pesos(hospedaje),
+            'transporte': {temporada: _pesos(valores) for temporada, valores in transporte.items()},
+            'seguro': _pesos(seguro),
+            'alimentacion': {temporada: _pesos(valores) for temporada, valores in alimentacion.items()},
+        },
+        'pax_sin_hospedaje': [a['faltantes'] for a in asignaciones],
+        'pax_sin_transporte': pax_sin_transporte,
+        'fuentes': fuentes,
+        'porcentajes': {'iva_hospedaje': 10, 'iva_otros': 19, 'utilidad': float(porcentaje_utilidad)},
+    }
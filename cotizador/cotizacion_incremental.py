@@ -0,0 +1,91 @@
+"""
+Ajuste incremental de una cotización guardada
+
+Una cotización se calcula en tres etapas, cada una con su propia caché:
+
+1. proveedores: los hospedajes, vehículos y precios por persona del
+   destino (DatosDestino), que solo dependen del destino y se guardan con
+   cache_cotizaciones.buscar_proveedores();
+2. componentes: el costo de cada componente para el grupo, las fechas y el
+   origen, con las consultas a Amadeus (caché de costos y de Amadeus);
+3. totales: IVA y utilidad, aritmética sobre los costos.
+
+Al ajustar una cotización guardada (la cotización anterior) con algunos
+campos cambiados solo se recalculan las etapas posteriores al cambio: un
+nuevo porcentaje de utilidad solo recalcula los totales sobre los costos
+guardados, sin consultas a la base de datos ni a Amadeus; otros pasajeros,
+fechas u origen recalculan los componentes con los proveedores de la caché,
+y solo un cambio de destino vuelve a consultar los proveedores.
+"""
+from django.core.exceptions import ValidationError
+
+from .cache_cotizaciones import buscar_proveedores, guardar_proveedores, obtener_costos
+from .cotizacion import DatosDestino, aplicar_utilidad, calcular_costos, detalle_cotizacion, total_pasajeros
+from .cotizaciones_guardadas import costos_guardados, datos_formulario, guardar_cotizacion
+from .forms import QuotationForm
+from .models import Destino
+
+
+ETAPAS = ('proveedores', 'componentes', 'totales')
+
+
+def etapas_afectadas(anteriores, nuevos):
+    """Etapas que hay que recalcular al pasar de los datos anteriores a los nuevos (datos limpios del QuotationForm)"""
+    cambiados = {campo for campo in set(anteriores) | set(nuevos) if anteriores.get(campo) != nuevos.get(campo)}
+    if not cambiados:
+        return []
+    if cambiados == {'porcentaje_utilidad'}:
+        return ['totales']
+    if 'destino' in cambiados:
+        return list(ETAPAS)
+    return ['componentes', 'totales']
+
+
+def ajustar_cotizacion(cotizacion, cambios, entidad, guardar=False):
+    """
+    Aplica cambios (campos del QuotationForm) a una cotización guardada o a
+    una vista previa (cotizaciones_guardadas.buscar_vista_previa).
+
+    Retorna {'etapas': etapas recalculadas, 'detalle': detalle ajustado} y,
+    con guardar, 'cotizacion': la nueva cotización guardada (la anterior no
+    se modifica); o {'errors': ...} si los datos no son válidos.
+    """
+    if set(cambios) == {'porcentaje_utilidad'} and not guardar:
+        # Camino rápido: se valida solo el campo, sin armar el formulario
+        # (que consulta los destinos de la entidad)
+        campo = QuotationForm.base_fields['porcentaje_utilidad']
+        try:
+            porcentaje_utilidad = campo.clean(cambios['porcentaje_utilidad'])
+        except ValidationError as e:
+            return {'errors': {'porcentaje_utilidad': e.messages}}
+        detalle = aplicar_utilidad(cotizacion.detalle, costos_guardados(cotizacion), porcentaje_utilidad)
+        return {'etapas': ['totales'], 'detalle': detalle}
+
+    form = QuotationForm({**cotizacion.datos, **cambios}, entidad_usuario=entidad)
+    if not form.is_valid():
+        return {'errors': form.errors}
+    nuevos = form.cleaned_data
+    etapas = etapas_afectadas(datos_formulario(cotizacion), nuevos)
+
+    if 'componentes' not in etapas:
+        costos = costos_guardados(cotizacion)
+        destino = cotizacion.destino
+        datos = None
+        detalle = aplicar_utilidad(cotizacion.detalle, costos, nuevos['porcentaje_utilidad'])
+    else:
+        destino = cotizacion.destino if 'proveedores' not in etapas else Destino.objects.get(pk=nuevos['destino'])
+        clave_proveedores, valores = buscar_proveedores(destino.pk)
+        datos = DatosDestino(destino, valores)
+        costos = obtener_costos(
+            nuevos, entidad.pk if entidad else None,
+            lambda: calcular_costos(destino, nuevos['origen'], nuevos['fecha_inicio'], nuevos['fecha_fin'],
+                                    total_pasajeros(nuevos), nuevos['medio_transporte'], datos=datos),
+        )
+        guardar_proveedores(clave_proveedores, datos, valores)
+        detalle = detalle_cotizacion(nuevos, destino, costos)
+
+    resultado = {'etapas': etapas, 'detalle': detalle}
+    if guardar:
+        resultado['cotizacion'] = guardar_cotizacion(nuevos, destino, entidad, costos, datos=datos)
+        resultado['detalle'] = resultado['cotizacion'].detalle
+    return resultado
@@ -0,0 +1,144 @@
+"""
+Cotización de varios escenarios en una sola petición
+
+Una agencia suele cotizar el mismo grupo para varios destinos, fechas o
+combinaciones de pasajeros. En lugar de repetir todo el trabajo por cada
+escenario, el lote:
+
+- valida todos los escenarios con las opciones de destino calculadas una vez
+  y carga los destinos en una sola consulta;
+- calcula una sola vez los escenarios con los mismos costos (solo cambia la
+  utilidad) y toma de la caché de cotizaciones los que ya se calcularon;
+- reúne las consultas a Amadeus de todos los escenarios, elimina las
+  repetidas (misma ruta, fechas y pasajeros) y las hace en paralelo con un
+  solo plazo;
+- comparte los proveedores de cada destino (DatosDestino) entre sus escenarios.
+
+Los resultados se retornan en el orden de entrada, con los errores de cada
+escenario por separado.
+"""
+from .cache_cotizaciones import buscar_costos, clave_cotizacion, guardar_costos
+from .cotizacion import (
+    DatosDestino, calcular_costos, consultar_amadeus, consultas_amadeus, detalle_cotizacion, total_pasajeros,
+)
+from .forms import QuotationForm
+from .models import Destino
+
+
+MAXIMO_ESCENARIOS_DEFECTO = 50
+
+
+def _validar(escenarios, entidad):
+    """Retorna (resultados con los errores de validación, [(indice, datos limpios)])"""
+    opciones_destino = QuotationForm(entidad_usuario=entidad).fields['destino'].choices
+    resultados = [None] * len(escenarios)
+    validos = []
+    for indice, escenario in enumerate(escenarios):
+        if not isinstance(escenario, dict):
+            resultados[indice] = {'success': False, 'error': 'El escenario debe ser un objeto con los campos de la cotización'}
+            continue
+        form = QuotationForm(escenario, entidad_usuario=entidad, opciones_destino=opciones_destino)
+        if form.is_valid():
+            validos.append((indice, form.cleaned_data))
+        else:
+            resultados[indice] = {'success': False, 'errors': form.errors}
+    return resultados, validos
+
+
+def _consultar_amadeus_compartido(pendientes, datos_destino):
+    """
+    Hace en paralelo las consultas a Amadeus de todos los escenarios
+    pendientes, sin repetir las iguales. Retorna {clave: resultados} con los
+    resultados de cada escenario como los de consultar_amadeus().
+    """
+    unicas = {}
+    por_escenario = {}
+    for clave, datos in pendientes.items():
+        consultas = consultas_amadeus(
+            datos_destino[int(datos['destino'])], datos['origen'], datos['fecha_inicio'], datos['fecha_fin'],
+            total_pasajeros(datos), datos['medio_transporte'],
+        )
+        por_escenario[clave] = {}
+        for nombre, (funcion, argumentos) in consultas.items():
+            identificador = (funcion, argumentos)
+            unicas.setdefault(identificador, (str(len(unicas)), funcion, argumentos))
+            por_escenario[clave][nombre] = unicas[identificador][0]
+
+    respuestas = consultar_amadeus({nombre: (funcion, argumentos) for nombre, funcion, argumentos in unicas.values()})
+    resultados = {
+        clave: {nombre: respuestas[compartida] for nombre, compartida in nombres.items()}
+        for clave, nombres in por_escenario.items()
+    }
+    return resultados, len(unicas)
+
+
+def cotizar_lote(escenarios, entidad):
+    """
+    Cotiza una lista de escenarios (diccionarios con los campos del
+    QuotationForm) para la entidad de la agencia.
+
+    Retorna (resultados, estadisticas): resultados tiene, en el orden de
+    entrada, {'success': True, 'detalle': ...} como calculate_quotation o
+    {'success': False, 'errors'/'error': ...}; estadisticas cuenta los
+    escenarios calculados, los tomados de la caché y las consultas a Amadeus.
+    """
+    entidad_id = entidad.pk if entidad else None
+    resultados, validos = _validar(escenarios, entidad)
+
+    destinos = Destino.objects.in_bulk({int(datos['destino']) for _, datos in validos})
+    datos_destino = {pk: DatosDestino(destino) for pk, destino in destinos.items()}
+
+    # Escenarios con los mismos costos comparten clave: se buscan y se calculan una vez
+    claves = {}
+    costos_por_clave = {}
+    pendientes = {}
+    for indice, datos in validos:
+        if int(datos['destino']) not in destinos:
+            resultados[indice] = {'success': False, 'error': f'Destino con ID {datos["destino"]} no encontrado'}
+            continue
+        clave = clave_cotizacion(datos, entidad_id)
+        claves[indice] = clave
+        if clave in costos_por_clave or clave in pendientes:
+            continue
+        _, costos = buscar_costos(datos, entidad_id, clave)
+        if costos is not None:
+            costos_por_clave[clave] = costos
+        else:
+            pendientes[clave] = datos
+    desde_cache = len(costos_por_clave)
+
+    resultados_amadeus, consultas = _consultar_amadeus_compartido(pendientes, datos_destino)
+    errores = {}
+    for clave, datos in pendientes.items():
+        try:
+            costos = calcular_costos(
+                destinos[int(datos['destino'])], datos['origen'], datos['fecha_inicio'], datos['fecha_fin'],
+                total_pasajeros(datos), datos['medio_transporte'],
+                datos=datos_destino[int(datos['destino'])], resultados=resultados_amadeus[clave],
+            )
+        except Exception as e:
+            print(f"Error al calcular un escenario del lote: {str(e)}")  # Mensaje de debug
+            errores[clave] = str(e)
+            continue
+        guardar_costos(clave, costos)
+        costos_por_clave[clave] = costos
+
+    for indice, datos in validos:
+        clave = claves.get(indice)
+        if clave is None:
+            continue
+        if clave in errores:
+            resultados[indice] = {'success': False, 'error': errores[clave]}
+        else:
+            resultados[indice] = {
+                'success': True,
+                'detalle': detalle_cotizacion(datos, destinos[int(datos['destino'])], costos_por_clave[clave]),
+            }
+
+    return resultados, {
+        'escenarios': len(escenarios),
+        'validos': len(validos),
+        'calculados': len(pendientes) - len(errores),
+        'desde_cache': desde_cache,
+        'consultas_amadeus': consultas,
+    }
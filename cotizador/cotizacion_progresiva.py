@@ -0,0 +1,108 @@
+"""
+Cotización progresiva (Server-Sent Events)
+
+calculate_quotation responde cuando todos los componentes tienen precio, es
+decir, cuando termina la consulta más lenta a Amadeus. La versión
+progresiva lanza primero las consultas a Amadeus y, mientras responden,
+envía uno a uno los componentes que se cotizan con proveedores locales
+(alimentación, seguro, transporte terrestre y marítimo y los que tienen
+convenio). Los componentes que esperan a Amadeus se envían primero como
+provisionales, con el precio local de respaldo, y de nuevo cuando llega su
+respuesta. Al final se envían los totales, iguales a los de
+calculate_quotation; como allí, la cotización solo se guarda con guardar.
+
+Cada evento es una línea 'event: <tipo>' y una 'data: <json>':
+
+- componente: {'componente', 'fuente', 'costo', 'por_pax', 'faltantes', 'provisional'}
+- totales: {'cotizacion_id', 'vista_previa', 'detalle'}
+- error: {'error'} o {'errors'} con los errores del formulario
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .cache_cotizaciones import buscar_costos, guardar_costos
+from .cotizacion import DatosDestino, calcular_costos, consultar_amadeus_a_medida
+from .cotizaciones_guardadas import Componentes, guardar_cotizacion, lineas_de_costos, vista_previa
+
+
+def evento_sse(tipo, datos):
+    """Texto de un evento Server-Sent Events con los datos en JSON"""
+    return f'event: {tipo}\ndata: {json.dumps(datos, cls=DjangoJSONEncoder)}\n\n'
+
+
+def _componente(componentes, componente, fuente, costo, faltantes=0, provisional=False):
+    return 'componente', {
+        'componente': componente,
+        'fuente': fuente,
+        'costo': float(costo),
+        'por_pax': float(costo / componentes.pax) if componentes.total_pax > 0 else 0.0,
+        'faltantes': faltantes,
+        'provisional': provisional,
+    }
+
+
+def eventos_cotizacion(datos_form, destino, entidad, guardar=False):
+    """
+    Genera (tipo, datos) de cada evento de la cotización para los datos
+    limpios de un QuotationForm y, con guardar, la guarda al final como
+    calculate_quotation (sin guardar cotizacion_id es None y se envía el
+    token de la vista previa)
+    """
+    entidad_id = entidad.pk if entidad else None
+    datos = DatosDestino(destino)
+    componentes = Componentes(datos_form, destino, datos)
+    clave, costos = buscar_costos(datos_form, entidad_id)
+
+    if costos is not None:
+        # Ya calculada: todos los componentes están listos
+        for componente, (fuente, costo, _) in lineas_de_costos(costos, componentes).items():
+            yield _componente(componentes, componente, fuente, costo)
+    else:
+        consultas = componentes.consultas()
+        pendientes = consultar_amadeus_a_medida(consultas)
+
+        respaldo = {}
+        for componente in componentes.nombres():
+            if componente in consultas:
+                respaldo[componente] = componentes.calcular(componente, 'respaldo')
+                yield _componente(componentes, componente, 'respaldo', respaldo[componente]['costo'],
+                                  respaldo[componente]['faltantes'], provisional=True)
+            else:
+                fuente = componentes.fuente_local(componente)
+                calculado = componentes.calcular(componente, fuente)
+                yield _componente(componentes, componente, fuente, calculado['costo'], calculado['faltantes'])
+
+        resultados = {}
+        for componente, respuesta in pendientes:
+            resultados[componente] = respuesta
+            if respuesta['success']:
+                yield _componente(componentes, componente, 'amadeus', respuesta['price'])
+            else:
+                yield _componente(componentes, componente, 'respaldo', respaldo[componente]['costo'],
+                                  respaldo[componente]['faltantes'])
+
+        # Los proveedores ya están en datos y las respuestas de Amadeus en
+        # resultados: solo se repiten las asignaciones en memoria
+        costos = calcular_costos(
+            destino, datos_form['origen'], datos_form['fecha_inicio'], datos_form['fecha_fin'],
+            componentes.total_pax, datos_form['medio_transporte'], datos=datos, resultados=resultados,
+        )
+        guardar_costos(clave, costos)
+
+    if guardar:
+        cotizacion = guardar_cotizacion(datos_form, destino, entidad, costos, datos=datos)
+    else:
+        cotizacion = vista_previa(datos_form, destino, entidad, costos)
+    yield 'totales', {'cotizacion_id': cotizacion.pk, 'vista_previa': getattr(cotizacion, 'vista_previa', None),
+                      'detalle': cotizacion.detalle}
+
+
+def flujo_sse(eventos):
+    """Texto de los eventos; si la cotización falla a mitad de camino se termina con un evento de error"""
+    try:
+        for tipo, datos in eventos:
+            yield evento_sse(tipo, datos)
+    except Exception as e:
+        print(f"Error en la cotización progresiva: {str(e)}")  # Mensaje de debug
+        yield evento_sse('error', {'error': 'Hubo un error al calcular la cotización'})
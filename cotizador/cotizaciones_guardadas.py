@@ -0,0 +1,369 @@
+"""
+Cotizaciones guardadas y re-cotización por componentes
+
+Cada cotización calculada se guarda como una Cotizacion con sus datos de
+entrada, sus costos y el detalle de la respuesta, de modo que volver a
+abrirla o compartirla no recalcula nada ni consulta Amadeus.
+
+Cada componente (hospedaje, transporte aéreo, terrestre y marítimo,
+alimentación y seguro) se guarda como una LineaCotizacion con su fuente,
+su costo, los proveedores elegidos y una firma de los precios de los que
+depende: las filas de los proveedores locales, la suma de precios por
+persona o el precio de Amadeus. Al re-cotizar se calcula la firma actual de
+cada componente y solo se recalculan los que cambiaron. Los precios de
+Amadeus se revisan solo en su caché de respuestas: si la respuesta ya no
+está, el componente se conserva y se reporta como sin verificar.
+
+Una cotización calculada sin guardar (vista previa) no queda en la base de
+datos: sus datos y costos se guardan en la caché con un token, con el que se
+puede ajustar (cotizacion_incremental) mientras no expire.
+"""
+import hashlib
+import json
+import uuid
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .asignacion_hospedaje import noches
+from .cache_cotizaciones import buscar_proveedores, guardar_proveedores, obtener_costos
+from .cotizacion import (
+    DatosDestino, asignar_habitaciones, asignar_vehiculos, calcular_costos, calcular_totales, consultas_amadeus,
+    detalle_cotizacion, total_pasajeros,
+)
+from .models import Cotizacion, Destino, LineaCotizacion
+
+
+CENTAVO = Decimal('0.01')
+
+PREFIJO_VISTA_PREVIA = 'cotizacion:vista_previa'
+# Segundos que se puede ajustar una vista previa
+TTL_VISTA_PREVIA_DEFECTO = 60 * 60
+
+TIPOS_VEHICULO = {'transporte_terrestre': 'terrestre', 'transporte_maritimo': 'maritimo'}
+
+
+def _firma(*partes):
+    canonico = json.dumps(partes, cls=DjangoJSONEncoder, sort_keys=True)
+    return hashlib.sha256(canonico.encode('utf-8')).hexdigest()
+
+
+def _decimal(valor):
+    return Decimal(str(valor)).quantize(CENTAVO)
+
+
+def datos_formulario(cotizacion):
+    """Datos del QuotationForm guardados, con fechas y porcentaje en sus tipos"""
+    datos = dict(cotizacion.datos)
+    datos['fecha_inicio'] = date.fromisoformat(datos['fecha_inicio'])
+    datos['fecha_fin'] = date.fromisoformat(datos['fecha_fin'])
+    datos['porcentaje_utilidad'] = Decimal(str(datos['porcentaje_utilidad']))
+    return datos
+
+
+def costos_guardados(cotizacion):
+    """Costos guardados, con los totales de cada componente como Decimal"""
+    costos = dict(cotizacion.costos)
+    for componente in ('hospedaje', 'transporte', 'alimentacion', 'seguro'):
+        costos[componente] = Decimal(str(costos[componente]))
+    return costos
+
+
+class Componentes:
+    """Componentes de una cotización y el estado actual de sus precios"""
+
+    def __init__(self, datos_form, destino, datos=None):
+        self.datos_form = datos_form
+        self.destino = destino
+        self.datos = datos or DatosDestino(destino)
+        self.proveedores = self.datos.en(datos_form['fecha_inicio'], datos_form['origen'])
+        self.total_pax = total_pasajeros(datos_form)
+        self.pax = Decimal(str(self.total_pax))
+        self.noches = noches(datos_form['fecha_inicio'], datos_form['fecha_fin'])
+        self.medio = datos_form['medio_transporte']
+        self._consultas = None
+
+    def nombres(self):
+        nombres = ['hospedaje']
+        if 'aereo' in self.medio:
+            nombres.append('transporte_aereo')
+        nombres.extend(componente for componente, tipo in TIPOS_VEHICULO.items() if tipo in self.medio)
+        return nombres + ['alimentacion', 'seguro']
+
+    def consultas(self):
+        if self._consultas is None:
+            self._consultas = consultas_amadeus(
+                self.datos, self.datos_form['origen'], self.datos_form['fecha_inicio'],
+                self.datos_form['fecha_fin'], self.total_pax, self.medio,
+            )
+        return self._consultas
+
+    def fuente_local(self, componente):
+        """Fuente del componente cuando no se consulta en Amadeus"""
+        if componente in ('hospedaje', 'transporte_aereo'):
+            return 'convenio'
+        if componente in TIPOS_VEHICULO and self.proveedores.en_ruta(TIPOS_VEHICULO[componente], self.total_pax):
+            return 'ruta'
+        return 'local'
+
+    def firma(self, componente, fuente, precio=None):
+        """Firma de los precios de los que depende el componente con esa fuente"""
+        if fuente == 'amadeus':
+            return _firma(componente, fuente, _decimal(precio))
+        if componente == 'hospedaje':
+            return _firma(componente, fuente, self.proveedores.hospedajes(con_convenio=fuente == 'convenio'))
+        if componente == 'transporte_aereo':
+            return _firma(componente, fuente, self.proveedores.por_persona('aereo_convenio' if fuente == 'convenio' else 'aereo'))
+        if componente in TIPOS_VEHICULO:
+            tramos = self.proveedores.tramos(TIPOS_VEHICULO[componente], self.total_pax)
+            # Sin camino de varios tramos la firma es la de los vehículos
+            return _firma(componente, fuente, tramos if tramos[0][0] else tramos[0][1])
+        return _firma(componente, fuente, self.proveedores.por_persona(componente))
+
+    def estado(self, componente):
+        """
+        (fuente, firma, precio de Amadeus) actuales del componente. Para
+        los componentes que se consultan en Amadeus solo se usa su caché;
+        si no hay respuesta, la fuente es 'respaldo' y el precio None.
+        """
+        consulta = self.consultas().get(componente)
+        if consulta is None:
+            fuente = self.fuente_local(componente)
+            return fuente, self.firma(componente, fuente), None
+        funcion, argumentos = consulta
+        respuesta = funcion(*argumentos, solo_cache=True)
+        if respuesta['success']:
+            return 'amadeus', self.firma(componente, 'amadeus', respuesta['price']), respuesta['price']
+        return 'respaldo', self.firma(componente, 'respaldo'), None
+
+    def calcular(self, componente, fuente, precio=None):
+        """
+        Costo del componente con la fuente dada. Retorna un diccionario con
+        'costo', 'proveedores' (hospedajes o vehículos elegidos),
+        'alternativas' (de hospedaje) y 'faltantes' (personas sin
+        hospedaje o transporte).
+        """
+        resultado = {'costo': precio, 'proveedores': [], 'alternativas': [], 'faltantes': 0}
+        if fuente == 'amadeus':
+            return resultado
+        if componente == 'hospedaje':
+            asignacion = asignar_habitaciones(
+                self.proveedores.hospedajes(con_convenio=fuente == 'convenio'), self.total_pax, self.noches
+            )
+            resultado.update(costo=asignacion['costo'], proveedores=asignacion['hospedajes'],
+                             alternativas=asignacion['alternativas'], faltantes=asignacion['faltantes'])
+        elif componente in TIPOS_VEHICULO:
+            asignacion = asignar_vehiculos(self.proveedores, TIPOS_VEHICULO[componente], self.total_pax)
+            resultado.update(costo=asignacion['costo'], proveedores=asignacion['vehiculos'],
+                             faltantes=asignacion['faltantes'])
+        elif componente == 'transporte_aereo':
+            resultado['costo'] = self.proveedores.por_persona('aereo_convenio' if fuente == 'convenio' else 'aereo') * self.pax
+        else:
+            resultado['costo'] = self.proveedores.por_persona(componente) * self.pax
+        return resultado
+
+
+def lineas_de_costos(costos, componentes):
+    """{componente: (fuente, costo, proveedores)} a partir de calcular_costos()"""
+    vehiculos = {componente: [v for v in costos.get('vehiculos', []) if v['tipoTransporte'] == tipo]
+                 for componente, tipo in TIPOS_VEHICULO.items()}
+    lineas = {}
+    for componente in componentes.nombres():
+        if componente == 'hospedaje':
+            lineas[componente] = (costos['fuentes']['hospedaje'], costos['hospedaje'], costos.get('hospedajes', []))
+        elif componente == 'transporte_aereo':
+            terrestre_y_maritimo = sum(Decimal(str(v['subtotal'])) for lista in vehiculos.values() for v in lista)
+            lineas[componente] = (costos['fuentes']['transporte_aereo'], costos['transporte'] - terrestre_y_maritimo, [])
+        elif componente in TIPOS_VEHICULO:
+            fuente = costos['fuentes'].get(componente, 'local')
+            lineas[componente] = (fuente, sum(Decimal(str(v['subtotal'])) for v in vehiculos[componente]), vehiculos[componente])
+        else:
+            lineas[componente] = ('local', costos[componente], [])
+    return lineas
+
+
+def _asignar_totales(cotizacion, costos):
+    totales = calcular_totales(costos, cotizacion.porcentaje_utilidad)
+    for campo in ('subtotal', 'iva', 'utilidad', 'total'):
+        setattr(cotizacion, campo, _decimal(totales[campo]))
+
+
+def guardar_cotizacion(datos_form, destino, entidad, costos, datos=None):
+    """
+    Guarda la cotización calculada con calcular_costos() para los datos
+    limpios de un QuotationForm. datos es el DatosDestino usado al
+    calcular, para no repetir sus consultas.
+    """
+    componentes = Componentes(datos_form, destino, datos)
+    cotizacion = Cotizacion(
+        entidad=entidad, destino=destino, origen=datos_form['origen'],
+        fecha_inicio=datos_form['fecha_inicio'], fecha_fin=datos_form['fecha_fin'],
+        total_pax=componentes.total_pax, porcentaje_utilidad=datos_form['porcentaje_utilidad'],
+        datos=datos_form, costos=costos, detalle=detalle_cotizacion(datos_form, destino, costos),
+    )
+    _asignar_totales(cotizacion, costos)
+
+    lineas = []
+    for componente, (fuente, costo, proveedores) in lineas_de_costos(costos, componentes).items():
+        lineas.append(LineaCotizacion(
+            componente=componente, fuente=fuente, costo=_decimal(costo), proveedores=proveedores,
+            firma=componentes.firma(componente, fuente, costo),
+        ))
+    with transaction.atomic():
+        cotizacion.save()
+        for linea in lineas:
+            linea.cotizacion = cotizacion
+        LineaCotizacion.objects.bulk_create(lineas)
+    return cotizacion
+
+
+def _como_json(valor):
+    """El valor tal como queda en un JSONField de Cotizacion (fechas y decimales como texto)"""
+    return json.loads(json.dumps(valor, cls=DjangoJSONEncoder))
+
+
+def vista_previa(datos_form, destino, entidad, costos):
+    """
+    Cotización sin guardar (sin pk ni líneas) con su detalle. Sus datos y
+    costos quedan en la caché con el token cotizacion.vista_previa, para
+    ajustarla con buscar_vista_previa() sin guardarla antes.
+    """
+    cotizacion = Cotizacion(entidad=entidad, destino=destino, datos=_como_json(datos_form),
+                            costos=_como_json(costos), detalle=detalle_cotizacion(datos_form, destino, costos))
+    cotizacion.vista_previa = uuid.uuid4().hex
+    ttl = getattr(settings, 'COTIZACION_VISTA_PREVIA_TTL', TTL_VISTA_PREVIA_DEFECTO)
+    if ttl:
+        cache.set(f'{PREFIJO_VISTA_PREVIA}:{cotizacion.vista_previa}', {
+            'entidad_id': entidad.pk if entidad else None,
+            'destino_id': destino.pk,
+            'datos': cotizacion.datos,
+            'costos': cotizacion.costos,
+            'detalle': _como_json(cotizacion.detalle),
+        }, timeout=ttl)
+    return cotizacion
+
+
+def buscar_vista_previa(token, entidad):
+    """Cotización sin guardar de una vista previa de la entidad, o None si no existe o ya expiró"""
+    valores = cache.get(f'{PREFIJO_VISTA_PREVIA}:{token}')
+    if valores is None or entidad is None or valores['entidad_id'] != entidad.pk:
+        return None
+    return Cotizacion(entidad=entidad, destino=Destino.objects.filter(pk=valores['destino_id']).first(),
+                      datos=valores['datos'], costos=valores['costos'], detalle=valores['detalle'])
+
+
+def cotizar(datos_form, destino, entidad, guardar=True):
+    """
+    Calcula los costos de la cotización (o los toma de la caché si la misma
+    cotización ya se calculó, aunque cambie el porcentaje de utilidad) y,
+    con guardar, la guarda. Lo usan calculate_quotation y la cola de
+    trabajos. Los proveedores del destino también se toman de la caché si
+    ya se consultaron. Sin guardar retorna la vista_previa().
+    """
+    clave_proveedores, valores = buscar_proveedores(destino.pk)
+    datos = DatosDestino(destino, valores)
+    costos = obtener_costos(
+        datos_form, entidad.pk if entidad else None,
+        lambda: calcular_costos(destino, datos_form['origen'], datos_form['fecha_inicio'], datos_form['fecha_fin'],
+                                total_pasajeros(datos_form), datos_form['medio_transporte'], datos=datos),
+    )
+    if guardar:
+        cotizacion = guardar_cotizacion(datos_form, destino, entidad, costos, datos=datos)
+    else:
+        cotizacion = vista_previa(datos_form, destino, entidad, costos)
+    guardar_proveedores(clave_proveedores, datos, valores)
+    return cotizacion
+
+
+def recotizar(cotizacion):
+    """
+    Vuelve a cotizar con los precios actuales, recalculando solo los
+    componentes cuya firma cambió. Retorna {'recalculados': [...],
+    'sin_verificar': [...]} con los componentes recalculados y los de
+    Amadeus que no se pudieron revisar por no estar en caché.
+    """
+    datos_form = datos_formulario(cotizacion)
+    componentes = Componentes(datos_form, cotizacion.destino)
+    costos = costos_guardados(cotizacion)
+    costos['fuentes'] = dict(costos.get('fuentes', {}))
+    costos['pax_sin_transporte'] = dict(costos.get('pax_sin_transporte', {}))
+
+    recalculados = []
+    sin_verificar = []
+    lineas = list(cotizacion.lineas.all())
+    for linea in lineas:
+        fuente, firma, precio = componentes.estado(linea.componente)
+        if firma == linea.firma:
+            continue
+        if linea.fuente == 'amadeus' and fuente == 'respaldo':
+            # La respuesta de Amadeus ya no está en caché: no hay con qué comparar
+            sin_verificar.append(linea.componente)
+            continue
+
+        resultado = componentes.calcular(linea.componente, fuente, precio)
+        if linea.componente == 'hospedaje':
+            costos['hospedaje'] = resultado['costo']
+            costos['hospedajes'] = resultado['proveedores']
+            costos['alternativas_hospedaje'] = resultado['alternativas']
+            costos['pax_sin_hospedaje'] = resultado['faltantes']
+            costos['fuentes']['hospedaje'] = fuente
+        elif linea.componente in TIPOS_VEHICULO:
+            tipo = TIPOS_VEHICULO[linea.componente]
+            costos['vehiculos'] = [v for v in costos.get('vehiculos', []) if v['tipoTransporte'] != tipo]
+            costos['vehiculos'] += resultado['proveedores']
+            costos['pax_sin_transporte'].pop(tipo, None)
+            if resultado['faltantes']:
+                costos['pax_sin_transporte'][tipo] = resultado['faltantes']
+            # Como en calcular_costos, solo los vehículos de una ruta tienen fuente propia
+            costos['fuentes'].pop(linea.componente, None)
+            if fuente == 'ruta':
+                costos['fuentes'][linea.componente] = fuente
+        elif linea.componente == 'transporte_aereo':
+            costos['fuentes']['transporte_aereo'] = fuente
+        else:
+            costos[linea.componente] = resultado['costo']
+
+        linea.fuente = fuente
+        linea.costo = _decimal(resultado['costo'])
+        linea.proveedores = resultado['proveedores']
+        linea.firma = firma
+        recalculados.append(linea.componente)
+
+    if recalculados:
+        if any(componente.startswith('transporte_') for componente in recalculados):
+            costos['transporte'] = sum(
+                (linea.costo for linea in lineas if linea.componente.startswith('transporte_')), Decimal('0.00')
+            )
+        costos['respaldo'] = [componente for componente, fuente in costos['fuentes'].items() if fuente == 'respaldo']
+        costos['amadeus'] = 'amadeus' in costos['fuentes'].values()
+        cotizacion.costos = costos
+        cotizacion.detalle = detalle_cotizacion(datos_form, cotizacion.destino, costos)
+        _asignar_totales(cotizacion, costos)
+        cotizacion.version += 1
+        with transaction.atomic():
+            cotizacion.save()
+            LineaCotizacion.objects.bulk_update(
+                [linea for linea in lineas if linea.componente in recalculados],
+                ['fuente', 'costo', 'proveedores', 'firma'],
+            )
+    return {'recalculados': recalculados, 'sin_verificar': sin_verificar}
+
+
+def resumen(cotizacion):
+    """Datos de una cotización para el historial"""
+    return {
+        'id': cotizacion.pk,
+        'creado': cotizacion.creado.isoformat(),
+        'actualizado': cotizacion.actualizado.isoformat(),
+        'version': cotizacion.version,
+        'destino': cotizacion.destino.nombre if cotizacion.destino else None,
+        'origen': cotizacion.origen,
+        'fecha_inicio': cotizacion.fecha_inicio.strftime('%Y-%m-%d'),
+        'fecha_fin': cotizacion.fecha_fin.strftime('%Y-%m-%d'),
+        'total_pax': cotizacion.total_pax,
+        'total': float(cotizacion.total),
+    }
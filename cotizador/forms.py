@@ -242,6 +242,7 @@ class TransporteForm(FormHelperMixin, forms.ModelForm):
             'pais', 'departamento', 'municipio',  # Nuevos campos de ubicación
             'RNT', 'cantidad', 'pax', 'capacidadCarga', 'baño', 'aire',
             'sillasrecli', 'wifi', 'enchufes', 'conexion_usb', 'pantallas', 'tipo_pantallas',
+            'modo_precio', 'precio_km',
             'imagen'  # Agregar el campo de imagen
         ]
         labels = {
@@ -262,6 +263,8 @@ class TransporteForm(FormHelperMixin, forms.ModelForm):
             'conexion_usb': 'Conexión USB',
             'pantallas': 'Pantallas',
             'tipo_pantallas': 'Tipo de Pantallas',
+            'modo_precio': 'Modo de precio',
+            'precio_km': 'Precio por km',
             'imagen': 'Imagen Principal del Vehículo'
         }
         widgets = {
@@ -282,6 +285,8 @@ class TransporteForm(FormHelperMixin, forms.ModelForm):
             'wifi': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'enchufes': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'tipo_pantallas': forms.Select(attrs={'class': 'form-select'}),
+            'modo_precio': forms.Select(attrs={'class': 'form-select'}),
+            'precio_km': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'min': '0'}),
             'imagen': forms.FileInput(attrs={'class': 'form-control'}),
             'imagenes': forms.HiddenInput(),  # Campo oculto para el valor real de imágenes múltiples
         }
@@ -308,6 +313,15 @@ class TransporteForm(FormHelperMixin, forms.ModelForm):
         # Validar que las URLs sean correctas si es necesario
         return data
 
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('modo_precio') == 'km':
+            if cleaned_data.get('tipoTransporte') != 'terrestre':
+                self.add_error('modo_precio', "El precio por kilómetro solo aplica a transporte terrestre.")
+            elif cleaned_data.get('precio_km') is None:
+                self.add_error('precio_km', "Indique el precio por kilómetro.")
+        return cleaned_data
+
     def save(self, commit=True):
         # Manejar la conversión del campo personalizado antes de guardar
         if 'imagenes_texto' in self.cleaned_data and hasattr(self.instance, 'imagenes'):
@@ -684,6 +698,49 @@ class ConvenioAgenciaForm(FormHelperMixin, forms.ModelForm):
             'descripcion': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
         }
 
+class CaminoRutasForm(forms.Form):
+    """Búsqueda del camino de rutas de varios tramos entre dos ciudades (ver cotizador.grafo_rutas)"""
+    CRITERIO_CHOICES = [
+        ('precio', 'Más barato'),
+        ('tramos', 'Menos tramos'),
+    ]
+    TIPO_CHOICES = [
+        ('terrestre', 'Terrestre'),
+        ('aereo', 'Aéreo'),
+        ('maritimo', 'Marítimo'),
+    ]
+
+    origen = forms.CharField(max_length=255, label="Ciudad de origen")
+    destino = forms.CharField(max_length=255, label="Ciudad de destino")
+    fecha = forms.DateField(label="Fecha del viaje")
+    pax = forms.IntegerField(min_value=1, label="Pasajeros")
+    criterio = forms.ChoiceField(choices=CRITERIO_CHOICES, required=False, label="Criterio")
+    tipos = forms.MultipleChoiceField(choices=TIPO_CHOICES, required=False, label="Tipos de vehículo")
+
+
+class ProveedoresCercanosForm(forms.Form):
+    """Búsqueda de proveedores a menos de un radio de un destino (ver cotizador.geografia)"""
+    CATEGORIA_CHOICES = [
+        ('hospedaje', 'Hospedaje'),
+        ('transporte', 'Transporte'),
+        ('alimentacion', 'Alimentación'),
+        ('seguro', 'Seguro'),
+    ]
+
+    categoria = forms.ChoiceField(choices=CATEGORIA_CHOICES, required=False, label="Categoría")
+    radio_km = forms.FloatField(min_value=0.1, label="Radio (km)")
+
+    def clean_radio_km(self):
+        from django.conf import settings
+        from .geografia import RADIO_MAXIMO_DEFECTO
+
+        radio_km = self.cleaned_data['radio_km']
+        maximo = getattr(settings, 'GEO_RADIO_MAXIMO_KM', RADIO_MAXIMO_DEFECTO)
+        if radio_km > maximo:
+            raise forms.ValidationError(f"El radio de búsqueda admite como máximo {maximo} km.")
+        return radio_km
+
+
 class RutaTransporteForm(FormHelperMixin, forms.ModelForm):
     def __init__(self, *args, **kwargs):
         # Obtener la entidad del usuario para filtrar opciones
@@ -817,8 +874,15 @@ class QuotationForm(FormHelperMixin, forms.Form):
     def __init__(self, *args, **kwargs):
         # Obtener la entidad del usuario para filtrar destinos
         entidad_usuario = kwargs.pop('entidad_usuario', None)
+        # Opciones de destino ya calculadas (p. ej. para validar un lote de
+        # escenarios sin consultar los destinos en cada formulario)
+        opciones_destino = kwargs.pop('opciones_destino', None)
         super().__init__(*args, **kwargs)
 
+        if opciones_destino is not None:
+            self.fields['destino'].choices = opciones_destino
+            return
+
         # Llenar las opciones de destinos según la entidad del usuario
         choices = [('', '---------')]
         if entidad_usuario:
@@ -843,6 +907,77 @@ class QuotationForm(FormHelperMixin, forms.Form):
         self.fields['destino'].choices = choices
 
 
+class BarridoCotizacionForm(QuotationForm):
+    """
+    Cotización para un rango de tamaños de grupo y varias temporadas. En
+    lugar del desglose de pasajeros se indica el rango (pax_desde a
+    pax_hasta, cada 'paso' pasajeros).
+    """
+    pax_desde = forms.IntegerField(min_value=1, label="Pasajeros desde")
+    pax_hasta = forms.IntegerField(min_value=1, label="Pasajeros hasta")
+    paso = forms.IntegerField(min_value=1, initial=1, required=False, label="Cada cuántos pasajeros")
+    temporadas = forms.MultipleChoiceField(
+        choices=Paquete.TEMPORADA_CHOICES,
+        label="Temporadas",
+        widget=forms.CheckboxSelectMultiple,
+        required=False
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for campo in ('adultos', 'ninios', 'bebes', 'adultos_mayores', 'estudiantes'):
+            del self.fields[campo]
+
+    def clean(self):
+        from django.conf import settings
+        from .cotizacion_barrido import MAXIMO_PUNTOS_DEFECTO, rango_pax
+
+        cleaned_data = super().clean()
+        pax_desde = cleaned_data.get('pax_desde')
+        pax_hasta = cleaned_data.get('pax_hasta')
+        if pax_desde and pax_hasta:
+            if pax_hasta < pax_desde:
+                raise forms.ValidationError("El número final de pasajeros debe ser mayor o igual al inicial.")
+            cleaned_data['pax'] = rango_pax(pax_desde, pax_hasta, cleaned_data.get('paso') or 1)
+            maximo = getattr(settings, 'COTIZACION_BARRIDO_MAXIMO', MAXIMO_PUNTOS_DEFECTO)
+            if len(cleaned_data['pax']) > maximo:
+                raise forms.ValidationError(f"El barrido admite como máximo {maximo} tamaños de grupo.")
+        # Sin temporadas elegidas se calculan todas
+        cleaned_data['temporadas'] = cleaned_data.get('temporadas') or [valor for valor, _ in Paquete.TEMPORADA_CHOICES]
+        return cleaned_data
+
+
+class VentanasCotizacionForm(QuotationForm):
+    """
+    Búsqueda de las estadías más baratas de un número de noches entre
+    fecha_inicio y fecha_fin (ver cotizador.busqueda_ventanas)
+    """
+    noches = forms.IntegerField(min_value=1, label="Noches de la estadía")
+    mejores = forms.IntegerField(min_value=1, max_value=20, required=False, label="Ventanas a mostrar")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['fecha_inicio'].label = "Salida desde"
+        self.fields['fecha_fin'].label = "Regreso hasta"
+
+    def clean(self):
+        from django.conf import settings
+        from .busqueda_ventanas import MAXIMO_VENTANAS_DEFECTO
+
+        cleaned_data = super().clean()
+        fecha_inicio = cleaned_data.get('fecha_inicio')
+        fecha_fin = cleaned_data.get('fecha_fin')
+        noches = cleaned_data.get('noches')
+        if fecha_inicio and fecha_fin and noches:
+            ventanas = (fecha_fin - fecha_inicio).days - noches + 1
+            if ventanas < 1:
+                raise forms.ValidationError("El rango de fechas debe cubrir al menos una estadía completa.")
+            maximo = getattr(settings, 'VENTANAS_MAXIMO', MAXIMO_VENTANAS_DEFECTO)
+            if ventanas > maximo:
+                raise forms.ValidationError(f"La búsqueda admite como máximo {maximo} fechas de salida.")
+        return cleaned_data
+
+
 class RutaTransporteForm(FormHelperMixin, forms.ModelForm):
     def __init__(self, *args, **kwargs):
         # Obtener la entidad del usuario para filtrar opciones
@@ -0,0 +1,238 @@
+"""
+Coordenadas de destinos y proveedores y búsqueda por radio
+
+Los municipios de referencia (Municipio) guardan la latitud y longitud de su
+cabecera, cargadas desde static/data/coordenadas_municipios.csv (o desde otro
+CSV con las mismas columnas, ver el comando cargar_ubicaciones). Los destinos
+y proveedores toman las coordenadas de su municipio_ref, salvo que su texto
+de ubicación ya sea un par numérico 'latitud, longitud', que es más preciso.
+Las señales de cotizador.signals las recalculan en cada save.
+
+Para buscar "todos los hospedajes disponibles a menos de X km" sin una
+extensión espacial de SQLite, cada registro guarda además la celda de una
+cuadrícula de TAMANO_CELDA grados (celda_geo, con índice). El círculo de
+búsqueda se cubre con un rango de celdas contiguas por cada fila de la
+cuadrícula, así que la consulta es una unión de rangos sobre el índice, y la
+distancia exacta (haversine) solo se calcula para los registros de esas
+celdas.
+"""
+import csv
+import math
+import re
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Alimentacion, Hospedaje, Municipio, Seguro, Transporte
+from .ubicaciones import normalizar_texto
+
+
+RUTA_COORDENADAS = settings.BASE_DIR / 'static' / 'data' / 'coordenadas_municipios.csv'
+
+MODELOS_CON_COORDENADAS = ['Destino', 'Hospedaje', 'Transporte', 'Alimentacion', 'Seguro']
+
+CAMPOS_GEO = ['latitud', 'longitud', 'celda_geo']
+
+RADIO_TIERRA_KM = 6371.0088
+KM_POR_GRADO = math.pi * RADIO_TIERRA_KM / 180
+
+# Celdas de 0,1 grados (unos 11 km de lado en Colombia); cambiarlo obliga a
+# recalcular celda_geo con el comando cargar_ubicaciones
+CELDAS_POR_GRADO = 10
+TAMANO_CELDA = 1 / CELDAS_POR_GRADO
+COLUMNAS = 360 * CELDAS_POR_GRADO
+
+TAMANO_LOTE = 500
+
+# Modelo y campos que se retornan de cada categoría de proveedor en la búsqueda por radio
+PROVEEDORES_CERCANOS = {
+    'hospedaje': (Hospedaje, ('id', 'nombreLugar', 'tipoHospedaje', 'capacidadpax', 'precio', 'calificacion')),
+    'transporte': (Transporte, ('id', 'nombre', 'tipoTransporte', 'pax', 'precio')),
+    'alimentacion': (Alimentacion, ('id', 'nombre', 'precio')),
+    'seguro': (Seguro, ('id', 'nombre', 'precio')),
+}
+
+# Radio máximo de búsqueda cuando no se configura GEO_RADIO_MAXIMO_KM
+RADIO_MAXIMO_DEFECTO = 200
+
+PATRON_COORDENADAS = re.compile(r'^\s*(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)\s*$')
+
+
+def coordenadas_validas(latitud, longitud):
+    return -90 <= latitud <= 90 and -180 <= longitud <= 180
+
+
+def haversine_km(latitud1, longitud1, latitud2, longitud2):
+    """Distancia en km sobre la superficie terrestre entre dos puntos (grados decimales)"""
+    fi1, fi2 = math.radians(latitud1), math.radians(latitud2)
+    delta_fi = fi2 - fi1
+    delta_lambda = math.radians(longitud2 - longitud1)
+    a = math.sin(delta_fi / 2) ** 2 + math.cos(fi1) * math.cos(fi2) * math.sin(delta_lambda / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _fila(latitud):
+    return min(int(math.floor((latitud + 90) * CELDAS_POR_GRADO)), 180 * CELDAS_POR_GRADO - 1)
+
+
+def _columna(longitud):
+    return min(int(math.floor((longitud + 180) * CELDAS_POR_GRADO)), COLUMNAS - 1)
+
+
+def celda_de(latitud, longitud):
+    """Número de la celda de la cuadrícula que contiene el punto"""
+    return _fila(latitud) * COLUMNAS + _columna(longitud)
+
+
+def coordenadas_desde_texto(texto):
+    """(latitud, longitud) de un texto 'lat, lon' como '4.6376, -75.5704', o None"""
+    coincidencia = PATRON_COORDENADAS.match(texto or '')
+    if not coincidencia:
+        return None
+    latitud, longitud = float(coincidencia.group(1)), float(coincidencia.group(2))
+    return (latitud, longitud) if coordenadas_validas(latitud, longitud) else None
+
+
+def leer_coordenadas(ruta=None):
+    """{(clave_departamento, clave_municipio): (latitud, longitud)} de un CSV departamento,municipio,latitud,longitud"""
+    coordenadas = {}
+    with open(ruta or RUTA_COORDENADAS, encoding='utf-8', newline='') as archivo:
+        for numero, fila in enumerate(csv.DictReader(archivo), start=2):
+            try:
+                latitud, longitud = float(fila['latitud']), float(fila['longitud'])
+            except (TypeError, ValueError):
+                raise ValueError(f'Coordenadas inválidas en la línea {numero}: {fila}')
+            if not coordenadas_validas(latitud, longitud):
+                raise ValueError(f'Coordenadas fuera de rango en la línea {numero}: {fila}')
+            clave = (normalizar_texto(fila['departamento']), normalizar_texto(fila['municipio']))
+            coordenadas[clave] = (latitud, longitud)
+    return coordenadas
+
+
+def cargar_coordenadas(ruta=None, apps=None):
+    """
+    Guarda en Municipio las coordenadas del CSV (por defecto
+    RUTA_COORDENADAS). Es idempotente; retorna el número de municipios
+    actualizados.
+    """
+    if apps is None:
+        from django.apps import apps
+    Municipio = apps.get_model('cotizador', 'Municipio')
+
+    coordenadas = leer_coordenadas(ruta)
+    actualizados = []
+    for municipio in Municipio.objects.select_related('departamento'):
+        nuevas = coordenadas.get((municipio.departamento.clave, municipio.clave))
+        if nuevas is not None and (municipio.latitud, municipio.longitud) != nuevas:
+            municipio.latitud, municipio.longitud = nuevas
+            actualizados.append(municipio)
+    Municipio.objects.bulk_update(actualizados, ['latitud', 'longitud'], batch_size=TAMANO_LOTE)
+    return len(actualizados)
+
+
+def mapa_coordenadas(apps=None):
+    """{municipio_id: (latitud, longitud)} de los municipios con coordenadas"""
+    if apps is None:
+        from django.apps import apps
+    Municipio = apps.get_model('cotizador', 'Municipio')
+    return {id_: (latitud, longitud) for id_, latitud, longitud in Municipio.objects.exclude(
+        latitud=None).exclude(longitud=None).values_list('id', 'latitud', 'longitud')}
+
+
+def coordenadas_de(instancia, mapa=None):
+    """
+    (latitud, longitud) de un destino o proveedor: las de su texto de
+    ubicación si es numérico, si no las de su municipio de referencia; o
+    None. Sin un mapa precargado (mapa_coordenadas) consulta el municipio.
+    """
+    coordenadas = coordenadas_desde_texto(getattr(instancia, 'ubicacion', None))
+    if coordenadas is not None or not instancia.municipio_ref_id:
+        return coordenadas
+    if mapa is not None:
+        return mapa.get(instancia.municipio_ref_id)
+    coordenadas = Municipio.objects.filter(pk=instancia.municipio_ref_id).values_list('latitud', 'longitud').first()
+    return coordenadas if coordenadas and None not in coordenadas else None
+
+
+def actualizar_coordenadas(instancia, mapa=None):
+    """Recalcula latitud, longitud y celda_geo de la instancia (sin guardarla). Retorna True si cambiaron."""
+    anteriores = tuple(getattr(instancia, campo) for campo in CAMPOS_GEO)
+    coordenadas = coordenadas_de(instancia, mapa)
+    if coordenadas is None:
+        instancia.latitud = instancia.longitud = instancia.celda_geo = None
+    else:
+        instancia.latitud, instancia.longitud = coordenadas
+        instancia.celda_geo = celda_de(*coordenadas)
+    return tuple(getattr(instancia, campo) for campo in CAMPOS_GEO) != anteriores
+
+
+def recalcular_coordenadas(apps=None):
+    """Recalcula las coordenadas de todos los destinos y proveedores; retorna el número de registros actualizados"""
+    if apps is None:
+        from django.apps import apps
+    mapa = mapa_coordenadas(apps)
+    total = 0
+    for nombre_modelo in MODELOS_CON_COORDENADAS:
+        modelo = apps.get_model('cotizador', nombre_modelo)
+        pendientes = [instancia for instancia in modelo.objects.all() if actualizar_coordenadas(instancia, mapa)]
+        modelo.objects.bulk_update(pendientes, CAMPOS_GEO, batch_size=TAMANO_LOTE)
+        total += len(pendientes)
+    return total
+
+
+def rangos_de_celdas(latitud, longitud, radio_km):
+    """
+    Rangos (desde, hasta) de celda_geo que cubren el círculo: uno por fila
+    de la cuadrícula, con las columnas de la longitud más ancha del círculo
+    en esa franja. No da la vuelta por el antimeridiano (no hace falta en
+    Colombia).
+    """
+    delta_latitud = radio_km / KM_POR_GRADO
+    latitud_minima = max(-90.0, latitud - delta_latitud)
+    latitud_maxima = min(90.0, latitud + delta_latitud)
+    coseno = math.cos(math.radians(max(abs(latitud_minima), abs(latitud_maxima))))
+    if coseno * 180 * KM_POR_GRADO <= radio_km:
+        columna_minima, columna_maxima = 0, COLUMNAS - 1
+    else:
+        delta_longitud = radio_km / (KM_POR_GRADO * coseno)
+        columna_minima = _columna(max(-180.0, longitud - delta_longitud))
+        columna_maxima = _columna(min(180.0, longitud + delta_longitud))
+    return [(fila * COLUMNAS + columna_minima, fila * COLUMNAS + columna_maxima)
+            for fila in range(_fila(latitud_minima), _fila(latitud_maxima) + 1)]
+
+
+def filtro_radio(latitud, longitud, radio_km):
+    """Q que selecciona los registros de las celdas que cubren el círculo"""
+    filtro = Q(pk__in=[])
+    for desde, hasta in rangos_de_celdas(latitud, longitud, radio_km):
+        filtro |= Q(celda_geo__range=(desde, hasta))
+    return filtro
+
+
+def cercanos(queryset, latitud, longitud, radio_km, campos=('id',)):
+    """
+    Registros del queryset a menos de radio_km del punto, como diccionarios
+    con los campos pedidos, sus coordenadas y 'distancia_km', del más
+    cercano al más lejano
+    """
+    resultado = []
+    for fila in queryset.filter(filtro_radio(latitud, longitud, radio_km)).values(*campos, 'latitud', 'longitud'):
+        distancia = haversine_km(latitud, longitud, fila['latitud'], fila['longitud'])
+        if distancia <= radio_km:
+            fila['distancia_km'] = round(distancia, 2)
+            resultado.append(fila)
+    resultado.sort(key=lambda fila: fila['distancia_km'])
+    return resultado
+
+
+def proveedores_cercanos(destino, categoria, radio_km):
+    """Proveedores disponibles de la categoría a menos de radio_km del destino ([] si el destino no tiene coordenadas)"""
+    if destino.latitud is None or destino.longitud is None:
+        return []
+    modelo, campos = PROVEEDORES_CERCANOS[categoria]
+    return cercanos(modelo.objects.filter(disponible=True), destino.latitud, destino.longitud, radio_km, campos)
+
+
+def hospedajes_cercanos(destino, radio_km):
+    """Hospedajes disponibles a menos de radio_km del destino"""
+    return proveedores_cercanos(destino, 'hospedaje', radio_km)
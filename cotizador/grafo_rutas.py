@@ -0,0 +1,333 @@
+"""
+Grafo de rutas de transporte de varios tramos
+
+Las rutas (RutaTransporte) se guardan como tramos sueltos desde la ciudad de
+origen de un convenio, pero muchos destinos (Puerto Nariño, municipios
+rurales) solo se alcanzan pasando por otra ciudad. El grafo de una agencia
+tiene un nodo por ciudad (clave normalizada de municipio) y una arista por
+cada par de ciudades con rutas; la ciudad de llegada de una ruta es su
+ciudad_destino, el municipio de su destino o los de los destinos de su
+paquete.
+
+El costo de una arista para un grupo es el de la ruta más barata del tramo
+vigente en la fecha: el precio de la temporada por las unidades del
+vehículo que necesita el grupo. camino() busca con Dijkstra, en centavos
+enteros, el camino más barato ('precio') o el de menos tramos y, entre
+ellos, el más barato ('tramos'), y termina al llegar al destino. Cada grafo
+guarda los últimos resultados, así que repetir una búsqueda (en cada
+componente de una cotización, en un lote o un barrido) es una consulta en
+diccionario.
+
+El grafo se guarda en memoria por agencia. Cada cambio de una ruta (o de su
+convenio o vehículo) se anota en la caché de Django con un número de
+secuencia; al consultar, cada proceso vuelve a leer solo las rutas
+cambiadas desde su copia y las reemplaza en una copia superficial del grafo
+(las consultas en curso siguen con la anterior). Si faltan cambios en la
+caché o son demasiados, el grafo se reconstruye completo.
+"""
+import heapq
+import threading
+from collections import OrderedDict, defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .indice_rutas import CAMPO_PRECIO, SIN_FIN, SIN_INICIO, clave_ciudad, temporada_de
+from .models import Paquete, RutaTransporte
+from .montos import a_centavos
+
+
+PREFIJO = 'grafo_rutas'
+
+CRITERIOS = ('precio', 'tramos')
+
+# Cambios que un proceso aplica sobre su copia antes de reconstruir el grafo completo
+CAMBIOS_MAXIMO_DEFECTO = 200
+# Segundos que se guarda cada cambio en la caché
+CAMBIOS_DURACION = 24 * 60 * 60
+# Resultados de camino() que guarda cada grafo (una cotización repite la
+# misma búsqueda en cada componente, lote y barrido)
+CONSULTAS_MAXIMO = 1024
+
+CAMPOS_RUTA = (
+    'id', 'clave_origen', 'clave_destino', 'destino__clave_municipio', 'paquete_id',
+    'precio_alta', 'precio_media', 'precio_baja',
+    'convenio_agencia__fecha_inicio', 'convenio_agencia__fecha_fin',
+    'transporte_id', 'transporte__entidad_id', 'transporte__nombre', 'transporte__tipoTransporte',
+    'transporte__pax', 'transporte__cantidad',
+)
+
+_GRAFOS = {}
+_LOCK = threading.Lock()
+
+
+def rutas_activas(agencia_id):
+    """Rutas de la agencia con convenio activo y vehículo disponible"""
+    return RutaTransporte.objects.filter(
+        convenio_agencia__entidad_agencia_id=agencia_id, convenio_agencia__activo=True,
+        transporte__disponible=True,
+    ).exclude(clave_origen='')
+
+
+def filas_de_rutas(rutas):
+    """
+    Filas de las rutas para el grafo: diccionarios con CAMPOS_RUTA más
+    'llegadas' (ciudades a las que llega cada ruta), con una consulta más
+    para los destinos de los paquetes
+    """
+    filas = list(rutas.values(*CAMPOS_RUTA))
+    municipios_por_paquete = defaultdict(set)
+    paquetes = {fila['paquete_id'] for fila in filas if fila['paquete_id']}
+    if paquetes:
+        for paquete_id, clave_municipio in Paquete.destinos.through.objects.filter(
+            paquete_id__in=paquetes
+        ).values_list('paquete_id', 'destino__clave_municipio'):
+            municipios_por_paquete[paquete_id].add(clave_municipio)
+
+    for fila in filas:
+        if fila['destino__clave_municipio']:
+            llegadas = {fila['destino__clave_municipio']}
+        elif fila['paquete_id']:
+            llegadas = municipios_por_paquete.get(fila['paquete_id'], set())
+        else:
+            llegadas = {fila['clave_destino']}
+        fila['llegadas'] = sorted(llegadas - {'', fila['clave_origen']})
+        fecha_inicio = fila['convenio_agencia__fecha_inicio']
+        fecha_fin = fila['convenio_agencia__fecha_fin']
+        fila['inicio'] = fecha_inicio.toordinal() if fecha_inicio else SIN_INICIO
+        fila['fin'] = fecha_fin.toordinal() + 1 if fecha_fin else SIN_FIN
+    return filas
+
+
+def _preparar(fila):
+    """Agrega a la fila los precios en centavos enteros y la capacidad para la búsqueda"""
+    fila['centavos'] = {campo: a_centavos(fila[campo]) for campo in CAMPO_PRECIO.values()}
+    fila['capacidad'] = fila['transporte__pax'] or 0
+    fila['unidades_maximas'] = fila['transporte__cantidad'] or 1
+    return fila
+
+
+class GrafoRutas:
+    """Ciudades y tramos de las rutas de una agencia"""
+
+    def __init__(self, filas=()):
+        # desde -> hasta -> {ruta_id: fila}
+        self._aristas = defaultdict(dict)
+        # ruta_id -> ciudad de salida
+        self._salidas = {}
+        self._consultas = OrderedDict()
+        self._lock = threading.Lock()
+        for fila in filas:
+            self._agregar(fila)
+
+    def _agregar(self, fila):
+        if not fila['llegadas'] or not (fila['transporte__pax'] or 0) > 0:
+            return
+        _preparar(fila)
+        desde = fila['clave_origen']
+        tramos = self._aristas[desde]
+        for hasta in fila['llegadas']:
+            tramos.setdefault(hasta, {})[fila['id']] = fila
+        self._salidas[fila['id']] = desde
+
+    def con_cambios(self, ruta_ids, filas):
+        """
+        Copia del grafo sin las rutas ruta_ids y con las filas dadas (las
+        que siguen activas de esas rutas). Solo se copian los diccionarios
+        de las ciudades que cambian.
+        """
+        nuevo = GrafoRutas()
+        nuevo._aristas = defaultdict(dict, self._aristas)
+        nuevo._salidas = dict(self._salidas)
+        copiadas = set()
+
+        def tramos_de(desde):
+            if desde not in copiadas:
+                nuevo._aristas[desde] = {hasta: dict(rutas) for hasta, rutas in self._aristas.get(desde, {}).items()}
+                copiadas.add(desde)
+            return nuevo._aristas[desde]
+
+        for ruta_id in ruta_ids:
+            desde = nuevo._salidas.pop(ruta_id, None)
+            if desde is None:
+                continue
+            tramos = tramos_de(desde)
+            for hasta in [hasta for hasta, rutas in tramos.items() if ruta_id in rutas]:
+                del tramos[hasta][ruta_id]
+                if not tramos[hasta]:
+                    del tramos[hasta]
+        for fila in filas:
+            if fila['llegadas']:
+                tramos_de(fila['clave_origen'])
+                nuevo._agregar(fila)
+        return nuevo
+
+    def numero_rutas(self):
+        return len(self._salidas)
+
+    def camino(self, origen, destino, fecha, total_pax, criterio='precio', tipos=None, temporada=None):
+        """
+        Camino desde la ciudad origen hasta la ciudad destino (claves
+        normalizadas) para un grupo que viaja en la fecha, con el criterio
+        'precio' o 'tramos' y opcionalmente solo con vehículos de los tipos
+        dados. Los precios son los de la temporada dada o, si no se da, los
+        de la temporada de la fecha. Retorna {'costo', 'tramos': [{'ruta_id', 'desde', 'hasta',
+        'tipo', 'transporte_id', 'entidad_id', 'vehiculo', 'capacidad',
+        'unidades', 'precio_unitario', 'costo'}]} o None si no hay camino.
+        """
+        if criterio not in CRITERIOS:
+            raise ValueError(f'Criterio desconocido: {criterio}')
+        if not origen or not destino or origen == destino or total_pax <= 0:
+            return None
+        tipos = frozenset(tipos) if tipos is not None else None
+        temporada = temporada or temporada_de(fecha)
+        clave = (origen, destino, fecha.toordinal(), total_pax, criterio, tipos, temporada)
+        with self._lock:
+            if clave in self._consultas:
+                self._consultas.move_to_end(clave)
+                resultado = self._consultas[clave]
+            else:
+                resultado = False
+        if resultado is False:
+            resultado = self._buscar(origen, destino, fecha, total_pax, criterio, tipos, temporada)
+            with self._lock:
+                self._consultas[clave] = resultado
+                while len(self._consultas) > CONSULTAS_MAXIMO:
+                    self._consultas.popitem(last=False)
+        if resultado is None:
+            return None
+        return {'costo': resultado['costo'], 'tramos': [dict(tramo) for tramo in resultado['tramos']]}
+
+    def _buscar(self, origen, destino, fecha, total_pax, criterio, tipos, temporada):
+        """Dijkstra desde origen; termina al sacar el destino de la cola"""
+        dia = fecha.toordinal()
+        campo = CAMPO_PRECIO[temporada]
+        por_precio = criterio == 'precio'
+
+        # Prioridades (centavos, tramos) o (tramos, centavos) comparadas como tuplas de enteros
+        mejores = {origen: (0, 0)}
+        previos = {}
+        pendientes = [((0, 0), origen)]
+        while pendientes:
+            actual, ciudad = heapq.heappop(pendientes)
+            if ciudad == destino:
+                break
+            if actual > mejores[ciudad]:
+                continue
+            costo, tramos = actual if por_precio else (actual[1], actual[0])
+            for hasta, rutas in self._aristas.get(ciudad, {}).items():
+                # Ruta más barata del tramo vigente en la fecha que lleva al grupo
+                mejor = None
+                for fila in rutas.values():
+                    if not fila['inicio'] <= dia < fila['fin']:
+                        continue
+                    if tipos is not None and fila['transporte__tipoTransporte'] not in tipos:
+                        continue
+                    unidades = -(-total_pax // fila['capacidad'])
+                    if unidades > fila['unidades_maximas']:
+                        continue
+                    centavos = fila['centavos'][campo] * unidades
+                    if mejor is None or (centavos, fila['id']) < (mejor[0], mejor[2]['id']):
+                        mejor = (centavos, unidades, fila)
+                if mejor is None:
+                    continue
+                nueva = (costo + mejor[0], tramos + 1) if por_precio else (tramos + 1, costo + mejor[0])
+                if hasta not in mejores or nueva < mejores[hasta]:
+                    mejores[hasta] = nueva
+                    previos[hasta] = (ciudad, mejor)
+                    heapq.heappush(pendientes, (nueva, hasta))
+
+        if destino not in previos:
+            return None
+        tramos = []
+        ciudad = destino
+        while ciudad != origen:
+            desde, (centavos, unidades, fila) = previos[ciudad]
+            tramos.append({
+                'ruta_id': fila['id'],
+                'desde': desde,
+                'hasta': ciudad,
+                'tipo': fila['transporte__tipoTransporte'],
+                'transporte_id': fila['transporte_id'],
+                'entidad_id': fila['transporte__entidad_id'],
+                'vehiculo': fila['transporte__nombre'],
+                'capacidad': fila['capacidad'],
+                'unidades': unidades,
+                'precio_unitario': Decimal(fila['centavos'][campo]) / 100,
+                'costo': Decimal(centavos) / 100,
+            })
+            ciudad = desde
+        tramos.reverse()
+        return {'costo': sum((tramo['costo'] for tramo in tramos), Decimal('0')), 'tramos': tramos}
+
+
+def _clave_secuencia(agencia_id):
+    return f'{PREFIJO}:secuencia:{agencia_id}'
+
+
+def _clave_cambio(agencia_id, secuencia):
+    return f'{PREFIJO}:cambio:{agencia_id}:{secuencia}'
+
+
+def registrar_cambios(agencia_id, ruta_ids):
+    """Anota que las rutas cambiaron (o se eliminaron) para que los grafos de la agencia las vuelvan a leer"""
+    clave = _clave_secuencia(agencia_id)
+    cache.add(clave, 0, timeout=None)
+    for ruta_id in ruta_ids:
+        cache.set(_clave_cambio(agencia_id, cache.incr(clave)), ruta_id, timeout=CAMBIOS_DURACION)
+
+
+def registrar_rutas(rutas):
+    """registrar_cambios() de las rutas de un queryset, por agencia"""
+    por_agencia = defaultdict(list)
+    for ruta_id, agencia_id in rutas.exclude(convenio_agencia=None).values_list(
+        'pk', 'convenio_agencia__entidad_agencia_id'
+    ):
+        por_agencia[agencia_id].append(ruta_id)
+    for agencia_id, ruta_ids in por_agencia.items():
+        registrar_cambios(agencia_id, ruta_ids)
+
+
+def construir_grafo(agencia_id):
+    """Grafo de todas las rutas activas de la agencia"""
+    return GrafoRutas(filas_de_rutas(rutas_activas(agencia_id)))
+
+
+def _cambios_desde(agencia_id, desde, hasta):
+    """Ids de las rutas cambiadas entre dos secuencias, o None si no están todos en la caché"""
+    claves = [_clave_cambio(agencia_id, secuencia) for secuencia in range(desde + 1, hasta + 1)]
+    cambios = cache.get_many(claves)
+    if len(cambios) != len(claves):
+        return None
+    return set(cambios.values())
+
+
+def grafo_de_agencia(agencia_id):
+    """Grafo de la agencia, al día con los cambios anotados con registrar_cambios()"""
+    secuencia = cache.get(_clave_secuencia(agencia_id), 0)
+    guardado = _GRAFOS.get(agencia_id)
+    if guardado is not None and guardado[0] == secuencia:
+        return guardado[1]
+
+    grafo = None
+    maximo = getattr(settings, 'GRAFO_RUTAS_CAMBIOS_MAXIMO', CAMBIOS_MAXIMO_DEFECTO)
+    if guardado is not None and 0 < secuencia - guardado[0] <= maximo:
+        cambiadas = _cambios_desde(agencia_id, guardado[0], secuencia)
+        if cambiadas is not None:
+            filas = filas_de_rutas(rutas_activas(agencia_id).filter(pk__in=cambiadas))
+            grafo = guardado[1].con_cambios(cambiadas, filas)
+    if grafo is None:
+        grafo = construir_grafo(agencia_id)
+    with _LOCK:
+        _GRAFOS[agencia_id] = (secuencia, grafo)
+    return grafo
+
+
+def buscar_camino(agencia_id, origen, destino, fecha, total_pax, criterio='precio', tipos=None):
+    """camino() entre dos ciudades (texto libre) con el grafo de la agencia"""
+    if agencia_id is None:
+        return None
+    return grafo_de_agencia(agencia_id).camino(
+        clave_ciudad(origen), clave_ciudad(destino), fecha, total_pax, criterio, tipos,
+    )
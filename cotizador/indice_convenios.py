@@ -0,0 +1,120 @@
+"""
+Índice de descuentos por convenio de cada agencia
+
+Un ConvenioAgencia da a una agencia un porcentaje de descuento con una
+empresa (hotel, transportadora, restaurante o aseguradora) mientras está
+activo y entre fecha_inicio y fecha_fin (sin fecha, sin límite). Para
+cotizar hay que saber, para cada proveedor, si su empresa tiene un convenio
+vigente con la agencia en la fecha del viaje y con qué descuento.
+
+En lugar de unir los convenios en cada consulta de proveedores, los
+convenios activos de la agencia se cargan una vez en memoria: para cada
+(tipo_convenio, empresa) se guardan intervalos de fechas disjuntos y
+ordenados con su descuento, y la consulta es una búsqueda binaria (bisect)
+en O(log n). Si dos convenios se traslapan se usa el mayor descuento.
+
+El índice se reconstruye cuando cambia algún convenio de la agencia: las
+señales cambian su versión en la caché de Django, así que los demás
+procesos también lo reconstruyen en su siguiente consulta.
+"""
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import Decimal
+
+from .cache_cotizaciones import renovar_version, version_de_clave
+from .models import ConvenioAgencia
+
+
+PREFIJO = 'convenios'
+
+# Tipo de convenio de cada categoría de proveedor
+TIPO_POR_CATEGORIA = {
+    'hospedaje': 'Hospedaje',
+    'transporte': 'Transporte',
+    'alimentacion': 'Alimentación',
+    'seguro': 'Seguro',
+}
+
+# Límites abiertos de los intervalos (ordinales de fecha)
+SIN_INICIO = 0
+SIN_FIN = float('inf')
+
+_INDICES = {}
+_LOCK = threading.Lock()
+
+
+class IndiceConvenios:
+    """Descuentos por convenio de una agencia como intervalos de fechas por (tipo_convenio, empresa)"""
+
+    def __init__(self, convenios):
+        """convenios: iterable de (tipo_convenio, entidad_convenio_id, fecha_inicio, fecha_fin, porcentaje_descuento)"""
+        por_clave = defaultdict(list)
+        for tipo, entidad_id, fecha_inicio, fecha_fin, porcentaje in convenios:
+            inicio = fecha_inicio.toordinal() if fecha_inicio else SIN_INICIO
+            # El intervalo incluye fecha_fin: se guarda el día siguiente como límite exclusivo
+            fin = fecha_fin.toordinal() + 1 if fecha_fin else SIN_FIN
+            if inicio < fin:
+                por_clave[(tipo, entidad_id)].append((inicio, fin, Decimal(str(porcentaje or 0))))
+
+        self._intervalos = {clave: self._disjuntos(intervalos) for clave, intervalos in por_clave.items()}
+
+    @staticmethod
+    def _disjuntos(intervalos):
+        """(inicios, fines, descuentos) de tramos disjuntos y ordenados con el mayor descuento vigente en cada uno"""
+        limites = sorted({inicio for inicio, _, _ in intervalos} | {fin for _, fin, _ in intervalos})
+        tramos = []
+        for desde, hasta in zip(limites, limites[1:]):
+            vigentes = [porcentaje for inicio, fin, porcentaje in intervalos if inicio <= desde and hasta <= fin]
+            if not vigentes:
+                continue
+            descuento = max(vigentes)
+            if tramos and tramos[-1][1] == desde and tramos[-1][2] == descuento:
+                tramos[-1][1] = hasta
+            else:
+                tramos.append([desde, hasta, descuento])
+        return [t[0] for t in tramos], [t[1] for t in tramos], [t[2] for t in tramos]
+
+    def descuento(self, tipo_convenio, entidad_id, fecha):
+        """Porcentaje de descuento del convenio vigente en la fecha, o None si no hay convenio"""
+        intervalos = self._intervalos.get((tipo_convenio, entidad_id))
+        if intervalos is None:
+            return None
+        inicios, fines, descuentos = intervalos
+        dia = fecha.toordinal()
+        posicion = bisect_right(inicios, dia) - 1
+        if posicion >= 0 and dia < fines[posicion]:
+            return descuentos[posicion]
+        return None
+
+
+def _clave_version(agencia_id):
+    return f'{PREFIJO}:version:{agencia_id}'
+
+
+def construir_indice(agencia_id):
+    """Índice de los convenios activos de la agencia (una consulta)"""
+    return IndiceConvenios(ConvenioAgencia.objects.filter(entidad_agencia_id=agencia_id, activo=True).values_list(
+        'tipo_convenio', 'entidad_convenio_id', 'fecha_inicio', 'fecha_fin', 'porcentaje_descuento',
+    ))
+
+
+def indice_de_agencia(agencia_id):
+    """Índice de la agencia, construido en la primera consulta y reutilizado mientras no cambien sus convenios"""
+    if agencia_id is None:
+        return IndiceConvenios([])
+    version = version_de_clave(_clave_version(agencia_id))
+    guardado = _INDICES.get(agencia_id)
+    if guardado is not None and guardado[0] == version:
+        return guardado[1]
+    indice = construir_indice(agencia_id)
+    with _LOCK:
+        _INDICES[agencia_id] = (version, indice)
+    return indice
+
+
+def invalidar(agencia_id):
+    """Descarta el índice de la agencia en todos los procesos (se reconstruye en la siguiente consulta)"""
+    renovar_version(_clave_version(agencia_id))
+    with _LOCK:
+        _INDICES.pop(agencia_id, None)
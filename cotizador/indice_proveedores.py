@@ -0,0 +1,320 @@
+"""
+Índice de proveedores candidatos por destino
+
+Mantiene la tabla CandidatoProveedor a partir de las claves normalizadas de
+ubicación (clave_municipio / clave_departamento) de cada Destino y de cada
+proveedor. Las señales de cotizador.signals lo actualizan en cada save/delete;
+los comandos reconstruir_indice_proveedores y verificar_indice_proveedores
+permiten reconstruirlo desde cero y comprobar su consistencia.
+
+Cada fila lleva además los valores precalculados del proveedor (precio por
+persona, calificación, disponibilidad y subtipo), que se actualizan con el
+mismo save/delete y permiten ordenar las opciones de un destino en la base
+de datos (ver cotizador.opciones).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+
+from .geografia import CAMPOS_GEO, actualizar_coordenadas, mapa_coordenadas
+from .models import Alimentacion, CandidatoProveedor, Destino, Hospedaje, Seguro, Transporte
+from .ubicaciones import claves_ubicacion, mapa_referencias, referencias_ubicacion
+
+
+MODELOS_POR_CATEGORIA = {
+    'hospedaje': Hospedaje,
+    'transporte': Transporte,
+    'alimentacion': Alimentacion,
+    'seguro': Seguro,
+}
+
+TAMANO_LOTE = 1000
+
+# Campo de capacidad con el que se divide el precio para obtenerlo por persona.
+# Las categorías sin capacidad (alimentación, seguro) ya tienen precio por persona.
+CAMPO_CAPACIDAD = {
+    'hospedaje': 'capacidadpax',
+    'transporte': 'pax',
+}
+
+CAMPOS_PRECALCULADOS = ['precio_por_persona', 'calificacion', 'disponible', 'subtipo']
+
+PRECISION_PRECIO = Decimal('0.0001')
+
+CAMPOS_UBICACION = ['clave_municipio', 'clave_departamento', 'pais_ref', 'departamento_ref', 'municipio_ref']
+
+
+def categoria_de(instancia):
+    """Retorna la categoría del índice para una instancia de proveedor, o None"""
+    for categoria, modelo in MODELOS_POR_CATEGORIA.items():
+        if isinstance(instancia, modelo):
+            return categoria
+    return None
+
+
+def campos_proveedor(categoria):
+    """Campos del proveedor de los que dependen los valores precalculados"""
+    campos = ['precio', 'disponible']
+    if categoria in CAMPO_CAPACIDAD:
+        campos.append(CAMPO_CAPACIDAD[categoria])
+    if categoria == 'hospedaje':
+        campos.append('calificacion')
+    if categoria == 'transporte':
+        campos.append('tipoTransporte')
+    return campos
+
+
+def valores_precalculados(categoria, datos):
+    """
+    Valores precalculados de una fila del índice a partir de los campos del
+    proveedor (un diccionario con campos_proveedor(categoria)). El precio por
+    persona equivale a precio_por_persona() del modelo.
+    """
+    precio = datos.get('precio')
+    capacidad = datos.get(CAMPO_CAPACIDAD.get(categoria))
+    if precio is not None:
+        precio = Decimal(str(precio))
+        if capacidad and capacidad > 0:
+            precio = precio / capacidad
+        precio = precio.quantize(PRECISION_PRECIO)
+    return {
+        'precio_por_persona': precio,
+        'calificacion': datos.get('calificacion'),
+        'disponible': datos.get('disponible', True),
+        'subtipo': datos.get('tipoTransporte') or '',
+    }
+
+
+def _precalculados_por_proveedor(categoria):
+    """proveedor_id -> valores precalculados de todos los proveedores de la categoría"""
+    campos = campos_proveedor(categoria)
+    return {
+        datos['pk']: valores_precalculados(categoria, datos)
+        for datos in MODELOS_POR_CATEGORIA[categoria].objects.values('pk', *campos)
+    }
+
+
+def _coincidencia(clave_municipio_destino, clave_departamento_destino, clave_municipio, clave_departamento):
+    """Tipo de coincidencia entre un destino y un proveedor, o None si no coinciden"""
+    mismo_departamento = bool(clave_departamento) and clave_departamento == clave_departamento_destino
+    # Hay municipios homónimos en distintos departamentos (p. ej. Armenia)
+    departamento_compatible = mismo_departamento or not clave_departamento or not clave_departamento_destino
+    if clave_municipio and clave_municipio == clave_municipio_destino and departamento_compatible:
+        return 'municipio'
+    if mismo_departamento:
+        return 'departamento'
+    return None
+
+
+def _filtro_claves(clave_municipio, clave_departamento):
+    """Q que selecciona registros con la misma clave de municipio o departamento"""
+    filtro = Q(pk__in=[])
+    if clave_municipio:
+        filtro |= Q(clave_municipio=clave_municipio)
+    if clave_departamento:
+        filtro |= Q(clave_departamento=clave_departamento)
+    return filtro
+
+
+def _valores_ubicacion(instancia):
+    return tuple(getattr(instancia, campo + '_id' if campo.endswith('_ref') else campo) for campo in CAMPOS_UBICACION)
+
+
+def _ubicacion_calculada(instancia, mapa=None):
+    """Claves normalizadas y referencias geográficas que le corresponden a la instancia"""
+    # La entidad de un Destino es la agencia que lo creó, no indica dónde está el destino
+    es_destino = isinstance(instancia, Destino)
+    clave_municipio, clave_departamento = claves_ubicacion(instancia, usar_entidad=not es_destino, usar_nombre=es_destino)
+    referencias = referencias_ubicacion(clave_municipio, clave_departamento, getattr(instancia, 'pais', None), mapa)
+    return (clave_municipio, clave_departamento, *referencias)
+
+
+def actualizar_claves(instancia, mapa=None):
+    """
+    Recalcula las claves de ubicación y las referencias a Pais/Departamento/
+    Municipio de la instancia (sin guardarla). Retorna True si cambiaron.
+    """
+    anteriores = _valores_ubicacion(instancia)
+    (instancia.clave_municipio, instancia.clave_departamento,
+     instancia.pais_ref_id, instancia.departamento_ref_id, instancia.municipio_ref_id) = _ubicacion_calculada(instancia, mapa)
+    return _valores_ubicacion(instancia) != anteriores
+
+
+def indexar_proveedor(instancia):
+    """Reemplaza las filas del índice de un proveedor por las de sus destinos coincidentes"""
+    categoria = categoria_de(instancia)
+    if categoria is None or instancia.pk is None:
+        return 0
+
+    precalculados = valores_precalculados(
+        categoria, {campo: getattr(instancia, campo) for campo in campos_proveedor(categoria)}
+    )
+    filas = []
+    if instancia.clave_municipio or instancia.clave_departamento:
+        destinos = Destino.objects.filter(
+            _filtro_claves(instancia.clave_municipio, instancia.clave_departamento)
+        ).values_list('id', 'clave_municipio', 'clave_departamento')
+        for destino_id, clave_municipio_destino, clave_departamento_destino in destinos:
+            coincidencia = _coincidencia(clave_municipio_destino, clave_departamento_destino,
+                                         instancia.clave_municipio, instancia.clave_departamento)
+            if coincidencia:
+                filas.append(CandidatoProveedor(destino_id=destino_id, categoria=categoria,
+                                                proveedor_id=instancia.pk, coincidencia=coincidencia,
+                                                **precalculados))
+
+    with transaction.atomic():
+        desindexar_proveedor(categoria, instancia.pk)
+        CandidatoProveedor.objects.bulk_create(filas, batch_size=TAMANO_LOTE)
+    return len(filas)
+
+
+def desindexar_proveedor(categoria, proveedor_id):
+    """Elimina todas las filas del índice de un proveedor"""
+    CandidatoProveedor.objects.filter(categoria=categoria, proveedor_id=proveedor_id).delete()
+
+
+def indexar_destino(destino):
+    """Reemplaza las filas del índice de un destino por las de sus proveedores coincidentes"""
+    filas = []
+    if destino.clave_municipio or destino.clave_departamento:
+        filtro = _filtro_claves(destino.clave_municipio, destino.clave_departamento)
+        for categoria, modelo in MODELOS_POR_CATEGORIA.items():
+            proveedores = modelo.objects.filter(filtro).values(
+                'pk', 'clave_municipio', 'clave_departamento', *campos_proveedor(categoria)
+            )
+            for datos in proveedores:
+                coincidencia = _coincidencia(destino.clave_municipio, destino.clave_departamento,
+                                             datos['clave_municipio'], datos['clave_departamento'])
+                if coincidencia:
+                    filas.append(CandidatoProveedor(destino_id=destino.pk, categoria=categoria,
+                                                    proveedor_id=datos['pk'], coincidencia=coincidencia,
+                                                    **valores_precalculados(categoria, datos)))
+
+    with transaction.atomic():
+        CandidatoProveedor.objects.filter(destino_id=destino.pk).delete()
+        CandidatoProveedor.objects.bulk_create(filas, batch_size=TAMANO_LOTE)
+    return len(filas)
+
+
+def reindexar_entidad(entidad):
+    """
+    Recalcula claves e índice de los proveedores de una entidad, ya que su
+    ubicación puede depender de la de la entidad cuando no tienen una propia.
+    """
+    for categoria, modelo in MODELOS_POR_CATEGORIA.items():
+        for proveedor in modelo.objects.filter(entidad=entidad).select_related('entidad'):
+            if actualizar_claves(proveedor):
+                actualizar_coordenadas(proveedor)
+                modelo.objects.bulk_update([proveedor], CAMPOS_UBICACION + CAMPOS_GEO)
+                indexar_proveedor(proveedor)
+
+
+def proveedores_candidatos(destino, categoria):
+    """QuerySet de los proveedores de una categoría indexados para el destino"""
+    modelo = MODELOS_POR_CATEGORIA[categoria]
+    ids = CandidatoProveedor.objects.filter(destino=destino, categoria=categoria).values('proveedor_id')
+    return modelo.objects.filter(pk__in=ids)
+
+
+def _claves_desactualizadas():
+    """Lista de (modelo, pk) cuyas claves o referencias guardadas no coinciden con las calculadas"""
+    mapa = mapa_referencias()
+    desactualizadas = []
+    for modelo in [Destino, *MODELOS_POR_CATEGORIA.values()]:
+        for instancia in modelo.objects.select_related('entidad').iterator():
+            if _ubicacion_calculada(instancia, mapa) != _valores_ubicacion(instancia):
+                desactualizadas.append((modelo._meta.model_name, instancia.pk))
+    return desactualizadas
+
+
+def _filas_esperadas():
+    """
+    Calcula el contenido completo que debería tener el índice.
+    Agrupa proveedores por clave en diccionarios para no comparar todos contra todos.
+    """
+    esperadas = set()
+    destinos = list(Destino.objects.values_list('id', 'clave_municipio', 'clave_departamento'))
+    for categoria, modelo in MODELOS_POR_CATEGORIA.items():
+        claves = {}
+        por_municipio = {}
+        por_departamento = {}
+        for proveedor_id, clave_municipio, clave_departamento in modelo.objects.values_list(
+                'pk', 'clave_municipio', 'clave_departamento'):
+            claves[proveedor_id] = (clave_municipio, clave_departamento)
+            if clave_municipio:
+                por_municipio.setdefault(clave_municipio, []).append(proveedor_id)
+            if clave_departamento:
+                por_departamento.setdefault(clave_departamento, []).append(proveedor_id)
+
+        for destino_id, clave_municipio_destino, clave_departamento_destino in destinos:
+            proveedores = set(por_municipio.get(clave_municipio_destino, []) if clave_municipio_destino else [])
+            if clave_departamento_destino:
+                proveedores.update(por_departamento.get(clave_departamento_destino, []))
+            for proveedor_id in proveedores:
+                coincidencia = _coincidencia(clave_municipio_destino, clave_departamento_destino,
+                                             *claves[proveedor_id])
+                if coincidencia:
+                    esperadas.add((destino_id, categoria, proveedor_id, coincidencia))
+    return esperadas
+
+
+def reconstruir_indice(recalcular_claves=True):
+    """
+    Reconstruye el índice desde cero. Con recalcular_claves también vuelve a
+    calcular las claves, referencias y coordenadas de destinos y proveedores
+    (útil tras cargas masivas que no disparan señales). Retorna el número de
+    filas creadas.
+    """
+    with transaction.atomic():
+        if recalcular_claves:
+            mapa = mapa_referencias()
+            coordenadas = mapa_coordenadas()
+            for modelo in [Destino, *MODELOS_POR_CATEGORIA.values()]:
+                # Sin cortocircuito: las coordenadas dependen del municipio recién calculado
+                pendientes = [instancia for instancia in modelo.objects.select_related('entidad').iterator()
+                              if actualizar_claves(instancia, mapa) | actualizar_coordenadas(instancia, coordenadas)]
+                modelo.objects.bulk_update(pendientes, CAMPOS_UBICACION + CAMPOS_GEO, batch_size=TAMANO_LOTE)
+
+        CandidatoProveedor.objects.all().delete()
+        precalculados = {categoria: _precalculados_por_proveedor(categoria) for categoria in MODELOS_POR_CATEGORIA}
+        filas = [
+            CandidatoProveedor(destino_id=destino_id, categoria=categoria,
+                               proveedor_id=proveedor_id, coincidencia=coincidencia,
+                               **precalculados[categoria][proveedor_id])
+            for destino_id, categoria, proveedor_id, coincidencia in _filas_esperadas()
+        ]
+        CandidatoProveedor.objects.bulk_create(filas, batch_size=TAMANO_LOTE)
+    return len(filas)
+
+
+def _precios_desactualizados():
+    """(destino_id, categoria, proveedor_id) de las filas cuyos valores precalculados no coinciden"""
+    desactualizadas = []
+    for categoria in MODELOS_POR_CATEGORIA:
+        precalculados = _precalculados_por_proveedor(categoria)
+        filas = CandidatoProveedor.objects.filter(categoria=categoria).values(
+            'destino_id', 'proveedor_id', *CAMPOS_PRECALCULADOS
+        )
+        for fila in filas:
+            esperados = precalculados.get(fila['proveedor_id'])
+            if esperados is not None and any(fila[campo] != esperados[campo] for campo in CAMPOS_PRECALCULADOS):
+                desactualizadas.append((fila['destino_id'], categoria, fila['proveedor_id']))
+    return sorted(desactualizadas)
+
+
+def verificar_indice():
+    """
+    Compara el índice guardado con el esperado.
+    Retorna un diccionario con las filas faltantes, las sobrantes, las filas
+    con valores precalculados desactualizados y las instancias cuyas claves
+    de ubicación están desactualizadas.
+    """
+    esperadas = _filas_esperadas()
+    guardadas = set(CandidatoProveedor.objects.values_list('destino_id', 'categoria', 'proveedor_id', 'coincidencia'))
+    return {
+        'faltantes': sorted(esperadas - guardadas),
+        'sobrantes': sorted(guardadas - esperadas),
+        'precios_desactualizados': _precios_desactualizados(),
+        'claves_desactualizadas': _claves_desactualizadas(),
+    }
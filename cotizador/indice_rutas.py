@@ -0,0 +1,202 @@
+"""
+Índice de precios de rutas de transporte por origen y destino
+
+Una RutaTransporte es un precio negociado por temporada (precio_alta,
+precio_media, precio_baja) para un vehículo entre la ciudad de origen del
+convenio de agencia y un destino, los destinos de un paquete o una ciudad
+de destino. Cuando la cotización tiene origen, los vehículos terrestres y
+marítimos de las rutas del origen al destino reemplazan a los transportes
+genéricos de la zona; si no hay ruta para un tipo de vehículo se usan los
+transportes genéricos.
+
+Las rutas guardan claves normalizadas de su origen y su ciudad de destino
+(clave_origen, clave_destino, mantenidas por cotizador.signals) con índices
+compuestos, así que las rutas de una agencia desde un origen se cargan con
+una sola consulta por igualdad. Esas rutas se guardan en memoria por
+(agencia, origen) en diccionarios por destino, por destino de paquete y por
+ciudad, y la consulta de cada cotización es una búsqueda en diccionario.
+
+Como el índice de convenios, se reconstruye cuando cambia una ruta, un
+convenio o un vehículo de la agencia: las señales cambian su versión en la
+caché de Django.
+"""
+import threading
+from collections import OrderedDict, defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+
+from .cache_cotizaciones import renovar_version, version_de_clave
+from .models import ConvenioAgencia, Paquete, RutaTransporte
+from .ubicaciones import claves_desde_texto
+
+
+PREFIJO = 'rutas'
+
+# Índices (agencia, origen) que se guardan en memoria en cada proceso
+INDICES_MAXIMO_DEFECTO = 256
+
+# Temporada de cada mes cuando no se configura RUTAS_TEMPORADA_POR_MES:
+# vacaciones de mitad y fin de año en alta, Semana Santa y puentes de
+# agosto, octubre y noviembre en media, el resto en baja
+TEMPORADA_POR_MES_DEFECTO = {
+    1: 'Alta', 2: 'Baja', 3: 'Media', 4: 'Media', 5: 'Baja', 6: 'Alta',
+    7: 'Alta', 8: 'Media', 9: 'Baja', 10: 'Media', 11: 'Media', 12: 'Alta',
+}
+
+CAMPO_PRECIO = {'Alta': 'precio_alta', 'Media': 'precio_media', 'Baja': 'precio_baja'}
+
+CAMPOS_RUTA = (
+    'id', 'destino_id', 'paquete_id', 'clave_destino', 'precio_alta', 'precio_media', 'precio_baja',
+    'convenio_agencia__fecha_inicio', 'convenio_agencia__fecha_fin',
+    'transporte_id', 'transporte__entidad_id', 'transporte__nombre', 'transporte__tipoTransporte',
+    'transporte__pax', 'transporte__cantidad',
+)
+
+SIN_INICIO = 0
+SIN_FIN = float('inf')
+
+_INDICES = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def clave_ciudad(texto):
+    """Clave normalizada del municipio de un texto de ciudad: 'Bogotá, Cundinamarca' -> 'BOGOTA'"""
+    return claves_desde_texto(texto)[0]
+
+
+def actualizar_claves(ruta):
+    """Calcula clave_origen (ciudad de origen del convenio) y clave_destino (ciudad_destino) de una ruta"""
+    ciudad_origen = None
+    if ruta.convenio_agencia_id:
+        ciudad_origen = ConvenioAgencia.objects.filter(pk=ruta.convenio_agencia_id).values_list(
+            'ciudad_origen', flat=True
+        ).first()
+    ruta.clave_origen = clave_ciudad(ciudad_origen)
+    ruta.clave_destino = clave_ciudad(ruta.ciudad_destino)
+
+
+def temporada_de(fecha):
+    """Temporada ('Alta', 'Media' o 'Baja') de los precios de ruta para un viaje que empieza en la fecha"""
+    temporadas = getattr(settings, 'RUTAS_TEMPORADA_POR_MES', TEMPORADA_POR_MES_DEFECTO)
+    return temporadas.get(fecha.month, 'Baja')
+
+
+class IndiceRutas:
+    """Rutas de una agencia desde un origen, por destino, por destino de paquete y por ciudad de destino"""
+
+    def __init__(self, rutas, destinos_por_paquete=None):
+        """
+        rutas: diccionarios con CAMPOS_RUTA; destinos_por_paquete: {paquete_id:
+        [destino_id]} de los paquetes de las rutas
+        """
+        destinos_por_paquete = destinos_por_paquete or {}
+        self._por_destino = defaultdict(list)
+        self._por_paquete = defaultdict(list)
+        self._por_ciudad = defaultdict(list)
+        for ruta in rutas:
+            fecha_inicio = ruta['convenio_agencia__fecha_inicio']
+            fecha_fin = ruta['convenio_agencia__fecha_fin']
+            ruta = {
+                **ruta,
+                'inicio': fecha_inicio.toordinal() if fecha_inicio else SIN_INICIO,
+                'fin': fecha_fin.toordinal() + 1 if fecha_fin else SIN_FIN,
+            }
+            if ruta['destino_id']:
+                self._por_destino[ruta['destino_id']].append(ruta)
+            elif ruta['paquete_id']:
+                for destino_id in destinos_por_paquete.get(ruta['paquete_id'], ()):
+                    self._por_paquete[destino_id].append(ruta)
+            elif ruta['clave_destino']:
+                self._por_ciudad[ruta['clave_destino']].append(ruta)
+
+    def rutas(self, destino, fecha, tipo):
+        """
+        Rutas vigentes en la fecha hacia el destino con vehículos del tipo:
+        las del destino, si no hay las de sus paquetes y si no las de su ciudad
+        """
+        dia = fecha.toordinal()
+        for candidatas in (self._por_destino.get(destino.pk), self._por_paquete.get(destino.pk),
+                           self._por_ciudad.get(destino.clave_municipio)):
+            vigentes = [ruta for ruta in candidatas or ()
+                        if ruta['transporte__tipoTransporte'] == tipo and ruta['inicio'] <= dia < ruta['fin']]
+            if vigentes:
+                return vigentes
+        return []
+
+    def vehiculos(self, destino, fecha, tipo, temporada=None):
+        """
+        Vehículos de las rutas (como DatosDestino.vehiculos()) con el precio
+        de la temporada dada o, si no se da, la de la fecha
+        """
+        campo = CAMPO_PRECIO[temporada or temporada_de(fecha)]
+        return [{
+            'id': ruta['transporte_id'],
+            'entidad_id': ruta['transporte__entidad_id'],
+            'nombre': ruta['transporte__nombre'],
+            'tipoTransporte': tipo,
+            'pax': ruta['transporte__pax'],
+            'cantidad': ruta['transporte__cantidad'],
+            'precio': Decimal(str(ruta[campo])),
+            'ruta_id': ruta['id'],
+        } for ruta in self.rutas(destino, fecha, tipo)]
+
+
+INDICE_VACIO = IndiceRutas([])
+
+
+def _clave_version(agencia_id):
+    return f'{PREFIJO}:version:{agencia_id}'
+
+
+def construir_indice(agencia_id, clave_origen):
+    """Índice de las rutas de la agencia desde el origen con convenio activo y vehículo disponible"""
+    rutas = list(RutaTransporte.objects.filter(
+        clave_origen=clave_origen, convenio_agencia__entidad_agencia_id=agencia_id,
+        convenio_agencia__activo=True, transporte__disponible=True,
+    ).values(*CAMPOS_RUTA))
+
+    destinos_por_paquete = defaultdict(list)
+    paquetes = {ruta['paquete_id'] for ruta in rutas if ruta['paquete_id'] and not ruta['destino_id']}
+    if paquetes:
+        for paquete_id, destino_id in Paquete.destinos.through.objects.filter(
+            paquete_id__in=paquetes
+        ).values_list('paquete_id', 'destino_id'):
+            destinos_por_paquete[paquete_id].append(destino_id)
+    return IndiceRutas(rutas, destinos_por_paquete)
+
+
+def indice_de_origen(agencia_id, origen):
+    """
+    Índice de las rutas de la agencia desde la ciudad de origen (texto
+    libre), construido en la primera consulta y reutilizado mientras no
+    cambien las rutas de la agencia
+    """
+    clave_origen = clave_ciudad(origen)
+    if agencia_id is None or not clave_origen:
+        return INDICE_VACIO
+    version = version_de_clave(_clave_version(agencia_id))
+    clave = (agencia_id, clave_origen)
+    guardado = _INDICES.get(clave)
+    if guardado is not None and guardado[0] == version:
+        return guardado[1]
+    indice = construir_indice(agencia_id, clave_origen)
+    with _LOCK:
+        _INDICES[clave] = (version, indice)
+        _INDICES.move_to_end(clave)
+        while len(_INDICES) > getattr(settings, 'RUTAS_INDICES_MAXIMO', INDICES_MAXIMO_DEFECTO):
+            _INDICES.popitem(last=False)
+    return indice
+
+
+def agencias_de_rutas(rutas):
+    """Agencias de los convenios de un queryset de rutas"""
+    return set(rutas.exclude(convenio_agencia=None).values_list('convenio_agencia__entidad_agencia_id', flat=True))
+
+
+def invalidar(agencia_id):
+    """Descarta los índices de rutas de la agencia en todos los procesos"""
+    renovar_version(_clave_version(agencia_id))
+    with _LOCK:
+        for clave in [clave for clave in _INDICES if clave[0] == agencia_id]:
+            del _INDICES[clave]
@@ -0,0 +1,79 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from cotizador.asignacion_flota import asignar_flota
+from cotizador.asignacion_hospedaje import asignar_hospedaje
+from cotizador.management.commands.benchmark_cotizaciones import percentil
+
+
+def catalogo_hospedajes(cantidad, semilla):
+    """Catálogo sintético de hospedajes, de cabañas a hoteles grandes"""
+    azar = random.Random(semilla)
+    hospedajes = []
+    for indice in range(cantidad):
+        habitaciones = azar.choice([1, 2, 4, 8, 15, 30, 60, 120])
+        capacidad = habitaciones * azar.choice([2, 2, 3, 4])
+        hospedajes.append({
+            'id': indice, 'nombreLugar': f'Hospedaje {indice}', 'capacidadpax': capacidad,
+            'habitaciones': habitaciones, 'precio': azar.randint(80, 400) * 1000 * habitaciones,
+            'calificacion': None,
+        })
+    return hospedajes
+
+
+def flota(cantidad, semilla):
+    """Flota sintética de carros, camionetas, busetas y buses"""
+    azar = random.Random(semilla)
+    return [
+        {'id': indice, 'pax': pax, 'cantidad': azar.randint(1, 5), 'precio': azar.randint(100, 2000) * 1000}
+        for indice, pax in enumerate(azar.choice([4, 7, 12, 19, 30, 40, 45]) for _ in range(cantidad))
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Mide el tiempo de la asignación de hospedaje y de flota sobre catálogos sintéticos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hospedajes', type=int, default=10000, help='Tamaño del catálogo de hospedajes')
+        parser.add_argument('--vehiculos', type=int, default=500, help='Tamaño de la flota')
+        parser.add_argument('--pax', type=int, nargs='+', default=[2, 15, 45, 150, 600])
+        parser.add_argument('--noches', type=int, default=3)
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--semilla', type=int, default=1)
+
+    def handle(self, *args, **options):
+        hospedajes = catalogo_hospedajes(options['hospedajes'], options['semilla'])
+        vehiculos = flota(options['vehiculos'], options['semilla'])
+        self.stdout.write(f'Hospedajes: {len(hospedajes)} | vehículos: {len(vehiculos)} | repeticiones: {options["repeticiones"]}')
+
+        for total_pax in options['pax']:
+            tiempos, resultado = self._medir(
+                lambda: asignar_hospedaje(hospedajes, total_pax, options['noches']), options['repeticiones'],
+            )
+            self.stdout.write(
+                f'Hospedaje {total_pax:>5} pax: {len(resultado["hospedajes"])} hospedaje(s), '
+                f'costo {resultado["costo"]} | ' + self._resumen(tiempos)
+            )
+
+        for total_pax in options['pax']:
+            for modo in ('auto', 'voraz'):
+                tiempos, resultado = self._medir(lambda: asignar_flota(vehiculos, total_pax, modo=modo), options['repeticiones'])
+                self.stdout.write(
+                    f'Flota {total_pax:>5} pax ({modo} -> {resultado["modo"]}): costo {resultado["costo"]} | '
+                    + self._resumen(tiempos)
+                )
+
+    def _medir(self, funcion, repeticiones):
+        tiempos = []
+        resultado = None
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            resultado = funcion()
+            tiempos.append(time.perf_counter() - inicio)
+        tiempos.sort()
+        return tiempos, resultado
+
+    def _resumen(self, tiempos):
+        return ' | '.join(f'p{p}: {percentil(tiempos, p) * 1000:.2f} ms' for p in (50, 95))
@@ -0,0 +1,147 @@
+import math
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+
+from cotizador import cache_cotizaciones
+from cotizador.amadeus_simulado import iniciar_en_hilo
+from cotizador.models import Destino
+
+
+def percentil(valores_ordenados, porcentaje):
+    if not valores_ordenados:
+        return 0.0
+    indice = max(math.ceil(porcentaje / 100 * len(valores_ordenados)) - 1, 0)
+    return valores_ordenados[indice]
+
+
+class Command(BaseCommand):
+    help = 'Mide el rendimiento (cotizaciones por segundo y latencias) de calcular-cotizacion'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', help='Usuario de la agencia que cotiza (por defecto el primero con entidad)')
+        parser.add_argument('--destino', type=int, help='Id del destino (por defecto el primero)')
+        parser.add_argument('--peticiones', type=int, default=200)
+        parser.add_argument('--concurrencia', type=int, default=8)
+        parser.add_argument(
+            '--medio-transporte',
+            nargs='+',
+            default=['aereo', 'terrestre'],
+            choices=['terrestre', 'aereo', 'maritimo', 'mixto'],
+        )
+        parser.add_argument(
+            '--variar-fechas',
+            action='store_true',
+            help='Usar fechas distintas en cada petición para que no se repitan en las cachés',
+        )
+        parser.add_argument('--sin-cache', action='store_true', help='Desactivar las cachés de cotizaciones y de respuestas de Amadeus')
+        parser.add_argument(
+            '--simulador',
+            action='store_true',
+            help='Iniciar el servidor simulado de Amadeus en este proceso y usarlo',
+        )
+        parser.add_argument('--latencia', default='lognormal:250,0.5', help='Latencia del simulador (ver servidor_amadeus_simulado)')
+        parser.add_argument('--tasa-error', type=float, default=0.0, help='Fracción de errores 500 del simulador')
+
+    def handle(self, *args, **options):
+        usuario, destino = self._usuario_y_destino(options['usuario'], options['destino'])
+
+        servidor = None
+        if options['simulador']:
+            servidor, url = iniciar_en_hilo(latencia=options['latencia'], tasa_error=options['tasa_error'])
+            os.environ['AMADEUS_BASE_URL'] = url
+            os.environ.setdefault('AMADEUS_API_KEY', 'simulado')
+            os.environ.setdefault('AMADEUS_API_SECRET', 'simulado')
+            self.stdout.write(f'Amadeus simulado en {url} (latencia {options["latencia"]})')
+
+        ajustes = {}
+        if options['sin_cache']:
+            ajustes = {
+                'COTIZACION_CACHE_TTL': 0,
+                'COTIZACION_CACHE_TTL_AMADEUS': 0,
+                'AMADEUS_CACHE_TTL': {'vuelos': 0, 'hoteles': 0},
+            }
+        with override_settings(**ajustes):
+            cache_cotizaciones.reiniciar_estadisticas()
+            latencias, errores, duracion = self._ejecutar(usuario, destino, options)
+
+        latencias.sort()
+        total = len(latencias) + errores
+        self.stdout.write(f'Destino: {destino.nombre} | peticiones: {total} | concurrencia: {options["concurrencia"]}')
+        self.stdout.write(f'Duración: {duracion:.2f} s | rendimiento: {total / duracion:.1f} cotizaciones/s')
+        self.stdout.write(
+            'Latencia (ms): ' + ' | '.join(
+                f'p{p}: {percentil(latencias, p) * 1000:.1f}' for p in (50, 90, 95, 99)
+            ) + f' | máx: {(latencias[-1] if latencias else 0) * 1000:.1f}'
+        )
+        estadisticas = cache_cotizaciones.estadisticas()
+        self.stdout.write(f'Caché de cotizaciones: {estadisticas["aciertos"]} aciertos, {estadisticas["fallos"]} fallos')
+        if servidor is not None:
+            self.stdout.write(f'Peticiones a Amadeus simulado: {servidor.peticiones}, tokens: {servidor.tokens}')
+            servidor.shutdown()
+        if errores:
+            self.stdout.write(self.style.WARNING(f'Respuestas con error: {errores}'))
+
+    def _usuario_y_destino(self, nombre_usuario, destino_id):
+        """El formulario de cotización solo acepta destinos de la entidad del usuario"""
+        usuarios = User.objects.filter(entidad__destinos__isnull=False).distinct()
+        if nombre_usuario:
+            usuarios = usuarios.filter(username=nombre_usuario)
+        if destino_id:
+            usuarios = usuarios.filter(entidad__destinos=destino_id)
+        usuario = usuarios.order_by('pk').first()
+        if usuario is None:
+            raise CommandError('No se encontró un usuario cuya entidad tenga el destino a cotizar')
+        destinos = Destino.objects.filter(entidad=usuario.entidad)
+        destino = destinos.get(pk=destino_id) if destino_id else destinos.order_by('pk').first()
+        return usuario, destino
+
+    def _ejecutar(self, usuario, destino, options):
+        pendientes = list(range(options['peticiones']))
+        lock = threading.Lock()
+        latencias = []
+        errores = [0]
+        inicio_base = date.today() + timedelta(days=30)
+
+        def trabajador():
+            cliente = Client(HTTP_HOST='127.0.0.1')
+            cliente.force_login(usuario)
+            while True:
+                with lock:
+                    if not pendientes:
+                        return
+                    numero = pendientes.pop()
+                desplazamiento = timedelta(days=numero if options['variar_fechas'] else 0)
+                # Sin 'guardar': las cotizaciones medidas no quedan en el historial
+                datos = {
+                    'origen': 'Bogotá', 'destino': destino.pk,
+                    'fecha_inicio': (inicio_base + desplazamiento).isoformat(),
+                    'fecha_fin': (inicio_base + desplazamiento + timedelta(days=4)).isoformat(),
+                    'adultos': 2, 'ninios': 0, 'bebes': 0, 'adultos_mayores': 0, 'estudiantes': 0,
+                    'medio_transporte': options['medio_transporte'], 'porcentaje_utilidad': '10',
+                }
+                inicio = time.perf_counter()
+                try:
+                    exito = cliente.post('/api/calcular-cotizacion/', datos).json().get('success')
+                except Exception:
+                    exito = False
+                transcurrido = time.perf_counter() - inicio
+                with lock:
+                    if exito:
+                        latencias.append(transcurrido)
+                    else:
+                        errores[0] += 1
+
+        hilos = [threading.Thread(target=trabajador) for _ in range(options['concurrencia'])]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return latencias, errores[0], time.perf_counter() - inicio
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from cotizador.geografia import cargar_coordenadas
+from cotizador.indice_proveedores import reconstruir_indice
+from cotizador.ubicaciones import cargar_catalogo_geografico
+
+
+class Command(BaseCommand):
+    help = 'Carga Pais/Departamento/Municipio desde static/data y recalcula las referencias de ubicación'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--coordenadas',
+            help='CSV departamento,municipio,latitud,longitud (por defecto static/data/coordenadas_municipios.csv)',
+        )
+
+    def handle(self, *args, **options):
+        creados = cargar_catalogo_geografico()
+        self.stdout.write(
+            f"Países: {creados['paises']}, departamentos: {creados['departamentos']}, "
+            f"municipios: {creados['municipios']} nuevos"
+        )
+        actualizados = cargar_coordenadas(options['coordenadas'])
+        self.stdout.write(f'Coordenadas de {actualizados} municipios actualizadas')
+        # Recalcula claves, referencias y coordenadas de destinos y proveedores, y con ellas el índice
+        total = reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(f'Referencias actualizadas; índice con {total} candidatos'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from cotizador.cache_cotizaciones import invalidar_todo
+from cotizador.matriz_distancias import construir_matriz, ruta_matriz
+
+
+class Command(BaseCommand):
+    help = 'Calcula la matriz de distancias entre municipios para los transportes con precio por kilómetro'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--salida',
+            help='Archivo de la matriz (por defecto DISTANCIAS_MATRIZ_RUTA)',
+        )
+
+    def handle(self, *args, **options):
+        ruta = options['salida'] or ruta_matriz()
+        municipios, con_coordenadas = construir_matriz(ruta)
+        # Las cotizaciones guardadas pueden tener precios por km con las distancias anteriores
+        invalidar_todo()
+        if con_coordenadas < municipios:
+            self.stdout.write(self.style.WARNING(
+                f'{municipios - con_coordenadas} municipios sin coordenadas no tendrán distancias '
+                f'(ver cargar_ubicaciones --coordenadas)'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Matriz de {municipios} municipios ({con_coordenadas} con coordenadas) guardada en {ruta}'
+        ))
@@ -0,0 +1,64 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cotizador.cola_trabajos import ejecutar_en_hilo, nombre_trabajador, tomar
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta los trabajos de cotización encolados, con un número máximo de trabajos a la vez'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hilos',
+            type=int,
+            default=None,
+            help='Trabajos que se ejecutan a la vez (por defecto TRABAJOS_HILOS)',
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=None,
+            help='Segundos entre revisiones de la cola cuando está vacía (por defecto TRABAJOS_INTERVALO)',
+        )
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Terminar cuando la cola quede vacía en lugar de seguir esperando trabajos',
+        )
+
+    def handle(self, *args, **options):
+        hilos = max(options['hilos'] or getattr(settings, 'TRABAJOS_HILOS', 2), 1)
+        intervalo = options['intervalo'] if options['intervalo'] is not None else getattr(settings, 'TRABAJOS_INTERVALO', 1)
+        trabajador = nombre_trabajador()
+        self.stdout.write(f'Trabajador {trabajador} con {hilos} hilos')
+
+        ejecutados = 0
+        en_curso = set()
+        with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+            try:
+                while True:
+                    # Se toman trabajos solo hasta llenar los hilos libres
+                    while len(en_curso) < hilos:
+                        trabajo = tomar(trabajador)
+                        if trabajo is None:
+                            break
+                        en_curso.add(ejecutor.submit(ejecutar_en_hilo, trabajo))
+
+                    if not en_curso:
+                        if options['una_vez']:
+                            break
+                        time.sleep(intervalo)
+                        continue
+
+                    terminados, en_curso = wait(en_curso, timeout=intervalo, return_when=FIRST_COMPLETED)
+                    ejecutados += len(terminados)
+            except KeyboardInterrupt:
+                # Se esperan los trabajos en curso; si el proceso se mata
+                # antes, otro trabajador los retoma cuando vence su reserva
+                self.stdout.write('Deteniendo el trabajador...')
+        ejecutados += len(en_curso)
+
+        self.stdout.write(self.style.SUCCESS(f'Trabajos ejecutados: {ejecutados}'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from cotizador.indice_proveedores import reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye desde cero el índice de proveedores candidatos por destino'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sin-claves',
+            action='store_true',
+            help='No recalcular las claves de ubicación; usar las que ya están guardadas',
+        )
+
+    def handle(self, *args, **options):
+        total = reconstruir_indice(recalcular_claves=not options['sin_claves'])
+        self.stdout.write(self.style.SUCCESS(f'Índice reconstruido: {total} candidatos'))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+
+from cotizador.codigos_iata import limpiar_sin_resolver, nombres_sin_resolver, resolver_iata_lote
+from cotizador.cotizacion import lugar_destino
+from cotizador.models import Destino
+
+
+class Command(BaseCommand):
+    help = 'Resuelve a códigos IATA los destinos registrados (o los nombres indicados) y lista los que no se reconocen'
+
+    def add_arguments(self, parser):
+        parser.add_argument('nombres', nargs='*', help='Nombres a resolver en lugar de los destinos registrados')
+        parser.add_argument(
+            '--archivo',
+            help='Archivo de texto con un nombre por línea',
+        )
+        parser.add_argument(
+            '--todos',
+            action='store_true',
+            help='Mostrar también los nombres resueltos',
+        )
+        parser.add_argument(
+            '--limpiar',
+            action='store_true',
+            help='Vaciar después de listarlos los nombres sin resolver registrados',
+        )
+
+    def handle(self, *args, **options):
+        nombres = list(options['nombres'])
+        if options['archivo']:
+            with open(options['archivo'], encoding='utf-8') as archivo:
+                nombres.extend(linea.strip() for linea in archivo if linea.strip())
+        if not nombres:
+            nombres = [lugar_destino(destino) for destino in Destino.objects.only('nombre', 'municipio', 'departamento')]
+
+        codigos = resolver_iata_lote(nombres)
+        if options['todos']:
+            for nombre, codigo in codigos.items():
+                if codigo:
+                    self.stdout.write(f'{codigo}  {nombre}')
+
+        no_resueltos = [nombre for nombre, codigo in codigos.items() if not codigo]
+        if no_resueltos:
+            self.stdout.write(self.style.WARNING(f'Sin código IATA: {len(no_resueltos)} de {len(codigos)}'))
+            for nombre in no_resueltos:
+                self.stdout.write(f'  {nombre}')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Se resolvieron los {len(codigos)} nombres'))
+
+        # Los que no se resolvieron en las cotizaciones de cualquier proceso (y en esta revisión)
+        sin_resolver = nombres_sin_resolver()
+        if sin_resolver:
+            self.stdout.write(self.style.WARNING(f'Nombres sin resolver registrados (consultas): {len(sin_resolver)}'))
+            for nombre, consultas in sin_resolver:
+                self.stdout.write(f'  {nombre}: {consultas}')
+        if options['limpiar']:
+            limpiar_sin_resolver()
@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from cotizador.amadeus_simulado import crear_servidor
+
+
+class Command(BaseCommand):
+    help = 'Inicia un servidor local que simula la API de Amadeus (apunte AMADEUS_BASE_URL a su dirección)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--puerto', type=int, default=8765)
+        parser.add_argument(
+            '--latencia',
+            default='fija:0',
+            help="Distribución de latencia en ms: 'fija:200', 'uniforme:50,400' o 'lognormal:200,0.6'",
+        )
+        parser.add_argument('--tasa-error', type=float, default=0.0, help='Fracción de respuestas 500 (0 a 1)')
+        parser.add_argument('--tasa-401', type=float, default=0.0, help='Fracción de respuestas 401 (0 a 1)')
+        parser.add_argument('--expires-in', type=int, default=1799, help='Vigencia en segundos de los tokens')
+        parser.add_argument(
+            '--respuestas',
+            help='Archivo JSON {"vuelos": ..., "hoteles": ...} con respuestas fijas en lugar de generadas',
+        )
+        parser.add_argument('--semilla', type=int, help='Semilla para latencias y errores reproducibles')
+        parser.add_argument('--registrar', action='store_true', help='Mostrar cada petición recibida')
+
+    def handle(self, *args, **options):
+        respuestas = None
+        if options['respuestas']:
+            with open(options['respuestas'], encoding='utf-8') as archivo:
+                respuestas = json.load(archivo)
+
+        servidor = crear_servidor(
+            host=options['host'], puerto=options['puerto'], latencia=options['latencia'],
+            tasa_error=options['tasa_error'], tasa_401=options['tasa_401'],
+            expires_in=options['expires_in'], respuestas=respuestas,
+            semilla=options['semilla'], registrar=options['registrar'],
+        )
+        host, puerto = servidor.server_address[:2]
+        self.stdout.write(self.style.SUCCESS(f'Amadeus simulado en http://{host}:{puerto}'))
+        self.stdout.write(f'Use AMADEUS_BASE_URL=http://{host}:{puerto} (Ctrl+C para detener)')
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
+            self.stdout.write(f'Peticiones atendidas: {servidor.peticiones}, tokens emitidos: {servidor.tokens}')
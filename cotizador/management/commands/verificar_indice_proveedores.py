@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cotizador.indice_proveedores import reconstruir_indice, verificar_indice
+
+
+class Command(BaseCommand):
+    help = 'Comprueba que el índice de proveedores candidatos coincida con las ubicaciones actuales'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reparar',
+            action='store_true',
+            help='Reconstruir el índice si se encuentran diferencias',
+        )
+        parser.add_argument(
+            '--limite',
+            type=int,
+            default=20,
+            help='Número máximo de diferencias a mostrar por tipo (por defecto 20)',
+        )
+
+    def handle(self, *args, **options):
+        resultado = verificar_indice()
+        limite = options['limite']
+
+        inconsistente = False
+        for tipo, filas in resultado.items():
+            if not filas:
+                continue
+            inconsistente = True
+            self.stdout.write(self.style.WARNING(f'{tipo}: {len(filas)}'))
+            for fila in filas[:limite]:
+                self.stdout.write(f'  {fila}')
+
+        if not inconsistente:
+            self.stdout.write(self.style.SUCCESS('El índice de proveedores es consistente'))
+            return
+
+        if options['reparar']:
+            total = reconstruir_indice()
+            self.stdout.write(self.style.SUCCESS(f'Índice reconstruido: {total} candidatos'))
+        else:
+            raise CommandError('El índice de proveedores es inconsistente; ejecute reconstruir_indice_proveedores o use --reparar')
@@ -0,0 +1,202 @@
+"""
+Matriz precalculada de distancias entre municipios
+
+Los transportes terrestres con precio por kilómetro (Transporte.modo_precio
+'km') cobran precio_km por la distancia del origen del grupo al destino. En
+lugar de calcular esa distancia en cada cotización, el comando
+construir_matriz_distancias calcula una vez la distancia haversine entre
+cada par de municipios de static/data/colombia_location_data.json con las
+coordenadas de Municipio (ver cotizador.geografia) y la guarda en un archivo
+binario compacto. Cada proceso abre el archivo con mmap, así que el sistema
+operativo comparte las páginas entre procesos y la consulta de una
+distancia es leer dos bytes en una posición calculada.
+
+Formato del archivo (little-endian): la cabecera CABECERA (MAGIA, VERSION,
+número de municipios y CRC32 de sus claves en orden, para detectar un
+archivo construido con otro catálogo) seguida del triángulo superior de la
+matriz sin la diagonal, fila por fila, en décimas de km como enteros sin
+signo de 16 bits; SIN_DISTANCIA marca los pares en que algún municipio no
+tiene coordenadas. Con los 1.100 municipios del catálogo ocupa 1,2 MB.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from functools import lru_cache
+
+from django.conf import settings
+
+from .geografia import haversine_km
+from .models import Municipio
+from .ubicaciones import RUTA_DATOS_UBICACION, claves_desde_texto, normalizar_texto
+
+
+MAGIA = b'MDKM'
+VERSION = 1
+CABECERA = struct.Struct('<4sHII')
+DISTANCIA = struct.Struct('<H')
+
+DECIMAS_POR_KM = 10
+SIN_DISTANCIA = 0xFFFF
+DISTANCIA_MAXIMA = (SIN_DISTANCIA - 1) / DECIMAS_POR_KM
+
+_MATRIZ = None
+_LOCK = threading.Lock()
+
+
+class MatrizInvalida(Exception):
+    """El archivo de la matriz no existe, está dañado o no corresponde al catálogo de municipios"""
+
+
+def ruta_matriz():
+    return getattr(settings, 'DISTANCIAS_MATRIZ_RUTA', settings.BASE_DIR / 'data' / 'matriz_distancias.bin')
+
+
+@lru_cache(maxsize=1)
+def claves_municipios():
+    """(clave_departamento, clave_municipio) de cada municipio del catálogo, en el orden de la matriz"""
+    with open(RUTA_DATOS_UBICACION, encoding='utf-8') as archivo:
+        datos = json.load(archivo)
+    claves = {}
+    for registro in datos:
+        clave_departamento = normalizar_texto(registro['departamento'])
+        for ciudad in registro['ciudades']:
+            claves.setdefault((clave_departamento, normalizar_texto(ciudad)), len(claves))
+    return tuple(claves)
+
+
+@lru_cache(maxsize=1)
+def posiciones():
+    """{(clave_departamento, clave_municipio): posición en la matriz}"""
+    return {clave: posicion for posicion, clave in enumerate(claves_municipios())}
+
+
+def _crc(claves):
+    return zlib.crc32('\n'.join(f'{departamento}|{municipio}' for departamento, municipio in claves).encode('utf-8'))
+
+
+def posicion_de(clave_municipio, clave_departamento):
+    """Posición del municipio en la matriz, o None si no está en el catálogo"""
+    return posiciones().get((clave_departamento, clave_municipio))
+
+
+def _indice_par(fila, columna, n):
+    """Índice del par (fila < columna) en el triángulo superior guardado fila por fila"""
+    return fila * (2 * n - fila - 1) // 2 + (columna - fila - 1)
+
+
+class MatrizDistancias:
+    """Matriz de distancias de un archivo, abierta con mmap de solo lectura"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        try:
+            with open(ruta, 'rb') as archivo:
+                self.firma_archivo = _firma_archivo(os.fstat(archivo.fileno()))
+                self._mmap = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise MatrizInvalida(f'No se pudo abrir {ruta}: {e}')
+
+        if len(self._mmap) < CABECERA.size:
+            raise MatrizInvalida(f'{ruta} no tiene cabecera')
+        magia, version, self.n, crc = CABECERA.unpack_from(self._mmap, 0)
+        if magia != MAGIA or version != VERSION:
+            raise MatrizInvalida(f'{ruta} no es una matriz de distancias de la versión {VERSION}')
+        claves = claves_municipios()
+        if self.n != len(claves) or crc != _crc(claves):
+            raise MatrizInvalida(f'{ruta} se construyó con otro catálogo de municipios')
+        if len(self._mmap) != CABECERA.size + DISTANCIA.size * (self.n * (self.n - 1) // 2):
+            raise MatrizInvalida(f'{ruta} está incompleto')
+
+    def distancia(self, i, j):
+        """Distancia en km entre los municipios de las posiciones i y j, o None si no se conoce"""
+        if i == j:
+            return 0.0
+        if i > j:
+            i, j = j, i
+        valor, = DISTANCIA.unpack_from(self._mmap, CABECERA.size + DISTANCIA.size * _indice_par(i, j, self.n))
+        return None if valor == SIN_DISTANCIA else valor / DECIMAS_POR_KM
+
+    def cerrar(self):
+        self._mmap.close()
+
+
+def _firma_archivo(estado):
+    return estado.st_ino, estado.st_mtime_ns, estado.st_size
+
+
+def matriz():
+    """
+    Matriz del archivo configurado, abierta en la primera consulta y vuelta
+    a abrir si el comando la reconstruyó; None si no hay una matriz válida
+    """
+    global _MATRIZ
+    ruta = ruta_matriz()
+    try:
+        firma = _firma_archivo(os.stat(ruta))
+    except OSError:
+        return None
+    actual = _MATRIZ
+    if actual is not None and actual.ruta == ruta and actual.firma_archivo == firma:
+        return actual
+    with _LOCK:
+        if _MATRIZ is None or _MATRIZ.ruta != ruta or _MATRIZ.firma_archivo != firma:
+            try:
+                # La matriz anterior no se cierra: otro hilo puede estar leyéndola
+                _MATRIZ = MatrizDistancias(ruta)
+            except MatrizInvalida as e:
+                print(f"Matriz de distancias no disponible: {e}")  # Mensaje de debug
+                return None
+        return _MATRIZ
+
+
+def distancia_km(desde, hasta):
+    """Distancia en km entre dos municipios dados como (clave_municipio, clave_departamento), o None"""
+    i, j = posicion_de(*desde), posicion_de(*hasta)
+    if i is None or j is None:
+        return None
+    actual = matriz()
+    return actual.distancia(i, j) if actual is not None else None
+
+
+def distancia_origen_destino(origen, destino):
+    """Distancia en km de la ciudad de origen (texto libre) al municipio del destino, o None"""
+    return distancia_km(claves_desde_texto(origen), (destino.clave_municipio, destino.clave_departamento))
+
+
+def construir_matriz(ruta=None):
+    """
+    Calcula la matriz con las coordenadas de Municipio y la escribe en la
+    ruta (por defecto DISTANCIAS_MATRIZ_RUTA). El archivo se reemplaza de
+    forma atómica, así que los procesos que tienen abierta la matriz
+    anterior la siguen leyendo hasta que la vuelvan a abrir. Retorna
+    (municipios, municipios con coordenadas).
+    """
+    ruta = ruta or ruta_matriz()
+    claves = claves_municipios()
+    n = len(claves)
+    coordenadas = {(departamento, municipio): (latitud, longitud) for departamento, municipio, latitud, longitud
+                   in Municipio.objects.exclude(latitud=None).exclude(longitud=None).values_list(
+                       'departamento__clave', 'clave', 'latitud', 'longitud')}
+    puntos = [coordenadas.get(clave) for clave in claves]
+
+    distancias = array('H', [SIN_DISTANCIA]) * (n * (n - 1) // 2)
+    conocidos = [i for i, punto in enumerate(puntos) if punto is not None]
+    for posicion, i in enumerate(conocidos):
+        for j in conocidos[posicion + 1:]:
+            distancia = min(haversine_km(*puntos[i], *puntos[j]), DISTANCIA_MAXIMA)
+            distancias[_indice_par(i, j, n)] = round(distancia * DECIMAS_POR_KM)
+    if sys.byteorder != 'little':
+        distancias.byteswap()
+
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    with open(temporal, 'wb') as archivo:
+        archivo.write(CABECERA.pack(MAGIA, VERSION, n, _crc(claves)))
+        distancias.tofile(archivo)
+    os.replace(temporal, ruta)
+    return n, len(conocidos)
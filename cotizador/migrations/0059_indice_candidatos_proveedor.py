@@ -0,0 +1,130 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizador', '0058_destino_departamento_destino_municipio_destino_pais_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alimentacion',
+            name='clave_departamento',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='alimentacion',
+            name='clave_municipio',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='alimentacion',
+            name='departamento',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='Departamento'),
+        ),
+        migrations.AddField(
+            model_name='alimentacion',
+            name='municipio',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='Municipio/Ciudad'),
+        ),
+        migrations.AddField(
+            model_name='alimentacion',
+            name='pais',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='País'),
+        ),
+        migrations.AddField(
+            model_name='destino',
+            name='clave_departamento',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='destino',
+            name='clave_municipio',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='hospedaje',
+            name='clave_departamento',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='hospedaje',
+            name='clave_municipio',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='seguro',
+            name='clave_departamento',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='seguro',
+            name='clave_municipio',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='seguro',
+            name='departamento',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='Departamento'),
+        ),
+        migrations.AddField(
+            model_name='seguro',
+            name='municipio',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='Municipio/Ciudad'),
+        ),
+        migrations.AddField(
+            model_name='seguro',
+            name='pais',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='País'),
+        ),
+        migrations.AddField(
+            model_name='transporte',
+            name='clave_departamento',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='transporte',
+            name='clave_municipio',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='transporte',
+            name='departamento',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='Departamento'),
+        ),
+        migrations.AddField(
+            model_name='transporte',
+            name='disponible',
+            field=models.BooleanField(default=True, verbose_name='Disponible'),
+        ),
+        migrations.AddField(
+            model_name='transporte',
+            name='municipio',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='Municipio/Ciudad'),
+        ),
+        migrations.AddField(
+            model_name='transporte',
+            name='pais',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='País'),
+        ),
+        migrations.CreateModel(
+            name='CandidatoProveedor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('categoria', models.CharField(choices=[('hospedaje', 'Hospedaje'), ('transporte', 'Transporte'), ('alimentacion', 'Alimentación'), ('seguro', 'Seguro')], max_length=20)),
+                ('proveedor_id', models.PositiveBigIntegerField()),
+                ('coincidencia', models.CharField(choices=[('municipio', 'Mismo municipio'), ('departamento', 'Mismo departamento')], max_length=20)),
+                ('destino', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candidatos_proveedor', to='cotizador.destino')),
+            ],
+            options={
+                'verbose_name': 'Candidato de Proveedor',
+                'verbose_name_plural': 'Candidatos de Proveedores',
+                'indexes': [models.Index(fields=['categoria', 'proveedor_id'], name='candidato_por_proveedor')],
+                'constraints': [models.UniqueConstraint(fields=('destino', 'categoria', 'proveedor_id'), name='candidato_proveedor_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,158 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizador', '0059_indice_candidatos_proveedor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Departamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('clave', models.CharField(db_index=True, max_length=100)),
+            ],
+            options={
+                'verbose_name': 'Departamento',
+                'verbose_name_plural': 'Departamentos',
+                'ordering': ['nombre'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Pais',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('codigo', models.CharField(max_length=2, unique=True, verbose_name='Código ISO')),
+                ('clave', models.CharField(help_text='Nombre normalizado sin tildes y en mayúsculas', max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name': 'País',
+                'verbose_name_plural': 'Países',
+                'ordering': ['nombre'],
+            },
+        ),
+        migrations.AddField(
+            model_name='alimentacion',
+            name='departamento_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='alimentaciones', to='cotizador.departamento'),
+        ),
+        migrations.AddField(
+            model_name='destino',
+            name='departamento_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='destinos', to='cotizador.departamento'),
+        ),
+        migrations.AddField(
+            model_name='entidad',
+            name='departamento_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='entidades', to='cotizador.departamento'),
+        ),
+        migrations.AddField(
+            model_name='hospedaje',
+            name='departamento_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='hospedajes', to='cotizador.departamento'),
+        ),
+        migrations.AddField(
+            model_name='seguro',
+            name='departamento_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='seguros', to='cotizador.departamento'),
+        ),
+        migrations.AddField(
+            model_name='transporte',
+            name='departamento_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transportes', to='cotizador.departamento'),
+        ),
+        migrations.CreateModel(
+            name='Municipio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('clave', models.CharField(db_index=True, max_length=100)),
+                ('departamento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='municipios', to='cotizador.departamento')),
+            ],
+            options={
+                'verbose_name': 'Municipio',
+                'verbose_name_plural': 'Municipios',
+                'ordering': ['nombre'],
+            },
+        ),
+        migrations.AddField(
+            model_name='alimentacion',
+            name='municipio_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='alimentaciones', to='cotizador.municipio'),
+        ),
+        migrations.AddField(
+            model_name='destino',
+            name='municipio_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='destinos', to='cotizador.municipio'),
+        ),
+        migrations.AddField(
+            model_name='entidad',
+            name='municipio_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='entidades', to='cotizador.municipio'),
+        ),
+        migrations.AddField(
+            model_name='hospedaje',
+            name='municipio_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='hospedajes', to='cotizador.municipio'),
+        ),
+        migrations.AddField(
+            model_name='seguro',
+            name='municipio_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='seguros', to='cotizador.municipio'),
+        ),
+        migrations.AddField(
+            model_name='transporte',
+            name='municipio_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transportes', to='cotizador.municipio'),
+        ),
+        migrations.AddField(
+            model_name='departamento',
+            name='pais',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='departamentos', to='cotizador.pais'),
+        ),
+        migrations.AddField(
+            model_name='alimentacion',
+            name='pais_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='alimentaciones', to='cotizador.pais'),
+        ),
+        migrations.AddField(
+            model_name='destino',
+            name='pais_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='destinos', to='cotizador.pais'),
+        ),
+        migrations.AddField(
+            model_name='entidad',
+            name='pais_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='entidades', to='cotizador.pais'),
+        ),
+        migrations.AddField(
+            model_name='hospedaje',
+            name='pais_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='hospedajes', to='cotizador.pais'),
+        ),
+        migrations.AddField(
+            model_name='seguro',
+            name='pais_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='seguros', to='cotizador.pais'),
+        ),
+        migrations.AddField(
+            model_name='transporte',
+            name='pais_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transportes', to='cotizador.pais'),
+        ),
+        migrations.AddConstraint(
+            model_name='municipio',
+            constraint=models.UniqueConstraint(fields=('departamento', 'clave'), name='municipio_clave_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='departamento',
+            constraint=models.UniqueConstraint(fields=('pais', 'clave'), name='departamento_clave_unica'),
+        ),
+    ]
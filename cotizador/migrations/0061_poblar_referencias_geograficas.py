@@ -0,0 +1,217 @@
+import json
+import unicodedata
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import migrations
+
+
+# Copia congelada de cotizador.ubicaciones tal como estaba al escribir la
+# migración (también la usan 0066 y 0069): cambiar ese módulo no debe
+# cambiar lo que hacen las migraciones ya escritas.
+RUTA_DATOS_UBICACION = settings.BASE_DIR / 'static' / 'data' / 'colombia_location_data.json'
+RUTA_DATOS_PAISES = settings.BASE_DIR / 'static' / 'data' / 'countries.json'
+CODIGO_COLOMBIA = 'CO'
+PAISES_IGNORADOS = {'COLOMBIA'}
+
+MODELOS_CON_CLAVES = ['Destino', 'Hospedaje', 'Transporte', 'Alimentacion', 'Seguro']
+
+
+def normalizar_texto(texto):
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = texto.replace('.', ' ')
+    return ' '.join(texto.upper().split())
+
+
+@lru_cache(maxsize=1)
+def catalogo_colombia():
+    """(departamentos, {clave_municipio: claves de sus departamentos})"""
+    with open(RUTA_DATOS_UBICACION, encoding='utf-8') as archivo:
+        datos = json.load(archivo)
+    departamentos = set()
+    municipios = {}
+    for registro in datos:
+        clave_departamento = normalizar_texto(registro['departamento'])
+        departamentos.add(clave_departamento)
+        for ciudad in registro['ciudades']:
+            municipios.setdefault(normalizar_texto(ciudad), set()).add(clave_departamento)
+    return departamentos, municipios
+
+
+def completar_departamento(clave_municipio, clave_departamento):
+    if clave_departamento or not clave_municipio:
+        return clave_departamento
+    _, municipios = catalogo_colombia()
+    candidatos = municipios.get(clave_municipio, set())
+    if len(candidatos) == 1:
+        return next(iter(candidatos))
+    return ''
+
+
+def claves_desde_texto(texto):
+    departamentos, municipios = catalogo_colombia()
+    partes = [normalizar_texto(parte) for parte in (texto or '').split(',')]
+    partes = [parte for parte in partes if parte and parte not in PAISES_IGNORADOS]
+
+    clave_departamento = ''
+    indice_departamento = None
+    for indice in range(len(partes) - 1, -1, -1):
+        if partes[indice] in departamentos:
+            clave_departamento = partes[indice]
+            indice_departamento = indice
+            break
+
+    clave_municipio = ''
+    for indice, parte in enumerate(partes):
+        if indice == indice_departamento:
+            continue
+        if parte in municipios and (not clave_departamento or clave_departamento in municipios[parte]):
+            clave_municipio = parte
+            break
+
+    if not clave_municipio and not clave_departamento and len(partes) == 1:
+        clave_municipio = partes[0]
+
+    return clave_municipio, completar_departamento(clave_municipio, clave_departamento)
+
+
+def claves_ubicacion(instancia, usar_entidad=True, usar_nombre=False):
+    fuentes = [instancia]
+    entidad = getattr(instancia, 'entidad', None) if usar_entidad else None
+    if entidad is not None:
+        fuentes.append(entidad)
+
+    for fuente in fuentes:
+        clave_municipio = normalizar_texto(getattr(fuente, 'municipio', None))
+        clave_departamento = normalizar_texto(getattr(fuente, 'departamento', None))
+        if clave_municipio or clave_departamento:
+            return clave_municipio, completar_departamento(clave_municipio, clave_departamento)
+
+        ubicacion = getattr(fuente, 'ubicacion', None)
+        if ubicacion:
+            claves = claves_desde_texto(ubicacion)
+            if any(claves):
+                return claves
+
+    if usar_nombre:
+        _, municipios = catalogo_colombia()
+        clave_municipio, clave_departamento = claves_desde_texto(getattr(instancia, 'nombre', None))
+        if clave_departamento or clave_municipio in municipios:
+            return clave_municipio, clave_departamento
+
+    return '', ''
+
+
+def cargar_catalogo_geografico(apps):
+    """Crea las filas de Pais, Departamento y Municipio que falten"""
+    Pais = apps.get_model('cotizador', 'Pais')
+    Departamento = apps.get_model('cotizador', 'Departamento')
+    Municipio = apps.get_model('cotizador', 'Municipio')
+
+    with open(RUTA_DATOS_PAISES, encoding='utf-8') as archivo:
+        paises = json.load(archivo)
+    with open(RUTA_DATOS_UBICACION, encoding='utf-8') as archivo:
+        datos = json.load(archivo)
+
+    codigos_existentes = set(Pais.objects.values_list('codigo', flat=True))
+    Pais.objects.bulk_create([
+        Pais(nombre=pais['name'], codigo=pais['code'], clave=normalizar_texto(pais['name']))
+        for pais in paises if pais['code'] not in codigos_existentes
+    ])
+
+    colombia = Pais.objects.get(codigo=CODIGO_COLOMBIA)
+    departamentos = {d.clave: d for d in Departamento.objects.filter(pais=colombia)}
+    nuevos_departamentos = []
+    for registro in datos:
+        clave = normalizar_texto(registro['departamento'])
+        if clave not in departamentos:
+            departamentos[clave] = Departamento(pais=colombia, nombre=registro['departamento'], clave=clave)
+            nuevos_departamentos.append(departamentos[clave])
+    Departamento.objects.bulk_create(nuevos_departamentos)
+
+    departamentos = {d.clave: d for d in Departamento.objects.filter(pais=colombia)}
+    existentes = set(Municipio.objects.values_list('departamento_id', 'clave'))
+    nuevos_municipios = []
+    for registro in datos:
+        departamento = departamentos[normalizar_texto(registro['departamento'])]
+        for ciudad in registro['ciudades']:
+            clave = normalizar_texto(ciudad)
+            if (departamento.pk, clave) not in existentes:
+                existentes.add((departamento.pk, clave))
+                nuevos_municipios.append(Municipio(departamento=departamento, nombre=ciudad, clave=clave))
+    Municipio.objects.bulk_create(nuevos_municipios, batch_size=500)
+
+
+def mapa_referencias(apps):
+    Pais = apps.get_model('cotizador', 'Pais')
+    Departamento = apps.get_model('cotizador', 'Departamento')
+    Municipio = apps.get_model('cotizador', 'Municipio')
+    return {
+        'paises': dict(Pais.objects.values_list('clave', 'id')),
+        'departamentos': {clave: (id_, pais_id) for id_, clave, pais_id
+                          in Departamento.objects.values_list('id', 'clave', 'pais_id')},
+        'municipios': {(departamento_id, clave): id_ for id_, departamento_id, clave
+                       in Municipio.objects.values_list('id', 'departamento_id', 'clave')},
+    }
+
+
+def referencias_ubicacion(clave_municipio, clave_departamento, texto_pais, mapa):
+    """(pais_id, departamento_id, municipio_id) de las claves, con None en los que no se encuentren"""
+    pais_id = departamento_id = municipio_id = None
+    if clave_departamento and clave_departamento in mapa['departamentos']:
+        departamento_id, pais_id = mapa['departamentos'][clave_departamento]
+        if clave_municipio:
+            municipio_id = mapa['municipios'].get((departamento_id, clave_municipio))
+
+    if pais_id is None and texto_pais:
+        pais_id = mapa['paises'].get(normalizar_texto(texto_pais))
+
+    return pais_id, departamento_id, municipio_id
+
+
+def poblar_referencias(apps, schema_editor):
+    """
+    Carga Pais/Departamento/Municipio y rellena las claves de ubicación y las
+    referencias de los registros existentes.
+    """
+    cargar_catalogo_geografico(apps)
+    mapa = mapa_referencias(apps)
+
+    Entidad = apps.get_model('cotizador', 'Entidad')
+    entidades = list(Entidad.objects.all())
+    for entidad in entidades:
+        claves = claves_ubicacion(entidad)
+        entidad.pais_ref_id, entidad.departamento_ref_id, entidad.municipio_ref_id = referencias_ubicacion(
+            *claves, entidad.pais, mapa
+        )
+    Entidad.objects.bulk_update(entidades, ['pais_ref', 'departamento_ref', 'municipio_ref'], batch_size=500)
+
+    for nombre_modelo in MODELOS_CON_CLAVES:
+        modelo = apps.get_model('cotizador', nombre_modelo)
+        instancias = list(modelo.objects.select_related('entidad'))
+        for instancia in instancias:
+            instancia.clave_municipio, instancia.clave_departamento = claves_ubicacion(
+                instancia, usar_entidad=nombre_modelo != 'Destino'
+            )
+            instancia.pais_ref_id, instancia.departamento_ref_id, instancia.municipio_ref_id = referencias_ubicacion(
+                instancia.clave_municipio, instancia.clave_departamento, getattr(instancia, 'pais', None), mapa
+            )
+        modelo.objects.bulk_update(
+            instancias,
+            ['clave_municipio', 'clave_departamento', 'pais_ref', 'departamento_ref', 'municipio_ref'],
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizador', '0060_referencias_geograficas'),
+    ]
+
+    operations = [
+        migrations.RunPython(poblar_referencias, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizador', '0061_poblar_referencias_geograficas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RespuestaAmadeus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(choices=[('vuelos', 'Ofertas de vuelos'), ('hoteles', 'Ofertas de hoteles')], max_length=20)),
+                ('clave', models.CharField(max_length=64, unique=True)),
+                ('parametros', models.JSONField()),
+                ('respuesta', models.JSONField()),
+                ('creado', models.DateTimeField()),
+                ('expira', models.DateTimeField()),
+                ('ultimo_acceso', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Respuesta de Amadeus',
+                'verbose_name_plural': 'Respuestas de Amadeus',
+            },
+        ),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:23
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+# Copia congelada de cotizador.indice_proveedores tal como estaba al escribir
+# la migración (también la usa 0070)
+MODELOS_POR_CATEGORIA = {
+    'hospedaje': 'Hospedaje',
+    'transporte': 'Transporte',
+    'alimentacion': 'Alimentacion',
+    'seguro': 'Seguro',
+}
+
+CAMPO_CAPACIDAD = {
+    'hospedaje': 'capacidadpax',
+    'transporte': 'pax',
+}
+
+CAMPOS_PRECALCULADOS = ['precio_por_persona', 'calificacion', 'disponible', 'subtipo']
+
+PRECISION_PRECIO = Decimal('0.0001')
+
+
+def campos_proveedor(categoria):
+    campos = ['precio', 'disponible']
+    if categoria in CAMPO_CAPACIDAD:
+        campos.append(CAMPO_CAPACIDAD[categoria])
+    if categoria == 'hospedaje':
+        campos.append('calificacion')
+    if categoria == 'transporte':
+        campos.append('tipoTransporte')
+    return campos
+
+
+def valores_precalculados(categoria, datos):
+    precio = datos.get('precio')
+    capacidad = datos.get(CAMPO_CAPACIDAD.get(categoria))
+    if precio is not None:
+        precio = Decimal(str(precio))
+        if capacidad and capacidad > 0:
+            precio = precio / capacidad
+        precio = precio.quantize(PRECISION_PRECIO)
+    return {
+        'precio_por_persona': precio,
+        'calificacion': datos.get('calificacion'),
+        'disponible': datos.get('disponible', True),
+        'subtipo': datos.get('tipoTransporte') or '',
+    }
+
+
+def poblar_precalculados(apps, schema_editor):
+    """Copia el precio por persona, la calificación, la disponibilidad y el subtipo a las filas existentes"""
+    CandidatoProveedor = apps.get_model('cotizador', 'CandidatoProveedor')
+    for categoria, nombre_modelo in MODELOS_POR_CATEGORIA.items():
+        modelo = apps.get_model('cotizador', nombre_modelo)
+        precalculados = {
+            datos['pk']: valores_precalculados(categoria, datos)
+            for datos in modelo.objects.values('pk', *campos_proveedor(categoria))
+        }
+        filas = list(CandidatoProveedor.objects.filter(categoria=categoria))
+        for fila in filas:
+            for campo, valor in precalculados.get(fila.proveedor_id, {}).items():
+                setattr(fila, campo, valor)
+        CandidatoProveedor.objects.bulk_update(filas, CAMPOS_PRECALCULADOS, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizador', '0062_cache_respuestas_amadeus'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='candidatoproveedor',
+            name='calificacion',
+            field=models.DecimalField(blank=True, decimal_places=1, max_digits=2, null=True),
+        ),
+        migrations.AddField(
+            model_name='candidatoproveedor',
+            name='disponible',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='candidatoproveedor',
+            name='precio_por_persona',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='candidatoproveedor',
+            name='subtipo',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='candidatoproveedor',
+            index=models.Index(condition=models.Q(('disponible', True)), fields=['destino', 'categoria', 'precio_por_persona'], name='candidato_por_precio'),
+        ),
+        migrations.AddIndex(
+            model_name='candidatoproveedor',
+            index=models.Index(condition=models.Q(('disponible', True)), fields=['destino', 'categoria', 'calificacion'], name='candidato_por_calificacion'),
+        ),
+        migrations.RunPython(poblar_precalculados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:37
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizador', '0063_precios_candidatos_proveedor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cotizacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('origen', models.CharField(max_length=255)),
+                ('fecha_inicio', models.DateField()),
+                ('fecha_fin', models.DateField()),
+                ('total_pax', models.PositiveIntegerField()),
+                ('porcentaje_utilidad', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('datos', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Datos del formulario de cotización')),
+                ('costos', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Resultado de calcular_costos()')),
+                ('detalle', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Detalle de la respuesta de calculate_quotation')),
+                ('subtotal', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('iva', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('utilidad', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('total', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('destino', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cotizaciones', to='cotizador.destino')),
+                ('entidad', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cotizaciones', to='cotizador.entidad')),
+            ],
+            options={
+                'verbose_name': 'Cotización',
+                'verbose_name_plural': 'Cotizaciones',
+                'ordering': ['-creado', '-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LineaCotizacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('componente', models.CharField(choices=[('hospedaje', 'Hospedaje'), ('transporte_aereo', 'Transporte aéreo'), ('transporte_terrestre', 'Transporte terrestre'), ('transporte_maritimo', 'Transporte marítimo'), ('alimentacion', 'Alimentación'), ('seguro', 'Seguro')], max_length=30)),
+                ('fuente', models.CharField(choices=[('convenio', 'Convenio'), ('amadeus', 'Amadeus'), ('respaldo', 'Proveedores locales (respaldo de Amadeus)'), ('local', 'Proveedores locales')], max_length=20)),
+                ('costo', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('proveedores', models.JSONField(blank=True, default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('firma', models.CharField(max_length=64)),
+                ('cotizacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lineas', to='cotizador.cotizacion')),
+            ],
+            options={
+                'verbose_name': 'Línea de Cotización',
+                'verbose_name_plural': 'Líneas de Cotización',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='cotizacion',
+            index=models.Index(fields=['entidad', '-creado', '-id'], name='cotizacion_por_entidad'),
+        ),
+        migrations.AddConstraint(
+            model_name='lineacotizacion',
+            constraint=models.UniqueConstraint(fields=('cotizacion', 'componente'), name='linea_cotizacion_unica'),
+        ),
+    ]
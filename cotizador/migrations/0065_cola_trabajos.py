@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:41
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizador', '0064_cotizaciones_guardadas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoCotizacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('cotizacion', 'Cotización'), ('lote', 'Lote de cotizaciones'), ('barrido', 'Barrido de pasajeros y temporadas'), ('ventanas', 'Búsqueda de ventanas de viaje')], max_length=20)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En proceso'), ('completado', 'Completado'), ('fallido', 'Fallido')], default='pendiente', max_length=20)),
+                ('parametros', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('resultado', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('maximo_intentos', models.PositiveIntegerField(default=3)),
+                ('disponible_desde', models.DateTimeField()),
+                ('trabajador', models.CharField(blank=True, max_length=100)),
+                ('reservado_hasta', models.DateTimeField(blank=True, null=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('iniciado', models.DateTimeField(blank=True, null=True)),
+                ('terminado', models.DateTimeField(blank=True, null=True)),
+                ('entidad', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='trabajos_cotizacion', to='cotizador.entidad')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Cotización',
+                'verbose_name_plural': 'Trabajos de Cotización',
+                'ordering': ['-creado', '-id'],
+                'indexes': [models.Index(fields=['estado', 'disponible_desde', 'id'], name='trabajo_disponible')],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:56
+
+import importlib
+
+from django.db import migrations, models
+
+
+# Copia congelada de cotizador.indice_rutas.clave_ciudad
+claves_desde_texto = importlib.import_module('cotizador.migrations.0061_poblar_referencias_geograficas').claves_desde_texto
+
+
+def clave_ciudad(texto):
+    return claves_desde_texto(texto)[0]
+
+
+def poblar_claves_rutas(apps, schema_editor):
+    """Calcula las claves de origen y ciudad de destino de las rutas existentes"""
+    RutaTransporte = apps.get_model('cotizador', 'RutaTransporte')
+    rutas = list(RutaTransporte.objects.select_related('convenio_agencia'))
+    for ruta in rutas:
+        ruta.clave_origen = clave_ciudad(ruta.convenio_agencia.ciudad_origen if ruta.convenio_agencia else None)
+        ruta.clave_destino = clave_ciudad(ruta.ciudad_destino)
+    RutaTransporte.objects.bulk_update(rutas, ['clave_origen', 'clave_destino'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizador', '0065_cola_trabajos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rutatransporte',
+            name='clave_destino',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='rutatransporte',
+            name='clave_origen',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='lineacotizacion',
+            name='fuente',
+            field=models.CharField(choices=[('convenio', 'Convenio'), ('amadeus', 'Amadeus'), ('respaldo', 'Proveedores locales (respaldo de Amadeus)'), ('local', 'Proveedores locales'), ('ruta', 'Ruta con precio negociado')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='rutatransporte',
+            index=models.Index(fields=['clave_origen', 'clave_destino'], name='ruta_por_ciudades'),
+        ),
+        migrations.AddIndex(
+            model_name='rutatransporte',
+            index=models.Index(fields=['clave_origen', 'destino'], name='ruta_por_destino'),
+        ),
+        migrations.RunPython(poblar_claves_rutas, migrations.RunPython.noop),
+    ]
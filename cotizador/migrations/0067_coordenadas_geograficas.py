@@ -0,0 +1,194 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:07
+
+import csv
+import importlib
+import math
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Copia congelada de cotizador.geografia tal como estaba al escribir la
+# migración (también la usa 0069)
+normalizar_texto = importlib.import_module('cotizador.migrations.0061_poblar_referencias_geograficas').normalizar_texto
+
+RUTA_COORDENADAS = settings.BASE_DIR / 'static' / 'data' / 'coordenadas_municipios.csv'
+
+MODELOS_CON_COORDENADAS = ['Destino', 'Hospedaje', 'Transporte', 'Alimentacion', 'Seguro']
+
+CAMPOS_GEO = ['latitud', 'longitud', 'celda_geo']
+
+CELDAS_POR_GRADO = 10
+COLUMNAS = 360 * CELDAS_POR_GRADO
+
+PATRON_COORDENADAS = re.compile(r'^\s*(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)\s*$')
+
+
+def coordenadas_validas(latitud, longitud):
+    return -90 <= latitud <= 90 and -180 <= longitud <= 180
+
+
+def celda_de(latitud, longitud):
+    fila = min(int(math.floor((latitud + 90) * CELDAS_POR_GRADO)), 180 * CELDAS_POR_GRADO - 1)
+    columna = min(int(math.floor((longitud + 180) * CELDAS_POR_GRADO)), COLUMNAS - 1)
+    return fila * COLUMNAS + columna
+
+
+def coordenadas_desde_texto(texto):
+    coincidencia = PATRON_COORDENADAS.match(texto or '')
+    if not coincidencia:
+        return None
+    latitud, longitud = float(coincidencia.group(1)), float(coincidencia.group(2))
+    return (latitud, longitud) if coordenadas_validas(latitud, longitud) else None
+
+
+def cargar_coordenadas(apps):
+    """Guarda en Municipio las coordenadas de RUTA_COORDENADAS"""
+    Municipio = apps.get_model('cotizador', 'Municipio')
+    coordenadas = {}
+    with open(RUTA_COORDENADAS, encoding='utf-8', newline='') as archivo:
+        for numero, fila in enumerate(csv.DictReader(archivo), start=2):
+            try:
+                latitud, longitud = float(fila['latitud']), float(fila['longitud'])
+            except (TypeError, ValueError):
+                raise ValueError(f'Coordenadas inválidas en la línea {numero}: {fila}')
+            if not coordenadas_validas(latitud, longitud):
+                raise ValueError(f'Coordenadas fuera de rango en la línea {numero}: {fila}')
+            clave = (normalizar_texto(fila['departamento']), normalizar_texto(fila['municipio']))
+            coordenadas[clave] = (latitud, longitud)
+
+    actualizados = []
+    for municipio in Municipio.objects.select_related('departamento'):
+        nuevas = coordenadas.get((municipio.departamento.clave, municipio.clave))
+        if nuevas is not None and (municipio.latitud, municipio.longitud) != nuevas:
+            municipio.latitud, municipio.longitud = nuevas
+            actualizados.append(municipio)
+    Municipio.objects.bulk_update(actualizados, ['latitud', 'longitud'], batch_size=500)
+
+
+def mapa_coordenadas(apps):
+    """{municipio_id: (latitud, longitud)} de los municipios con coordenadas"""
+    Municipio = apps.get_model('cotizador', 'Municipio')
+    return {id_: (latitud, longitud) for id_, latitud, longitud in Municipio.objects.exclude(
+        latitud=None).exclude(longitud=None).values_list('id', 'latitud', 'longitud')}
+
+
+def actualizar_coordenadas(instancia, mapa):
+    """Recalcula latitud, longitud y celda_geo de la instancia (sin guardarla). Retorna True si cambiaron."""
+    anteriores = tuple(getattr(instancia, campo) for campo in CAMPOS_GEO)
+    coordenadas = coordenadas_desde_texto(getattr(instancia, 'ubicacion', None))
+    if coordenadas is None and instancia.municipio_ref_id:
+        coordenadas = mapa.get(instancia.municipio_ref_id)
+    if coordenadas is None:
+        instancia.latitud = instancia.longitud = instancia.celda_geo = None
+    else:
+        instancia.latitud, instancia.longitud = coordenadas
+        instancia.celda_geo = celda_de(*coordenadas)
+    return tuple(getattr(instancia, campo) for campo in CAMPOS_GEO) != anteriores
+
+
+def poblar_coordenadas(apps, schema_editor):
+    """Carga las coordenadas de los municipios y calcula las de los destinos y proveedores existentes"""
+    cargar_coordenadas(apps)
+    mapa = mapa_coordenadas(apps)
+    for nombre_modelo in MODELOS_CON_COORDENADAS:
+        modelo = apps.get_model('cotizador', nombre_modelo)
+        pendientes = [instancia for instancia in modelo.objects.all() if actualizar_coordenadas(instancia, mapa)]
+        modelo.objects.bulk_update(pendientes, CAMPOS_GEO, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizador', '0066_indice_rutas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alimentacion',
+            name='celda_geo',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='alimentacion',
+            name='latitud',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='alimentacion',
+            name='longitud',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='destino',
+            name='celda_geo',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='destino',
+            name='latitud',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='destino',
+            name='longitud',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='hospedaje',
+            name='celda_geo',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='hospedaje',
+            name='latitud',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='hospedaje',
+            name='longitud',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='municipio',
+            name='latitud',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='municipio',
+            name='longitud',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='seguro',
+            name='celda_geo',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='seguro',
+            name='latitud',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='seguro',
+            name='longitud',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transporte',
+            name='celda_geo',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transporte',
+            name='latitud',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transporte',
+            name='longitud',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(poblar_coordenadas, migrations.RunPython.noop),
+    ]
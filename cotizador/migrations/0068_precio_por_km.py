@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizador', '0067_coordenadas_geograficas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transporte',
+            name='modo_precio',
+            field=models.CharField(choices=[('trayecto', 'Precio por trayecto'), ('km', 'Precio por kilómetro')], default='trayecto', max_length=10, verbose_name='Modo de precio'),
+        ),
+        migrations.AddField(
+            model_name='transporte',
+            name='precio_km',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Precio por km'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+import importlib
+
+from django.db import migrations
+
+
+# Copias congeladas de cotizador.ubicaciones y cotizador.geografia
+_ubicaciones = importlib.import_module('cotizador.migrations.0061_poblar_referencias_geograficas')
+_geografia = importlib.import_module('cotizador.migrations.0067_coordenadas_geograficas')
+claves_ubicacion = _ubicaciones.claves_ubicacion
+mapa_referencias = _ubicaciones.mapa_referencias
+referencias_ubicacion = _ubicaciones.referencias_ubicacion
+actualizar_coordenadas = _geografia.actualizar_coordenadas
+mapa_coordenadas = _geografia.mapa_coordenadas
+
+
+def recalcular_claves_destinos(apps, schema_editor):
+    """
+    Recalcula las claves, referencias y coordenadas de los destinos que solo
+    tienen el municipio en el nombre (los de seed_destinos). El índice de
+    candidatos se llena en 0070.
+    """
+    Destino = apps.get_model('cotizador', 'Destino')
+    mapa = mapa_referencias(apps)
+    coordenadas = mapa_coordenadas(apps)
+    destinos = list(Destino.objects.filter(clave_municipio='', clave_departamento=''))
+    for destino in destinos:
+        destino.clave_municipio, destino.clave_departamento = claves_ubicacion(
+            destino, usar_entidad=False, usar_nombre=True
+        )
+        destino.pais_ref_id, destino.departamento_ref_id, destino.municipio_ref_id = referencias_ubicacion(
+            destino.clave_municipio, destino.clave_departamento, destino.pais, mapa
+        )
+        actualizar_coordenadas(destino, coordenadas)
+    Destino.objects.bulk_update(
+        destinos,
+        ['clave_municipio', 'clave_departamento', 'pais_ref', 'departamento_ref', 'municipio_ref',
+         'latitud', 'longitud', 'celda_geo'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizador', '0068_precio_por_km'),
+    ]
+
+    operations = [
+        migrations.RunPython(recalcular_claves_destinos, migrations.RunPython.noop),
+    ]
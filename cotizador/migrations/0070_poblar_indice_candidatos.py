@@ -0,0 +1,71 @@
+import importlib
+
+from django.db import migrations
+
+
+# Copia congelada de cotizador.indice_proveedores
+_precalculados = importlib.import_module('cotizador.migrations.0063_precios_candidatos_proveedor')
+MODELOS_POR_CATEGORIA = _precalculados.MODELOS_POR_CATEGORIA
+campos_proveedor = _precalculados.campos_proveedor
+valores_precalculados = _precalculados.valores_precalculados
+
+
+def coincidencia_de(clave_municipio_destino, clave_departamento_destino, clave_municipio, clave_departamento):
+    """Tipo de coincidencia entre un destino y un proveedor, o None si no coinciden"""
+    mismo_departamento = bool(clave_departamento) and clave_departamento == clave_departamento_destino
+    departamento_compatible = mismo_departamento or not clave_departamento or not clave_departamento_destino
+    if clave_municipio and clave_municipio == clave_municipio_destino and departamento_compatible:
+        return 'municipio'
+    if mismo_departamento:
+        return 'departamento'
+    return None
+
+
+def poblar_indice(apps, schema_editor):
+    """
+    Llena CandidatoProveedor a partir de las claves de ubicación guardadas en
+    0061 y 0069, igual que reconstruir_indice_proveedores sin recalcular claves
+    """
+    Destino = apps.get_model('cotizador', 'Destino')
+    CandidatoProveedor = apps.get_model('cotizador', 'CandidatoProveedor')
+
+    destinos = list(Destino.objects.values_list('id', 'clave_municipio', 'clave_departamento'))
+    filas = []
+    for categoria, nombre_modelo in MODELOS_POR_CATEGORIA.items():
+        modelo = apps.get_model('cotizador', nombre_modelo)
+        proveedores = {}
+        por_municipio = {}
+        por_departamento = {}
+        for datos in modelo.objects.values('pk', 'clave_municipio', 'clave_departamento', *campos_proveedor(categoria)):
+            proveedores[datos['pk']] = datos
+            if datos['clave_municipio']:
+                por_municipio.setdefault(datos['clave_municipio'], []).append(datos['pk'])
+            if datos['clave_departamento']:
+                por_departamento.setdefault(datos['clave_departamento'], []).append(datos['pk'])
+
+        for destino_id, clave_municipio_destino, clave_departamento_destino in destinos:
+            candidatos = set(por_municipio.get(clave_municipio_destino, []) if clave_municipio_destino else [])
+            if clave_departamento_destino:
+                candidatos.update(por_departamento.get(clave_departamento_destino, []))
+            for proveedor_id in sorted(candidatos):
+                datos = proveedores[proveedor_id]
+                coincidencia = coincidencia_de(clave_municipio_destino, clave_departamento_destino,
+                                               datos['clave_municipio'], datos['clave_departamento'])
+                if coincidencia:
+                    filas.append(CandidatoProveedor(destino_id=destino_id, categoria=categoria,
+                                                    proveedor_id=proveedor_id, coincidencia=coincidencia,
+                                                    **valores_precalculados(categoria, datos)))
+
+    CandidatoProveedor.objects.all().delete()
+    CandidatoProveedor.objects.bulk_create(filas, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cotizador', '0069_claves_destino_por_nombre'),
+    ]
+
+    operations = [
+        migrations.RunPython(poblar_indice, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 
 class BaseModel(models.Model):
     """
@@ -13,6 +14,59 @@ class BaseModel(models.Model):
         # Será sobrescrito por modelos específicos si necesitan lógica específica
         super().save(*args, **kwargs)
 
+class Pais(models.Model):
+    """País de referencia, cargado desde static/data/countries.json"""
+    nombre = models.CharField(max_length=100)
+    codigo = models.CharField(max_length=2, unique=True, verbose_name="Código ISO")
+    clave = models.CharField(max_length=100, unique=True, help_text="Nombre normalizado sin tildes y en mayúsculas")
+
+    def __str__(self):
+        return self.nombre
+
+    class Meta:
+        verbose_name = "País"
+        verbose_name_plural = "Países"
+        ordering = ['nombre']
+
+
+class Departamento(models.Model):
+    """Departamento de referencia, cargado desde static/data/colombia_location_data.json"""
+    pais = models.ForeignKey(Pais, on_delete=models.CASCADE, related_name='departamentos')
+    nombre = models.CharField(max_length=100)
+    clave = models.CharField(max_length=100, db_index=True)
+
+    def __str__(self):
+        return self.nombre
+
+    class Meta:
+        verbose_name = "Departamento"
+        verbose_name_plural = "Departamentos"
+        ordering = ['nombre']
+        constraints = [
+            models.UniqueConstraint(fields=['pais', 'clave'], name='departamento_clave_unica'),
+        ]
+
+
+class Municipio(models.Model):
+    """Municipio de referencia, cargado desde static/data/colombia_location_data.json"""
+    departamento = models.ForeignKey(Departamento, on_delete=models.CASCADE, related_name='municipios')
+    nombre = models.CharField(max_length=100)
+    clave = models.CharField(max_length=100, db_index=True)
+    # Coordenadas de la cabecera municipal, cargadas desde static/data/coordenadas_municipios.csv
+    latitud = models.FloatField(blank=True, null=True)
+    longitud = models.FloatField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.nombre} ({self.departamento.nombre})"
+
+    class Meta:
+        verbose_name = "Municipio"
+        verbose_name_plural = "Municipios"
+        ordering = ['nombre']
+        constraints = [
+            models.UniqueConstraint(fields=['departamento', 'clave'], name='municipio_clave_unica'),
+        ]
+
 class Entidad(BaseModel):
     nombre = models.CharField(max_length=255, verbose_name="Nombre o Razón Social")
     nit = models.CharField(max_length=20, unique=True, verbose_name="NIT o Documento de Identidad")
@@ -37,6 +91,10 @@ class Entidad(BaseModel):
     pais = models.CharField(max_length=100, blank=True, null=True, verbose_name="País")
     departamento = models.CharField(max_length=100, blank=True, null=True, verbose_name="Departamento")
     municipio = models.CharField(max_length=100, blank=True, null=True, verbose_name="Municipio")
+    # Referencias normalizadas, resueltas a partir de los campos de texto (ver cotizador.signals)
+    pais_ref = models.ForeignKey(Pais, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='entidades')
+    departamento_ref = models.ForeignKey(Departamento, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='entidades')
+    municipio_ref = models.ForeignKey(Municipio, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='entidades')
     direccion = models.CharField(max_length=255, blank=True, null=True, verbose_name="Dirección")
     barrio = models.CharField(max_length=100, blank=True, null=True, verbose_name="Barrio")
     observacion = models.TextField(blank=True, null=True, verbose_name="Observación")
@@ -119,6 +177,14 @@ class Alimentacion(BaseModel):
     pais = models.CharField(max_length=100, blank=True, null=True, verbose_name="País")
     departamento = models.CharField(max_length=100, blank=True, null=True, verbose_name="Departamento")
     municipio = models.CharField(max_length=100, blank=True, null=True, verbose_name="Municipio/Ciudad")
+    clave_municipio = models.CharField(max_length=100, blank=True, default='', db_index=True, editable=False)
+    clave_departamento = models.CharField(max_length=100, blank=True, default='', db_index=True, editable=False)
+    pais_ref = models.ForeignKey(Pais, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='alimentaciones')
+    departamento_ref = models.ForeignKey(Departamento, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='alimentaciones')
+    municipio_ref = models.ForeignKey(Municipio, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='alimentaciones')
+    latitud = models.FloatField(blank=True, null=True, editable=False)
+    longitud = models.FloatField(blank=True, null=True, editable=False)
+    celda_geo = models.PositiveIntegerField(blank=True, null=True, db_index=True, editable=False)
     descripcion = models.TextField()
 
     # Precio por persona por temporada
@@ -262,6 +328,16 @@ class Destino(BaseModel):
     municipio = models.CharField(max_length=100, blank=True, null=True, verbose_name="Municipio/Ciudad")
     # Mantenemos ubicacion para compatibilidad con otros procesos
     ubicacion = models.CharField(max_length=255, verbose_name="Ubicación", blank=True, null=True)
+    # Claves normalizadas de ubicación, mantenidas por cotizador.signals para el índice de candidatos
+    clave_municipio = models.CharField(max_length=100, blank=True, default='', db_index=True, editable=False)
+    clave_departamento = models.CharField(max_length=100, blank=True, default='', db_index=True, editable=False)
+    pais_ref = models.ForeignKey(Pais, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='destinos')
+    departamento_ref = models.ForeignKey(Departamento, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='destinos')
+    municipio_ref = models.ForeignKey(Municipio, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='destinos')
+    # Coordenadas y celda de la cuadrícula de búsqueda por radio, mantenidas por cotizador.signals
+    latitud = models.FloatField(blank=True, null=True, editable=False)
+    longitud = models.FloatField(blank=True, null=True, editable=False)
+    celda_geo = models.PositiveIntegerField(blank=True, null=True, db_index=True, editable=False)
     descripcion = models.TextField()
     categoria = models.CharField(max_length=255, choices=CATEGORIA_CHOICES)
     categoria_otro = models.CharField(max_length=100, blank=True, null=True, verbose_name="¿Cuál?")
@@ -374,6 +450,14 @@ class Hospedaje(BaseModel):
     gimnasio = models.BooleanField(default=False)
     coworking = models.BooleanField(default=False)
     ubicacion = models.CharField(max_length=255, blank=True, null=True)
+    clave_municipio = models.CharField(max_length=100, blank=True, default='', db_index=True, editable=False)
+    clave_departamento = models.CharField(max_length=100, blank=True, default='', db_index=True, editable=False)
+    pais_ref = models.ForeignKey(Pais, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='hospedajes')
+    departamento_ref = models.ForeignKey(Departamento, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='hospedajes')
+    municipio_ref = models.ForeignKey(Municipio, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='hospedajes')
+    latitud = models.FloatField(blank=True, null=True, editable=False)
+    longitud = models.FloatField(blank=True, null=True, editable=False)
+    celda_geo = models.PositiveIntegerField(blank=True, null=True, db_index=True, editable=False)
     calificacion = models.DecimalField(max_digits=2, decimal_places=1, blank=True, null=True)
 
     precio = models.DecimalField(max_digits=10, decimal_places=2, default=0) # Añadido campo precio
@@ -407,6 +491,14 @@ class Seguro(BaseModel):
     pais = models.CharField(max_length=100, blank=True, null=True, verbose_name="País")
     departamento = models.CharField(max_length=100, blank=True, null=True, verbose_name="Departamento")
     municipio = models.CharField(max_length=100, blank=True, null=True, verbose_name="Municipio/Ciudad")
+    clave_municipio = models.CharField(max_length=100, blank=True, default='', db_index=True, editable=False)
+    clave_departamento = models.CharField(max_length=100, blank=True, default='', db_index=True, editable=False)
+    pais_ref = models.ForeignKey(Pais, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='seguros')
+    departamento_ref = models.ForeignKey(Departamento, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='seguros')
+    municipio_ref = models.ForeignKey(Municipio, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='seguros')
+    latitud = models.FloatField(blank=True, null=True, editable=False)
+    longitud = models.FloatField(blank=True, null=True, editable=False)
+    celda_geo = models.PositiveIntegerField(blank=True, null=True, db_index=True, editable=False)
     descripcion = models.TextField()
     precio = models.DecimalField(max_digits=10, decimal_places=2)
     disponible = models.BooleanField(default=True, verbose_name="Disponible")
@@ -438,6 +530,14 @@ class Transporte(BaseModel):
     pais = models.CharField(max_length=100, blank=True, null=True, verbose_name="País")
     departamento = models.CharField(max_length=100, blank=True, null=True, verbose_name="Departamento")
     municipio = models.CharField(max_length=100, blank=True, null=True, verbose_name="Municipio/Ciudad")
+    clave_municipio = models.CharField(max_length=100, blank=True, default='', db_index=True, editable=False)
+    clave_departamento = models.CharField(max_length=100, blank=True, default='', db_index=True, editable=False)
+    pais_ref = models.ForeignKey(Pais, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='transportes')
+    departamento_ref = models.ForeignKey(Departamento, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='transportes')
+    municipio_ref = models.ForeignKey(Municipio, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='transportes')
+    latitud = models.FloatField(blank=True, null=True, editable=False)
+    longitud = models.FloatField(blank=True, null=True, editable=False)
+    celda_geo = models.PositiveIntegerField(blank=True, null=True, db_index=True, editable=False)
     RNT = models.IntegerField(blank=True, null=True)
     pax = models.IntegerField(blank=True, null=True, help_text="Capacidad en número de pasajeros")
     capacidadCarga = models.CharField(max_length=255, blank=True, null=True)
@@ -472,6 +572,15 @@ class Transporte(BaseModel):
     bar = models.BooleanField(default=False)
 
     precio = models.DecimalField(max_digits=10, decimal_places=2, default=0) # Añadido campo precio
+    # Precio por kilómetro (solo terrestre): el vehículo cuesta precio_km por la distancia del
+    # origen del grupo al destino (ver cotizador.matriz_distancias); sin distancia se usa precio
+    MODO_PRECIO_CHOICES = [
+        ('trayecto', 'Precio por trayecto'),
+        ('km', 'Precio por kilómetro'),
+    ]
+    modo_precio = models.CharField(max_length=10, choices=MODO_PRECIO_CHOICES, default='trayecto', verbose_name="Modo de precio")
+    precio_km = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True, verbose_name="Precio por km")
+    disponible = models.BooleanField(default=True, verbose_name="Disponible")
 
     # Nuevos campos para el modelo actualizado
     modeloTransporte = models.CharField(
@@ -695,6 +804,10 @@ class RutaTransporte(BaseModel):
     precio_alta = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Precio Temporada Alta")
     precio_media = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Precio Temporada Media")
     precio_baja = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Precio Temporada Baja")
+    # Claves normalizadas de la ciudad de origen del convenio y de ciudad_destino,
+    # mantenidas por cotizador.signals para el índice de rutas
+    clave_origen = models.CharField(max_length=100, blank=True, default='', editable=False)
+    clave_destino = models.CharField(max_length=100, blank=True, default='', editable=False)
 
     def __str__(self):
         origen = 'N/A'
@@ -721,4 +834,218 @@ class RutaTransporte(BaseModel):
 
     class Meta:
         verbose_name = "Ruta de Transporte"
-        verbose_name_plural = "Rutas de Transporte"
\ No newline at end of file
+        verbose_name_plural = "Rutas de Transporte"
+        indexes = [
+            models.Index(fields=['clave_origen', 'clave_destino'], name='ruta_por_ciudades'),
+            models.Index(fields=['clave_origen', 'destino'], name='ruta_por_destino'),
+        ]
+
+class CandidatoProveedor(models.Model):
+    """
+    Índice precalculado Destino × proveedor.
+    Cada fila indica que un proveedor está en el mismo municipio o departamento
+    que el destino, para que la cotización resuelva sus proveedores con
+    búsquedas por igualdad en lugar de ubicacion__icontains.
+
+    También guarda una copia del precio por persona, la calificación, la
+    disponibilidad y el subtipo (tipo de transporte) del proveedor, para
+    obtener las mejores opciones de un destino con ORDER BY ... LIMIT sobre
+    un índice, sin leer las tablas de proveedores.
+    """
+    CATEGORIA_CHOICES = [
+        ('hospedaje', 'Hospedaje'),
+        ('transporte', 'Transporte'),
+        ('alimentacion', 'Alimentación'),
+        ('seguro', 'Seguro'),
+    ]
+    COINCIDENCIA_CHOICES = [
+        ('municipio', 'Mismo municipio'),
+        ('departamento', 'Mismo departamento'),
+    ]
+
+    destino = models.ForeignKey(Destino, on_delete=models.CASCADE, related_name='candidatos_proveedor')
+    categoria = models.CharField(max_length=20, choices=CATEGORIA_CHOICES)
+    proveedor_id = models.PositiveBigIntegerField()
+    coincidencia = models.CharField(max_length=20, choices=COINCIDENCIA_CHOICES)
+    precio_por_persona = models.DecimalField(max_digits=16, decimal_places=4, null=True, blank=True)
+    calificacion = models.DecimalField(max_digits=2, decimal_places=1, null=True, blank=True)
+    disponible = models.BooleanField(default=True)
+    subtipo = models.CharField(max_length=20, blank=True, default='')
+
+    def __str__(self):
+        return f"{self.destino_id} - {self.categoria} #{self.proveedor_id} ({self.coincidencia})"
+
+    class Meta:
+        verbose_name = "Candidato de Proveedor"
+        verbose_name_plural = "Candidatos de Proveedores"
+        constraints = [
+            models.UniqueConstraint(fields=['destino', 'categoria', 'proveedor_id'], name='candidato_proveedor_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['categoria', 'proveedor_id'], name='candidato_por_proveedor'),
+            # Índices parciales (solo proveedores disponibles) para las opciones de cotizador.opciones
+            models.Index(fields=['destino', 'categoria', 'precio_por_persona'], name='candidato_por_precio',
+                         condition=models.Q(disponible=True)),
+            models.Index(fields=['destino', 'categoria', 'calificacion'], name='candidato_por_calificacion',
+                         condition=models.Q(disponible=True)),
+        ]
+
+
+class RespuestaAmadeus(models.Model):
+    """
+    Respuesta de la API de Amadeus guardada en caché (ver cotizador.cache_amadeus).
+    La clave es un hash del endpoint y de los parámetros normalizados.
+    """
+    ENDPOINT_CHOICES = [
+        ('vuelos', 'Ofertas de vuelos'),
+        ('hoteles', 'Ofertas de hoteles'),
+    ]
+
+    endpoint = models.CharField(max_length=20, choices=ENDPOINT_CHOICES)
+    clave = models.CharField(max_length=64, unique=True)
+    parametros = models.JSONField()
+    respuesta = models.JSONField()
+    creado = models.DateTimeField()
+    expira = models.DateTimeField()
+    ultimo_acceso = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.endpoint} {self.parametros} (expira {self.expira:%Y-%m-%d %H:%M})"
+
+    class Meta:
+        verbose_name = "Respuesta de Amadeus"
+        verbose_name_plural = "Respuestas de Amadeus"
+
+
+class Cotizacion(models.Model):
+    """
+    Cotización calculada y guardada: los datos del formulario, los costos
+    (con los proveedores elegidos) y el detalle de la respuesta, para
+    volver a abrirla sin recalcular ni consultar Amadeus. Cada componente
+    se guarda además como una LineaCotizacion (ver cotizador.cotizaciones_guardadas).
+    """
+    entidad = models.ForeignKey(Entidad, on_delete=models.CASCADE, related_name='cotizaciones', null=True, blank=True)
+    destino = models.ForeignKey(Destino, on_delete=models.SET_NULL, related_name='cotizaciones', null=True, blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+    # Veces que se ha vuelto a cotizar con precios actualizados
+    version = models.PositiveIntegerField(default=1)
+
+    origen = models.CharField(max_length=255)
+    fecha_inicio = models.DateField()
+    fecha_fin = models.DateField()
+    total_pax = models.PositiveIntegerField()
+    porcentaje_utilidad = models.DecimalField(max_digits=5, decimal_places=2)
+    datos = models.JSONField(encoder=DjangoJSONEncoder, help_text="Datos del formulario de cotización")
+    costos = models.JSONField(encoder=DjangoJSONEncoder, help_text="Resultado de calcular_costos()")
+    detalle = models.JSONField(encoder=DjangoJSONEncoder, help_text="Detalle de la respuesta de calculate_quotation")
+
+    subtotal = models.DecimalField(max_digits=16, decimal_places=2)
+    iva = models.DecimalField(max_digits=16, decimal_places=2)
+    utilidad = models.DecimalField(max_digits=16, decimal_places=2)
+    total = models.DecimalField(max_digits=16, decimal_places=2)
+
+    def __str__(self):
+        return f"Cotización #{self.pk} - {self.destino or 'Sin destino'} ({self.fecha_inicio:%Y-%m-%d})"
+
+    class Meta:
+        verbose_name = "Cotización"
+        verbose_name_plural = "Cotizaciones"
+        ordering = ['-creado', '-id']
+        indexes = [
+            # Historial de una agencia, de la más reciente a la más antigua
+            models.Index(fields=['entidad', '-creado', '-id'], name='cotizacion_por_entidad'),
+        ]
+
+
+class LineaCotizacion(models.Model):
+    """
+    Componente de una cotización guardada, con los proveedores elegidos y
+    una firma de los precios de los que depende: al volver a cotizar solo se
+    recalculan los componentes cuya firma cambió.
+    """
+    COMPONENTE_CHOICES = [
+        ('hospedaje', 'Hospedaje'),
+        ('transporte_aereo', 'Transporte aéreo'),
+        ('transporte_terrestre', 'Transporte terrestre'),
+        ('transporte_maritimo', 'Transporte marítimo'),
+        ('alimentacion', 'Alimentación'),
+        ('seguro', 'Seguro'),
+    ]
+    FUENTE_CHOICES = [
+        ('convenio', 'Convenio'),
+        ('amadeus', 'Amadeus'),
+        ('respaldo', 'Proveedores locales (respaldo de Amadeus)'),
+        ('local', 'Proveedores locales'),
+        ('ruta', 'Ruta con precio negociado'),
+    ]
+
+    cotizacion = models.ForeignKey(Cotizacion, on_delete=models.CASCADE, related_name='lineas')
+    componente = models.CharField(max_length=30, choices=COMPONENTE_CHOICES)
+    fuente = models.CharField(max_length=20, choices=FUENTE_CHOICES)
+    costo = models.DecimalField(max_digits=16, decimal_places=2)
+    proveedores = models.JSONField(encoder=DjangoJSONEncoder, default=list, blank=True)
+    firma = models.CharField(max_length=64)
+
+    def __str__(self):
+        return f"{self.cotizacion_id} - {self.get_componente_display()}: {self.costo}"
+
+    class Meta:
+        verbose_name = "Línea de Cotización"
+        verbose_name_plural = "Líneas de Cotización"
+        constraints = [
+            models.UniqueConstraint(fields=['cotizacion', 'componente'], name='linea_cotizacion_unica'),
+        ]
+
+
+class TrabajoCotizacion(models.Model):
+    """
+    Cotización que se calcula en segundo plano: las vistas la encolan y
+    retornan de inmediato, y el comando procesar_trabajos la ejecuta (ver
+    cotizador.cola_trabajos). La cola vive en la misma base de datos, sin un
+    broker externo.
+    """
+    TIPO_CHOICES = [
+        ('cotizacion', 'Cotización'),
+        ('lote', 'Lote de cotizaciones'),
+        ('barrido', 'Barrido de pasajeros y temporadas'),
+        ('ventanas', 'Búsqueda de ventanas de viaje'),
+    ]
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('completado', 'Completado'),
+        ('fallido', 'Fallido'),
+    ]
+
+    entidad = models.ForeignKey(Entidad, on_delete=models.CASCADE, related_name='trabajos_cotizacion', null=True, blank=True)
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+    parametros = models.JSONField(encoder=DjangoJSONEncoder)
+    resultado = models.JSONField(encoder=DjangoJSONEncoder, null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    intentos = models.PositiveIntegerField(default=0)
+    maximo_intentos = models.PositiveIntegerField(default=3)
+    # No se toma antes de esta fecha (espera entre reintentos)
+    disponible_desde = models.DateTimeField()
+    # Trabajador que lo tomó y hasta cuándo lo reserva; si el trabajador
+    # muere, otro lo vuelve a tomar cuando vence la reserva
+    trabajador = models.CharField(max_length=100, blank=True)
+    reservado_hasta = models.DateTimeField(null=True, blank=True)
+
+    creado = models.DateTimeField(auto_now_add=True)
+    iniciado = models.DateTimeField(null=True, blank=True)
+    terminado = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Trabajo #{self.pk} - {self.get_tipo_display()} ({self.get_estado_display()})"
+
+    class Meta:
+        verbose_name = "Trabajo de Cotización"
+        verbose_name_plural = "Trabajos de Cotización"
+        ordering = ['-creado', '-id']
+        indexes = [
+            # Siguiente trabajo disponible de la cola
+            models.Index(fields=['estado', 'disponible_desde', 'id'], name='trabajo_disponible'),
+        ]
@@ -0,0 +1,14 @@
+"""
+Montos en centavos enteros
+
+Las asignaciones de hospedaje y flota, el grafo de rutas y el barrido
+comparan y suman precios en centavos enteros para no acumular errores de
+redondeo binario. Todos convierten con a_centavos(), así que un mismo precio
+da los mismos centavos en cualquiera de ellos.
+"""
+from decimal import Decimal
+
+
+def a_centavos(valor):
+    """Centavos enteros de un monto en pesos (Decimal, float, entero o None), redondeados al más cercano"""
+    return int((Decimal(str(valor or 0)) * 100).to_integral_value())
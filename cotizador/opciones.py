@@ -0,0 +1,99 @@
+"""
+Mejores opciones por categoría para una cotización
+
+En lugar de un solo total por categoría, la cotización ofrece las k opciones
+más baratas de hospedaje, transporte, alimentación y seguro del destino y,
+para el hospedaje, las k mejor calificadas. Las opciones salen del índice
+CandidatoProveedor, que guarda el precio por persona y la calificación de
+cada proveedor: cada lista es una consulta ORDER BY ... LIMIT k sobre un
+índice (destino, categoria, disponible, precio o calificación), así que su
+costo no crece con el número de proveedores.
+"""
+from django.conf import settings
+
+from .indice_proveedores import MODELOS_POR_CATEGORIA
+from .models import CandidatoProveedor
+
+
+OPCIONES_DEFECTO = 3
+
+CAMPO_NOMBRE = {
+    'hospedaje': 'nombreLugar',
+    'transporte': 'nombre',
+    'alimentacion': 'nombre',
+    'seguro': 'nombre',
+}
+
+TIPOS_TRANSPORTE = ('aereo', 'terrestre', 'maritimo')
+
+
+def _candidatos(destino, categoria, orden, k, subtipos=None):
+    filas = CandidatoProveedor.objects.filter(destino=destino, categoria=categoria, disponible=True)
+    if subtipos:
+        filas = filas.filter(subtipo__in=subtipos)
+    if orden == 'calificacion':
+        filas = filas.filter(calificacion__isnull=False).order_by('-calificacion', '-id')
+    else:
+        filas = filas.filter(precio_por_persona__isnull=False).order_by('precio_por_persona', 'id')
+    return list(filas.values('proveedor_id', 'precio_por_persona', 'calificacion', 'subtipo')[:k])
+
+
+def _opcion(fila, total_pax):
+    precio = fila['precio_por_persona']
+    return {
+        'id': fila['proveedor_id'],
+        'nombre': fila['nombre'],
+        'precio_por_persona': float(precio) if precio is not None else None,
+        'total': float(precio * total_pax) if precio is not None else None,
+        'calificacion': float(fila['calificacion']) if fila['calificacion'] is not None else None,
+        'subtipo': fila['subtipo'],
+    }
+
+
+def buscar_opciones(destino, medio_transporte, k=None):
+    """
+    Filas del índice de las mejores opciones por categoría, con el nombre
+    del proveedor: {'hospedaje': {'mas_baratos': [...], 'mejor_calificados':
+    [...]}, 'transporte': {'mas_baratos': [...]}, ...}. No dependen del
+    número de pasajeros, así que se pueden reutilizar entre cotizaciones del
+    mismo destino. El transporte se limita a los tipos de medio_transporte
+    ('mixto' o una lista vacía incluyen todos).
+    """
+    if k is None:
+        k = getattr(settings, 'COTIZACION_OPCIONES', OPCIONES_DEFECTO)
+    subtipos = [medio for medio in medio_transporte if medio in TIPOS_TRANSPORTE]
+    if 'mixto' in medio_transporte:
+        subtipos = []
+
+    encontradas = {}
+    for categoria in MODELOS_POR_CATEGORIA:
+        por_orden = {
+            'mas_baratos': _candidatos(destino, categoria, 'precio', k, subtipos if categoria == 'transporte' else None),
+        }
+        if categoria == 'hospedaje':
+            por_orden['mejor_calificados'] = _candidatos(destino, categoria, 'calificacion', k)
+
+        # Una sola consulta por categoría para los nombres de las k (o 2k) opciones
+        ids = {fila['proveedor_id'] for filas in por_orden.values() for fila in filas}
+        nombres = dict(MODELOS_POR_CATEGORIA[categoria].objects.filter(pk__in=ids).values_list(
+            'pk', CAMPO_NOMBRE[categoria]
+        )) if ids else {}
+        for filas in por_orden.values():
+            for fila in filas:
+                fila['nombre'] = nombres.get(fila['proveedor_id'])
+        encontradas[categoria] = por_orden
+    return encontradas
+
+
+def opciones_cotizacion(destino, total_pax, medio_transporte, k=None, encontradas=None):
+    """
+    Opciones por categoría para total_pax pasajeros, con los valores como
+    números flotantes listos para la respuesta JSON. encontradas es el
+    resultado de buscar_opciones() si ya se obtuvo.
+    """
+    if encontradas is None:
+        encontradas = buscar_opciones(destino, medio_transporte, k)
+    return {
+        categoria: {orden: [_opcion(fila, total_pax) for fila in filas] for orden, filas in por_orden.items()}
+        for categoria, por_orden in encontradas.items()
+    }
@@ -0,0 +1,186 @@
+"""
+Señales del cotizador
+
+Mantienen actualizados las referencias geográficas, las coordenadas y el índice de
+proveedores candidatos (CandidatoProveedor) cada vez que se guarda o elimina
+un destino, un proveedor o una entidad, e invalidan las cotizaciones en caché
+de los destinos afectados y los índices de convenios y rutas y el grafo de
+rutas de las agencias.
+
+Las invalidaciones de la caché se hacen al confirmar la transacción (ver
+al_confirmar): si se hicieran dentro de ella, otro proceso podría
+reconstruir un índice o una cotización con los datos anteriores y
+guardarlo con la versión nueva.
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import cache_cotizaciones, geografia, grafo_rutas, indice_convenios, indice_proveedores, indice_rutas
+from .models import (
+    Alimentacion, ConvenioAgencia, Destino, Entidad, Hospedaje, RutaTransporte, Seguro, Transporte,
+)
+from .ubicaciones import claves_ubicacion, referencias_ubicacion
+
+
+def al_confirmar(funcion, *argumentos):
+    """Ejecuta funcion(*argumentos) al confirmar la transacción en curso (de inmediato si no hay una)"""
+    transaction.on_commit(partial(funcion, *argumentos))
+
+
+@receiver(pre_save, sender=Destino)
+@receiver(pre_save, sender=Hospedaje)
+@receiver(pre_save, sender=Transporte)
+@receiver(pre_save, sender=Alimentacion)
+@receiver(pre_save, sender=Seguro)
+def calcular_claves_ubicacion(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    indice_proveedores.actualizar_claves(instance)
+    geografia.actualizar_coordenadas(instance)
+
+
+@receiver(pre_save, sender=Entidad)
+def resolver_referencias_entidad(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    clave_municipio, clave_departamento = claves_ubicacion(instance)
+    instance.pais_ref_id, instance.departamento_ref_id, instance.municipio_ref_id = referencias_ubicacion(
+        clave_municipio, clave_departamento, instance.pais
+    )
+
+
+@receiver(post_save, sender=Hospedaje)
+@receiver(post_save, sender=Transporte)
+@receiver(post_save, sender=Alimentacion)
+@receiver(post_save, sender=Seguro)
+def indexar_proveedor_guardado(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    indice_proveedores.indexar_proveedor(instance)
+
+
+@receiver(post_delete, sender=Hospedaje)
+@receiver(post_delete, sender=Transporte)
+@receiver(post_delete, sender=Alimentacion)
+@receiver(post_delete, sender=Seguro)
+def desindexar_proveedor_eliminado(sender, instance, **kwargs):
+    indice_proveedores.desindexar_proveedor(indice_proveedores.categoria_de(instance), instance.pk)
+
+
+@receiver(post_save, sender=Destino)
+def indexar_destino_guardado(sender, instance, raw=False, **kwargs):
+    # Las filas del destino se borran en cascada al eliminarlo
+    if raw:
+        return
+    indice_proveedores.indexar_destino(instance)
+    # Las rutas al destino llegan a su municipio
+    al_confirmar(grafo_rutas.registrar_rutas, RutaTransporte.objects.filter(destino=instance))
+
+
+@receiver(post_save, sender=Entidad)
+def reindexar_proveedores_entidad(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    indice_proveedores.reindexar_entidad(instance)
+
+
+@receiver(pre_save, sender=ConvenioAgencia)
+def recordar_agencia_previa(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    instance._agencia_previa = sender._base_manager.filter(pk=instance.pk).values_list(
+        'entidad_agencia_id', flat=True
+    ).first()
+
+
+@receiver(post_save, sender=ConvenioAgencia)
+def actualizar_origen_de_rutas(sender, instance, raw=False, created=False, **kwargs):
+    # Las rutas del convenio salen de su ciudad de origen
+    if raw or created:
+        return
+    RutaTransporte.objects.filter(convenio_agencia=instance).update(
+        clave_origen=indice_rutas.clave_ciudad(instance.ciudad_origen)
+    )
+
+
+@receiver(post_save, sender=ConvenioAgencia)
+@receiver(post_delete, sender=ConvenioAgencia)
+def invalidar_indice_convenios(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Al eliminar el convenio sus rutas se eliminan en cascada con sus propias señales
+    ruta_ids = list(RutaTransporte.objects.filter(convenio_agencia_id=instance.pk).values_list('pk', flat=True))
+    for agencia_id in {getattr(instance, '_agencia_previa', None), instance.entidad_agencia_id} - {None}:
+        al_confirmar(indice_convenios.invalidar, agencia_id)
+        al_confirmar(indice_rutas.invalidar, agencia_id)
+        al_confirmar(grafo_rutas.registrar_cambios, agencia_id, ruta_ids)
+
+
+@receiver(pre_save, sender=RutaTransporte)
+def calcular_claves_ruta(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    indice_rutas.actualizar_claves(instance)
+    if instance.pk is not None:
+        instance._agencias_previas = indice_rutas.agencias_de_rutas(sender._base_manager.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=RutaTransporte)
+@receiver(post_delete, sender=RutaTransporte)
+def invalidar_indice_rutas(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    agencias = getattr(instance, '_agencias_previas', set())
+    if instance.convenio_agencia_id:
+        agencias |= set(ConvenioAgencia.objects.filter(pk=instance.convenio_agencia_id).values_list(
+            'entidad_agencia_id', flat=True
+        ))
+    for agencia_id in agencias:
+        al_confirmar(indice_rutas.invalidar, agencia_id)
+        al_confirmar(grafo_rutas.registrar_cambios, agencia_id, [instance.pk])
+
+
+@receiver(post_save, sender=Transporte)
+def invalidar_rutas_del_vehiculo(sender, instance, raw=False, created=False, **kwargs):
+    # Al eliminar un vehículo sus rutas se eliminan en cascada con sus propias señales
+    if raw or created:
+        return
+    rutas = RutaTransporte.objects.filter(transporte=instance)
+    for agencia_id in indice_rutas.agencias_de_rutas(rutas):
+        al_confirmar(indice_rutas.invalidar, agencia_id)
+    al_confirmar(grafo_rutas.registrar_rutas, rutas)
+
+
+# Las señales de caché se conectan después de las del índice para que, al
+# guardar, los destinos afectados se calculen con el índice ya actualizado
+MODELOS_QUE_AFECTAN_COTIZACIONES = [
+    Destino, Hospedaje, Transporte, Alimentacion, Seguro, Entidad, ConvenioAgencia, RutaTransporte,
+]
+
+
+def recordar_afectados_previos(sender, instance, raw=False, **kwargs):
+    """Guarda los destinos que dependían del estado anterior de la instancia"""
+    if raw or instance.pk is None:
+        return
+    anterior = sender._base_manager.filter(pk=instance.pk).first()
+    if anterior is not None:
+        instance._cotizaciones_afectadas = cache_cotizaciones.afectados(anterior)
+
+
+def invalidar_cotizaciones(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    destinos, afecta_a_todos = getattr(instance, '_cotizaciones_afectadas', (set(), False))
+    nuevos, afecta_a_todos_ahora = cache_cotizaciones.afectados(instance)
+    al_confirmar(cache_cotizaciones.invalidar, destinos | nuevos, afecta_a_todos or afecta_a_todos_ahora)
+    instance._cotizaciones_afectadas = (set(), False)
+
+
+for modelo in MODELOS_QUE_AFECTAN_COTIZACIONES:
+    pre_save.connect(recordar_afectados_previos, sender=modelo)
+    pre_delete.connect(recordar_afectados_previos, sender=modelo)
+    post_save.connect(invalidar_cotizaciones, sender=modelo)
+    post_delete.connect(invalidar_cotizaciones, sender=modelo)
@@ -1,3 +1,1474 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import amadeus_simulado, api_integrations, cache_amadeus, cola_trabajos
+from .cache_cotizaciones import estadisticas, reiniciar_estadisticas
+from .codigos_iata import (
+    limpiar_sin_resolver, nombres_sin_resolver, resolver_iata, resolver_iata_lote, tabla_iata,
+)
+from .asignacion_flota import asignar_flota, costos_flota
+from .asignacion_hospedaje import asignar_hospedaje, noches
+from .cotizacion import total_por_persona
+from .geografia import celda_de, haversine_km, hospedajes_cercanos
+from .grafo_rutas import GrafoRutas
+from .indice_convenios import IndiceConvenios
+from .indice_proveedores import proveedores_candidatos, reconstruir_indice, verificar_indice
+from .matriz_distancias import CABECERA, claves_municipios, distancia_km
+from .models import (
+    Alimentacion, CandidatoProveedor, ConvenioAgencia, Departamento, Destino, Entidad, Hospedaje, Municipio, Pais,
+    RespuestaAmadeus, RutaTransporte, Seguro, Transporte, TrabajoCotizacion,
+)
+from .ubicaciones import cargar_catalogo_geografico, claves_desde_texto, normalizar_texto
+
+
+class UbicacionesTest(TestCase):
+    def test_normalizar_texto(self):
+        self.assertEqual(normalizar_texto('  Chinchiná '), 'CHINCHINA')
+        self.assertEqual(normalizar_texto('San  José del Guaviare'), 'SAN JOSE DEL GUAVIARE')
+
+    def test_claves_desde_texto(self):
+        self.assertEqual(claves_desde_texto('SALENTO, QUINDÍO, COLOMBIA'), ('SALENTO', 'QUINDIO'))
+        # El departamento se deduce cuando el municipio es único
+        self.assertEqual(claves_desde_texto('Colombia, Salento'), ('SALENTO', 'QUINDIO'))
+        # Municipio homónimo de un departamento
+        self.assertEqual(claves_desde_texto('Caldas, Antioquia'), ('CALDAS', 'ANTIOQUIA'))
+
+
+class CodigosIataTest(TestCase):
+    def test_resolucion(self):
+        self.assertEqual(resolver_iata('Medellín'), 'MDE')
+        self.assertEqual(resolver_iata('MEDELLIN (JOSÉ MARÍA CÓRDOVA)'), 'MDE')
+        self.assertEqual(resolver_iata('Salento, Quindío, Colombia'), 'AXM')
+        self.assertEqual(resolver_iata('Tunja'), 'BOG')
+        self.assertEqual(resolver_iata('Aeropuerto Internacional El Dorado'), 'BOG')
+        self.assertEqual(resolver_iata('Ciudad (CTG)'), 'CTG')
+
+    def test_municipio_homonimo(self):
+        # Armenia (Quindío) tiene aeropuerto propio; Armenia (Antioquia) usa el de su departamento
+        self.assertEqual(resolver_iata('Armenia'), 'AXM')
+        self.assertEqual(resolver_iata('Armenia, Antioquia'), 'MDE')
+
+    def test_todos_los_municipios_tienen_aeropuerto(self):
+        self.assertEqual(len(tabla_iata()['municipios']), Municipio.objects.count())
+
+    def test_lote_y_nombres_sin_resolver(self):
+        limpiar_sin_resolver()
+        self.assertEqual(resolver_iata_lote(['Pasto', 'Valle del Cocora', 'Pasto']),
+                         {'Pasto': 'PSO', 'Valle del Cocora': None})
+        self.assertEqual(nombres_sin_resolver(), [('Valle del Cocora', 1)])
+
+        # Los nombres se guardan en la caché: el comando ve los de los procesos web
+        resolver_iata('Valle  del Cocora')
+        resolver_iata('Caño Cristales')
+        self.assertEqual(nombres_sin_resolver(), [('Valle del Cocora', 2), ('Caño Cristales', 1)])
+        salida = StringIO()
+        call_command('revisar_codigos_iata', 'Pasto', '--limpiar', stdout=salida)
+        self.assertIn('Valle del Cocora: 2', salida.getvalue())
+        self.assertIn('Caño Cristales: 1', salida.getvalue())
+        self.assertEqual(nombres_sin_resolver(), [])
+
+
+class ReferenciasGeograficasTest(TestCase):
+    def test_catalogo_cargado_por_migracion(self):
+        self.assertTrue(Pais.objects.filter(codigo='CO').exists())
+        self.assertEqual(Departamento.objects.count(), 32)
+        self.assertEqual(Municipio.objects.get(clave='PUERTO NARINO').departamento.clave, 'AMAZONAS')
+        # La carga es idempotente
+        self.assertEqual(cargar_catalogo_geografico(), {'paises': 0, 'departamentos': 0, 'municipios': 0})
+
+    def test_referencias_resueltas_al_guardar(self):
+        entidad = Entidad.objects.create(
+            nombre='Hotel', nit='900300', tipo_entidad='Hospedaje', mail='h@test.com',
+            municipio='Chinchiná', departamento='Caldas', pais='Colombia', ubicacion='',
+        )
+        hospedaje = Hospedaje.objects.create(
+            entidad=entidad, tipoHospedaje='Hotel', nombreLugar='Hacienda', precio=Decimal('1'),
+        )
+        municipio = Municipio.objects.get(clave='CHINCHINA')
+        self.assertEqual(entidad.municipio_ref, municipio)
+        self.assertEqual(hospedaje.municipio_ref, municipio)
+        self.assertEqual(hospedaje.departamento_ref, municipio.departamento)
+        self.assertEqual(hospedaje.pais_ref.codigo, 'CO')
+
+    def test_filtro_por_municipio_en_api(self):
+        User.objects.create_user(username='u', password='clave-segura-123')
+        self.client.login(username='u', password='clave-segura-123')
+        Destino.objects.create(nombre='Cocora', municipio='Salento', departamento='Quindío',
+                               descripcion='-', categoria='Ecoturismo')
+        Destino.objects.create(nombre='Tayrona', municipio='Santa Marta', departamento='Magdalena',
+                               descripcion='-', categoria='Ecoturismo')
+        salento = Municipio.objects.get(clave='SALENTO')
+        respuesta = self.client.get('/api/destinos/', {'municipio_id': salento.pk}).json()
+        self.assertEqual([destino['nombre'] for destino in respuesta], ['COCORA'])
+
+
+class IndiceProveedoresTest(TestCase):
+    def setUp(self):
+        self.entidad = Entidad.objects.create(
+            nombre='Hotel Prueba', nit='900100', tipo_entidad='Hospedaje',
+            mail='hotel@test.com', ubicacion='',
+        )
+        self.destino = Destino.objects.create(
+            nombre='Valle del Cocora', municipio='Salento', departamento='Quindío',
+            pais='Colombia', descripcion='Palmas de cera', categoria='Ecoturismo',
+        )
+
+    def test_proveedor_en_mismo_municipio(self):
+        hospedaje = Hospedaje.objects.create(
+            entidad=self.entidad, tipoHospedaje='Hotel', nombreLugar='Finca Salento',
+            ubicacion='Colombia, Salento', precio=Decimal('100000'),
+        )
+        candidato = CandidatoProveedor.objects.get(destino=self.destino, categoria='hospedaje')
+        self.assertEqual(candidato.proveedor_id, hospedaje.pk)
+        self.assertEqual(candidato.coincidencia, 'municipio')
+        self.assertEqual(list(proveedores_candidatos(self.destino, 'hospedaje')), [hospedaje])
+
+    def test_proveedor_usa_ubicacion_de_entidad(self):
+        self.entidad.municipio = 'Armenia'
+        self.entidad.departamento = 'Quindío'
+        self.entidad.save()
+        alimentacion = Alimentacion.objects.create(
+            entidad=self.entidad, nombre='Restaurante', descripcion='Local', precio=Decimal('20000'),
+        )
+        candidato = CandidatoProveedor.objects.get(destino=self.destino, categoria='alimentacion')
+        self.assertEqual(candidato.proveedor_id, alimentacion.pk)
+        self.assertEqual(candidato.coincidencia, 'departamento')
+
+    def test_municipio_homonimo_en_otro_departamento(self):
+        destino = Destino.objects.create(
+            nombre='Parque del Café', municipio='Armenia', departamento='Quindío',
+            descripcion='Parque temático', categoria='Turismo cultural',
+        )
+        Transporte.objects.create(
+            entidad=self.entidad, tipoTransporte='terrestre', municipio='Armenia',
+            departamento='Antioquia', precio=Decimal('50000'), pax=10,
+        )
+        self.assertFalse(proveedores_candidatos(destino, 'transporte').exists())
+
+    def test_actualizar_y_eliminar_mantienen_indice(self):
+        hospedaje = Hospedaje.objects.create(
+            entidad=self.entidad, tipoHospedaje='Hotel', nombreLugar='Hotel Pereira',
+            ubicacion='Pereira, Risaralda', precio=Decimal('90000'),
+        )
+        self.assertFalse(proveedores_candidatos(self.destino, 'hospedaje').exists())
+
+        hospedaje.ubicacion = 'Filandia, Quindío'
+        hospedaje.save()
+        self.assertTrue(proveedores_candidatos(self.destino, 'hospedaje').exists())
+
+        hospedaje.delete()
+        self.assertFalse(CandidatoProveedor.objects.filter(categoria='hospedaje').exists())
+
+    def test_destino_de_seed_con_municipio_en_el_nombre(self):
+        # Como seed_destinos: sin municipio/departamento y con coordenadas en 'ubicacion'
+        destino = Destino.objects.create(nombre='SALENTO', ubicacion='4.6500, -75.5833',
+                                         descripcion='Pueblo cafetero', categoria='Turismo cultural')
+        self.assertEqual((destino.clave_municipio, destino.clave_departamento), ('SALENTO', 'QUINDIO'))
+        self.assertEqual(destino.municipio_ref, Municipio.objects.get(clave='SALENTO'))
+        hospedaje = Hospedaje.objects.create(
+            entidad=self.entidad, tipoHospedaje='Hotel', nombreLugar='Hotel Salento',
+            ubicacion='Salento, Quindío', precio=Decimal('100000'),
+        )
+        self.assertEqual(list(proveedores_candidatos(destino, 'hospedaje')), [hospedaje])
+        # Un nombre que no es un municipio no inventa una ubicación
+        destino = Destino.objects.create(nombre='Caño Cristales', ubicacion='2.2647, -73.7950',
+                                         descripcion='Río de colores', categoria='Ecoturismo')
+        self.assertEqual((destino.clave_municipio, destino.clave_departamento), ('', ''))
+
+    def test_destino_guardado_despues_del_proveedor(self):
+        hospedaje = Hospedaje.objects.create(
+            entidad=self.entidad, tipoHospedaje='Hotel', nombreLugar='Hotel Leticia',
+            ubicacion='Leticia, Amazonas', precio=Decimal('80000'),
+        )
+        destino = Destino.objects.create(
+            nombre='Puerto Nariño', municipio='Puerto Nariño', departamento='Amazonas',
+            descripcion='Pueblo amazónico', categoria='Ecoturismo',
+        )
+        self.assertEqual(list(proveedores_candidatos(destino, 'hospedaje')), [hospedaje])
+
+    def test_verificar_y_reconstruir(self):
+        hospedaje = Hospedaje.objects.create(
+            entidad=self.entidad, tipoHospedaje='Hotel', nombreLugar='Hotel Salento',
+            ubicacion='Salento, Quindío', precio=Decimal('120000'),
+        )
+        self.assertEqual(verificar_indice(), {
+            'faltantes': [], 'sobrantes': [], 'precios_desactualizados': [], 'claves_desactualizadas': [],
+        })
+
+        # Una actualización masiva no dispara señales y deja el índice desactualizado
+        Hospedaje.objects.filter(pk=hospedaje.pk).update(ubicacion='Pasto, Nariño')
+        CandidatoProveedor.objects.all().delete()
+        resultado = verificar_indice()
+        self.assertEqual(resultado['claves_desactualizadas'], [('hospedaje', hospedaje.pk)])
+
+        Hospedaje.objects.filter(pk=hospedaje.pk).update(ubicacion='Salento, Quindío', precio=Decimal('90000'))
+        reconstruir_indice()
+        Hospedaje.objects.filter(pk=hospedaje.pk).update(precio=Decimal('100000'))
+        self.assertEqual(verificar_indice()['precios_desactualizados'], [(self.destino.pk, 'hospedaje', hospedaje.pk)])
+        Hospedaje.objects.filter(pk=hospedaje.pk).update(ubicacion='Pasto, Nariño')
+
+        self.assertEqual(reconstruir_indice(), 0)
+        self.assertEqual(verificar_indice(), {
+            'faltantes': [], 'sobrantes': [], 'precios_desactualizados': [], 'claves_desactualizadas': [],
+        })
+
+        call_command('verificar_indice_proveedores', stdout=StringIO())
+
+
+class GeografiaTest(TestCase):
+    def setUp(self):
+        self.destino = Destino.objects.create(
+            nombre='Cocora', municipio='Salento', departamento='Quindío', descripcion='-', categoria='Ecoturismo',
+        )
+
+    def hospedaje(self, nombre, ubicacion, disponible=True):
+        return Hospedaje.objects.create(tipoHospedaje='Hotel', nombreLugar=nombre, ubicacion=ubicacion,
+                                        precio=Decimal('100000'), disponible=disponible)
+
+    def test_coordenadas_del_municipio_o_del_texto(self):
+        self.assertEqual((self.destino.latitud, self.destino.longitud), (4.6376, -75.5704))
+        self.assertEqual(self.destino.celda_geo, celda_de(4.6376, -75.5704))
+
+        # Un texto 'lat, lon' tiene prioridad sobre el municipio
+        destino = Destino.objects.create(nombre='Puerto Nariño', ubicacion='-3.7703, -70.3831',
+                                         descripcion='-', categoria='Ecoturismo')
+        self.assertEqual((destino.latitud, destino.longitud), (-3.7703, -70.3831))
+
+        hospedaje = self.hospedaje('Sin coordenadas', 'Pasto')
+        hospedaje.ubicacion = 'Filandia, Quindío'
+        hospedaje.save()
+        self.assertEqual((hospedaje.latitud, hospedaje.longitud), (4.6747, -75.658))
+
+    def test_hospedajes_cercanos(self):
+        filandia = self.hospedaje('Filandia', 'Filandia, Quindío')
+        calarca = self.hospedaje('Calarcá', 'Calarcá, Quindío')
+        armenia = self.hospedaje('Armenia', 'Armenia, Quindío')
+        pereira = self.hospedaje('Pereira', 'Pereira, Risaralda')
+        self.hospedaje('Medellín', 'Medellín, Antioquia')
+        self.hospedaje('Cerrado', 'Filandia, Quindío', disponible=False)
+
+        self.assertEqual([h['id'] for h in hospedajes_cercanos(self.destino, 15)], [filandia.pk, calarca.pk])
+        cercanos = hospedajes_cercanos(self.destino, 25)
+        self.assertEqual([h['id'] for h in cercanos], [filandia.pk, calarca.pk, armenia.pk, pereira.pk])
+        self.assertAlmostEqual(cercanos[0]['distancia_km'], 10.55, places=2)
+
+        # La cuadrícula no deja por fuera ningún hospedaje dentro del radio
+        for radio in (5, 50, 200):
+            esperados = sorted(
+                h.pk for h in Hospedaje.objects.filter(disponible=True)
+                if haversine_km(self.destino.latitud, self.destino.longitud, h.latitud, h.longitud) <= radio
+            )
+            self.assertEqual(sorted(h['id'] for h in hospedajes_cercanos(self.destino, radio)), esperados)
+
+        User.objects.create_user(username='u', password='clave-segura-123')
+        self.client.login(username='u', password='clave-segura-123')
+        respuesta = self.client.get(f'/api/destinos/{self.destino.pk}/cercanos/', {'radio_km': 12}).json()
+        self.assertEqual([h['nombreLugar'] for h in respuesta['proveedores']], ['Filandia'])
+        respuesta = self.client.get(f'/api/destinos/{self.destino.pk}/cercanos/', {'radio_km': 1000}).json()
+        self.assertIn('radio_km', respuesta['errors'])
+
+
+class MatrizDistanciasTest(TestCase):
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.ruta = Path(carpeta.name) / 'matriz.bin'
+        ajustes = override_settings(DISTANCIAS_MATRIZ_RUTA=self.ruta)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def test_distancias_desde_el_archivo(self):
+        salento, pereira, ipiales = ('SALENTO', 'QUINDIO'), ('PEREIRA', 'RISARALDA'), ('IPIALES', 'NARINO')
+        self.assertIsNone(distancia_km(salento, pereira))
+
+        call_command('construir_matriz_distancias', stdout=StringIO())
+        n = len(claves_municipios())
+        self.assertEqual(self.ruta.stat().st_size, CABECERA.size + n * (n - 1))
+        self.assertAlmostEqual(distancia_km(salento, pereira), 23.99, delta=0.05)
+        self.assertEqual(distancia_km(pereira, salento), distancia_km(salento, pereira))
+        self.assertEqual(distancia_km(salento, salento), 0.0)
+        # Armenia (Antioquia) no tiene coordenadas en static/data/coordenadas_municipios.csv
+        self.assertIsNone(distancia_km(salento, ('ARMENIA', 'ANTIOQUIA')))
+
+        # Al reconstruir el archivo los procesos leen la nueva matriz
+        Municipio.objects.filter(clave='IPIALES').update(latitud=4.8133, longitud=-75.6961)
+        call_command('construir_matriz_distancias', stdout=StringIO())
+        self.assertEqual(distancia_km(salento, ipiales), distancia_km(salento, pereira))
+
+
+class TotalesAgregadosTest(TestCase):
+    def setUp(self):
+        self.entidad = Entidad.objects.create(
+            nombre='Proveedor', nit='900400', tipo_entidad='Hospedaje', mail='p@test.com', ubicacion='',
+        )
+
+    def total_python(self, proveedores):
+        """Cálculo anterior: una instancia por fila y precio_por_persona() en Python"""
+        return sum((p.precio_por_persona() for p in proveedores if p.disponible), Decimal('0'))
+
+    def test_hospedaje_equivale_al_calculo_en_python(self):
+        for precio, capacidad, disponible in [('100000', 3, True), ('85000.50', None, True),
+                                              ('60000', 0, True), ('70000', 7, True), ('999999', 2, False)]:
+            Hospedaje.objects.create(entidad=self.entidad, tipoHospedaje='Hotel', nombreLugar='H',
+                                     precio=Decimal(precio), capacidadpax=capacidad, disponible=disponible)
+        esperado = self.total_python(Hospedaje.objects.all())
+        self.assertAlmostEqual(total_por_persona(Hospedaje.objects.all(), 'hospedaje'), esperado, places=4)
+
+    def test_transporte_alimentacion_y_seguro(self):
+        for precio, pax in [('350000', 40), ('120000', None), ('99999.99', 6)]:
+            Transporte.objects.create(entidad=self.entidad, tipoTransporte='terrestre',
+                                      precio=Decimal(precio), pax=pax)
+        Alimentacion.objects.create(entidad=self.entidad, nombre='A', descripcion='-', precio=Decimal('25000.25'))
+        Alimentacion.objects.create(entidad=self.entidad, nombre='B', descripcion='-', precio=Decimal('1'),
+                                    disponible=False)
+        Seguro.objects.create(entidad=self.entidad, nombre='Viaje', descripcion='-', cobertura='-',
+                              precio=Decimal('18000'))
+
+        for categoria, modelo in [('transporte', Transporte), ('alimentacion', Alimentacion), ('seguro', Seguro)]:
+            esperado = self.total_python(modelo.objects.all())
+            self.assertAlmostEqual(total_por_persona(modelo.objects.all(), categoria), esperado, places=4)
+
+        self.assertEqual(total_por_persona(Seguro.objects.none(), 'seguro'), Decimal('0.00'))
+
+
+class AmadeusClienteTest(TestCase):
+    def setUp(self):
+        cache_amadeus.limpiar()
+        api_integrations._single_flight.clear()
+        api_integrations.clear_token_cache()
+        self.addCleanup(api_integrations.clear_token_cache)
+        self.session = mock.Mock()
+        self.session.post.return_value = mock.Mock(
+            status_code=200, json=lambda: {'access_token': 'token-1', 'expires_in': 1799},
+        )
+        patcher = mock.patch('cotizador.api_integrations.get_session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_token_compartido_entre_instancias(self):
+        self.session.get.return_value = mock.Mock(status_code=200, json=lambda: {'data': []})
+        api_integrations.AmadeusAPI('clave', 'secreto').search_flights('BOG', 'CTG', '2026-03-01')
+        api_integrations.AmadeusAPI('clave', 'secreto').get_hotel_offers('CTG', '2026-03-01', '2026-03-05')
+        self.assertEqual(self.session.post.call_count, 1)
+        self.assertEqual(self.session.get.call_count, 2)
+
+    def test_token_expirado_se_renueva(self):
+        self.session.post.return_value = mock.Mock(
+            status_code=200, json=lambda: {'access_token': 'token-1', 'expires_in': 30},
+        )
+        amadeus = api_integrations.AmadeusAPI('clave', 'secreto')
+        amadeus.get_access_token()
+        amadeus.get_access_token()
+        # expires_in menor que el margen de renovación: cada llamada pide uno nuevo
+        self.assertEqual(self.session.post.call_count, 2)
+
+    def test_reintenta_una_vez_ante_401(self):
+        self.session.get.side_effect = [
+            mock.Mock(status_code=401, text='token revocado'),
+            mock.Mock(status_code=200, json=lambda: {'data': []}),
+        ]
+        resultado = api_integrations.AmadeusAPI('clave', 'secreto').search_flights('BOG', 'CTG', '2026-03-01')
+        self.assertEqual(resultado, {'data': []})
+        self.assertEqual(self.session.post.call_count, 2)
+
+    def test_token_se_pide_sin_bloquear_otras_claves(self):
+        liberar = threading.Event()
+        pedidos = []
+
+        def pedir_token(url, data=None, **opciones):
+            pedidos.append(data['client_id'])
+            if data['client_id'] == 'lenta':
+                liberar.wait(5)
+            return mock.Mock(status_code=200, json=lambda: {'access_token': f"token-{data['client_id']}",
+                                                            'expires_in': 1799})
+
+        self.session.post.side_effect = pedir_token
+        tokens = []
+        hilos = [threading.Thread(target=lambda: tokens.append(
+            api_integrations.AmadeusAPI('lenta', 'secreto').get_access_token())) for _ in range(3)]
+        for hilo in hilos:
+            hilo.start()
+        time.sleep(0.1)
+        # Mientras se pide el token de una clave, otra clave obtiene el suyo
+        inicio = time.monotonic()
+        self.assertEqual(api_integrations.AmadeusAPI('rapida', 'secreto').get_access_token(), 'token-rapida')
+        self.assertLess(time.monotonic() - inicio, 1)
+        liberar.set()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(tokens, ['token-lenta'] * 3)
+        self.assertEqual(pedidos, ['lenta', 'rapida'])
+
+
+class AmadeusSimuladoTest(TestCase):
+    def setUp(self):
+        cache_amadeus.limpiar()
+        api_integrations.clear_token_cache()
+        self.servidor, url = amadeus_simulado.iniciar_en_hilo(latencia='fija:1', semilla=1)
+        self.addCleanup(self.servidor.server_close)
+        self.addCleanup(self.servidor.shutdown)
+        entorno = mock.patch.dict(os.environ, {
+            'AMADEUS_BASE_URL': url, 'AMADEUS_API_KEY': 'simulado', 'AMADEUS_API_SECRET': 'simulado',
+        })
+        entorno.start()
+        self.addCleanup(entorno.stop)
+
+    def test_vuelos_y_hoteles_desde_el_simulador(self):
+        vuelo = api_integrations.get_flight_prices_amadeus('Bogotá', 'Cartagena de Indias, Bolívar',
+                                                           date(2026, 3, 1), date(2026, 3, 5), 2)
+        hotel = api_integrations.get_hotel_prices_amadeus('Cartagena de Indias', date(2026, 3, 1), date(2026, 3, 5), 2)
+        self.assertTrue(vuelo['success'])
+        self.assertEqual((vuelo['origin_code'], vuelo['destination_code']), ('BOG', 'CTG'))
+        self.assertTrue(hotel['success'])
+        self.assertEqual(hotel['city_code'], 'CTG')
+        self.assertEqual((self.servidor.tokens, self.servidor.peticiones), (1, 2))
+
+    def test_latencia_configurable(self):
+        self.assertEqual(amadeus_simulado.Latencia('fija:250').muestra(), 0.25)
+        muestras = [amadeus_simulado.Latencia('uniforme:10,20', semilla=3).muestra() for _ in range(20)]
+        self.assertTrue(all(0.01 <= muestra <= 0.02 for muestra in muestras))
+        with self.assertRaises(ValueError):
+            amadeus_simulado.Latencia('normal:100')
+
+
+class SingleFlightTest(TestCase):
+    def concurrentes(self, single_flight, funcion, cantidad=5):
+        """Ejecuta la misma clave desde varios hilos y retorna lo que recibió cada uno"""
+        resultados = []
+
+        def llamar():
+            try:
+                resultados.append(single_flight.do('BOG-CTG', funcion))
+            except Exception as e:
+                resultados.append(e)
+
+        hilos = [threading.Thread(target=llamar) for _ in range(cantidad)]
+        for hilo in hilos:
+            hilo.start()
+        return hilos, resultados
+
+    def test_llamadas_concurrentes_comparten_resultado(self):
+        single_flight = api_integrations.SingleFlight()
+        liberar = threading.Event()
+        llamadas = []
+
+        def buscar():
+            llamadas.append(1)
+            liberar.wait(5)
+            return {'data': ['vuelo']}
+
+        hilos, resultados = self.concurrentes(single_flight, buscar)
+        time.sleep(0.1)
+        liberar.set()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(resultados, [{'data': ['vuelo']}] * 5)
+
+    def test_falla_compartida(self):
+        single_flight = api_integrations.SingleFlight(failure_ttl=60)
+        llamadas = []
+
+        def buscar():
+            llamadas.append(1)
+            time.sleep(0.1)
+            raise Exception('Amadeus no disponible')
+
+        hilos, resultados = self.concurrentes(single_flight, buscar)
+        for hilo in hilos:
+            hilo.join()
+        self.assertTrue(all(str(resultado) == 'Amadeus no disponible' for resultado in resultados))
+        # La falla se repite sin volver a consultar mientras dure failure_ttl
+        with self.assertRaises(Exception):
+            single_flight.do('BOG-CTG', buscar)
+        self.assertEqual(len(llamadas), 1)
+
+    def test_aciertos_en_cache_no_toman_el_bloqueo_entre_procesos(self):
+        single_flight = api_integrations.SingleFlight()
+        bloqueos = []
+        llamadas = []
+
+        @contextmanager
+        def bloqueo(clave):
+            bloqueos.append(clave)
+            yield
+
+        def buscar():
+            llamadas.append(1)
+            return {'data': ['vuelo']}
+
+        en_cache = [{'data': ['en caché']}]
+        with mock.patch('cotizador.api_integrations.process_lock', bloqueo):
+            self.assertEqual(single_flight.do('BOG-CTG', buscar, cached=lambda: en_cache[0]), {'data': ['en caché']})
+            self.assertEqual(bloqueos, [])
+
+            # Otro proceso la guardó mientras se esperaba el bloqueo
+            respuestas = iter([None, {'data': ['de otro proceso']}])
+            self.assertEqual(single_flight.do('BOG-CTG', buscar, cached=lambda: next(respuestas)),
+                             {'data': ['de otro proceso']})
+            self.assertEqual(bloqueos, ['BOG-CTG'])
+
+            self.assertEqual(single_flight.do('BOG-CTG', buscar, cached=lambda: None), {'data': ['vuelo']})
+        self.assertEqual(len(llamadas), 1)
+
+
+class CacheAmadeusTest(TestCase):
+    def setUp(self):
+        cache_amadeus.limpiar()
+        self.consultas = 0
+
+    def consultar(self):
+        self.consultas += 1
+        return {'data': [self.consultas]}
+
+    def test_memoria_y_base_de_datos(self):
+        parametros = {'cityCode': 'CTG', 'checkInDate': '2026-03-01', 'adults': 2}
+        self.assertEqual(cache_amadeus.obtener('hoteles', parametros, self.consultar), {'data': [1]})
+        self.assertEqual(cache_amadeus.obtener('hoteles', dict(reversed(parametros.items())), self.consultar),
+                         {'data': [1]})
+        # Tras un reinicio (memoria vacía) la respuesta sigue en la base de datos
+        cache_amadeus._memoria.clear()
+        self.assertEqual(cache_amadeus.obtener('hoteles', parametros, self.consultar), {'data': [1]})
+        self.assertEqual(self.consultas, 1)
+
+    def test_respuesta_vencida_se_entrega_y_se_renueva(self):
+        parametros = {'cityCode': 'CTG'}
+        cache_amadeus.obtener('hoteles', parametros, self.consultar)
+        RespuestaAmadeus.objects.update(expira=timezone.now() - timedelta(seconds=10))
+        cache_amadeus._memoria.clear()
+
+        with mock.patch('cotizador.cache_amadeus._programar_revalidacion') as programar:
+            self.assertEqual(cache_amadeus.obtener('hoteles', parametros, self.consultar), {'data': [1]})
+        programar.assert_called_once()
+
+        # Fuera de la ventana de renovación se consulta antes de responder
+        RespuestaAmadeus.objects.update(expira=timezone.now() - timedelta(days=1))
+        cache_amadeus._memoria.clear()
+        self.assertEqual(cache_amadeus.obtener('hoteles', parametros, self.consultar), {'data': [2]})
+
+    @override_settings(AMADEUS_CACHE_MAX_ENTRADAS=2)
+    def test_descarta_las_de_acceso_mas_antiguo(self):
+        for codigo in ('BOG', 'CTG'):
+            cache_amadeus.obtener('vuelos', {'destino': codigo}, self.consultar)
+        RespuestaAmadeus.objects.filter(parametros__destino='BOG').update(
+            ultimo_acceso=timezone.now() - timedelta(hours=1))
+        cache_amadeus.obtener('vuelos', {'destino': 'MDE'}, self.consultar)
+        self.assertEqual(sorted(RespuestaAmadeus.objects.values_list('parametros__destino', flat=True)),
+                         ['CTG', 'MDE'])
+
+    @override_settings(AMADEUS_CACHE_MAX_ENTRADAS=2)
+    def test_aciertos_en_memoria_cuentan_como_acceso(self):
+        for codigo in ('BOG', 'CTG'):
+            cache_amadeus.obtener('vuelos', {'destino': codigo}, self.consultar)
+        RespuestaAmadeus.objects.update(ultimo_acceso=timezone.now() - timedelta(hours=1))
+
+        # Dentro del intervalo el acierto en memoria no escribe en la base de datos
+        with self.assertNumQueries(0):
+            cache_amadeus.obtener('vuelos', {'destino': 'BOG'}, self.consultar)
+        with override_settings(AMADEUS_CACHE_INTERVALO_ACCESO=0):
+            cache_amadeus.obtener('vuelos', {'destino': 'BOG'}, self.consultar)
+        cache_amadeus.obtener('vuelos', {'destino': 'MDE'}, self.consultar)
+        self.assertEqual(sorted(RespuestaAmadeus.objects.values_list('parametros__destino', flat=True)),
+                         ['BOG', 'MDE'])
+
+
+class AsignacionFlotaTest(TestCase):
+    vehiculos = [
+        {'id': 1, 'pax': 4, 'cantidad': 5, 'precio': Decimal('90000')},
+        {'id': 2, 'pax': 12, 'cantidad': 2, 'precio': Decimal('200000')},
+        {'id': 3, 'pax': 40, 'cantidad': None, 'precio': Decimal('500000')},
+        {'id': 4, 'pax': None, 'cantidad': 3, 'precio': Decimal('1000')},
+    ]
+
+    def test_exacto_encuentra_el_minimo(self):
+        asignacion = asignar_flota(self.vehiculos, 14, modo='exacto')
+        # Una buseta y un carro (290000) en lugar de dos busetas (400000)
+        self.assertEqual(asignacion['costo'], Decimal('290000'))
+        self.assertEqual({v['id']: v['unidades'] for v in asignacion['vehiculos']}, {1: 1, 2: 1})
+        self.assertEqual(asignacion['faltantes'], 0)
+
+    def test_voraz_cubre_al_grupo_y_cierra_con_el_mas_barato(self):
+        asignacion = asignar_flota(self.vehiculos, 30, modo='voraz')
+        self.assertGreaterEqual(asignacion['capacidad'], 30)
+        self.assertEqual(asignacion['costo'], Decimal('500000'))
+        self.assertEqual(asignacion['modo'], 'voraz')
+
+    def test_auto_cambia_de_modo_segun_el_tamano(self):
+        self.assertEqual(asignar_flota(self.vehiculos, 10)['modo'], 'exacto')
+        self.assertEqual(asignar_flota(self.vehiculos, 10, limite_exacto=10)['modo'], 'voraz')
+
+    def test_flota_insuficiente(self):
+        asignacion = asignar_flota(self.vehiculos, 200, modo='exacto')
+        self.assertEqual(asignacion['capacidad'], 84)
+        self.assertEqual(asignacion['faltantes'], 116)
+
+    def test_costos_flota_para_todos_los_tamanos(self):
+        costos = costos_flota(self.vehiculos, 90)
+        for pax in (1, 5, 14, 41, 84):
+            self.assertEqual(Decimal(costos[pax]) / 100, asignar_flota(self.vehiculos, pax, modo='exacto')['costo'])
+        self.assertIsNone(costos[85])
+        self.assertIsNone(costos_flota(self.vehiculos, 90, limite_exacto=10))
+
+
+class IndiceConveniosTest(TestCase):
+    def test_intervalos_traslapados_y_abiertos(self):
+        indice = IndiceConvenios([
+            ('Hospedaje', 1, date(2026, 1, 1), date(2026, 6, 30), Decimal('10')),
+            ('Hospedaje', 1, date(2026, 3, 1), date(2026, 3, 31), Decimal('15')),
+            ('Hospedaje', 1, date(2026, 9, 1), None, Decimal('5')),
+            ('Seguro', 2, None, None, Decimal('0')),
+        ])
+        self.assertIsNone(indice.descuento('Hospedaje', 1, date(2025, 12, 31)))
+        self.assertEqual(indice.descuento('Hospedaje', 1, date(2026, 2, 28)), Decimal('10'))
+        # Donde se traslapan se usa el mayor descuento
+        self.assertEqual(indice.descuento('Hospedaje', 1, date(2026, 3, 31)), Decimal('15'))
+        self.assertEqual(indice.descuento('Hospedaje', 1, date(2026, 6, 30)), Decimal('10'))
+        self.assertIsNone(indice.descuento('Hospedaje', 1, date(2026, 7, 1)))
+        self.assertEqual(indice.descuento('Hospedaje', 1, date(2030, 1, 1)), Decimal('5'))
+        # Un convenio sin descuento sigue siendo un convenio
+        self.assertEqual(indice.descuento('Seguro', 2, date(2026, 1, 1)), Decimal('0'))
+        self.assertIsNone(indice.descuento('Transporte', 1, date(2026, 3, 1)))
+
+
+class GrafoRutasTest(TestCase):
+    @staticmethod
+    def ruta(ruta_id, desde, hasta, precio, pax=10, tipo='terrestre'):
+        return {
+            'id': ruta_id, 'clave_origen': desde, 'llegadas': [hasta], 'inicio': 0, 'fin': float('inf'),
+            'precio_alta': precio, 'precio_media': precio, 'precio_baja': precio,
+            'transporte_id': ruta_id, 'transporte__entidad_id': 1, 'transporte__nombre': f'Vehículo {ruta_id}',
+            'transporte__tipoTransporte': tipo, 'transporte__pax': pax, 'transporte__cantidad': 2,
+        }
+
+    def setUp(self):
+        self.grafo = GrafoRutas([
+            self.ruta(1, 'BOGOTA', 'PUERTO NARINO', Decimal('900')),
+            self.ruta(2, 'BOGOTA', 'LETICIA', Decimal('300'), tipo='aereo'),
+            self.ruta(3, 'LETICIA', 'PUERTO NARINO', Decimal('200'), tipo='maritimo'),
+            # Para más de 5 pasajeros hacen falta dos unidades
+            self.ruta(4, 'BOGOTA', 'LETICIA', Decimal('250'), pax=5),
+        ])
+
+    def test_camino_mas_barato_y_de_menos_tramos(self):
+        fecha = date(2026, 3, 1)
+        camino = self.grafo.camino('BOGOTA', 'PUERTO NARINO', fecha, 4)
+        self.assertEqual(camino['costo'], Decimal('450'))
+        self.assertEqual([tramo['ruta_id'] for tramo in camino['tramos']], [4, 3])
+        # Con 8 pasajeros la ruta 4 necesita dos vehículos y conviene la aérea
+        camino = self.grafo.camino('BOGOTA', 'PUERTO NARINO', fecha, 8)
+        self.assertEqual([(tramo['ruta_id'], tramo['unidades']) for tramo in camino['tramos']], [(2, 1), (3, 1)])
+        self.assertEqual(camino['costo'], Decimal('500'))
+
+        camino = self.grafo.camino('BOGOTA', 'PUERTO NARINO', fecha, 4, criterio='tramos')
+        self.assertEqual([tramo['ruta_id'] for tramo in camino['tramos']], [1])
+        self.assertIsNone(self.grafo.camino('BOGOTA', 'PUERTO NARINO', fecha, 4, tipos={'maritimo'}))
+        self.assertIsNone(self.grafo.camino('BOGOTA', 'PUERTO NARINO', fecha, 30))
+
+    def test_cambios_sin_modificar_el_grafo_anterior(self):
+        fecha = date(2026, 3, 1)
+        nuevo = self.grafo.con_cambios({3, 4}, [self.ruta(4, 'BOGOTA', 'LETICIA', Decimal('100'), pax=5)])
+        self.assertEqual(nuevo.numero_rutas(), 3)
+        self.assertEqual([tramo['ruta_id'] for tramo in nuevo.camino('BOGOTA', 'PUERTO NARINO', fecha, 4)['tramos']],
+                         [1])
+        self.assertEqual(self.grafo.camino('BOGOTA', 'PUERTO NARINO', fecha, 4)['costo'], Decimal('450'))
+
+
+class AsignacionHospedajeTest(TestCase):
+    hospedajes = [
+        {'id': 1, 'capacidadpax': 40, 'habitaciones': 20, 'precio': Decimal('2000000')},
+        {'id': 2, 'capacidadpax': 6, 'habitaciones': None, 'precio': Decimal('250000')},
+        {'id': 3, 'capacidadpax': 30, 'habitaciones': 10, 'precio': Decimal('900000')},
+        {'id': 4, 'capacidadpax': None, 'habitaciones': 3, 'precio': Decimal('1000')},
+    ]
+
+    def test_noches(self):
+        self.assertEqual(noches(date(2026, 3, 1), date(2026, 3, 5)), 4)
+        self.assertEqual(noches(date(2026, 3, 1), date(2026, 3, 1)), 1)
+
+    def test_habitaciones_y_alternativas(self):
+        asignacion = asignar_hospedaje(self.hospedajes, 5, 2, alternativas=2)
+        # Dos habitaciones triples del id 3 (2 x 90000 x 2 noches) antes que la casa completa del id 2
+        self.assertEqual([h['id'] for h in asignacion['alternativas']], [3, 2])
+        self.assertEqual(asignacion['hospedajes'][0]['habitaciones_usadas'], 2)
+        self.assertEqual(asignacion['costo'], Decimal('360000'))
+
+    def test_menor_numero_de_hospedajes(self):
+        asignacion = asignar_hospedaje(self.hospedajes, 45, 1)
+        self.assertEqual(asignacion['alternativas'], [])
+        self.assertEqual([(h['id'], h['pax']) for h in asignacion['hospedajes']], [(1, 40), (3, 5)])
+        self.assertEqual(asignacion['faltantes'], 0)
+
+        self.assertEqual(asignar_hospedaje(self.hospedajes, 100, 1)['faltantes'], 24)
+
+    def test_fracciones_de_centavo_se_redondean_como_en_la_flota(self):
+        hospedaje = [{'id': 1, 'capacidadpax': 2, 'habitaciones': None, 'precio': Decimal('100.006')}]
+        vehiculo = [{'id': 1, 'pax': 2, 'cantidad': 1, 'precio': Decimal('100.006')}]
+        self.assertEqual(asignar_hospedaje(hospedaje, 2, 1)['costo'], Decimal('100.01'))
+        self.assertEqual(asignar_flota(vehiculo, 2)['costo'], Decimal('100.01'))
+
+
+class CalculateQuotationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='agencia', password='clave-segura-123')
+        self.agencia = Entidad.objects.create(
+            nombre='Agencia', nit='800100', tipo_entidad='Operadora turística o agencia de viajes',
+            mail='agencia@test.com', ubicacion='', user=self.user,
+        )
+        self.destino = Destino.objects.create(
+            entidad=self.agencia, nombre='Valle del Cocora', municipio='Salento',
+            departamento='Quindío', descripcion='Palmas de cera', categoria='Ecoturismo',
+        )
+        self.client.login(username='agencia', password='clave-segura-123')
+        cache.clear()
+        reiniciar_estadisticas()
+
+        # Las pruebas no deben consultar la API real de Amadeus
+        sin_amadeus = {'success': False, 'error': 'Amadeus deshabilitado en pruebas'}
+        for nombre in ('get_hotel_prices_amadeus', 'get_flight_prices_amadeus'):
+            patcher = mock.patch(f'cotizador.api_integrations.{nombre}', return_value=sin_amadeus)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def cotizar(self, **datos):
+        datos = {
+            'origen': 'Bogotá', 'destino': self.destino.pk,
+            'fecha_inicio': '2026-03-01', 'fecha_fin': '2026-03-05',
+            'adultos': 2, 'ninios': 0, 'bebes': 0, 'adultos_mayores': 0, 'estudiantes': 0,
+            'medio_transporte': ['terrestre'], 'porcentaje_utilidad': '10', **datos,
+        }
+        return self.client.post('/api/calcular-cotizacion/', datos).json()
+
+    def test_transporte_terrestre_del_destino(self):
+        transportadora = Entidad.objects.create(
+            nombre='Transportes', nit='900200', tipo_entidad='Transporte', mail='t@test.com', ubicacion='',
+        )
+        Transporte.objects.create(
+            entidad=transportadora, tipoTransporte='terrestre', municipio='Armenia',
+            departamento='Quindío', precio=Decimal('100000'), pax=10,
+        )
+        Transporte.objects.create(
+            entidad=transportadora, tipoTransporte='terrestre', municipio='Pasto',
+            departamento='Nariño', precio=Decimal('999000'), pax=10,
+        )
+        respuesta = self.cotizar()
+        self.assertTrue(respuesta['success'])
+        # Se cobra el vehículo completo que lleva al grupo, no el de Pasto
+        self.assertEqual(respuesta['detalle']['totales']['transporte'], 100000.0)
+        self.assertEqual([v['unidades'] for v in respuesta['detalle']['vehiculos']], [1])
+
+    def test_transporte_terrestre_con_precio_por_km(self):
+        Transporte.objects.create(
+            entidad=self.agencia, tipoTransporte='terrestre', nombre='Van', municipio='Salento',
+            departamento='Quindío', precio=Decimal('100000'), pax=10, modo_precio='km', precio_km=Decimal('2000'),
+        )
+        with tempfile.TemporaryDirectory() as carpeta, \
+                override_settings(DISTANCIAS_MATRIZ_RUTA=Path(carpeta) / 'matriz.bin'):
+            # Sin matriz se cobra el precio por trayecto
+            self.assertEqual(self.cotizar()['detalle']['totales']['transporte'], 100000.0)
+
+            call_command('construir_matriz_distancias', stdout=StringIO())
+            distancia = distancia_km(('BOGOTA', 'CUNDINAMARCA'), ('SALENTO', 'QUINDIO'))
+            detalle = self.cotizar()['detalle']
+            self.assertEqual(detalle['vehiculos'][0]['distancia_km'], distancia)
+            self.assertAlmostEqual(detalle['totales']['transporte'], 2000 * distancia, places=2)
+
+            # Un origen que no está en el catálogo no tiene distancia
+            self.assertEqual(self.cotizar(origen='Quito')['detalle']['totales']['transporte'], 100000.0)
+
+    def test_asignacion_de_flota_elige_la_combinacion_mas_barata(self):
+        Transporte.objects.create(
+            entidad=self.agencia, tipoTransporte='terrestre', nombre='Buseta', municipio='Salento',
+            departamento='Quindío', precio=Decimal('300000'), pax=20, cantidad=3,
+        )
+        Transporte.objects.create(
+            entidad=self.agencia, tipoTransporte='terrestre', nombre='Bus', municipio='Salento',
+            departamento='Quindío', precio=Decimal('550000'), pax=40,
+        )
+        detalle = self.cotizar(adultos=45)['detalle']
+        self.assertEqual(detalle['totales']['transporte'], 850000.0)
+        self.assertEqual(
+            sorted((v['nombre'], v['unidades']) for v in detalle['vehiculos']),
+            [('Bus', 1), ('Buseta', 1)],
+        )
+        self.assertEqual(detalle['pax_sin_transporte'], {})
+
+    def test_opciones_por_categoria(self):
+        for nombre, precio, capacidad, calificacion in [
+            ('Finca', '300000', 3, '4.8'), ('Hostal', '90000', 6, '3.9'),
+            ('Glamping', '200000', 2, None), ('Hotel', '400000', 8, '4.5'),
+        ]:
+            Hospedaje.objects.create(
+                entidad=self.agencia, tipoHospedaje='Hotel', nombreLugar=nombre, ubicacion='Salento, Quindío',
+                precio=Decimal(precio), capacidadpax=capacidad,
+                calificacion=Decimal(calificacion) if calificacion else None,
+            )
+        Transporte.objects.create(
+            entidad=self.agencia, tipoTransporte='maritimo', nombre='Lancha', municipio='Salento',
+            departamento='Quindío', precio=Decimal('10000'), pax=10,
+        )
+        with override_settings(COTIZACION_OPCIONES=2):
+            opciones = self.cotizar()['detalle']['opciones']
+
+        hospedaje = opciones['hospedaje']
+        self.assertEqual([o['nombre'] for o in hospedaje['mas_baratos']], ['Hostal', 'Hotel'])
+        self.assertEqual(hospedaje['mas_baratos'][0]['precio_por_persona'], 15000.0)
+        self.assertEqual(hospedaje['mas_baratos'][0]['total'], 30000.0)
+        self.assertEqual([o['nombre'] for o in hospedaje['mejor_calificados']], ['Finca', 'Hotel'])
+        # Solo se ofrecen transportes de los medios elegidos
+        self.assertEqual(opciones['transporte']['mas_baratos'], [])
+
+    def test_cache_reutiliza_costos_al_cambiar_utilidad(self):
+        Transporte.objects.create(
+            entidad=self.agencia, tipoTransporte='terrestre', municipio='Salento',
+            departamento='Quindío', precio=Decimal('50000'), pax=5,
+        )
+        primera = self.cotizar(porcentaje_utilidad='10')
+        segunda = self.cotizar(porcentaje_utilidad='20')
+        self.assertEqual(estadisticas()['aciertos'], 1)
+        self.assertEqual(primera['detalle']['totales']['transporte'], segunda['detalle']['totales']['transporte'])
+        self.assertGreater(segunda['detalle']['totales']['utilidad'], primera['detalle']['totales']['utilidad'])
+
+    def test_costos_con_respaldo_se_guardan_poco_tiempo(self):
+        from .cache_cotizaciones import TTL_RESPALDO_DEFECTO, guardar_costos
+
+        # Amadeus no responde en las pruebas: el hospedaje se cotiza con el respaldo local
+        with override_settings(COTIZACION_CACHE_TTL_RESPALDO=0):
+            self.assertEqual(self.cotizar()['detalle']['respaldo'], ['hospedaje'])
+            self.cotizar()
+        self.assertEqual(estadisticas()['aciertos'], 0)
+
+        with mock.patch('cotizador.cache_cotizaciones.cache.set') as guardar:
+            guardar_costos('clave', {'respaldo': ['hospedaje'], 'amadeus': False})
+        self.assertEqual(guardar.call_args.kwargs['timeout'], TTL_RESPALDO_DEFECTO)
+
+    def test_cambio_de_proveedor_invalida_cache(self):
+        transporte = Transporte.objects.create(
+            entidad=self.agencia, tipoTransporte='terrestre', municipio='Salento',
+            departamento='Quindío', precio=Decimal('50000'), pax=5,
+        )
+        self.assertEqual(self.cotizar()['detalle']['totales']['transporte'], 50000.0)
+
+        # La caché se invalida al confirmar la transacción, no antes
+        transporte.precio = Decimal('100000')
+        with self.captureOnCommitCallbacks() as al_confirmar:
+            transporte.save()
+        self.assertEqual(self.cotizar()['detalle']['totales']['transporte'], 50000.0)
+        for funcion in al_confirmar:
+            funcion()
+        self.assertEqual(self.cotizar()['detalle']['totales']['transporte'], 100000.0)
+
+        # Un proveedor de otro departamento no invalida las cotizaciones del destino
+        with self.captureOnCommitCallbacks(execute=True):
+            Transporte.objects.create(
+                entidad=self.agencia, tipoTransporte='terrestre', municipio='Pasto',
+                departamento='Nariño', precio=Decimal('70000'), pax=5,
+            )
+        self.cotizar()
+        self.assertEqual(estadisticas(), {'aciertos': 2, 'fallos': 2, 'tasa_aciertos': 2 / 4})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transporte.delete()
+        self.assertEqual(self.cotizar()['detalle']['totales']['transporte'], 0.0)
+
+    @override_settings(COTIZACION_PLAZO_AMADEUS=0.2)
+    def test_plazo_de_amadeus_usa_precios_locales(self):
+        Hospedaje.objects.create(
+            entidad=self.agencia, tipoHospedaje='Hotel', nombreLugar='Finca', ubicacion='Salento, Quindío',
+            precio=Decimal('300000'), capacidadpax=3,
+        )
+        Transporte.objects.create(
+            entidad=self.agencia, tipoTransporte='aereo', municipio='Armenia', departamento='Quindío',
+            precio=Decimal('400000'), pax=2,
+        )
+        liberar = threading.Event()
+        self.addCleanup(liberar.set)
+
+        def amadeus_lento(*args):
+            liberar.wait(5)
+            return {'success': True, 'price': Decimal('1')}
+
+        with mock.patch('cotizador.api_integrations.get_hotel_prices_amadeus', side_effect=amadeus_lento), \
+                mock.patch('cotizador.api_integrations.get_flight_prices_amadeus', side_effect=amadeus_lento):
+            inicio = time.monotonic()
+            detalle = self.cotizar(medio_transporte=['aereo'])['detalle']
+            # Ambas consultas comparten el plazo en lugar de esperarse una tras otra
+            self.assertLess(time.monotonic() - inicio, 2)
+
+        self.assertEqual(sorted(detalle['respaldo']), ['hospedaje', 'transporte_aereo'])
+        # Cuatro noches en la finca completa
+        self.assertEqual(detalle['totales']['hospedaje'], 1200000.0)
+        self.assertEqual(detalle['totales']['transporte'], 400000.0)
+
+    def cotizar_lote(self, escenarios):
+        base = {
+            'origen': 'Bogotá', 'destino': self.destino.pk,
+            'fecha_inicio': '2026-03-01', 'fecha_fin': '2026-03-05',
+            'adultos': 2, 'ninios': 0, 'bebes': 0, 'adultos_mayores': 0, 'estudiantes': 0,
+            'medio_transporte': ['aereo'], 'porcentaje_utilidad': '10',
+        }
+        return self.client.post(
+            '/api/calcular-cotizaciones/', json.dumps({'escenarios': [{**base, **e} for e in escenarios]}),
+            content_type='application/json',
+        )
+
+    def test_lote_comparte_calculos_y_consultas(self):
+        Transporte.objects.create(
+            entidad=self.agencia, tipoTransporte='aereo', municipio='Armenia', departamento='Quindío',
+            precio=Decimal('400000'), pax=2,
+        )
+        sin_datos = {'success': False, 'error': 'sin datos'}
+        with mock.patch('cotizador.api_integrations.get_hotel_prices_amadeus', return_value=sin_datos) as hoteles, \
+                mock.patch('cotizador.api_integrations.get_flight_prices_amadeus', return_value=sin_datos) as vuelos:
+            respuesta = self.cotizar_lote([
+                {'porcentaje_utilidad': '10'},
+                {'porcentaje_utilidad': '20'},
+                {'origen': 'Medellín'},
+                {'destino': 999999},
+            ]).json()
+
+        resultados = respuesta['resultados']
+        self.assertEqual([r['success'] for r in resultados], [True, True, True, False])
+        self.assertIn('destino', resultados[3]['errors'])
+        self.assertEqual(resultados[0]['detalle']['totales']['transporte'], 400000.0)
+        self.assertEqual(resultados[2]['detalle']['origen'], 'Medellín')
+        self.assertGreater(
+            resultados[1]['detalle']['totales']['utilidad'], resultados[0]['detalle']['totales']['utilidad'],
+        )
+        # Los dos primeros escenarios solo difieren en la utilidad: un solo
+        # cálculo. El cambio de origen no repite la consulta de hoteles
+        self.assertEqual(
+            respuesta['estadisticas'],
+            {'escenarios': 4, 'validos': 3, 'calculados': 2, 'desde_cache': 0, 'consultas_amadeus': 3},
+        )
+        self.assertEqual((hoteles.call_count, vuelos.call_count), (1, 2))
+
+        # Un lote repetido se toma de la caché
+        estadisticas_lote = self.cotizar_lote([{}]).json()['estadisticas']
+        self.assertEqual((estadisticas_lote['calculados'], estadisticas_lote['desde_cache']), (0, 1))
+
+    def test_lote_invalido(self):
+        respuesta = self.client.post('/api/calcular-cotizaciones/', 'no es json', content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(self.cotizar_lote([]).status_code, 400)
+        with override_settings(COTIZACION_LOTE_MAXIMO=1):
+            self.assertEqual(self.cotizar_lote([{}, {}]).status_code, 400)
+
+    def test_barrido_coincide_con_las_cotizaciones(self):
+        Hospedaje.objects.create(
+            entidad=self.agencia, tipoHospedaje='Hotel', nombreLugar='Hostal', ubicacion='Salento, Quindío',
+            precio=Decimal('240000'), capacidadpax=12, habitaciones=4,
+        )
+        Transporte.objects.create(
+            entidad=self.agencia, tipoTransporte='terrestre', nombre='Van', municipio='Salento',
+            departamento='Quindío', precio=Decimal('180000'), pax=7, cantidad=2,
+        )
+        Alimentacion.objects.create(
+            entidad=self.agencia, nombre='Almuerzo', descripcion='-', municipio='Salento', departamento='Quindío',
+            precio=Decimal('25000'), price_per_person_alta=Decimal('32000.50'),
+        )
+        respuesta = self.client.post('/api/calcular-barrido/', {
+            'origen': 'Bogotá', 'destino': self.destino.pk, 'fecha_inicio': '2026-03-01', 'fecha_fin': '2026-03-05',
+            'medio_transporte': ['terrestre'], 'porcentaje_utilidad': '12.5',
+            'pax_desde': 2, 'pax_hasta': 16, 'paso': 3, 'temporadas': ['Alta', 'Baja'],
+        }).json()
+        barrido = respuesta['barrido']
+        self.assertEqual(barrido['pax'], [2, 5, 8, 11, 14, 16])
+        self.assertEqual([serie['temporada'] for serie in barrido['series']], ['Alta', 'Baja'])
+        self.assertEqual(barrido['componentes']['alimentacion']['Alta'][0], 64001.0)
+        self.assertEqual(barrido['pax_sin_hospedaje'][-1], 4)
+        self.assertEqual(barrido['pax_sin_transporte'], {'terrestre': [0, 0, 0, 0, 0, 2]})
+
+        # Sin precio de temporada baja se usa el precio base, como en la cotización
+        baja = barrido['series'][1]
+        for indice, pax in enumerate(barrido['pax']):
+            detalle = self.cotizar(adultos=pax, porcentaje_utilidad='12.5')['detalle']
+            self.assertAlmostEqual(baja['total'][indice], detalle['totales']['total'], delta=0.02)
+            self.assertEqual(barrido['componentes']['transporte']['Baja'][indice], detalle['totales']['transporte'])
+
+        # Con una ruta desde el origen y un vehículo por kilómetro el barrido cotiza el transporte como la cotización
+        with self.captureOnCommitCallbacks(execute=True):
+            Transporte.objects.create(
+                entidad=self.agencia, tipoTransporte='terrestre', nombre='Campero', municipio='Salento',
+                departamento='Quindío', precio=Decimal('90000'), pax=4, modo_precio='km', precio_km=Decimal('300'),
+            )
+            lancha = Transporte.objects.create(
+                entidad=self.agencia, tipoTransporte='maritimo', nombre='Lancha', municipio='Bogotá',
+                departamento='Cundinamarca', precio=Decimal('1'), pax=9, cantidad=2,
+            )
+            convenio = ConvenioAgencia.objects.create(entidad_agencia=self.agencia, entidad_convenio=self.agencia,
+                                                      ciudad_origen='Bogotá, Cundinamarca')
+            RutaTransporte.objects.create(
+                convenio_agencia=convenio, transporte=lancha, destino=self.destino,
+                precio_alta=Decimal('350000'), precio_media=Decimal('250000'), precio_baja=Decimal('150000'),
+            )
+        with tempfile.TemporaryDirectory() as carpeta, \
+                override_settings(DISTANCIAS_MATRIZ_RUTA=Path(carpeta) / 'matriz.bin'):
+            call_command('construir_matriz_distancias', stdout=StringIO())
+            distancia = distancia_km(('BOGOTA', 'CUNDINAMARCA'), ('SALENTO', 'QUINDIO'))
+            barrido = self.client.post('/api/calcular-barrido/', {
+                'origen': 'Bogotá', 'destino': self.destino.pk, 'fecha_inicio': '2026-03-01',
+                'fecha_fin': '2026-03-05', 'medio_transporte': ['terrestre', 'maritimo'],
+                'porcentaje_utilidad': '12.5', 'pax_desde': 2, 'pax_hasta': 16, 'paso': 3,
+                'temporadas': ['Alta', 'Media', 'Baja'],
+            }).json()['barrido']
+            # Marzo es temporada media: la serie Media es la de la cotización
+            for indice, pax in enumerate(barrido['pax']):
+                detalle = self.cotizar(adultos=pax, porcentaje_utilidad='12.5',
+                                       medio_transporte=['terrestre', 'maritimo'])['detalle']
+                self.assertEqual(barrido['componentes']['transporte']['Media'][indice], detalle['totales']['transporte'])
+                self.assertAlmostEqual(barrido['series'][1]['total'][indice], detalle['totales']['total'], delta=0.02)
+        # Dos pasajeros: el campero por su distancia y una lancha con el precio de la ruta en cada temporada
+        transporte = barrido['componentes']['transporte']
+        self.assertAlmostEqual(transporte['Alta'][0], 300 * distancia + 350000, places=2)
+        self.assertAlmostEqual(transporte['Media'][0], 300 * distancia + 250000, places=2)
+        self.assertAlmostEqual(transporte['Baja'][0], 300 * distancia + 150000, places=2)
+        # Entre Alta y Baja cambian la lancha y la alimentación (2 x 7000,50), con IVA y utilidad
+        self.assertAlmostEqual(barrido['series'][0]['total'][0] - barrido['series'][2]['total'][0],
+                               (200000 + 14001) * 1.19 * 1.125, delta=0.02)
+
+    @override_settings(VENTANAS_FRACCION_CONSULTAS=0.8, VENTANAS_LOTE=4)
+    def test_busqueda_de_ventanas_con_pocas_consultas(self):
+        Transporte.objects.create(
+            entidad=self.agencia, tipoTransporte='aereo', municipio='Armenia', departamento='Quindío',
+            precio=Decimal('400000'), pax=2,
+        )
+        consultas = []
+
+        def hoteles(destino, fecha_inicio, fecha_fin, adultos=1, solo_cache=False):
+            if solo_cache:
+                return {'success': False, 'error': 'Sin respuesta en caché', 'en_cache': False}
+            consultas.append(fecha_inicio)
+            # El hotel es más barato alrededor del 20 de marzo
+            return {'success': True, 'price': Decimal(1000000 + 50000 * abs(fecha_inicio.day - 20))}
+
+        def vuelos(origen, destino, fecha_inicio, fecha_fin, adultos=1, solo_cache=False):
+            if solo_cache:
+                return {'success': False, 'error': 'Sin respuesta en caché', 'en_cache': False}
+            consultas.append(fecha_inicio)
+            return {'success': True, 'price': Decimal('300000')}
+
+        with mock.patch('cotizador.api_integrations.get_hotel_prices_amadeus', side_effect=hoteles), \
+                mock.patch('cotizador.api_integrations.get_flight_prices_amadeus', side_effect=vuelos):
+            respuesta = self.client.post('/api/buscar-ventanas/', {
+                'origen': 'Bogotá', 'destino': self.destino.pk, 'fecha_inicio': '2026-03-01',
+                'fecha_fin': '2026-03-31', 'noches': 4, 'mejores': 1,
+                'adultos': 2, 'ninios': 0, 'bebes': 0, 'adultos_mayores': 0, 'estudiantes': 0,
+                'medio_transporte': ['aereo'], 'porcentaje_utilidad': '10',
+            }).json()
+
+        estadisticas_busqueda = respuesta['estadisticas']
+        self.assertEqual(estadisticas_busqueda['ventanas'], 27)
+        self.assertEqual([v['fecha_inicio'] for v in respuesta['ventanas']], ['2026-03-20'])
+        self.assertEqual(respuesta['ventanas'][0]['detalle']['totales']['hospedaje'], 1000000.0)
+        # Menos de una consulta a Amadeus por ventana
+        self.assertEqual(estadisticas_busqueda['consultas_amadeus'], len(consultas))
+        self.assertLess(len(consultas), estadisticas_busqueda['ventanas'])
+        self.assertGreater(estadisticas_busqueda['descartadas'], 0)
+
+    def test_busqueda_de_ventanas_en_un_rango_corto(self):
+        Transporte.objects.create(
+            entidad=self.agencia, tipoTransporte='aereo', municipio='Armenia', departamento='Quindío',
+            precio=Decimal('400000'), pax=2,
+        )
+
+        def respuesta_amadeus(precio):
+            def consultar(*argumentos, solo_cache=False, **opciones):
+                if solo_cache:
+                    return {'success': False, 'error': 'Sin respuesta en caché', 'en_cache': False}
+                return {'success': True, 'price': Decimal(precio)}
+            return consultar
+
+        with mock.patch('cotizador.api_integrations.get_hotel_prices_amadeus', side_effect=respuesta_amadeus(900000)), \
+                mock.patch('cotizador.api_integrations.get_flight_prices_amadeus', side_effect=respuesta_amadeus(300000)):
+            # Una sola ventana necesita dos consultas (hotel y vuelo) aunque la fracción dé cero
+            respuesta = self.client.post('/api/buscar-ventanas/', {
+                'origen': 'Bogotá', 'destino': self.destino.pk, 'fecha_inicio': '2026-03-01',
+                'fecha_fin': '2026-03-05', 'noches': 4, 'mejores': 3,
+                'adultos': 2, 'ninios': 0, 'bebes': 0, 'adultos_mayores': 0, 'estudiantes': 0,
+                'medio_transporte': ['aereo'], 'porcentaje_utilidad': '10',
+            }).json()
+
+        self.assertEqual([v['fecha_inicio'] for v in respuesta['ventanas']], ['2026-03-01'])
+        self.assertEqual(respuesta['ventanas'][0]['detalle']['totales']['hospedaje'], 900000.0)
+        self.assertEqual(respuesta['estadisticas']['consultas_amadeus'], 2)
+        self.assertIsNone(respuesta['estadisticas']['agotado'])
+
+    def test_cotizacion_guardada_y_historial(self):
+        from .models import Cotizacion
+
+        # Sin guardar la cotización es una vista previa y no queda en el historial
+        previa = self.cotizar()
+        self.assertIsNone(previa['cotizacion_id'])
+        self.assertFalse(Cotizacion.objects.exists())
+
+        primera = self.cotizar(guardar='1')
+        segunda = self.cotizar(adultos=3, guardar='1')
+        self.assertNotEqual(primera['cotizacion_id'], segunda['cotizacion_id'])
+        self.assertEqual(primera['detalle']['totales'], previa['detalle']['totales'])
+
+        historial = self.client.get('/api/cotizaciones/', {'por_pagina': 1}).json()
+        self.assertEqual((historial['total'], historial['paginas']), (2, 2))
+        self.assertEqual(historial['cotizaciones'][0]['id'], segunda['cotizacion_id'])
+        self.assertEqual(self.client.get('/api/cotizaciones/', {'pagina': 2, 'por_pagina': 1}).json()
+                         ['cotizaciones'][0]['total_pax'], 2)
+
+        guardada = self.client.get(f'/api/cotizaciones/{primera["cotizacion_id"]}/').json()
+        self.assertEqual(guardada['detalle']['totales'], primera['detalle']['totales'])
+
+        # Otra agencia no ve la cotización
+        otro = User.objects.create_user(username='otra', password='clave-segura-123')
+        Entidad.objects.create(nombre='Otra', nit='800200', tipo_entidad='Operadora turística o agencia de viajes',
+                               mail='otra@test.com', ubicacion='', user=otro)
+        self.client.login(username='otra', password='clave-segura-123')
+        self.assertEqual(self.client.get(f'/api/cotizaciones/{primera["cotizacion_id"]}/').status_code, 404)
+        self.assertEqual(self.client.get('/api/cotizaciones/').json()['total'], 0)
+
+    def test_recotizar_solo_recalcula_lo_que_cambio(self):
+        Transporte.objects.create(
+            entidad=self.agencia, tipoTransporte='terrestre', nombre='Van', municipio='Salento',
+            departamento='Quindío', precio=Decimal('150000'), pax=10,
+        )
+        almuerzo = Alimentacion.objects.create(
+            entidad=self.agencia, nombre='Almuerzo', descripcion='-', municipio='Salento', departamento='Quindío',
+            precio=Decimal('25000'),
+        )
+        cotizacion_id = self.cotizar(guardar='1')['cotizacion_id']
+        recotizar = f'/api/cotizaciones/{cotizacion_id}/recotizar/'
+
+        sin_cambios = self.client.post(recotizar).json()
+        self.assertEqual((sin_cambios['recalculados'], sin_cambios['cotizacion']['version']), ([], 1))
+
+        almuerzo.precio = Decimal('30000')
+        with self.captureOnCommitCallbacks(execute=True):
+            almuerzo.save()
+        respuesta = self.client.post(recotizar).json()
+        self.assertEqual(respuesta['recalculados'], ['alimentacion'])
+        self.assertEqual(respuesta['sin_verificar'], [])
+        self.assertEqual(respuesta['cotizacion']['version'], 2)
+        self.assertEqual(respuesta['detalle']['totales']['alimentacion'], 60000.0)
+        self.assertEqual(respuesta['detalle']['totales']['transporte'], 150000.0)
+        self.assertEqual([v['nombre'] for v in respuesta['detalle']['vehiculos']], ['Van'])
+
+        # El detalle recotizado es el mismo de una cotización nueva
+        self.assertEqual(respuesta['detalle']['totales'], self.cotizar()['detalle']['totales'])
+
+    def test_cotizacion_progresiva(self):
+        from .models import Cotizacion
+
+        Alimentacion.objects.create(
+            entidad=self.agencia, nombre='Almuerzo', descripcion='-', municipio='Salento', departamento='Quindío',
+            precio=Decimal('25000'),
+        )
+        respuesta_amadeus = threading.Event()
+
+        def hoteles(lugar, fecha_inicio, fecha_fin, adultos=1, solo_cache=False):
+            # Amadeus responde solo después de que se enviaron los componentes locales
+            respuesta_amadeus.wait(5)
+            return {'success': True, 'price': Decimal('800000')}
+
+        eventos = []
+        with mock.patch('cotizador.api_integrations.get_hotel_prices_amadeus', side_effect=hoteles):
+            respuesta = self.client.post('/api/calcular-cotizacion/progresiva/', {
+                'origen': 'Bogotá', 'destino': self.destino.pk, 'fecha_inicio': '2026-03-01',
+                'fecha_fin': '2026-03-05', 'adultos': 2, 'ninios': 0, 'bebes': 0, 'adultos_mayores': 0,
+                'estudiantes': 0, 'medio_transporte': ['terrestre'], 'porcentaje_utilidad': '10', 'guardar': '1',
+            })
+            self.assertEqual(respuesta['Content-Type'], 'text/event-stream')
+            for fragmento in respuesta.streaming_content:
+                tipo, datos = fragmento.decode().strip().split('\n')
+                eventos.append((tipo[len('event: '):], json.loads(datos[len('data: '):])))
+                if eventos[-1][1].get('componente') == 'seguro':
+                    respuesta_amadeus.set()
+
+        componentes = [(datos['componente'], datos['fuente'], datos['costo'], datos['provisional'])
+                       for tipo, datos in eventos if tipo == 'componente']
+        self.assertEqual(componentes, [
+            ('hospedaje', 'respaldo', 0.0, True),
+            ('transporte_terrestre', 'local', 0.0, False),
+            ('alimentacion', 'local', 50000.0, False),
+            ('seguro', 'local', 0.0, False),
+            ('hospedaje', 'amadeus', 800000.0, False),
+        ])
+        tipo, totales = eventos[-1]
+        self.assertEqual(tipo, 'totales')
+        self.assertEqual(totales['detalle']['totales']['hospedaje'], 800000.0)
+        self.assertEqual(totales['detalle']['totales']['subtotal_con_iva'], 939500.0)
+        # La cotización quedó guardada y en la caché, igual que con calculate_quotation
+        self.assertTrue(Cotizacion.objects.filter(pk=totales['cotizacion_id']).exists())
+        self.assertEqual(self.cotizar()['detalle']['totales'], totales['detalle']['totales'])
+
+        # Sin guardar es una vista previa: mismos totales (desde la caché) y nada nuevo en el historial
+        respuesta = self.client.post('/api/calcular-cotizacion/progresiva/', {
+            'origen': 'Bogotá', 'destino': self.destino.pk, 'fecha_inicio': '2026-03-01',
+            'fecha_fin': '2026-03-05', 'adultos': 2, 'ninios': 0, 'bebes': 0, 'adultos_mayores': 0,
+            'estudiantes': 0, 'medio_transporte': ['terrestre'], 'porcentaje_utilidad': '10',
+        })
+        tipo, datos = b''.join(respuesta.streaming_content).decode().strip().split('\n\n')[-1].split('\n')
+        previa = json.loads(datos[len('data: '):])
+        self.assertIsNone(previa['cotizacion_id'])
+        self.assertEqual(previa['detalle']['totales'], totales['detalle']['totales'])
+        self.assertEqual(Cotizacion.objects.count(), 1)
+
+    def test_ajuste_incremental_de_la_cotizacion(self):
+        from .cotizacion_incremental import ajustar_cotizacion
+        from .models import Cotizacion
+
+        Transporte.objects.create(
+            entidad=self.agencia, tipoTransporte='terrestre', nombre='Van', municipio='Salento',
+            departamento='Quindío', precio=Decimal('150000'), pax=10,
+        )
+        Alimentacion.objects.create(
+            entidad=self.agencia, nombre='Almuerzo', descripcion='-', municipio='Salento', departamento='Quindío',
+            precio=Decimal('25000'),
+        )
+        cotizacion_id = self.cotizar(guardar='1')['cotizacion_id']
+        cotizacion = Cotizacion.objects.select_related('destino').get(pk=cotizacion_id)
+
+        # Solo utilidad: aritmética sobre los costos guardados, sin consultas
+        with self.assertNumQueries(0):
+            ajuste = ajustar_cotizacion(cotizacion, {'porcentaje_utilidad': '20'}, self.agencia)
+        self.assertEqual(ajuste['etapas'], ['totales'])
+        self.assertEqual(ajuste['detalle']['totales'], self.cotizar(porcentaje_utilidad='20')['detalle']['totales'])
+
+        # Otros pasajeros: se recalculan los componentes con los proveedores de la caché
+        with self.assertNumQueries(1):  # los destinos del formulario
+            ajuste = ajustar_cotizacion(cotizacion, {'adultos': 4}, self.agencia)
+        self.assertEqual(ajuste['etapas'], ['componentes', 'totales'])
+        self.assertEqual(ajuste['detalle']['totales'], self.cotizar(adultos=4)['detalle']['totales'])
+
+        respuesta = self.client.post(f'/api/cotizaciones/{cotizacion_id}/ajustar/',
+                                     {'cambios': {'porcentaje_utilidad': '-'}}, content_type='application/json').json()
+        self.assertIn('porcentaje_utilidad', respuesta['errors'])
+        respuesta = self.client.post(f'/api/cotizaciones/{cotizacion_id}/ajustar/',
+                                     {'cambios': {'adultos': 3}, 'guardar': True}, content_type='application/json').json()
+        self.assertEqual(respuesta['cotizacion']['total_pax'], 3)
+        self.assertNotEqual(respuesta['cotizacion']['id'], cotizacion_id)
+
+    def test_ajuste_de_una_vista_previa(self):
+        from .models import Cotizacion
+
+        Alimentacion.objects.create(
+            entidad=self.agencia, nombre='Almuerzo', descripcion='-', municipio='Salento', departamento='Quindío',
+            precio=Decimal('25000'),
+        )
+        previa = self.cotizar()
+        self.assertIsNone(previa['cotizacion_id'])
+        url = f'/api/cotizaciones/vista-previa/{previa["vista_previa"]}/ajustar/'
+
+        # La vista previa se ajusta como una cotización guardada, sin guardarla antes
+        ajuste = self.client.post(url, {'cambios': {'porcentaje_utilidad': '20'}},
+                                  content_type='application/json').json()
+        self.assertEqual(ajuste['etapas'], ['totales'])
+        self.assertEqual(ajuste['detalle']['totales'], self.cotizar(porcentaje_utilidad='20')['detalle']['totales'])
+        ajuste = self.client.post(url, {'cambios': {'adultos': 4}}, content_type='application/json').json()
+        self.assertEqual(ajuste['etapas'], ['componentes', 'totales'])
+        self.assertEqual(ajuste['detalle']['totales'], self.cotizar(adultos=4)['detalle']['totales'])
+        self.assertFalse(Cotizacion.objects.exists())
+
+        # Con guardar el ajuste queda en el historial y se puede re-cotizar
+        respuesta = self.client.post(url, {'cambios': {'adultos': 3}, 'guardar': True},
+                                     content_type='application/json').json()
+        self.assertEqual(respuesta['cotizacion']['total_pax'], 3)
+        recotizada = self.client.post(f'/api/cotizaciones/{respuesta["cotizacion"]["id"]}/recotizar/').json()
+        self.assertEqual(recotizada['recalculados'], [])
+
+        # Otra agencia no puede usar el token
+        otro = User.objects.create_user(username='otra', password='clave-segura-123')
+        Entidad.objects.create(nombre='Otra', nit='800200', tipo_entidad='Operadora turística o agencia de viajes',
+                               mail='otra@test.com', ubicacion='', user=otro)
+        self.client.login(username='otra', password='clave-segura-123')
+        respuesta = self.client.post(url, {'cambios': {'adultos': 3}}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 404)
+
+    def test_descuentos_por_convenio_de_la_agencia(self):
+        hotel = Entidad.objects.create(nombre='Hotel', nit='900300', tipo_entidad='Hospedaje', mail='h@test.com',
+                                       ubicacion='')
+        Hospedaje.objects.create(
+            entidad=hotel, tipoHospedaje='Hotel', nombreLugar='Hotel Salento', ubicacion='Salento, Quindío',
+            precio=Decimal('100000'), capacidadpax=4, habitaciones=2,
+        )
+        otra = Entidad.objects.create(nombre='Otra', nit='800200', tipo_entidad='Operadora turística o agencia de viajes',
+                                      mail='otra@test.com', ubicacion='')
+        # El convenio de otra agencia no cuenta
+        ConvenioAgencia.objects.create(entidad_agencia=otra, entidad_convenio=hotel, porcentaje_descuento=Decimal('50'))
+        convenio = ConvenioAgencia.objects.create(
+            entidad_agencia=self.agencia, entidad_convenio=hotel, porcentaje_descuento=Decimal('10'),
+            fecha_inicio=date(2026, 4, 1), fecha_fin=date(2026, 4, 30),
+        )
+
+        # Fuera de las fechas del convenio se consulta Amadeus (y falla)
+        sin_convenio = self.cotizar()['detalle']
+        self.assertEqual(sin_convenio['fuentes']['hospedaje'], 'respaldo')
+        self.assertGreater(sin_convenio['totales']['hospedaje'], 0)
+
+        convenio.fecha_inicio = date(2026, 3, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            convenio.save()
+        con_convenio = self.cotizar()['detalle']
+        self.assertEqual(con_convenio['fuentes']['hospedaje'], 'convenio')
+        self.assertEqual(con_convenio['totales']['hospedaje'], sin_convenio['totales']['hospedaje'] * 0.9)
+
+    def test_precios_de_ruta_desde_el_origen(self):
+        from .models import Cotizacion
+
+        transportadora = Entidad.objects.create(nombre='Expreso', nit='900400', tipo_entidad='Transporte',
+                                                mail='e@test.com', ubicacion='')
+        Transporte.objects.create(
+            entidad=transportadora, tipoTransporte='terrestre', nombre='Van local', municipio='Salento',
+            departamento='Quindío', precio=Decimal('50000'), pax=10,
+        )
+        bus = Transporte.objects.create(
+            entidad=transportadora, tipoTransporte='terrestre', nombre='Bus Bogotá', municipio='Bogotá',
+            departamento='Cundinamarca', precio=Decimal('1'), pax=40,
+        )
+        convenio = ConvenioAgencia.objects.create(entidad_agencia=self.agencia, entidad_convenio=transportadora,
+                                                  ciudad_origen='Bogotá D.C.')
+        ruta = RutaTransporte.objects.create(
+            convenio_agencia=convenio, transporte=bus, ciudad_destino='salento',
+            precio_alta=Decimal('800000'), precio_media=Decimal('600000'), precio_baja=Decimal('400000'),
+        )
+        self.assertEqual((ruta.clave_destino, ruta.clave_origen), ('SALENTO', 'BOGOTA D C'))
+
+        # El origen del convenio no está en el catálogo: no hay ruta y se usa el transporte generico
+        generico = self.cotizar()['detalle']
+        self.assertEqual(generico['totales']['transporte'], 50000.0)
+        self.assertNotIn('transporte_terrestre', generico['fuentes'])
+
+        convenio.ciudad_origen = 'Bogotá, Cundinamarca'
+        with self.captureOnCommitCallbacks(execute=True):
+            convenio.save()
+        respuesta = self.cotizar(guardar='1')
+        detalle = respuesta['detalle']
+        # Marzo es temporada media
+        self.assertEqual(detalle['totales']['transporte'], 600000.0)
+        self.assertEqual(detalle['fuentes']['transporte_terrestre'], 'ruta')
+        self.assertEqual([v['nombre'] for v in detalle['vehiculos']], ['Bus Bogotá'])
+        linea = Cotizacion.objects.latest('pk').lineas.get(componente='transporte_terrestre')
+        self.assertEqual(linea.fuente, 'ruta')
+
+        # Otro origen no tiene ruta; la ruta al destino tiene prioridad sobre la de su ciudad
+        self.assertEqual(self.cotizar(origen='Medellín')['detalle']['totales']['transporte'], 50000.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            RutaTransporte.objects.create(
+                convenio_agencia=convenio, transporte=bus, destino=self.destino,
+                precio_alta=Decimal('700000'), precio_media=Decimal('500000'), precio_baja=Decimal('300000'),
+            )
+        self.assertEqual(self.cotizar()['detalle']['totales']['transporte'], 500000.0)
+        self.assertEqual(self.cotizar(fecha_inicio='2026-12-01', fecha_fin='2026-12-05')['detalle']['totales']['transporte'],
+                         700000.0)
+
+        # Sin rutas, re-cotizar vuelve al transporte local y lo refleja en las fuentes
+        with self.captureOnCommitCallbacks(execute=True):
+            RutaTransporte.objects.all().delete()
+        recotizada = self.client.post(f'/api/cotizaciones/{respuesta["cotizacion_id"]}/recotizar/').json()
+        self.assertEqual(recotizada['recalculados'], ['transporte_terrestre'])
+        self.assertEqual(recotizada['detalle']['totales']['transporte'], 50000.0)
+        self.assertNotIn('transporte_terrestre', recotizada['detalle']['fuentes'])
+        linea = Cotizacion.objects.latest('pk').lineas.get(componente='transporte_terrestre')
+        self.assertEqual(linea.fuente, 'local')
+
+    def test_camino_de_varios_tramos_por_una_ciudad_intermedia(self):
+        transportadora = Entidad.objects.create(nombre='Expreso', nit='900400', tipo_entidad='Transporte',
+                                                mail='e@test.com', ubicacion='')
+        with self.captureOnCommitCallbacks(execute=True):
+            van = Transporte.objects.create(entidad=transportadora, tipoTransporte='terrestre', nombre='Van',
+                                            municipio='Pereira', departamento='Risaralda', precio=Decimal('1'), pax=10,
+                                            cantidad=2)
+            jeep = Transporte.objects.create(entidad=transportadora, tipoTransporte='terrestre', nombre='Jeep',
+                                             municipio='Armenia', departamento='Quindío', precio=Decimal('1'), pax=10,
+                                             cantidad=2)
+            desde_pereira = ConvenioAgencia.objects.create(entidad_agencia=self.agencia,
+                                                           entidad_convenio=transportadora, ciudad_origen='Pereira')
+            desde_armenia = ConvenioAgencia.objects.create(entidad_agencia=self.agencia,
+                                                           entidad_convenio=transportadora, ciudad_origen='Armenia, Quindío')
+            tramo = RutaTransporte.objects.create(
+                convenio_agencia=desde_pereira, transporte=van, ciudad_destino='Armenia',
+                precio_alta=Decimal('200000'), precio_media=Decimal('200000'), precio_baja=Decimal('200000'),
+            )
+            RutaTransporte.objects.create(
+                convenio_agencia=desde_armenia, transporte=jeep, destino=self.destino,
+                precio_alta=Decimal('100000'), precio_media=Decimal('100000'), precio_baja=Decimal('100000'),
+            )
+
+        detalle = self.cotizar(origen='Pereira')['detalle']
+        self.assertEqual(detalle['totales']['transporte'], 300000.0)
+        self.assertEqual(detalle['fuentes']['transporte_terrestre'], 'ruta')
+        self.assertEqual([(v['nombre'], v['tramo']['desde'], v['tramo']['hasta']) for v in detalle['vehiculos']],
+                         [('Van', 'PEREIRA', 'ARMENIA'), ('Jeep', 'ARMENIA', 'SALENTO')])
+
+        # El cambio de un tramo se aplica al grafo y a las cotizaciones en caché
+        tramo.precio_media = Decimal('250000')
+        with self.captureOnCommitCallbacks(execute=True):
+            tramo.save()
+        self.assertEqual(self.cotizar(origen='Pereira')['detalle']['totales']['transporte'], 350000.0)
+
+        camino = self.client.get('/api/rutas/camino/', {
+            'origen': 'Pereira', 'destino': 'Salento', 'fecha': '2026-03-01', 'pax': 12, 'criterio': 'tramos',
+        }).json()
+        self.assertTrue(camino['success'])
+        self.assertEqual([t['unidades'] for t in camino['tramos']], [2, 2])
+        self.assertEqual(float(camino['costo']), 700000.0)
+
+    def test_cotizacion_en_segundo_plano(self):
+        encolada = self.cotizar(en_segundo_plano='1')
+        self.assertEqual(encolada['estado'], 'pendiente')
+        estado = f'/api/trabajos/{encolada["trabajo_id"]}/'
+        self.assertNotIn('resultado', self.client.get(estado).json())
+
+        self.assertEqual(cola_trabajos.procesar_pendientes(), 1)
+
+        respuesta = self.client.get(estado).json()
+        self.assertEqual((respuesta['estado'], respuesta['intentos']), ('completado', 1))
+        self.assertEqual(respuesta['resultado']['detalle']['totales'], self.cotizar()['detalle']['totales'])
+
+        # Los errores de validación son el resultado del trabajo, sin reintentos
+        trabajo_id = self.client.post('/api/trabajos/', {'tipo': 'barrido', 'parametros': {'origen': 'Bogotá'}},
+                                      content_type='application/json').json()['trabajo_id']
+        self.assertEqual(cola_trabajos.procesar_pendientes(), 1)
+        respuesta = self.client.get(f'/api/trabajos/{trabajo_id}/').json()
+        self.assertEqual(respuesta['estado'], 'completado')
+        self.assertIn('destino', respuesta['resultado']['errors'])
+        self.assertEqual(self.client.post('/api/trabajos/', {'tipo': 'otro', 'parametros': {}},
+                                          content_type='application/json').status_code, 400)
+
+        salida = StringIO()
+        call_command('procesar_trabajos', '--una-vez', stdout=salida)
+        self.assertIn('Trabajos ejecutados: 0', salida.getvalue())
+
+    @override_settings(TRABAJOS_ESPERA_BASE=60, TRABAJOS_MAXIMO_INTENTOS=2)
+    def test_trabajo_se_reintenta_con_espera(self):
+        trabajo = cola_trabajos.encolar('lote', {'escenarios': [{}]}, self.agencia)
+        with mock.patch('cotizador.cotizacion_lote.cotizar_lote', side_effect=RuntimeError('Amadeus caído')):
+            self.assertEqual(cola_trabajos.ejecutar(cola_trabajos.tomar('prueba')), 'pendiente')
+            # Hasta que pase la espera no se vuelve a tomar
+            self.assertIsNone(cola_trabajos.tomar('prueba'))
+            trabajo.refresh_from_db()
+            self.assertGreater(trabajo.disponible_desde, timezone.now() + timedelta(seconds=50))
+
+            TrabajoCotizacion.objects.filter(pk=trabajo.pk).update(disponible_desde=timezone.now())
+            self.assertEqual(cola_trabajos.ejecutar(cola_trabajos.tomar('prueba')), 'fallido')
+        trabajo.refresh_from_db()
+        self.assertEqual((trabajo.intentos, trabajo.error), (2, 'Amadeus caído'))
+
+        # Un trabajo cuyo trabajador murió se retoma al vencer su reserva
+        otro = cola_trabajos.encolar('lote', {'escenarios': [{}]}, self.agencia)
+        self.assertEqual(cola_trabajos.tomar('muerto').pk, otro.pk)
+        self.assertIsNone(cola_trabajos.tomar('vivo'))
+        TrabajoCotizacion.objects.filter(pk=otro.pk).update(reservado_hasta=timezone.now() - timedelta(seconds=1))
+        retomado = cola_trabajos.tomar('vivo')
+        self.assertEqual((retomado.pk, retomado.trabajador, retomado.intentos), (otro.pk, 'vivo', 2))
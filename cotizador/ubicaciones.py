@@ -0,0 +1,243 @@
+"""
+Utilidades para normalizar ubicaciones geográficas
+
+Los proveedores guardan su ubicación como texto libre (con o sin tildes, en
+mayúsculas o minúsculas, en distinto orden). Este módulo reduce ese texto a
+claves normalizadas de municipio y departamento, usando como referencia el
+catálogo de static/data/colombia_location_data.json, y las resuelve a las
+tablas Pais / Departamento / Municipio para poder filtrar por ids enteros.
+"""
+import json
+import unicodedata
+from functools import lru_cache
+
+from django.conf import settings
+
+
+RUTA_DATOS_UBICACION = settings.BASE_DIR / 'static' / 'data' / 'colombia_location_data.json'
+RUTA_DATOS_PAISES = settings.BASE_DIR / 'static' / 'data' / 'countries.json'
+CODIGO_COLOMBIA = 'CO'
+
+# Nombres de país que pueden aparecer dentro de un texto de ubicación
+PAISES_IGNORADOS = {'COLOMBIA'}
+
+
+def normalizar_texto(texto):
+    """
+    Convierte un texto en una clave comparable: sin tildes, en mayúsculas y
+    con los espacios internos colapsados. 'Chinchiná ' -> 'CHINCHINA'
+    """
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = texto.replace('.', ' ')
+    return ' '.join(texto.upper().split())
+
+
+@lru_cache(maxsize=1)
+def catalogo_colombia():
+    """
+    Carga una sola vez el catálogo de departamentos y municipios.
+    Retorna (departamentos, municipios) donde municipios mapea cada clave de
+    municipio al conjunto de claves de departamento en que existe.
+    """
+    with open(RUTA_DATOS_UBICACION, encoding='utf-8') as archivo:
+        datos = json.load(archivo)
+
+    departamentos = set()
+    municipios = {}
+    for registro in datos:
+        clave_departamento = normalizar_texto(registro['departamento'])
+        departamentos.add(clave_departamento)
+        for ciudad in registro['ciudades']:
+            municipios.setdefault(normalizar_texto(ciudad), set()).add(clave_departamento)
+    return departamentos, municipios
+
+
+def _completar_departamento(clave_municipio, clave_departamento):
+    """Deduce el departamento cuando el municipio solo existe en uno"""
+    if clave_departamento or not clave_municipio:
+        return clave_departamento
+    _, municipios = catalogo_colombia()
+    candidatos = municipios.get(clave_municipio, set())
+    if len(candidatos) == 1:
+        return next(iter(candidatos))
+    return ''
+
+
+def claves_desde_texto(texto):
+    """
+    Extrae (clave_municipio, clave_departamento) de un texto libre como
+    'SALENTO, QUINDÍO, COLOMBIA' o 'Colombia, Salento'.
+    """
+    departamentos, municipios = catalogo_colombia()
+    partes = [normalizar_texto(parte) for parte in (texto or '').split(',')]
+    partes = [parte for parte in partes if parte and parte not in PAISES_IGNORADOS]
+
+    # El departamento suele ir después del municipio, así que se busca desde el final
+    clave_departamento = ''
+    indice_departamento = None
+    for indice in range(len(partes) - 1, -1, -1):
+        if partes[indice] in departamentos:
+            clave_departamento = partes[indice]
+            indice_departamento = indice
+            break
+
+    clave_municipio = ''
+    for indice, parte in enumerate(partes):
+        if indice == indice_departamento:
+            continue
+        if parte in municipios and (not clave_departamento or clave_departamento in municipios[parte]):
+            clave_municipio = parte
+            break
+
+    # Texto con una sola parte desconocida: se conserva como municipio para
+    # poder emparejar lugares que no están en el catálogo
+    if not clave_municipio and not clave_departamento and len(partes) == 1:
+        clave_municipio = partes[0]
+
+    return clave_municipio, _completar_departamento(clave_municipio, clave_departamento)
+
+
+def claves_ubicacion(instancia, usar_entidad=True, usar_nombre=False):
+    """
+    Calcula (clave_municipio, clave_departamento) para un destino o proveedor.
+
+    Se usa la primera fuente que tenga datos, en este orden: los campos
+    municipio/departamento propios, el texto 'ubicacion' propio y, si
+    usar_entidad es True, los mismos datos de la entidad asociada. Con
+    usar_nombre, si ninguna da un lugar se usa el nombre cuando es un
+    municipio del catálogo (los destinos cargados con seed_destinos solo
+    tienen coordenadas en 'ubicacion' y el municipio en el nombre).
+    """
+    fuentes = [instancia]
+    entidad = getattr(instancia, 'entidad', None) if usar_entidad else None
+    if entidad is not None:
+        fuentes.append(entidad)
+
+    for fuente in fuentes:
+        clave_municipio = normalizar_texto(getattr(fuente, 'municipio', None))
+        clave_departamento = normalizar_texto(getattr(fuente, 'departamento', None))
+        if clave_municipio or clave_departamento:
+            return clave_municipio, _completar_departamento(clave_municipio, clave_departamento)
+
+        ubicacion = getattr(fuente, 'ubicacion', None)
+        if ubicacion:
+            claves = claves_desde_texto(ubicacion)
+            if any(claves):
+                return claves
+
+    if usar_nombre:
+        _, municipios = catalogo_colombia()
+        clave_municipio, clave_departamento = claves_desde_texto(getattr(instancia, 'nombre', None))
+        if clave_departamento or clave_municipio in municipios:
+            return clave_municipio, clave_departamento
+
+    return '', ''
+
+
+def cargar_catalogo_geografico(apps=None):
+    """
+    Crea las filas de Pais, Departamento y Municipio que falten a partir de
+    countries.json y colombia_location_data.json. Es idempotente.
+
+    Recibe opcionalmente el registro de apps de una migración para poder
+    usarse con los modelos históricos. Retorna el número de filas creadas
+    por modelo.
+    """
+    if apps is None:
+        from django.apps import apps
+    Pais = apps.get_model('cotizador', 'Pais')
+    Departamento = apps.get_model('cotizador', 'Departamento')
+    Municipio = apps.get_model('cotizador', 'Municipio')
+
+    with open(RUTA_DATOS_PAISES, encoding='utf-8') as archivo:
+        paises = json.load(archivo)
+    with open(RUTA_DATOS_UBICACION, encoding='utf-8') as archivo:
+        datos = json.load(archivo)
+
+    creados = {'paises': 0, 'departamentos': 0, 'municipios': 0}
+
+    codigos_existentes = set(Pais.objects.values_list('codigo', flat=True))
+    nuevos_paises = [
+        Pais(nombre=pais['name'], codigo=pais['code'], clave=normalizar_texto(pais['name']))
+        for pais in paises if pais['code'] not in codigos_existentes
+    ]
+    Pais.objects.bulk_create(nuevos_paises)
+    creados['paises'] = len(nuevos_paises)
+
+    colombia = Pais.objects.get(codigo=CODIGO_COLOMBIA)
+    departamentos = {d.clave: d for d in Departamento.objects.filter(pais=colombia)}
+    nuevos_departamentos = []
+    for registro in datos:
+        clave = normalizar_texto(registro['departamento'])
+        if clave not in departamentos:
+            departamentos[clave] = Departamento(pais=colombia, nombre=registro['departamento'], clave=clave)
+            nuevos_departamentos.append(departamentos[clave])
+    Departamento.objects.bulk_create(nuevos_departamentos)
+    creados['departamentos'] = len(nuevos_departamentos)
+
+    # bulk_create no asigna pk en todos los motores; se recargan los departamentos
+    departamentos = {d.clave: d for d in Departamento.objects.filter(pais=colombia)}
+    existentes = set(Municipio.objects.values_list('departamento_id', 'clave'))
+    nuevos_municipios = []
+    for registro in datos:
+        departamento = departamentos[normalizar_texto(registro['departamento'])]
+        for ciudad in registro['ciudades']:
+            clave = normalizar_texto(ciudad)
+            if (departamento.pk, clave) not in existentes:
+                existentes.add((departamento.pk, clave))
+                nuevos_municipios.append(Municipio(departamento=departamento, nombre=ciudad, clave=clave))
+    Municipio.objects.bulk_create(nuevos_municipios, batch_size=500)
+    creados['municipios'] = len(nuevos_municipios)
+
+    return creados
+
+
+def mapa_referencias(apps=None):
+    """
+    Carga en memoria las tablas de referencia para resolver muchas claves
+    sin una consulta por registro (backfill, reconstrucción del índice).
+    """
+    if apps is None:
+        from django.apps import apps
+    Pais = apps.get_model('cotizador', 'Pais')
+    Departamento = apps.get_model('cotizador', 'Departamento')
+    Municipio = apps.get_model('cotizador', 'Municipio')
+    return {
+        'paises': dict(Pais.objects.values_list('clave', 'id')),
+        'departamentos': {clave: (id_, pais_id) for id_, clave, pais_id
+                          in Departamento.objects.values_list('id', 'clave', 'pais_id')},
+        'municipios': {(departamento_id, clave): id_ for id_, departamento_id, clave
+                       in Municipio.objects.values_list('id', 'departamento_id', 'clave')},
+    }
+
+
+def referencias_ubicacion(clave_municipio, clave_departamento, texto_pais=None, mapa=None):
+    """
+    Resuelve las claves normalizadas a ids de las tablas de referencia.
+    Retorna (pais_id, departamento_id, municipio_id); los que no se
+    encuentren quedan en None. Si no se pasa un mapa precargado se consulta
+    la base de datos.
+    """
+    if mapa is None:
+        from .models import Departamento, Municipio, Pais
+        mapa = {
+            'paises': dict(Pais.objects.filter(clave=normalizar_texto(texto_pais)).values_list('clave', 'id')),
+            'departamentos': {clave: (id_, pais_id) for id_, clave, pais_id in Departamento.objects.filter(
+                clave=clave_departamento).values_list('id', 'clave', 'pais_id')},
+            'municipios': {(departamento_id, clave): id_ for id_, departamento_id, clave in Municipio.objects.filter(
+                departamento__clave=clave_departamento, clave=clave_municipio).values_list('id', 'departamento_id', 'clave')},
+        }
+
+    pais_id = departamento_id = municipio_id = None
+    if clave_departamento and clave_departamento in mapa['departamentos']:
+        departamento_id, pais_id = mapa['departamentos'][clave_departamento]
+        if clave_municipio:
+            municipio_id = mapa['municipios'].get((departamento_id, clave_municipio))
+
+    if pais_id is None and texto_pais:
+        pais_id = mapa['paises'].get(normalizar_texto(texto_pais))
+
+    return pais_id, departamento_id, municipio_id
@@ -41,6 +41,7 @@ from .views import (
     get_destinations_packages_list,
     autocomplete_destinations_and_packages,
     autocomplete_transportes,
+    autocomplete_municipios,
     ConvenioAgenciaCreateView,
     ConvenioAgenciaUpdateView,
     ConvenioAgenciaDeleteView,
@@ -53,6 +54,19 @@ from .views import (
     rutas_transporte_convenio,
     get_convenio_agencia_info,
     calculate_quotation,
+    calculate_quotation_stream,
+    calculate_quotation_batch,
+    calculate_quotation_sweep,
+    search_quotation_windows,
+    search_route_path,
+    nearby_suppliers,
+    quotation_history,
+    quotation_detail,
+    reprice_quotation,
+    adjust_quotation,
+    adjust_quotation_preview,
+    submit_quotation_job,
+    quotation_job_status,
 )
 
 router = DefaultRouter()
@@ -92,6 +106,7 @@ urlpatterns = [
     path('transporte/<int:pk>/delete/', TransporteDeleteView.as_view(), name='transporte-delete'),
     path('destino/<int:pk>/', DestinoDetailView.as_view(), name='destino-detail'),
     path('api/destinos/precios/', get_destination_prices, name='api-destinos-precios'),
+    path('destinos/<int:destino_id>/cercanos/', nearby_suppliers, name='api-destinos-cercanos'),
 
     path('check_username/', check_username_availability, name='check_username_availability'),
     path('ajax/login/', ajax_login_view, name='ajax_login'),
@@ -100,6 +115,7 @@ urlpatterns = [
     path('api/autocomplete-destinations-packages/', autocomplete_destinations_and_packages, name='autocomplete_destinations_packages'),
     path('api/get-destinations-packages/', get_destinations_packages_list, name='get_destinations_packages'),
     path('api/autocomplete-transportes/', autocomplete_transportes, name='autocomplete_transportes'),
+    path('api/autocomplete-municipios/', autocomplete_municipios, name='autocomplete_municipios'),
 
     path('convenios/', convenios_list, name='convenios-list'),
     path('convenios-agencia/', convenios_agencia_list, name='convenios-agencia-list'),
@@ -112,6 +128,18 @@ urlpatterns = [
     path('rutas/<int:pk>/editar/', RutaTransporteUpdateView.as_view(), name='ruta-transporte-update'),
     path('rutas/<int:pk>/eliminar/', RutaTransporteDeleteView.as_view(), name='ruta-transporte-delete'),
     path('rutas/convenio/<int:convenio_id>/', rutas_transporte_convenio, name='rutas-convenio'),
+    path('rutas/camino/', search_route_path, name='rutas-camino'),
     path('api/convenio-agencia/<int:convenio_id>/', get_convenio_agencia_info, name='get_convenio_agencia_info'),
     path('calcular-cotizacion/', calculate_quotation, name='calcular_cotizacion'),
+    path('calcular-cotizacion/progresiva/', calculate_quotation_stream, name='calcular_cotizacion_progresiva'),
+    path('calcular-cotizaciones/', calculate_quotation_batch, name='calcular_cotizaciones'),
+    path('calcular-barrido/', calculate_quotation_sweep, name='calcular_barrido'),
+    path('buscar-ventanas/', search_quotation_windows, name='buscar_ventanas'),
+    path('cotizaciones/', quotation_history, name='cotizaciones_historial'),
+    path('cotizaciones/<int:cotizacion_id>/', quotation_detail, name='cotizacion_detalle'),
+    path('cotizaciones/<int:cotizacion_id>/recotizar/', reprice_quotation, name='cotizacion_recotizar'),
+    path('cotizaciones/<int:cotizacion_id>/ajustar/', adjust_quotation, name='cotizacion_ajustar'),
+    path('cotizaciones/vista-previa/<str:token>/ajustar/', adjust_quotation_preview, name='cotizacion_vista_previa_ajustar'),
+    path('trabajos/', submit_quotation_job, name='trabajos_encolar'),
+    path('trabajos/<int:trabajo_id>/', quotation_job_status, name='trabajo_estado'),
 ]
\ No newline at end of file
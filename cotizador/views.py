@@ -1,7 +1,7 @@
 from rest_framework import viewsets
 from django.shortcuts import render, redirect, get_object_or_404
 from django.db.models import Q
-from .models import Alimentacion, Destino, Entidad, Hospedaje, Seguro, Transporte, Paquete, ConvenioTransporte, RutaTransporte, ConvenioAgencia
+from .models import Alimentacion, Destino, Entidad, Hospedaje, Seguro, Transporte, Paquete, ConvenioTransporte, RutaTransporte, ConvenioAgencia, Municipio
 from .serializers import AlimentacionSerializer, DestinoSerializer, EntidadSerializer, HospedajeSerializer, SeguroSerializer, TransporteSerializer, PaqueteSerializer
 from .forms import HospedajeForm, TransporteForm, AlimentacionForm, SeguroForm, DestinoForm, EntidadRegistrationForm, PaqueteForm, EntidadUpdateForm, AlimentacionServiceForm
 from django.http import JsonResponse
@@ -16,7 +16,27 @@ from .crud_views import BaseCreateView, BaseUpdateView, BaseDeleteView
 from django.views.generic import DetailView
 
 
-class AlimentacionViewSet(viewsets.ModelViewSet):
+class FiltroUbicacionMixin:
+    """
+    Permite filtrar con ?pais_id=, ?departamento_id= y ?municipio_id= sobre las
+    referencias geográficas normalizadas en lugar de buscar por texto.
+    """
+    PARAMETROS_UBICACION = (
+        ('pais_id', 'pais_ref_id'),
+        ('departamento_id', 'departamento_ref_id'),
+        ('municipio_id', 'municipio_ref_id'),
+    )
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        for parametro, campo in self.PARAMETROS_UBICACION:
+            valor = self.request.query_params.get(parametro)
+            if valor and valor.isdigit():
+                queryset = queryset.filter(**{campo: int(valor)})
+        return queryset
+
+
+class AlimentacionViewSet(FiltroUbicacionMixin, viewsets.ModelViewSet):
     queryset = Alimentacion.objects.all()
     serializer_class = AlimentacionSerializer
 
@@ -32,7 +52,7 @@ class AlimentacionViewSet(viewsets.ModelViewSet):
     #     return queryset
 
 
-class DestinoViewSet(viewsets.ModelViewSet):
+class DestinoViewSet(FiltroUbicacionMixin, viewsets.ModelViewSet):
     queryset = Destino.objects.all()
     serializer_class = DestinoSerializer
 
@@ -40,7 +60,7 @@ class EntidadViewSet(viewsets.ModelViewSet):
     queryset = Entidad.objects.all()
     serializer_class = EntidadSerializer
 
-class HospedajeViewSet(viewsets.ModelViewSet):
+class HospedajeViewSet(FiltroUbicacionMixin, viewsets.ModelViewSet):
     queryset = Hospedaje.objects.all()
     serializer_class = HospedajeSerializer
 
@@ -50,7 +70,7 @@ class HospedajeViewSet(viewsets.ModelViewSet):
         # Estos campos pertenecen al proceso de cotización, no al registro de hospedaje
         return queryset
 
-class SeguroViewSet(viewsets.ModelViewSet):
+class SeguroViewSet(FiltroUbicacionMixin, viewsets.ModelViewSet):
     queryset = Seguro.objects.all()
     serializer_class = SeguroSerializer
 
@@ -65,7 +85,7 @@ class SeguroViewSet(viewsets.ModelViewSet):
         #     queryset = queryset.filter(fecha_inicio__lte=end_date)
         return queryset
 
-class TransporteViewSet(viewsets.ModelViewSet):
+class TransporteViewSet(FiltroUbicacionMixin, viewsets.ModelViewSet):
     queryset = Transporte.objects.all()
     serializer_class = TransporteSerializer
 
@@ -824,9 +844,9 @@ def home_view(request):
 def calculate_quotation(request):
     from .forms import QuotationForm
     from django.http import JsonResponse
-    from decimal import Decimal
-    from .models import Hospedaje, Transporte, Alimentacion, Seguro, Destino
-    from .api_integrations import get_flight_prices_amadeus, get_hotel_prices_amadeus
+    from .models import Destino
+    from .cola_trabajos import encolar, parametros_de
+    from .cotizaciones_guardadas import cotizar
 
     if request.method == 'POST':
         form = QuotationForm(request.POST, entidad_usuario=request.user.entidad if hasattr(request.user, 'entidad') else None)
@@ -836,22 +856,23 @@ def calculate_quotation(request):
             # Obtener datos del formulario
             origen = form.cleaned_data['origen']
             destino_id = form.cleaned_data['destino']
-            fecha_inicio = form.cleaned_data['fecha_inicio']
-            fecha_fin = form.cleaned_data['fecha_fin']
-            adultos = form.cleaned_data['adultos']
-            ninios = form.cleaned_data['ninios']
-            bebes = form.cleaned_data['bebes']
-            adultos_mayores = form.cleaned_data['adultos_mayores']
-            estudiantes = form.cleaned_data['estudiantes']
             medio_transporte = form.cleaned_data['medio_transporte']
-            porcentaje_utilidad = form.cleaned_data['porcentaje_utilidad']
 
             print(f"Destino ID recibido: {destino_id}")
             print(f"Origen: {origen}")
             print(f"Medio de transporte: {medio_transporte}")
 
-            # Calcular el total de pasajeros
-            total_pax = adultos + ninios + bebes + adultos_mayores + estudiantes
+            entidad = getattr(request.user, 'entidad', None)
+            # Solo con guardar la cotización queda en el historial; sin él es
+            # una vista previa (p. ej. el comando benchmark_cotizaciones) que
+            # se puede ajustar con su token en cotizaciones/vista-previa/<token>/ajustar/
+            guardar = request.POST.get('guardar') in ('1', 'true', 'on')
+
+            # Con en_segundo_plano la cotización se calcula en la cola de
+            # trabajos y se consulta después en trabajos/<id>/
+            if request.POST.get('en_segundo_plano') in ('1', 'true', 'on'):
+                trabajo = encolar('cotizacion', {**parametros_de(form.cleaned_data), 'guardar': guardar}, entidad)
+                return JsonResponse({'success': True, 'trabajo_id': trabajo.pk, 'estado': trabajo.estado}, status=202)
 
             # Obtener el destino
             try:
@@ -861,212 +882,16 @@ def calculate_quotation(request):
                 print(f"Destino con ID {destino_id} no encontrado en la base de datos")
                 return JsonResponse({'success': False, 'error': f'Destino con ID {destino_id} no encontrado'})
 
-            # Inicializar totales
-            total_hospedaje = Decimal('0.00')
-            total_transporte = Decimal('0.00')
-            total_alimentacion = Decimal('0.00')
-            total_seguro = Decimal('0.00')
-
-            # Calcular precios de hospedaje
-            # Primero verificar si hay hoteles con convenio
-            # Buscar hoteles en la ubicación exacta del destino o en el municipio/departamento
-            hospedajes_con_convenio = Hospedaje.objects.filter(
-                (
-                    models.Q(ubicacion__icontains=destino_obj.ubicacion or destino_obj.nombre) |
-                    models.Q(ubicacion__icontains=destino_obj.municipio or "") |
-                    models.Q(ubicacion__icontains=destino_obj.departamento or "")
-                ),
-                entidad__convenios_con_agencias__tipo_convenio='Hospedaje'
-            ).distinct()
-
-            if hospedajes_con_convenio.exists():
-                # Usar hoteles con convenio
-                for hospedaje in hospedajes_con_convenio:
-                    if hospedaje.disponible:
-                        precio_unitario = hospedaje.precio_por_persona()
-                        total_hospedaje += precio_unitario * Decimal(str(total_pax))
-            else:
-                # Si no hay convenio, usar API de Amadeus
-                try:
-                    hotel_result = get_hotel_prices_amadeus(destino_obj.nombre, fecha_inicio, fecha_fin, total_pax)
-                    if hotel_result['success']:
-                        total_hospedaje = hotel_result['price']
-                        print(f"Se encontró hotel vía API Amadeus: {total_hospedaje}")  # Mensaje de debug
-                    else:
-                        print(f"Error API Amadeus hoteles: {hotel_result['error']}")  # Mensaje de debug
-                        # Si la API falla, usar hoteles locales como respaldo
-                        hospedajes_locales = Hospedaje.objects.filter(ubicacion__icontains=destino_obj.nombre)
-                        for hospedaje in hospedajes_locales:
-                            if hospedaje.disponible:
-                                precio_unitario = hospedaje.precio_por_persona()
-                                total_hospedaje += precio_unitario * Decimal(str(total_pax))
-                except Exception as e:
-                    print(f"Excepción al llamar API Amadeus hoteles: {str(e)}")  # Mensaje de debug
-                    # En caso de error con la API, usar hoteles locales
-                    hospedajes_locales = Hospedaje.objects.filter(ubicacion__icontains=destino_obj.nombre)
-                    for hospedaje in hospedajes_locales:
-                        if hospedaje.disponible:
-                            precio_unitario = hospedaje.precio_por_persona()
-                            total_hospedaje += precio_unitario * Decimal(str(total_pax))
-
-            # Calcular precios de transporte
-            if 'aereo' in medio_transporte:
-                # Verificar si hay transporte aéreo con convenio
-                transportes_aereos_con_convenio = Transporte.objects.filter(
-                    tipoTransporte='aereo',
-                    entidad__convenios_con_agencias__tipo_convenio='Transporte'
-                ).distinct()
-
-                if transportes_aereos_con_convenio.exists():
-                    # Usar transportes con convenio
-                    for transporte in transportes_aereos_con_convenio:
-                        if transporte.disponible:
-                            precio_unitario = transporte.precio_por_persona()
-                            total_transporte += precio_unitario * Decimal(str(total_pax))
-                else:
-                    # Si no hay convenio, usar API de Amadeus para vuelos
-                    try:
-                        # Para usar la API de Amadeus, necesitamos códigos de aeropuerto
-                        # Por ahora, usamos una aproximación o valores predeterminados
-                        flight_result = get_flight_prices_amadeus(origen, destino_obj.nombre, fecha_inicio, fecha_fin, total_pax)
-                        if flight_result['success']:
-                            total_transporte = flight_result['price']
-                            print(f"Se encontró vuelo vía API Amadeus: {total_transporte}")  # Mensaje de debug
-                        else:
-                            print(f"Error API Amadeus vuelos: {flight_result['error']}")  # Mensaje de debug
-                    except Exception as e:
-                        print(f"Excepción al llamar API Amadeus vuelos: {str(e)}")  # Mensaje de debug
-                        # En caso de error con la API, usar transportes locales
-                        transportes_aereos = Transporte.objects.filter(
-                            models.Q(tipoTransporte='aereo') &
-                            (
-                                models.Q(entidad__ubicacion__icontains=destino_obj.ubicacion or "") |
-                                models.Q(entidad__ubicacion__icontains=destino_obj.municipio or "") |
-                                models.Q(entidad__ubicacion__icontains=destino_obj.departamento or "") |
-                                models.Q(entidad__ubicacion__icontains=destino_obj.nombre)
-                            )
-                        )
-                        for transporte in transportes_aereos:
-                            if transporte.disponible:
-                                precio_unitario = transporte.precio_por_persona()
-                                total_transporte += precio_unitario * Decimal(str(total_pax))
-
-            if 'terrestre' in medio_transporte:
-                transportes_terrestres = Transporte.objects.filter(
-                    models.Q(tipoTransporte='terrestre') &
-                    (
-                        models.Q(entidad__ubicacion__icontains=destino_obj.ubicacion or "") |
-                        models.Q(entidad__ubicacion__icontains=destino_obj.municipio or "") |
-                        models.Q(entidad__ubicacion__icontains=destino_obj.departamento or "") |
-                        models.Q(entidad__ubicacion__icontains=destino_obj.nombre)
-                    )
-                )
-                for transporte in transportes_terrestres:
-                    if transporte.disponible:
-                        precio_unitario = transporte.precio_por_persona()
-                        total_transporte += precio_unitario * Decimal(str(total_pax))
-
-            if 'maritimo' in medio_transporte:
-                transportes_maritimos = Transporte.objects.filter(
-                    models.Q(tipoTransporte='maritimo') &
-                    (
-                        models.Q(entidad__ubicacion__icontains=destino_obj.ubicacion or "") |
-                        models.Q(entidad__ubicacion__icontains=destino_obj.municipio or "") |
-                        models.Q(entidad__ubicacion__icontains=destino_obj.departamento or "") |
-                        models.Q(entidad__ubicacion__icontains=destino_obj.nombre)
-                    )
-                )
-                for transporte in transportes_maritimos:
-                    if transporte.disponible:
-                        precio_unitario = transporte.precio_por_persona()
-                        total_transporte += precio_unitario * Decimal(str(total_pax))
-
-            # Calcular precios de alimentación
-            servicios_alimentacion = Alimentacion.objects.filter(
-                models.Q(entidad__ubicacion__icontains=destino_obj.ubicacion or "") |
-                models.Q(entidad__ubicacion__icontains=destino_obj.municipio or "") |
-                models.Q(entidad__ubicacion__icontains=destino_obj.departamento or "") |
-                models.Q(entidad__ubicacion__icontains=destino_obj.nombre)
-            )
-            for alimento in servicios_alimentacion:
-                if alimento.disponible:
-                    # Usar precio por persona según la temporada
-                    precio_unitario = alimento.precio_por_persona()  # Por defecto usar precio base
-                    total_alimentacion += precio_unitario * Decimal(str(total_pax))
-
-            # Calcular precios de seguro
-            seguros = Seguro.objects.filter(
-                models.Q(entidad__ubicacion__icontains=destino_obj.ubicacion or "") |
-                models.Q(entidad__ubicacion__icontains=destino_obj.municipio or "") |
-                models.Q(entidad__ubicacion__icontains=destino_obj.departamento or "") |
-                models.Q(entidad__ubicacion__icontains=destino_obj.nombre)
-            )
-            for seguro in seguros:
-                if seguro.disponible:
-                    precio_unitario = seguro.precio_por_persona()
-                    total_seguro += precio_unitario * Decimal(str(total_pax))
-
-            # Calcular subtotal
-            subtotal = total_hospedaje + total_transporte + total_alimentacion + total_seguro
-
-            # Calcular IVA - hospedaje tiene 10%, otros servicios 19%
-            iva_hospedaje = total_hospedaje * Decimal('0.10')
-            iva_otros = (total_transporte + total_alimentacion + total_seguro) * Decimal('0.19')
-            total_iva = iva_hospedaje + iva_otros
-
-            # Calcular total con IVA
-            total_con_iva = subtotal + total_iva
-
-            # Calcular utilidad
-            utilidad = total_con_iva * (porcentaje_utilidad / Decimal('100.0'))
-
-            # Calcular total final
-            total_final = total_con_iva + utilidad
-
-            # Calcular precios por pax
-            hospedaje_por_pax = total_hospedaje / Decimal(str(total_pax)) if total_pax > 0 else Decimal('0.00')
-            transporte_por_pax = total_transporte / Decimal(str(total_pax)) if total_pax > 0 else Decimal('0.00')
-            alimentacion_por_pax = total_alimentacion / Decimal(str(total_pax)) if total_pax > 0 else Decimal('0.00')
-            seguro_por_pax = total_seguro / Decimal(str(total_pax)) if total_pax > 0 else Decimal('0.00')
-            total_por_pax = total_final / Decimal(str(total_pax)) if total_pax > 0 else Decimal('0.00')
+            # Costos por componente (desde la caché si ya se calcularon); con
+            # guardar la cotización se guarda para volver a abrirla sin
+            # recalcular (ver cotizador.cotizaciones_guardadas)
+            cotizacion = cotizar(form.cleaned_data, destino_obj, entidad, guardar=guardar)
 
             return JsonResponse({
                 'success': True,
-                'detalle': {
-                    'origen': origen,
-                    'destino': destino_obj.nombre,
-                    'fecha_inicio': fecha_inicio.strftime('%Y-%m-%d'),
-                    'fecha_fin': fecha_fin.strftime('%Y-%m-%d'),
-                    'total_pax': total_pax,
-                    'desglose_pax': {
-                        'adultos': adultos,
-                        'ninios': ninios,
-                        'bebes': bebes,
-                        'adultos_mayores': adultos_mayores,
-                        'estudiantes': estudiantes,
-                    },
-                    'precios_por_pax': {
-                        'hospedaje': float(hospedaje_por_pax),
-                        'transporte': float(transporte_por_pax),
-                        'alimentacion': float(alimentacion_por_pax),
-                        'seguro': float(seguro_por_pax),
-                    },
-                    'totales': {
-                        'hospedaje': float(total_hospedaje),
-                        'transporte': float(total_transporte),
-                        'alimentacion': float(total_alimentacion),
-                        'seguro': float(total_seguro),
-                        'subtotal': float(subtotal),
-                        'iva': float(total_iva),
-                        'utilidad': float(utilidad),
-                        'total': float(total_final),
-                    },
-                    'porcentajes': {
-                        'iva_hospedaje': 10,
-                        'iva_otros': 19,
-                        'utilidad': float(porcentaje_utilidad),
-                    }
-                }
+                'cotizacion_id': cotizacion.pk,
+                'vista_previa': getattr(cotizacion, 'vista_previa', None),
+                'detalle': cotizacion.detalle,
             })
 
         else:
@@ -1074,6 +899,322 @@ def calculate_quotation(request):
 
     return JsonResponse({'success': False, 'error': 'Método no permitido'})
 
+@login_required
+def calculate_quotation_stream(request):
+    """
+    Cotización progresiva: recibe los mismos campos que calculate_quotation
+    y responde con Server-Sent Events, un evento por componente en cuanto
+    tiene precio y al final los totales (ver cotizador.cotizacion_progresiva)
+    """
+    from django.http import StreamingHttpResponse
+    from .forms import QuotationForm
+    from .models import Destino
+    from .cotizacion_progresiva import eventos_cotizacion, flujo_sse
+
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'})
+
+    entidad = getattr(request.user, 'entidad', None)
+    form = QuotationForm(request.POST, entidad_usuario=entidad)
+    # Como en calculate_quotation, sin guardar es una vista previa
+    guardar = request.POST.get('guardar') in ('1', 'true', 'on')
+    if not form.is_valid():
+        eventos = [('error', {'errors': form.errors})]
+    else:
+        destino_obj = Destino.objects.filter(id=form.cleaned_data['destino']).first()
+        if destino_obj is None:
+            eventos = [('error', {'error': f'Destino con ID {form.cleaned_data["destino"]} no encontrado'})]
+        else:
+            eventos = eventos_cotizacion(form.cleaned_data, destino_obj, entidad, guardar=guardar)
+
+    respuesta = StreamingHttpResponse(flujo_sse(eventos), content_type='text/event-stream')
+    # Que ni el navegador ni un proxy (nginx) guarden los eventos antes de entregarlos
+    respuesta['Cache-Control'] = 'no-cache'
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta
+
+@login_required
+def calculate_quotation_batch(request):
+    """
+    Cotiza varios escenarios en una petición. Recibe un JSON
+    {"escenarios": [{campos del QuotationForm}, ...]} y retorna los
+    resultados en el mismo orden (ver cotizador.cotizacion_lote).
+    """
+    from .cotizacion_lote import MAXIMO_ESCENARIOS_DEFECTO, cotizar_lote
+
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'})
+
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'El cuerpo de la petición no es un JSON válido'}, status=400)
+
+    escenarios = data.get('escenarios') if isinstance(data, dict) else None
+    if not isinstance(escenarios, list) or not escenarios:
+        return JsonResponse({'success': False, 'error': 'Se requiere una lista de escenarios'}, status=400)
+    maximo = getattr(settings, 'COTIZACION_LOTE_MAXIMO', MAXIMO_ESCENARIOS_DEFECTO)
+    if len(escenarios) > maximo:
+        return JsonResponse({'success': False, 'error': f'Se permiten como máximo {maximo} escenarios por lote'}, status=400)
+
+    resultados, estadisticas = cotizar_lote(escenarios, getattr(request.user, 'entidad', None))
+    return JsonResponse({'success': True, 'resultados': resultados, 'estadisticas': estadisticas})
+
+@login_required
+def calculate_quotation_sweep(request):
+    """
+    Matriz de precios de un destino para un rango de pasajeros y varias
+    temporadas (ver cotizador.cotizacion_barrido)
+    """
+    from .forms import BarridoCotizacionForm
+    from .models import Destino
+    from .cotizacion_barrido import barrido_cotizacion
+
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'})
+
+    form = BarridoCotizacionForm(request.POST, entidad_usuario=getattr(request.user, 'entidad', None))
+    if not form.is_valid():
+        return JsonResponse({'success': False, 'errors': form.errors})
+
+    datos = form.cleaned_data
+    try:
+        destino_obj = Destino.objects.get(id=datos['destino'])
+    except Destino.DoesNotExist:
+        return JsonResponse({'success': False, 'error': f'Destino con ID {datos["destino"]} no encontrado'})
+
+    barrido = barrido_cotizacion(
+        destino_obj, datos['pax'], datos['temporadas'], datos['fecha_inicio'], datos['fecha_fin'],
+        datos['medio_transporte'], datos['porcentaje_utilidad'], origen=datos['origen'],
+    )
+    return JsonResponse({'success': True, 'destino': destino_obj.nombre, 'barrido': barrido})
+
+@login_required
+def search_quotation_windows(request):
+    """
+    Estadías más baratas de un número de noches dentro de un rango de fechas
+    (ver cotizador.busqueda_ventanas)
+    """
+    from .forms import VentanasCotizacionForm
+    from .models import Destino
+    from .busqueda_ventanas import buscar_ventanas
+
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'})
+
+    entidad = getattr(request.user, 'entidad', None)
+    form = VentanasCotizacionForm(request.POST, entidad_usuario=entidad)
+    if not form.is_valid():
+        return JsonResponse({'success': False, 'errors': form.errors})
+
+    datos = form.cleaned_data
+    try:
+        destino_obj = Destino.objects.get(id=datos['destino'])
+    except Destino.DoesNotExist:
+        return JsonResponse({'success': False, 'error': f'Destino con ID {datos["destino"]} no encontrado'})
+
+    busqueda = buscar_ventanas(datos, destino_obj, entidad.pk if entidad else None, datos['noches'],
+                               mejores=datos.get('mejores'))
+    return JsonResponse({'success': True, **busqueda})
+
+@login_required
+def search_route_path(request):
+    """
+    Camino más barato (o de menos tramos) entre dos ciudades con las rutas
+    de la agencia del usuario (ver cotizador.grafo_rutas)
+    """
+    from .forms import CaminoRutasForm
+    from .grafo_rutas import buscar_camino
+
+    form = CaminoRutasForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'success': False, 'errors': form.errors})
+
+    datos = form.cleaned_data
+    entidad = getattr(request.user, 'entidad', None)
+    camino = buscar_camino(entidad.pk if entidad else None, datos['origen'], datos['destino'], datos['fecha'],
+                           datos['pax'], datos['criterio'] or 'precio', datos['tipos'] or None)
+    if camino is None:
+        return JsonResponse({'success': False, 'error': 'No hay rutas entre las ciudades indicadas'})
+    return JsonResponse({'success': True, **camino})
+
+@login_required
+def nearby_suppliers(request, destino_id):
+    """Proveedores disponibles de una categoría a menos de un radio del destino (ver cotizador.geografia)"""
+    from .forms import ProveedoresCercanosForm
+    from .geografia import proveedores_cercanos
+    from .models import Destino
+
+    form = ProveedoresCercanosForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'success': False, 'errors': form.errors})
+    destino = Destino.objects.filter(pk=destino_id).first()
+    if destino is None:
+        return JsonResponse({'success': False, 'error': f'Destino con ID {destino_id} no encontrado'})
+    if destino.latitud is None:
+        return JsonResponse({'success': False, 'error': 'El destino no tiene coordenadas'})
+
+    categoria = form.cleaned_data['categoria'] or 'hospedaje'
+    proveedores = proveedores_cercanos(destino, categoria, form.cleaned_data['radio_km'])
+    return JsonResponse({
+        'success': True,
+        'categoria': categoria,
+        'origen': {'latitud': destino.latitud, 'longitud': destino.longitud},
+        'proveedores': proveedores,
+    })
+
+@login_required
+def quotation_history(request):
+    """Historial paginado de cotizaciones guardadas de la entidad, de la más reciente a la más antigua"""
+    from django.core.paginator import Paginator
+    from .models import Cotizacion
+    from .cotizaciones_guardadas import resumen
+
+    entidad = getattr(request.user, 'entidad', None)
+    cotizaciones = Cotizacion.objects.filter(entidad=entidad).select_related('destino') if entidad else Cotizacion.objects.none()
+    try:
+        por_pagina = min(max(int(request.GET.get('por_pagina', 20)), 1), 100)
+    except ValueError:
+        por_pagina = 20
+    pagina = Paginator(cotizaciones.defer('datos', 'costos', 'detalle'), por_pagina).get_page(request.GET.get('pagina'))
+
+    return JsonResponse({
+        'success': True,
+        'cotizaciones': [resumen(cotizacion) for cotizacion in pagina],
+        'pagina': pagina.number,
+        'paginas': pagina.paginator.num_pages,
+        'total': pagina.paginator.count,
+    })
+
+def _cotizacion_de_usuario(request, cotizacion_id):
+    from .models import Cotizacion
+
+    entidad = getattr(request.user, 'entidad', None)
+    if entidad is None:
+        return None
+    return Cotizacion.objects.filter(pk=cotizacion_id, entidad=entidad).select_related('destino').first()
+
+@login_required
+def quotation_detail(request, cotizacion_id):
+    """Cotización guardada, con el detalle tal como se calculó"""
+    from .cotizaciones_guardadas import resumen
+
+    cotizacion = _cotizacion_de_usuario(request, cotizacion_id)
+    if cotizacion is None:
+        return JsonResponse({'success': False, 'error': 'Cotización no encontrada'}, status=404)
+    return JsonResponse({'success': True, 'cotizacion': resumen(cotizacion), 'detalle': cotizacion.detalle})
+
+@login_required
+def reprice_quotation(request, cotizacion_id):
+    """Vuelve a cotizar una cotización guardada, recalculando solo los componentes cuyos precios cambiaron"""
+    from .cotizaciones_guardadas import recotizar, resumen
+
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'})
+    cotizacion = _cotizacion_de_usuario(request, cotizacion_id)
+    if cotizacion is None:
+        return JsonResponse({'success': False, 'error': 'Cotización no encontrada'}, status=404)
+    if cotizacion.destino is None:
+        return JsonResponse({'success': False, 'error': 'El destino de la cotización ya no existe'})
+
+    cambios = recotizar(cotizacion)
+    return JsonResponse({'success': True, 'cotizacion': resumen(cotizacion), 'detalle': cotizacion.detalle, **cambios})
+
+def _respuesta_ajuste(request, cotizacion):
+    from .cotizacion_incremental import ajustar_cotizacion
+    from .cotizaciones_guardadas import resumen
+
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'El cuerpo de la petición no es un JSON válido'}, status=400)
+    cambios = data.get('cambios') if isinstance(data, dict) else None
+    if not isinstance(cambios, dict):
+        return JsonResponse({'success': False, 'error': 'Se requiere un objeto de cambios'}, status=400)
+
+    # Si el destino ya no existe, el formulario lo rechaza a menos que se cambie
+    ajuste = ajustar_cotizacion(cotizacion, cambios, getattr(request.user, 'entidad', None),
+                                guardar=bool(data.get('guardar')))
+    if 'errors' in ajuste:
+        return JsonResponse({'success': False, 'errors': ajuste['errors']})
+    respuesta = {'success': True, 'etapas': ajuste['etapas'], 'detalle': ajuste['detalle']}
+    if 'cotizacion' in ajuste:
+        respuesta['cotizacion'] = resumen(ajuste['cotizacion'])
+    return JsonResponse(respuesta)
+
+@login_required
+def adjust_quotation(request, cotizacion_id):
+    """
+    Ajusta una cotización guardada con algunos campos cambiados. Recibe un
+    JSON {"cambios": {campos del QuotationForm}, "guardar": false} y
+    recalcula solo las etapas afectadas (ver cotizador.cotizacion_incremental)
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'})
+    cotizacion = _cotizacion_de_usuario(request, cotizacion_id)
+    if cotizacion is None:
+        return JsonResponse({'success': False, 'error': 'Cotización no encontrada'}, status=404)
+    return _respuesta_ajuste(request, cotizacion)
+
+@login_required
+def adjust_quotation_preview(request, token):
+    """
+    Ajusta una vista previa (cotización calculada sin guardar) con su token,
+    igual que adjust_quotation; con "guardar" el ajuste queda en el historial
+    """
+    from .cotizaciones_guardadas import buscar_vista_previa
+
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'})
+    cotizacion = buscar_vista_previa(token, getattr(request.user, 'entidad', None))
+    if cotizacion is None:
+        return JsonResponse({'success': False, 'error': 'Vista previa no encontrada o vencida'}, status=404)
+    return _respuesta_ajuste(request, cotizacion)
+
+@login_required
+def submit_quotation_job(request):
+    """
+    Encola un trabajo de cotización. Recibe un JSON {"tipo": "cotizacion" |
+    "lote" | "barrido" | "ventanas", "parametros": {...}} con los mismos
+    campos que la vista síncrona y retorna el id del trabajo para
+    consultarlo en trabajos/<id>/ (ver cotizador.cola_trabajos).
+    """
+    from .cola_trabajos import EJECUTORES, encolar
+    from .cotizacion_lote import MAXIMO_ESCENARIOS_DEFECTO
+
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'})
+
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'El cuerpo de la petición no es un JSON válido'}, status=400)
+
+    tipo = data.get('tipo') if isinstance(data, dict) else None
+    parametros = data.get('parametros') if isinstance(data, dict) else None
+    if tipo not in EJECUTORES:
+        return JsonResponse({'success': False, 'error': f'Tipo de trabajo no válido: {tipo}'}, status=400)
+    if not isinstance(parametros, dict):
+        return JsonResponse({'success': False, 'error': 'Se requiere un objeto de parámetros'}, status=400)
+    maximo = getattr(settings, 'COTIZACION_LOTE_MAXIMO', MAXIMO_ESCENARIOS_DEFECTO)
+    if tipo == 'lote' and len(parametros.get('escenarios') or []) > maximo:
+        return JsonResponse({'success': False, 'error': f'Se permiten como máximo {maximo} escenarios por lote'}, status=400)
+
+    trabajo = encolar(tipo, parametros, getattr(request.user, 'entidad', None))
+    return JsonResponse({'success': True, 'trabajo_id': trabajo.pk, 'estado': trabajo.estado}, status=202)
+
+@login_required
+def quotation_job_status(request, trabajo_id):
+    """Estado de un trabajo de cotización y, si ya terminó, su resultado"""
+    from .models import TrabajoCotizacion
+    from .cola_trabajos import estado_trabajo
+
+    entidad = getattr(request.user, 'entidad', None)
+    trabajo = TrabajoCotizacion.objects.filter(pk=trabajo_id, entidad=entidad).first() if entidad else None
+    if trabajo is None:
+        return JsonResponse({'success': False, 'error': 'Trabajo no encontrado'}, status=404)
+    return JsonResponse({'success': True, **estado_trabajo(trabajo)})
+
 @login_required
 def dashboard_view(request):
     entidad_nombre = None
@@ -1213,6 +1354,14 @@ def search_destinations_and_packages(request):
             if query:
                 destinos = destinos.filter(nombre__icontains=query)
 
+            # Filtros opcionales por ubicación usando las referencias normalizadas
+            municipio_id = request.GET.get('municipio_id', '')
+            departamento_id = request.GET.get('departamento_id', '')
+            if municipio_id.isdigit():
+                destinos = destinos.filter(municipio_ref_id=int(municipio_id))
+            elif departamento_id.isdigit():
+                destinos = destinos.filter(departamento_ref_id=int(departamento_id))
+
             # Filtrar paquetes que contengan la búsqueda (por nombre)
             paquetes = Paquete.objects.filter(entidad=entidad)
             if query:
@@ -1311,6 +1460,31 @@ def autocomplete_destinations_and_packages(request):
             'message': 'Usuario no autenticado o consulta vacía'
         })
 
+def autocomplete_municipios(request):
+    """Vista para autocompletar municipios de la tabla de referencia"""
+    from .ubicaciones import normalizar_texto
+
+    query = normalizar_texto(request.GET.get('q', ''))
+    municipios = Municipio.objects.select_related('departamento')
+    departamento_id = request.GET.get('departamento_id', '')
+    if departamento_id.isdigit():
+        municipios = municipios.filter(departamento_id=int(departamento_id))
+    if query:
+        # La clave ya está normalizada, así que basta un prefijo sobre la columna indexada
+        municipios = municipios.filter(clave__startswith=query)
+
+    return JsonResponse({
+        'municipios': [
+            {
+                'id': municipio.id,
+                'nombre': municipio.nombre,
+                'departamento_id': municipio.departamento_id,
+                'departamento': municipio.departamento.nombre,
+            }
+            for municipio in municipios[:20]
+        ]
+    })
+
 def autocomplete_transportes(request):
     """Vista para autocompletar transportes"""
     query = request.GET.get('q', '').strip()
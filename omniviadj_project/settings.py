@@ -80,6 +80,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Segundos que se espera un bloqueo de escritura (la cola de
+        # trabajos escribe desde varios hilos)
+        'OPTIONS': {'timeout': 20},
     }
 }
 
@@ -137,3 +140,77 @@ LOGOUT_REDIRECT_URL = 'home'
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Caché de cotizaciones (cotizador.cache_cotizaciones)
+# Con varios procesos de servidor se necesita una caché compartida (Redis,
+# Memcached o base de datos) para que la invalidación llegue a todos.
+# TTL en segundos; 0 desactiva la caché para ese tipo de cotización.
+COTIZACION_CACHE_TTL = 60 * 60
+COTIZACION_CACHE_TTL_AMADEUS = 15 * 60
+# Cotizaciones con precios locales porque Amadeus falló o no respondió a tiempo
+COTIZACION_CACHE_TTL_RESPALDO = 60
+
+# Consultas a Amadeus durante una cotización (cotizador.cotizacion)
+# Plazo total en segundos para las consultas de hoteles y vuelos, que se hacen
+# en paralelo; pasado el plazo se usan precios locales.
+COTIZACION_PLAZO_AMADEUS = 8
+AMADEUS_MAX_HILOS = 8
+
+# Caché de respuestas de Amadeus (cotizador.cache_amadeus)
+# TTL en segundos por endpoint; una respuesta vencida se sigue entregando
+# durante AMADEUS_CACHE_VENTANA_OBSOLETA segundos mientras se renueva.
+AMADEUS_CACHE_TTL = {
+    'vuelos': 15 * 60,
+    'hoteles': 30 * 60,
+}
+AMADEUS_CACHE_VENTANA_OBSOLETA = 60 * 60
+AMADEUS_CACHE_MAX_ENTRADAS = 5000
+AMADEUS_CACHE_MAX_MEMORIA = 256
+
+# Asignación de flota terrestre y marítima (cotizador.asignacion_flota)
+# 'auto' usa el modo exacto mientras la programación dinámica no supere
+# FLOTA_LIMITE_EXACTO operaciones y, si no, el voraz; también se puede
+# fijar 'exacto' o 'voraz'.
+FLOTA_MODO = 'auto'
+FLOTA_LIMITE_EXACTO = 50000
+
+# Asignación de habitaciones (cotizador.asignacion_hospedaje)
+# Número de alternativas de un solo hospedaje que se retornan en la cotización
+HOSPEDAJE_ALTERNATIVAS = 3
+
+# Opciones por categoría en la respuesta de la cotización (cotizador.opciones)
+COTIZACION_OPCIONES = 3
+
+# Cotización por lotes (cotizador.cotizacion_lote)
+COTIZACION_LOTE_MAXIMO = 50
+
+# Barrido de pasajeros y temporadas (cotizador.cotizacion_barrido)
+COTIZACION_BARRIDO_MAXIMO = 200
+
+# Búsqueda de la ventana de viaje más barata (cotizador.busqueda_ventanas)
+VENTANAS_MEJORES = 5
+VENTANAS_PRESUPUESTO = 10  # segundos por búsqueda
+VENTANAS_LOTE = 4
+VENTANAS_FRACCION_CONSULTAS = 0.5  # consultas a Amadeus por fecha de salida
+VENTANAS_HOLGURA = 0.10
+VENTANAS_VECINDAD = 3  # días
+VENTANAS_MAXIMO = 366
+
+# Cola de trabajos de cotización (cotizador.cola_trabajos, comando procesar_trabajos)
+TRABAJOS_HILOS = 2
+TRABAJOS_INTERVALO = 1  # segundos entre revisiones de la cola vacía
+TRABAJOS_MAXIMO_INTENTOS = 3
+TRABAJOS_ESPERA_BASE = 5  # segundos antes del primer reintento; se duplica en cada uno
+TRABAJOS_RESERVA = 300  # segundos que un trabajador reserva un trabajo
+
+# Índice de rutas de transporte por origen y destino (cotizador.indice_rutas)
+RUTAS_INDICES_MAXIMO = 256  # índices (agencia, origen) en memoria por proceso
+
+# Grafo de rutas de varios tramos (cotizador.grafo_rutas)
+GRAFO_RUTAS_CAMBIOS_MAXIMO = 200  # rutas cambiadas que se aplican a la copia en memoria antes de reconstruirla
+
+# Búsqueda de proveedores por radio alrededor de un destino (cotizador.geografia)
+GEO_RADIO_MAXIMO_KM = 200
+
+# Matriz de distancias entre municipios para el precio por km (comando construir_matriz_distancias)
+DISTANCIAS_MATRIZ_RUTA = BASE_DIR / 'data' / 'matriz_distancias.bin'
@@ -18,7 +18,7 @@ destinos_data_json = """
 [
   {
     "nombre": "PUERTO NARIÑO",
-    "ubicacion": "3.1622, -70.3697",
+    "ubicacion": "-3.7703, -70.3831",
     "descripcion": "Pueblo sostenible amazónico sin vehículos, rodeado de selva virgen con delfines rosados, comunidades indígenas y biodiversidad única del Amazonas.",
     "categoria": "Turismo ecológico",
     "categoria_otro": null,
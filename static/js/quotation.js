@@ -118,12 +118,23 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         });
 
+        // La cotización calculada desde el formulario queda en el historial
+        formData.append('guardar', '1');
+
         // Agregar CSRF token si no existe
         const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]');
         if (csrfToken) {
             formData.append('csrfmiddlewaretoken', csrfToken.value);
         }
 
+        // Se usa la cotización progresiva (Server-Sent Events) para mostrar
+        // cada componente en cuanto tiene precio; sin soporte de streams se
+        // espera la respuesta completa
+        if (window.ReadableStream && window.TextDecoder) {
+            calculateQuotationStream(formData);
+            return;
+        }
+
         // Enviar solicitud al servidor
         fetch('/api/calcular-cotizacion/', {
             method: 'POST',
@@ -135,75 +146,177 @@ document.addEventListener('DOMContentLoaded', function() {
         .then(response => response.json())
         .then(data => {
             if (data.success) {
-                const detalle = data.detalle;
-
-                // Mostrar resultados
-                resultOrigen.textContent = detalle.origen;
-                resultDestination.textContent = detalle.destino;
-                resultFechaInicio.textContent = detalle.fecha_inicio;
-                resultFechaFin.textContent = detalle.fecha_fin;
-                resultTotalPax.textContent = detalle.total_pax;
-
-                // Mostrar desglose de pasajeros
-                resultPaxDetails.textContent = `Adultos: ${detalle.desglose_pax.adultos}, Niños: ${detalle.desglose_pax.ninios}, Bebés: ${detalle.desglose_pax.bebes}, Adultos Mayores: ${detalle.desglose_pax.adultos_mayores}, Estudiantes: ${detalle.desglose_pax.estudiantes}`;
-
-                resultUtilidad.textContent = detalle.porcentajes.utilidad;
-
-                // Mostrar precios por pax
-                priceHospedajePax.textContent = detalle.precios_por_pax.hospedaje.toFixed(2);
-                priceTransportePax.textContent = detalle.precios_por_pax.transporte.toFixed(2);
-                priceAlimentacionPax.textContent = detalle.precios_por_pax.alimentacion.toFixed(2);
-                priceSeguroPax.textContent = detalle.precios_por_pax.seguro.toFixed(2);
-
-                // Mostrar totales
-                totalHospedaje.textContent = detalle.totales.hospedaje.toFixed(2);
-                totalTransporte.textContent = detalle.totales.transporte.toFixed(2);
-                totalAlimentacion.textContent = detalle.totales.alimentacion.toFixed(2);
-                totalSeguro.textContent = detalle.totales.seguro.toFixed(2);
-
-                // Mostrar impuestos y utilidad
-                ivaHospedaje.textContent = detalle.totales.iva_hospedaje.toFixed(2);
-                ivaOtros.textContent = (detalle.totales.iva - detalle.totales.iva_hospedaje).toFixed(2); // IVA otros servicios
-                subtotalConIva.textContent = detalle.totales.subtotal_con_iva.toFixed(2);
-                utilidadPorcentaje.textContent = detalle.porcentajes.utilidad;
-                montoUtilidad.textContent = detalle.totales.utilidad.toFixed(2);
-
-                // Mostrar total final y precio por pax
-                totalFinal.textContent = detalle.totales.total.toFixed(2);
-                precioPorPax.textContent = detalle.precios_por_pax.total.toFixed(2);
-
-                // Mostrar resultados
-                quoteResult.style.display = 'block';
+                mostrarDetalle(data.detalle);
             } else {
-                // Mostrar mensaje más detallado
-                let errorMessage = 'Error en la cotización: ';
-
-                if (data.error) {
-                    errorMessage += data.error;
-                } else if (data.errors) {
-                    // Si hay errores de validación específicos
-                    if (data.errors.destino) {
-                        errorMessage += 'Por favor, seleccione un destino válido.';
-                    } else if (data.errors.origen) {
-                        errorMessage += 'Por favor, ingrese un origen válido.';
-                    } else {
-                        errorMessage += 'Datos inválidos.';
-                    }
+                mostrarError(data);
+            }
+        })
+        .catch(error => {
+            console.error('Error:', error);
+            alert('Hubo un error al calcular la cotización');
+        });
+    }
+
+    // Elementos de precio por pax y total de cada componente
+    const componentesPrecio = {
+        hospedaje: [priceHospedajePax, totalHospedaje],
+        transporte: [priceTransportePax, totalTransporte],
+        alimentacion: [priceAlimentacionPax, totalAlimentacion],
+        seguro: [priceSeguroPax, totalSeguro],
+    };
 
-                    console.log('Errores de validación:', data.errors);
-                } else {
-                    errorMessage += 'Datos inválidos.';
+    // Muestra un componente recibido de la cotización progresiva; el
+    // transporte es la suma del aéreo, el terrestre y el marítimo
+    function mostrarComponente(componente, componentes) {
+        componentes[componente.componente] = componente;
+        const categoria = componente.componente.startsWith('transporte') ? 'transporte' : componente.componente;
+        const partes = Object.values(componentes).filter(c => (c.componente.startsWith('transporte') ? 'transporte' : c.componente) === categoria);
+        const costo = partes.reduce((suma, c) => suma + c.costo, 0);
+        const porPax = partes.reduce((suma, c) => suma + c.por_pax, 0);
+        const provisional = partes.some(c => c.provisional);
+
+        const [elementoPax, elementoTotal] = componentesPrecio[categoria];
+        elementoPax.textContent = porPax.toFixed(2);
+        elementoTotal.textContent = costo.toFixed(2);
+        // Los precios provisionales (esperando a Amadeus) se muestran atenuados
+        elementoPax.style.opacity = provisional ? 0.5 : 1;
+        elementoTotal.style.opacity = provisional ? 0.5 : 1;
+        quoteResult.style.display = 'block';
+    }
+
+    // Cotización progresiva: lee los eventos a medida que llegan
+    function calculateQuotationStream(formData) {
+        const componentes = {};
+        let pendiente = '';
+
+        function procesarEvento(texto) {
+            let tipo = 'message';
+            let datos = '';
+            texto.split('\n').forEach(linea => {
+                if (linea.startsWith('event:')) {
+                    tipo = linea.slice(6).trim();
+                } else if (linea.startsWith('data:')) {
+                    datos += linea.slice(5).trim();
                 }
+            });
+            if (!datos) {
+                return;
+            }
+            const data = JSON.parse(datos);
+            if (tipo === 'componente') {
+                mostrarComponente(data, componentes);
+            } else if (tipo === 'totales') {
+                [priceHospedajePax, priceTransportePax, priceAlimentacionPax, priceSeguroPax,
+                 totalHospedaje, totalTransporte, totalAlimentacion, totalSeguro].forEach(elemento => {
+                    elemento.style.opacity = 1;
+                });
+                mostrarDetalle(data.detalle);
+            } else if (tipo === 'error') {
+                mostrarError(data);
+            }
+        }
 
-                alert(errorMessage);
+        fetch('/api/calcular-cotizacion/progresiva/', {
+            method: 'POST',
+            body: formData,
+            headers: {
+                'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value,
             }
         })
+        .then(response => {
+            const lector = response.body.getReader();
+            const decodificador = new TextDecoder();
+
+            function leer() {
+                return lector.read().then(({ done, value }) => {
+                    if (done) {
+                        if (pendiente.trim()) {
+                            procesarEvento(pendiente);
+                        }
+                        return;
+                    }
+                    // Los eventos se separan con una línea en blanco
+                    pendiente += decodificador.decode(value, { stream: true });
+                    const eventos = pendiente.split('\n\n');
+                    pendiente = eventos.pop();
+                    eventos.forEach(procesarEvento);
+                    return leer();
+                });
+            }
+            return leer();
+        })
         .catch(error => {
             console.error('Error:', error);
             alert('Hubo un error al calcular la cotización');
         });
     }
 
+    // Muestra el detalle completo de la cotización
+    function mostrarDetalle(detalle) {
+        // Mostrar resultados
+        resultOrigen.textContent = detalle.origen;
+        resultDestination.textContent = detalle.destino;
+        resultFechaInicio.textContent = detalle.fecha_inicio;
+        resultFechaFin.textContent = detalle.fecha_fin;
+        resultTotalPax.textContent = detalle.total_pax;
+
+        // Mostrar desglose de pasajeros
+        resultPaxDetails.textContent = `Adultos: ${detalle.desglose_pax.adultos}, Niños: ${detalle.desglose_pax.ninios}, Bebés: ${detalle.desglose_pax.bebes}, Adultos Mayores: ${detalle.desglose_pax.adultos_mayores}, Estudiantes: ${detalle.desglose_pax.estudiantes}`;
+
+        resultUtilidad.textContent = detalle.porcentajes.utilidad;
+
+        // Mostrar precios por pax
+        priceHospedajePax.textContent = detalle.precios_por_pax.hospedaje.toFixed(2);
+        priceTransportePax.textContent = detalle.precios_por_pax.transporte.toFixed(2);
+        priceAlimentacionPax.textContent = detalle.precios_por_pax.alimentacion.toFixed(2);
+        priceSeguroPax.textContent = detalle.precios_por_pax.seguro.toFixed(2);
+
+        // Mostrar totales
+        totalHospedaje.textContent = detalle.totales.hospedaje.toFixed(2);
+        totalTransporte.textContent = detalle.totales.transporte.toFixed(2);
+        totalAlimentacion.textContent = detalle.totales.alimentacion.toFixed(2);
+        totalSeguro.textContent = detalle.totales.seguro.toFixed(2);
+
+        // Mostrar impuestos y utilidad
+        ivaHospedaje.textContent = detalle.totales.iva_hospedaje.toFixed(2);
+        ivaOtros.textContent = (detalle.totales.iva - detalle.totales.iva_hospedaje).toFixed(2); // IVA otros servicios
+        subtotalConIva.textContent = detalle.totales.subtotal_con_iva.toFixed(2);
+        utilidadPorcentaje.textContent = detalle.porcentajes.utilidad;
+        montoUtilidad.textContent = detalle.totales.utilidad.toFixed(2);
+
+        // Mostrar total final y precio por pax
+        totalFinal.textContent = detalle.totales.total.toFixed(2);
+        precioPorPax.textContent = detalle.precios_por_pax.total.toFixed(2);
+
+        // Mostrar resultados
+        quoteResult.style.display = 'block';
+    }
+
+    // Muestra los errores de validación o del cálculo
+    function mostrarError(data) {
+        // Mostrar mensaje más detallado
+        let errorMessage = 'Error en la cotización: ';
+
+        if (data.error) {
+            errorMessage += data.error;
+        } else if (data.errors) {
+            // Si hay errores de validación específicos
+            if (data.errors.destino) {
+                errorMessage += 'Por favor, seleccione un destino válido.';
+            } else if (data.errors.origen) {
+                errorMessage += 'Por favor, ingrese un origen válido.';
+            } else {
+                errorMessage += 'Datos inválidos.';
+            }
+
+            console.log('Errores de validación:', data.errors);
+        } else {
+            errorMessage += 'Datos inválidos.';
+        }
+
+        alert(errorMessage);
+    }
+
     // Agregar evento de envío al formulario
     quotationForm.addEventListener('submit', calculateQuotation);
 });
\ No newline at end of file